@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        """Register search index signal handlers and the query profiler"""
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .query_profiler import install
+
+        connection_created.connect(install, dispatch_uid='core.query_profiler')
+        for connection in connections.all(initialized_only=True):
+            install(connection)
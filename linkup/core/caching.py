@@ -0,0 +1,516 @@
+"""
+Tag-invalidated application cache.
+
+Entries live in the Django cache (Redis in production, locmem in development
+and tests) under keys that are the same in every worker process:
+
+    <prefix>:<namespace>:v<version>:<sha1 of the JSON-encoded key>
+
+so a value cached by one gunicorn/daphne worker is a hit in all the others.
+Bumping a namespace's version in code orphans its old entries.
+
+Each entry records the version of every tag it was stored with, e.g.
+``user:42`` or ``post:17``. A tag version is a counter in the cache;
+invalidating the tag increments it, and an entry is only served while all of
+its tags still carry the versions it recorded. A tag that is missing from
+the cache (evicted or never created) fails the check, so eviction can only
+cause misses, never stale hits. Every entry also carries its namespace's tag,
+which is how a whole namespace is cleared.
+
+Namespaces created with ``l1=True`` also go through a small per-process LRU
+(TAGGED_CACHE_L1_SIZE entries, each kept for TAGGED_CACHE_L1_TTL seconds) in
+front of the shared cache. Invalidations drop matching L1 entries in the
+process that made them; other processes may serve their L1 copy until it
+expires, so only use it where a few seconds of staleness is fine. L1 hands
+out the stored object itself, so callers must not mutate cached values.
+
+get_or_compute() guards hot entries against stampedes:
+
+- single flight: on a miss, one caller takes a short-lived lock
+  (``cache.add``, i.e. SET NX EX on Redis) and recomputes while the others
+  wait briefly for its result instead of running the same query;
+- stale-while-revalidate: entries outlive their timeout by a grace period
+  (``stale_ttl``); once expired, the caller holding the lock recomputes and
+  everyone else is served the old value meanwhile. Tag invalidation is never
+  served stale;
+- probabilistic early refresh (XFetch): shortly before expiry, callers
+  recompute with a probability that grows as expiry approaches and scales
+  with how long the value took to compute, so entries written together don't
+  all expire together.
+
+Hits, L1 hits, stale hits, early refreshes and misses are counted per
+namespace and exported through core.metrics.
+"""
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import partial, wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import cache_requests
+
+_MISSING = object()
+
+# Tags for an entry, or a function of the computed value returning them
+Tags = Union[Iterable[str], Callable[[Any], Iterable[str]]]
+
+
+def _setting(name, default):
+    return getattr(settings, f'TAGGED_CACHE_{name}', default)
+
+
+def digest(key: Any) -> str:
+    """Stable digest of a JSON-encodable key (unlike ``hash()``, which is salted per process)."""
+    encoded = json.dumps(key, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+class CacheNamespace:
+    """A named, versioned group of entries with a default timeout."""
+
+    def __init__(self, tagged_cache: 'TaggedCache', name: str, version: int = 1,
+                 timeout: Optional[int] = 300, l1: bool = False, stale_ttl: Optional[int] = None):
+        self.tagged_cache = tagged_cache
+        self.name = name
+        self.version = version
+        self.timeout = timeout
+        self.l1 = l1
+        self.stale_ttl = _setting('STALE_TTL', 60) if stale_ttl is None else stale_ttl
+
+    @property
+    def tag(self) -> str:
+        return f'ns:{self.name}'
+
+    def make_key(self, key: Any) -> str:
+        return f'{self.tagged_cache.prefix}:{self.name}:v{self.version}:{digest(key)}'
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self.tagged_cache.get(self, key, default)
+
+    def get_many(self, keys: Iterable[Any]) -> Dict[Any, Any]:
+        return self.tagged_cache.get_many(self, keys)
+
+    def set(self, key: Any, value: Any, tags: Iterable[str] = (), timeout: Optional[int] = None):
+        self.tagged_cache.set(self, key, value, tags, timeout)
+
+    def set_many(self, values: Dict[Any, Any], tags_for: Optional[Callable[[Any], Iterable[str]]] = None,
+                 timeout: Optional[int] = None):
+        self.tagged_cache.set_many(self, values, tags_for, timeout)
+
+    def get_or_compute(self, key: Any, compute: Callable[[], Any], tags: Tags = (),
+                       timeout: Optional[int] = None) -> Any:
+        return self.tagged_cache.get_or_compute(self, key, compute, tags, timeout)
+
+    def get_or_compute_many(self, keys: Iterable[Any], compute: Callable[[List[Any]], Dict[Any, Any]],
+                            tags_for: Optional[Callable[[Any], Iterable[str]]] = None,
+                            timeout: Optional[int] = None) -> Dict[Any, Any]:
+        return self.tagged_cache.get_or_compute_many(self, keys, compute, tags_for, timeout)
+
+    def delete(self, key: Any):
+        self.tagged_cache.delete(self, key)
+
+    def invalidate(self):
+        """Drop every entry in the namespace."""
+        self.tagged_cache.invalidate_tags(self.tag)
+
+    def cached(self, tags: Optional[Callable[..., Iterable[str]]] = None, timeout: Optional[int] = None):
+        """
+        Decorator caching a function's result under its module, name and arguments.
+
+        ``tags`` is called with the same arguments and returns the tags to
+        store the result with.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = [func.__module__, func.__qualname__, args, kwargs]
+                entry_tags = tags(*args, **kwargs) if tags else ()
+                return self.get_or_compute(key, lambda: func(*args, **kwargs), entry_tags, timeout)
+            wrapper.cache_namespace = self
+            return wrapper
+        return decorator
+
+
+class TaggedCache:
+    """Versioned, tag-invalidated entries in the Django cache behind a per-process L1."""
+
+    def __init__(self, cache_backend=None, prefix: Optional[str] = None,
+                 l1_size: Optional[int] = None, l1_ttl: Optional[float] = None):
+        self.cache = cache_backend or cache
+        self.prefix = prefix or _setting('KEY_PREFIX', 'tc')
+        self.l1_size = _setting('L1_SIZE', 1000) if l1_size is None else l1_size
+        self.l1_ttl = _setting('L1_TTL', 5) if l1_ttl is None else l1_ttl
+        self._l1: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def namespace(self, name: str, version: int = 1, timeout: Optional[int] = 300,
+                  l1: bool = False, stale_ttl: Optional[int] = None) -> CacheNamespace:
+        return CacheNamespace(self, name, version, timeout, l1, stale_ttl)
+
+    # Tags
+
+    def _tag_key(self, tag: str) -> str:
+        return f'{self.prefix}:tag:{tag}'
+
+    def _tag_versions(self, tags: Iterable[str], create: bool = False) -> Dict[str, int]:
+        """Current version of each tag; with ``create``, missing tags are started."""
+        keys = {self._tag_key(tag): tag for tag in tags}
+        if not keys:
+            return {}
+        versions = {keys[key]: value for key, value in self.cache.get_many(list(keys)).items()}
+        if create:
+            tag_timeout = _setting('TAG_TIMEOUT', 86400)
+            for key, tag in keys.items():
+                if tag in versions:
+                    continue
+                # Start from the clock so a recreated tag never repeats an old version
+                version = time.time_ns()
+                if not self.cache.add(key, version, tag_timeout):
+                    version = self.cache.get(key, version)
+                versions[tag] = version
+        return versions
+
+    def invalidate_tags(self, *tags: str):
+        """Make every entry stored with any of ``tags`` a miss, in all processes."""
+        for tag in tags:
+            try:
+                self.cache.incr(self._tag_key(tag))
+            except ValueError:
+                pass  # No version yet, so nothing can have been stored under it
+        tags = set(tags)
+        with self._lock:
+            for key in [key for key, (_, _, entry_tags) in self._l1.items() if tags & entry_tags]:
+                del self._l1[key]
+
+    def invalidate_tags_on_commit(self, *tags: str):
+        """Invalidate once the current transaction commits, so readers can't re-cache old rows."""
+        transaction.on_commit(partial(self.invalidate_tags, *tags))
+
+    # L1
+
+    def _l1_get(self, namespace: CacheNamespace, key: str) -> Any:
+        if not (namespace.l1 and self.l1_size):
+            return _MISSING
+        with self._lock:
+            item = self._l1.get(key)
+            if item is None:
+                return _MISSING
+            expires, value, _ = item
+            if expires < time.monotonic():
+                del self._l1[key]
+                return _MISSING
+            self._l1.move_to_end(key)
+            return value
+
+    def _l1_set(self, namespace: CacheNamespace, key: str, value: Any, tags: Iterable[str]):
+        if not (namespace.l1 and self.l1_size):
+            return
+        with self._lock:
+            self._l1[key] = (time.monotonic() + self.l1_ttl, value, frozenset(tags))
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def clear_l1(self):
+        with self._lock:
+            self._l1.clear()
+
+    # Entries
+    #
+    # Stored as {'v': value, 't': {tag: version}, 'e': logical expiry (epoch
+    # seconds, None for no timeout), 'd': seconds the value took to compute}.
+    # The backend keeps them stale_ttl seconds past 'e'.
+
+    def _count(self, namespace: CacheNamespace, result: str, amount: int = 1):
+        if not amount:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(
+                namespace.name, {'hit': 0, 'l1_hit': 0, 'stale': 0, 'early': 0, 'miss': 0}
+            )
+            stats[result] += amount
+        cache_requests.inc(amount, cache=namespace.name, result=result)
+
+    def _read(self, cache_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Entries whose tags are all current, fresh or expired. Two round trips."""
+        entries = self.cache.get_many(cache_keys)
+        versions = self._tag_versions({tag for entry in entries.values() for tag in entry['t']})
+        return {
+            cache_key: entry for cache_key, entry in entries.items()
+            if all(versions.get(tag) == version for tag, version in entry['t'].items())
+        }
+
+    @staticmethod
+    def _fresh(entry: Dict[str, Any], now: float) -> bool:
+        return entry.get('e') is None or now < entry['e']
+
+    @staticmethod
+    def _refresh_early(entry: Dict[str, Any], now: float) -> bool:
+        """XFetch: recompute before expiry with probability rising as expiry nears."""
+        if entry.get('e') is None or not entry.get('d'):
+            return False
+        beta = _setting('EARLY_REFRESH_BETA', 1.0)
+        return now - entry['d'] * beta * math.log(1.0 - random.random()) >= entry['e']
+
+    def _entry(self, namespace: CacheNamespace, value: Any, versions: Dict[str, int],
+               timeout: Optional[int], duration: float = 0.0):
+        """The stored entry and how long the backend should keep it."""
+        timeout = namespace.timeout if timeout is None else timeout
+        if timeout is None:
+            return {'v': value, 't': versions, 'e': None, 'd': duration}, None
+        entry = {'v': value, 't': versions, 'e': time.time() + timeout, 'd': duration}
+        return entry, timeout + namespace.stale_ttl
+
+    def get(self, namespace: CacheNamespace, key: Any, default: Any = None) -> Any:
+        cache_key = namespace.make_key(key)
+        return self._lookup(namespace, [cache_key]).get(cache_key, default)
+
+    def get_many(self, namespace: CacheNamespace, keys: Iterable[Any]) -> Dict[Any, Any]:
+        """Values for the (hashable) keys that are cached and still fresh; misses are left out."""
+        cache_keys = {namespace.make_key(key): key for key in keys}
+        return {cache_keys[cache_key]: value for cache_key, value in self._lookup(namespace, list(cache_keys)).items()}
+
+    def _lookup(self, namespace: CacheNamespace, cache_keys: List[str]) -> Dict[str, Any]:
+        """Fresh values by cache key, from L1 or the shared cache."""
+        found: Dict[str, Any] = {}
+        pending: List[str] = []
+        for cache_key in cache_keys:
+            value = self._l1_get(namespace, cache_key)
+            if value is _MISSING:
+                pending.append(cache_key)
+            else:
+                found[cache_key] = value
+        self._count(namespace, 'l1_hit', len(found))
+        if not pending:
+            return found
+
+        now = time.time()
+        hits = 0
+        for cache_key, entry in self._read(pending).items():
+            if self._fresh(entry, now):
+                found[cache_key] = entry['v']
+                self._l1_set(namespace, cache_key, entry['v'], entry['t'])
+                hits += 1
+        self._count(namespace, 'hit', hits)
+        self._count(namespace, 'miss', len(pending) - hits)
+        return found
+
+    def set(self, namespace: CacheNamespace, key: Any, value: Any, tags: Iterable[str] = (),
+            timeout: Optional[int] = None):
+        """Store ``value`` under ``key`` with ``tags`` (plus the namespace tag)."""
+        self._store(namespace, namespace.make_key(key), value, set(tags) | {namespace.tag}, timeout)
+
+    def _store(self, namespace: CacheNamespace, cache_key: str, value: Any, tags: set,
+               timeout: Optional[int], versions: Optional[Dict[str, int]] = None, duration: float = 0.0):
+        """
+        Write one entry.
+
+        ``versions`` are tag versions read before the value was computed, so
+        an invalidation that lands while it was being computed still wins.
+        """
+        current = self._tag_versions(tags - set(versions or ()), create=True)
+        if versions:
+            current.update({tag: versions[tag] for tag in tags if tag in versions})
+        entry, backend_timeout = self._entry(namespace, value, current, timeout, duration)
+        self.cache.set(cache_key, entry, backend_timeout)
+        self._l1_set(namespace, cache_key, value, tags)
+
+    def set_many(self, namespace: CacheNamespace, values: Dict[Any, Any],
+                 tags_for: Optional[Callable[[Any], Iterable[str]]] = None, timeout: Optional[int] = None,
+                 versions: Optional[Dict[str, int]] = None, duration: float = 0.0):
+        """Store several entries, reading all of their tag versions in one go."""
+        if not values:
+            return
+        entry_tags = {key: set(tags_for(key) if tags_for else ()) | {namespace.tag} for key in values}
+        current = self._tag_versions(set().union(*entry_tags.values()) - set(versions or ()), create=True)
+        current.update(versions or {})
+        entries = {}
+        backend_timeout = None
+        for key, value in values.items():
+            cache_key = namespace.make_key(key)
+            entries[cache_key], backend_timeout = self._entry(
+                namespace, value, {tag: current[tag] for tag in entry_tags[key]}, timeout, duration
+            )
+            self._l1_set(namespace, cache_key, value, entry_tags[key])
+        self.cache.set_many(entries, backend_timeout)
+
+    # Single flight
+
+    def _acquire(self, cache_key: str) -> Optional[str]:
+        """Take the recompute lock for an entry; returns the release token, or None if it is held."""
+        token = uuid.uuid4().hex
+        if self.cache.add(f'{cache_key}:lock', token, _setting('LOCK_TIMEOUT', 10)):
+            return token
+        return None
+
+    def _release(self, cache_key: str, token: str):
+        # Only drop our own lock; it may have expired and been taken over
+        lock_key = f'{cache_key}:lock'
+        if self.cache.get(lock_key) == token:
+            self.cache.delete(lock_key)
+
+    def _wait_for(self, namespace: CacheNamespace, cache_key: str) -> Any:
+        """Poll for the lock holder's result; _MISSING if it doesn't arrive in time."""
+        deadline = time.monotonic() + _setting('LOCK_WAIT', 2)
+        interval = _setting('LOCK_POLL_INTERVAL', 0.05)
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            entry = self._read([cache_key]).get(cache_key)
+            if entry is not None and self._fresh(entry, time.time()):
+                self._l1_set(namespace, cache_key, entry['v'], entry['t'])
+                return entry['v']
+            if self.cache.get(f'{cache_key}:lock') is None:
+                break  # The holder gave up without storing anything
+        return _MISSING
+
+    def _compute(self, namespace: CacheNamespace, cache_key: str, compute: Callable[[], Any],
+                 tags: Tags, timeout: Optional[int], token: Optional[str]) -> Any:
+        try:
+            static_tags = set() if callable(tags) else set(tags)
+            versions = self._tag_versions(static_tags | {namespace.tag}, create=True)
+            started = time.monotonic()
+            value = compute()
+            duration = time.monotonic() - started
+            entry_tags = set(tags(value)) if callable(tags) else static_tags
+            self._store(namespace, cache_key, value, entry_tags | {namespace.tag}, timeout, versions, duration)
+            return value
+        finally:
+            if token:
+                self._release(cache_key, token)
+
+    def get_or_compute(self, namespace: CacheNamespace, key: Any, compute: Callable[[], Any],
+                       tags: Tags = (), timeout: Optional[int] = None) -> Any:
+        """
+        The cached value for ``key``, computing and storing it when needed.
+
+        At most one caller per key recomputes at a time; see the module
+        docstring. ``tags`` may be a function of the computed value, for
+        entries whose tags depend on what the computation found.
+        """
+        cache_key = namespace.make_key(key)
+        value = self._l1_get(namespace, cache_key)
+        if value is not _MISSING:
+            self._count(namespace, 'l1_hit')
+            return value
+
+        entry = self._read([cache_key]).get(cache_key)
+        if entry is not None:
+            now = time.time()
+            fresh = self._fresh(entry, now)
+            if fresh and not self._refresh_early(entry, now):
+                self._count(namespace, 'hit')
+                self._l1_set(namespace, cache_key, entry['v'], entry['t'])
+                return entry['v']
+            token = self._acquire(cache_key)
+            if token is None:
+                # Someone else is refreshing it; serve what we have meanwhile
+                self._count(namespace, 'hit' if fresh else 'stale')
+                return entry['v']
+            self._count(namespace, 'early' if fresh else 'miss')
+            return self._compute(namespace, cache_key, compute, tags, timeout, token)
+
+        self._count(namespace, 'miss')
+        token = self._acquire(cache_key)
+        if token is None:
+            value = self._wait_for(namespace, cache_key)
+            if value is not _MISSING:
+                return value
+        return self._compute(namespace, cache_key, compute, tags, timeout, token)
+
+    def get_or_compute_many(self, namespace: CacheNamespace, keys: Iterable[Any],
+                            compute: Callable[[List[Any]], Dict[Any, Any]],
+                            tags_for: Optional[Callable[[Any], Iterable[str]]] = None,
+                            timeout: Optional[int] = None) -> Dict[Any, Any]:
+        """
+        Cached values for several (hashable) keys, computing the rest in one call.
+
+        ``compute`` receives the keys to load and returns a value for each.
+        Expired and early-refresh entries are recomputed by whoever takes
+        their lock and served stale to everyone else; plain misses are always
+        computed, since they are loaded together in one batch anyway.
+        """
+        cache_keys = {namespace.make_key(key): key for key in keys}
+        found: Dict[Any, Any] = {}
+        pending: List[str] = []
+        for cache_key, key in cache_keys.items():
+            value = self._l1_get(namespace, cache_key)
+            if value is _MISSING:
+                pending.append(cache_key)
+            else:
+                found[key] = value
+        self._count(namespace, 'l1_hit', len(found))
+        if not pending:
+            return found
+
+        entries = self._read(pending)
+        now = time.time()
+        load: List[str] = []
+        tokens: Dict[str, str] = {}
+        for cache_key in pending:
+            entry = entries.get(cache_key)
+            if entry is None:
+                self._count(namespace, 'miss')
+                load.append(cache_key)
+                continue
+            fresh = self._fresh(entry, now)
+            token = None
+            if not fresh or self._refresh_early(entry, now):
+                token = self._acquire(cache_key)
+            if token is None:
+                self._count(namespace, 'hit' if fresh else 'stale')
+                found[cache_keys[cache_key]] = entry['v']
+                if fresh:
+                    self._l1_set(namespace, cache_key, entry['v'], entry['t'])
+                continue
+            self._count(namespace, 'early' if fresh else 'miss')
+            tokens[cache_key] = token
+            load.append(cache_key)
+
+        if load:
+            try:
+                load_keys = [cache_keys[cache_key] for cache_key in load]
+                tags = set().union(*(tags_for(key) for key in load_keys)) if tags_for else set()
+                versions = self._tag_versions(tags | {namespace.tag}, create=True)
+                started = time.monotonic()
+                computed = compute(load_keys)
+                self.set_many(namespace, computed, tags_for, timeout, versions, time.monotonic() - started)
+                found.update(computed)
+            finally:
+                for cache_key, token in tokens.items():
+                    self._release(cache_key, token)
+        return found
+
+    def delete(self, namespace: CacheNamespace, key: Any):
+        cache_key = namespace.make_key(key)
+        self.cache.delete(cache_key)
+        with self._lock:
+            self._l1.pop(cache_key, None)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-namespace lookups in this process, with hit ratios."""
+        with self._lock:
+            rows = [dict(stats, namespace=name) for name, stats in self._stats.items()]
+        for row in rows:
+            served = row['hit'] + row['l1_hit'] + row['stale']
+            lookups = served + row['early'] + row['miss']
+            row['hit_ratio'] = round(served / lookups, 3) if lookups else 0.0
+        return sorted(rows, key=lambda row: row['namespace'])
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Global instance
+tagged_cache = TaggedCache()
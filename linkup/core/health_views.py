@@ -2,11 +2,15 @@
 Health check views for monitoring and deployment orchestration.
 """
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.db import connection
 from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
 import logging
 
+from .metrics import metrics as metrics_registry
+
 logger = logging.getLogger(__name__)
 
 
@@ -115,3 +119,24 @@ def readiness_check(request):
         response_data['failed_checks'] = errors
     
     return JsonResponse(response_data, status=status_code)
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint.
+    Requires ``Authorization: Bearer <METRICS_AUTH_TOKEN>`` when that setting is configured,
+    and a staff session when it isn't.
+    """
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        authorized = constant_time_compare(supplied, token)
+    else:
+        authorized = request.user.is_authenticated and request.user.is_staff
+    if not authorized:
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    
+    return HttpResponse(
+        metrics_registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
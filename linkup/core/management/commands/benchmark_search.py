@@ -0,0 +1,93 @@
+"""
+Management command comparing the full-text search index with the legacy
+icontains query builders on the current database.
+
+Seed a dataset first, e.g. ``python manage.py seed_test_data``.
+"""
+
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.search_index import search_index
+from core.views import _build_job_search_query, _build_post_search_query, _build_user_search_query
+from feed.models import Post
+from jobs.models import Job
+
+User = get_user_model()
+
+DEFAULT_QUERIES = ['developer', 'python engineer', 'manager', 'data', 'remote design', 'ma']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark indexed search against the legacy icontains query builders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--query',
+            action='append',
+            help='Query to benchmark (repeatable, default: a fixed sample)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Timed runs per query and implementation (default: 20)',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rebuild the search index before benchmarking',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f"Indexed {search_index.rebuild()} documents")
+
+        self.stdout.write(
+            f"Dataset: {User.objects.count()} users, {Job.objects.count()} jobs, {Post.objects.count()} posts"
+        )
+        self.stdout.write(f"{'query':<20} {'kind':<6} {'legacy ms':>10} {'index ms':>10} {'speedup':>8} {'hits':>11}")
+
+        for query in options['query'] or DEFAULT_QUERIES:
+            for kind, legacy, indexed in self._implementations(query):
+                legacy_ms, legacy_hits = self._time(legacy, options['iterations'])
+                index_ms, index_hits = self._time(indexed, options['iterations'])
+                speedup = legacy_ms / index_ms if index_ms else 0
+                self.stdout.write(
+                    f"{query:<20} {kind:<6} {legacy_ms:>10.2f} {index_ms:>10.2f} {speedup:>7.1f}x "
+                    f"{legacy_hits:>5}/{index_hits:<5}"
+                )
+
+    @staticmethod
+    def _implementations(query):
+        return [
+            (
+                'user',
+                lambda: list(_build_user_search_query(query).distinct()[:50]),
+                lambda: search_index.hydrate(User.objects.all(), search_index.search('user', query)),
+            ),
+            (
+                'job',
+                lambda: list(_build_job_search_query(query).distinct()[:50]),
+                lambda: search_index.hydrate(Job.objects.filter(is_active=True), search_index.search('job', query)),
+            ),
+            (
+                'post',
+                lambda: list(_build_post_search_query(query)[:50]),
+                lambda: search_index.hydrate(Post.objects.all(), search_index.search('post', query)),
+            ),
+        ]
+
+    @staticmethod
+    def _time(func, iterations):
+        """Median wall time in ms over ``iterations`` runs, and the hit count."""
+        hits = len(func())  # Warm up caches and connections
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), hits
@@ -0,0 +1,131 @@
+"""
+Management command counting session store writes for an authenticated
+client, with per-request activity stamps (the old behaviour) and with the
+throttled SESSION_ACTIVITY_GRANULARITY stamps.
+
+Requests go through the session, authentication and session security
+middleware only, on a simulated clock so ``--seconds`` of browsing can be
+replayed instantly.
+"""
+
+import json
+import uuid
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from core.middleware import SessionSecurityMiddleware
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Count session writes per 1,000 authenticated requests, per-request vs throttled activity stamps'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1000,
+            help='Requests to replay per mode (default: 1000)',
+        )
+        parser.add_argument(
+            '--seconds',
+            type=int,
+            default=600,
+            help='Simulated time the requests are spread over (default: 600)',
+        )
+        parser.add_argument(
+            '--granularity',
+            type=int,
+            default=None,
+            help='Activity stamp granularity for the throttled mode (default: SESSION_ACTIVITY_GRANULARITY)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Output in JSON format',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['seconds'] < 0:
+            raise CommandError('--requests must be positive and --seconds not negative')
+        granularity = options['granularity']
+        if granularity is None:
+            granularity = getattr(settings, 'SESSION_ACTIVITY_GRANULARITY', 60)
+
+        modes = [
+            ('every_request', {'SESSION_SAVE_EVERY_REQUEST': True, 'SESSION_ACTIVITY_GRANULARITY': 0}),
+            ('throttled', {'SESSION_SAVE_EVERY_REQUEST': False, 'SESSION_ACTIVITY_GRANULARITY': granularity}),
+        ]
+        user = User.objects.create_user(username=f'bench_session_{uuid.uuid4().hex[:8]}')
+        try:
+            results = {
+                'config': {
+                    'requests': options['requests'],
+                    'seconds': options['seconds'],
+                    'granularity': granularity,
+                    'engine': settings.SESSION_ENGINE,
+                },
+                'modes': {
+                    name: self.measure(user, options['requests'], options['seconds'], overrides)
+                    for name, overrides in modes
+                },
+            }
+        finally:
+            user.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'mode':<15} {'writes':>8} {'per 1k requests':>16}")
+        for name, row in results['modes'].items():
+            self.stdout.write(f"{name:<15} {row['writes']:>8} {row['writes_per_1k']:>16.1f}")
+        before = results['modes']['every_request']['writes']
+        after = results['modes']['throttled']['writes']
+        self.stdout.write(self.style.SUCCESS(
+            f"Session writes cut from {before} to {after} over {options['seconds']}s of simulated browsing"
+        ))
+
+    def measure(self, user, requests, seconds, overrides):
+        with override_settings(**overrides):
+            engine = import_module(settings.SESSION_ENGINE)
+            session = engine.SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.create()
+
+            handler = SessionMiddleware(AuthenticationMiddleware(SessionSecurityMiddleware(lambda r: HttpResponse())))
+            factory = RequestFactory()
+            start = timezone.now()
+            step = timedelta(seconds=seconds / requests)
+            writes = 0
+            original_save = engine.SessionStore.save
+
+            def counting_save(store, *args, **kwargs):
+                nonlocal writes
+                writes += 1
+                return original_save(store, *args, **kwargs)
+
+            try:
+                with mock.patch.object(engine.SessionStore, 'save', counting_save):
+                    for i in range(requests):
+                        with mock.patch('django.utils.timezone.now', return_value=start + step * i):
+                            request = factory.get('/', HTTP_USER_AGENT='bench')
+                            request.COOKIES[settings.SESSION_COOKIE_NAME] = session.session_key
+                            handler(request)
+            finally:
+                session.delete()
+
+        return {'writes': writes, 'writes_per_1k': writes * 1000 / requests}
@@ -0,0 +1,92 @@
+"""
+Management command to report how much space content-addressed attachment
+storage saves, and optionally repair blob reference counts.
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, Sum
+
+from core.models import Blob
+from core.storage import BLOB_PREFIX, ContentAddressedStorage, blob_storage
+
+
+def blob_fields():
+    """Every file field stored through ContentAddressedStorage."""
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage):
+                yield model, field
+
+
+def count_references():
+    """Number of file field values pointing at each blob, keyed by physical name."""
+    counts = {}
+    for model, field in blob_fields():
+        names = (
+            model._default_manager.filter(**{f'{field.name}__startswith': f'{BLOB_PREFIX}/'})
+            .values_list(field.name, flat=True)
+            .iterator()
+        )
+        for name in names:
+            physical = field.storage._physical_name(name)
+            counts[physical] = counts.get(physical, 0) + 1
+    return counts
+
+
+def format_bytes(size):
+    return f"{size / (1024 * 1024):.1f}MB"
+
+
+class Command(BaseCommand):
+    help = 'Report the deduplication ratio of attachment blob storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Recount references from the file fields, fix drifted counts and remove unreferenced blobs',
+        )
+
+    def handle(self, *args, **options):
+        if options['repair']:
+            self.repair()
+
+        totals = Blob.objects.aggregate(
+            stored=Sum('size'),
+            logical=Sum(F('size') * F('ref_count')),
+            references=Sum('ref_count'),
+        )
+        blobs = Blob.objects.count()
+        stored = totals['stored'] or 0
+        logical = totals['logical'] or 0
+        references = totals['references'] or 0
+        ratio = logical / stored if stored else 1.0
+
+        self.stdout.write(f"Blobs stored:      {blobs}")
+        self.stdout.write(f"File references:   {references}")
+        self.stdout.write(f"Bytes referenced:  {format_bytes(logical)}")
+        self.stdout.write(f"Bytes on disk:     {format_bytes(stored)}")
+        self.stdout.write(f"Bytes saved:       {format_bytes(logical - stored)}")
+        self.stdout.write(self.style.SUCCESS(f"Dedup ratio:       {ratio:.2f}x"))
+
+    def repair(self):
+        counts = count_references()
+        fixed = 0
+        orphaned = []
+        with transaction.atomic():
+            for blob in Blob.objects.select_for_update():
+                actual = counts.get(blob.name, 0)
+                if actual == 0:
+                    orphaned.append(blob.name)
+                    blob.delete()
+                elif blob.ref_count != actual:
+                    Blob.objects.filter(pk=blob.pk).update(ref_count=actual)
+                    fixed += 1
+        for name in orphaned:
+            blob_storage.delete(name)
+        missing = set(counts) - set(Blob.objects.values_list('name', flat=True))
+        self.stdout.write(f"Repaired {fixed} reference counts, removed {len(orphaned)} unreferenced blobs")
+        if missing:
+            self.stdout.write(self.style.WARNING(f"{len(missing)} referenced blobs have no Blob row"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.models import SearchDocument
+from core.search_index import search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild full-text search documents for users, jobs and posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            choices=[kind for kind, _ in SearchDocument.KIND_CHOICES],
+            help='Only rebuild this kind of document (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding search documents...")
+        total = search_index.rebuild(options['kind'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} documents"))
@@ -0,0 +1,452 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms are plain dictionaries updated under one
+lock, so recording a value costs a dict lookup and an addition. The
+``/metrics`` endpoint renders them on demand.
+
+Gunicorn and daphne run several worker processes, and a scrape only
+reaches one of them. When ``METRICS_MULTIPROC_DIR`` is set, each process
+also writes a snapshot of its values to ``<dir>/<pid>.json`` every
+``METRICS_FLUSH_INTERVAL`` seconds (from a daemon thread, and at exit),
+and a scrape merges every snapshot in the directory:
+
+- counters and histograms are summed across all files, including those
+  of workers that have exited, so totals never go backwards;
+- gauges are summed across live processes only;
+- ``local`` gauges (set by scrape-time collectors, e.g. queue depth) are
+  never written to disk and come from the scraping process alone.
+
+A worker forked after the parent recorded values starts from zero (the
+parent's values are already counted in the parent's own file); the reset
+runs in an ``os.register_at_fork`` hook, before the child records anything.
+
+Clear the directory when the server starts so old PIDs do not linger.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Iterable[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self.registry._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    """A monotonically increasing total."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only increase')
+        key = self._key(labels)
+        with self.registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry._touch()
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down.
+
+    ``local`` gauges are not shared between processes; use them for values
+    a collector recomputes on every scrape.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, *args, local: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local = local
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry._touch()
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.registry._lock:
+            self._values[key] = value
+        self.registry._touch()
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative ``le`` buckets, plus their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.registry._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the +Inf overflow last, then sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+        self.registry._touch()
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return sum(state[:-1]) if state else 0
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block in seconds."""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, object]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class MetricsRegistry:
+    """Holds this process's metrics and renders them, merged with other workers when configured."""
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: Optional[float] = None):
+        self._multiproc_dir = multiproc_dir
+        self._flush_interval = flush_interval
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher: Optional[threading.Thread] = None
+        self._atexit_registered = False
+        _registries.add(self)
+
+    @property
+    def multiproc_dir(self) -> Optional[str]:
+        if self._multiproc_dir is None:
+            return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+        return self._multiproc_dir
+
+    @property
+    def flush_interval(self) -> float:
+        if self._flush_interval is None:
+            return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        return self._flush_interval
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), local: bool = False) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames, local=local))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets=buckets))
+
+    def register_collector(self, collector: Callable[[], None]):
+        """Run ``collector`` before every scrape, typically to set ``local`` gauges."""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def _touch(self):
+        """Note a change; in multiprocess mode make sure this worker's flusher is running."""
+        self._dirty = True
+        if self._flusher is None and self.multiproc_dir:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            try:
+                os.makedirs(self.multiproc_dir, exist_ok=True)
+            except OSError as e:
+                logger.error(f"Cannot create metrics directory {self.multiproc_dir}: {e}")
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+            self._flusher.start()
+            # Inherited by forked workers, where flush() writes the child's own file
+            register_atexit = not self._atexit_registered
+            self._atexit_registered = True
+        if register_atexit:
+            atexit.register(self.flush)
+
+    def _after_fork(self):
+        """In a forked child: drop the parent's values and flusher thread, which did not survive the fork."""
+        self._lock = threading.Lock()  # Another thread may have held it at fork time
+        self._dirty = False
+        self._flusher = None
+        for metric in self._metrics.values():
+            metric._values.clear()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def _snapshot(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            self._dirty = False
+            return {
+                name: {json.dumps(key): value for key, value in metric._values.items()}
+                for name, metric in self._metrics.items()
+                if not getattr(metric, 'local', False) and metric._values
+            }
+
+    def flush(self):
+        """Write this process's values to the shared directory."""
+        directory = self.multiproc_dir
+        if not directory or not os.path.isdir(directory):
+            return
+        try:
+            path = os.path.join(directory, f'{os.getpid()}.json')
+            temp_path = f'{path}.tmp'
+            with open(temp_path, 'w') as fh:
+                json.dump(self._snapshot(), fh)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to flush metrics to {directory}: {e}")
+
+    def _merged_values(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        """Values to render: this process's own, plus other workers' snapshots in multiprocess mode."""
+        with self._lock:
+            merged = {name: dict(metric._values) for name, metric in self._metrics.items()}
+        directory = self.multiproc_dir
+        if not directory or not os.path.isdir(directory):
+            return merged
+
+        own_file = f'{os.getpid()}.json'
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == own_file:
+                continue
+            try:
+                pid = int(filename[:-5])
+                with open(os.path.join(directory, filename)) as fh:
+                    snapshot = json.load(fh)
+            except (ValueError, OSError) as e:
+                logger.warning(f"Skipping unreadable metrics file {filename}: {e}")
+                continue
+            alive = _pid_alive(pid)
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None or (isinstance(metric, Gauge) and (metric.local or not alive)):
+                    continue
+                target = merged.setdefault(name, {})
+                for raw_key, value in values.items():
+                    key = tuple(json.loads(raw_key))
+                    if isinstance(metric, Histogram):
+                        if len(value) != len(metric.buckets) + 2:
+                            continue
+                        current = target.get(key)
+                        target[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+
+        merged = self._merged_values()
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append(f'# HELP {name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, key))
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels + [('le', _format_value(bound))])
+                        lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Clear this process's values (tests)."""
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+_registries = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for registry in list(_registries):
+        registry._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Global instance
+metrics = MetricsRegistry()
+
+# HTTP
+http_request_duration = metrics.histogram(
+    'linkup_http_request_duration_seconds', 'HTTP request latency by URL name', ['view', 'method'],
+)
+http_requests = metrics.counter(
+    'linkup_http_requests_total', 'HTTP responses by URL name and status class', ['view', 'status'],
+)
+
+# Database (fed by core.query_profiler for every profiled request and WebSocket event)
+db_queries = metrics.counter(
+    'linkup_db_queries_total', 'Database queries by view or WebSocket event', ['source'],
+)
+db_duplicate_queries = metrics.counter(
+    'linkup_db_duplicate_queries_total', 'Queries repeating an earlier SQL fingerprint in the same request or event',
+    ['source'],
+)
+db_query_seconds = metrics.counter(
+    'linkup_db_query_seconds_total', 'Time spent in database queries by view or WebSocket event', ['source'],
+)
+
+# WebSockets and the channel layer
+websocket_connections = metrics.gauge(
+    'linkup_websocket_connections', 'Open WebSocket connections by consumer', ['consumer'],
+)
+channel_layer_send_duration = metrics.histogram(
+    'linkup_channel_layer_send_seconds', 'Channel layer send latency', ['method'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+# Messaging
+messages = metrics.counter(
+    'linkup_messages_total', 'Chat messages reaching each delivery state', ['status'],
+)
+messaging_error_log = metrics.counter(
+    'linkup_messaging_error_log_total', 'MessagingError records by outcome (queued, sampled_out, queue_full, ...)',
+    ['outcome'],
+)
+message_queue_depth = metrics.gauge(
+    'linkup_message_queue_depth', 'Unprocessed QueuedMessage rows by queue type', ['queue_type'], local=True,
+)
+
+# Cache
+cache_requests = metrics.counter(
+    'linkup_cache_requests_total', 'Application cache lookups by cache and result (hit/l1_hit/stale/early/miss)', ['cache', 'result'],
+)
+
+# Rate limiting
+rate_limited = metrics.counter(
+    'linkup_rate_limited_total', 'Requests and WebSocket frames rejected by the rate limiter', ['scope'],
+)
+
+
+def instrument_channel_layer(layer):
+    """
+    Time ``send`` and ``group_send`` on a channel layer instance.
+
+    Layers are shared per process, so this wraps each one once; later calls
+    are no-ops.
+    """
+    if layer is None or getattr(layer, '_linkup_metrics', False):
+        return layer
+    for method in ('send', 'group_send'):
+        original = getattr(layer, method, None)
+        if original is None:
+            continue
+
+        async def timed(*args, _original=original, _method=method, **kwargs):
+            with channel_layer_send_duration.time(method=_method):
+                return await _original(*args, **kwargs)
+
+        setattr(layer, method, timed)
+    layer._linkup_metrics = True
+    return layer
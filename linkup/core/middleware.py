@@ -4,18 +4,23 @@ Implements additional security measures including rate limiting,
 request validation, and security headers.
 """
 
+import re
 import time
 import hashlib
 import logging
 from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
 from django.http import HttpResponse, HttpResponseBadRequest
-from django.core.cache import cache
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth import get_user_model
-from django.urls import resolve
+from django.urls import Resolver404, URLResolver, get_resolver, resolve
+from django.urls.resolvers import RoutePattern
 from django.utils import timezone
 
+from .rate_limit import RateLimit, rate_limiter
+
 logger = logging.getLogger('django.security')
 
 User = get_user_model()
@@ -85,6 +90,9 @@ class RateLimitMiddleware(MiddlewareMixin):
         'search': 'search',
     }
     
+    # Paths without converters, mapped to their limit type when first needed
+    _path_limit_types = None
+
     def process_request(self, request):
         """Check rate limits before processing request."""
         
@@ -99,10 +107,11 @@ class RateLimitMiddleware(MiddlewareMixin):
         limit_type = self._get_limit_type(request)
         
         # Check rate limit
-        if self._is_rate_limited(client_id, limit_type):
+        result = self._check_rate_limit(client_id, limit_type)
+        if not result.allowed:
             logger.warning(f"Rate limit exceeded for {client_id} on {request.path}")
             response = HttpResponse("Rate limit exceeded. Please try again later.", status=429)
-            response['Retry-After'] = '60'
+            response['Retry-After'] = str(result.retry_after)
             return response
         
         return None
@@ -123,38 +132,73 @@ class RateLimitMiddleware(MiddlewareMixin):
     
     def _get_limit_type(self, request):
         """Determine which rate limit to apply."""
-        try:
-            # Resolve URL to get view name
-            resolved = resolve(request.path)
-            view_name = resolved.url_name
-            
-            # Check for special endpoints
-            for endpoint, limit_type in self.SPECIAL_ENDPOINTS.items():
-                if endpoint in view_name:
-                    return limit_type
-            
-            # Check for API endpoints
-            if request.path.startswith('/api/'):
-                return 'api'
-            
-            return 'default'
-        except:
-            return 'default'
+        path = request.path
+        path_limit_types = self._get_path_limit_types()
+        if path in path_limit_types:
+            return path_limit_types[path]
+        # Paths with converters: resolved once per distinct path
+        match = _resolve_path(path)
+        return self._limit_type_for_view(match.url_name if match else None, path)
     
-    def _is_rate_limited(self, client_id, limit_type):
-        """Check if client has exceeded rate limit."""
-        limit = self.RATE_LIMITS.get(limit_type, self.RATE_LIMITS['default'])
+    @classmethod
+    def _limit_type_for_view(cls, view_name, path):
+        """Limit type for a resolved URL name (None if the path did not resolve)."""
+        if not view_name:
+            return 'default'
         
-        # Use cache for rate limiting
-        cache_key = f"rate_limit_{limit_type}_{client_id}"
-        current_requests = cache.get(cache_key, 0)
+        # Check for special endpoints
+        for endpoint, limit_type in cls.SPECIAL_ENDPOINTS.items():
+            if endpoint in view_name:
+                return limit_type
         
-        if current_requests >= limit:
-            return True
+        # Check for API endpoints
+        if path.startswith('/api/'):
+            return 'api'
         
-        # Increment counter
-        cache.set(cache_key, current_requests + 1, 60)  # 60 seconds TTL
-        return False
+        return 'default'
+    
+    @classmethod
+    def _get_path_limit_types(cls):
+        """
+        Limit types for every URL without converters, built from the URLconf
+        on first use instead of resolving each request's path.
+        """
+        if cls._path_limit_types is None:
+            path_limit_types = {}
+            for path in _static_paths(get_resolver().url_patterns):
+                try:
+                    view_name = resolve(path).url_name
+                except Resolver404:
+                    continue
+                path_limit_types[path] = cls._limit_type_for_view(view_name, path)
+            cls._path_limit_types = path_limit_types
+        return cls._path_limit_types
+    
+    def _check_rate_limit(self, client_id, limit_type):
+        """Count the request against the client's sliding window for this limit type."""
+        limit = self.RATE_LIMITS.get(limit_type, self.RATE_LIMITS['default'])
+        return rate_limiter.hit(limit_type, client_id, limit, 60)
+
+
+def _static_paths(patterns, prefix='/'):
+    """Paths of the URL patterns that are plain routes without converters."""
+    for pattern in patterns:
+        if not isinstance(pattern.pattern, RoutePattern) or pattern.pattern.converters:
+            continue
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from _static_paths(pattern.url_patterns, route)
+        else:
+            yield route
+
+
+@lru_cache(maxsize=4096)
+def _resolve_path(path):
+    """resolve() for paths seen before comes from this cache; None if the path does not resolve."""
+    try:
+        return resolve(path)
+    except Resolver404:
+        return None
 
 
 class RequestValidationMiddleware(MiddlewareMixin):
@@ -186,6 +230,23 @@ class RequestValidationMiddleware(MiddlewareMixin):
         r';\s*ls\s+',
     ]
     
+    # All patterns as one alternation, so each value is scanned in a single pass.
+    # Values are lowercased instead of using re.IGNORECASE, which is several times slower here.
+    SUSPICIOUS_PATTERN = re.compile('|'.join(f'(?:{p})' for p in SUSPICIOUS_PATTERNS))
+    
+    # Values longer than this are rejected rather than scanned (trusted fields excepted)
+    MAX_FIELD_LENGTH = 100 * 1024
+    
+    # Per-endpoint policies, by view name: POST fields that are sanitized with
+    # bleach before they are stored, so they are not scanned or capped
+    TRUSTED_RICH_TEXT_FIELDS = {
+        'feed:feed': frozenset({'content'}),
+        'feed:update_post': frozenset({'content'}),
+    }
+    
+    # Headers scanned along with the request data
+    SCANNED_HEADERS = ['HTTP_USER_AGENT', 'HTTP_REFERER', 'HTTP_X_FORWARDED_FOR']
+    
     def process_request(self, request):
         """Validate request for security threats."""
         
@@ -216,36 +277,40 @@ class RequestValidationMiddleware(MiddlewareMixin):
             return False
     
     def _contains_suspicious_patterns(self, request):
-        """Check request data for suspicious patterns."""
-        import re
+        """
+        Check request data for suspicious patterns.
         
-        # Combine all request data
-        request_data = []
+        Each key and value is scanned on its own, stopping at the first match.
+        """
+        match = _resolve_path(request.path)
+        trusted = self.TRUSTED_RICH_TEXT_FIELDS.get(match.view_name, frozenset()) if match else frozenset()
         
-        # Add POST data
+        # POST data
         if hasattr(request, 'POST'):
-            for key, value in request.POST.items():
-                request_data.extend([key, str(value)])
-        
-        # Add GET parameters
-        for key, value in request.GET.items():
-            request_data.extend([key, str(value)])
-        
-        # Add headers (selective)
-        suspicious_headers = ['User-Agent', 'Referer', 'X-Forwarded-For']
-        for header in suspicious_headers:
-            value = request.META.get(f'HTTP_{header.upper().replace("-", "_")}')
-            if value:
-                request_data.append(value)
-        
-        # Check patterns
-        combined_data = ' '.join(request_data).lower()
-        
-        for pattern in self.SUSPICIOUS_PATTERNS:
-            if re.search(pattern, combined_data, re.IGNORECASE):
+            for key, values in request.POST.lists():
+                if self._is_suspicious(key):
+                    return True
+                if key in trusted:
+                    continue
+                for value in values:
+                    if self._is_suspicious(value):
+                        return True
+        
+        # GET parameters
+        for key, values in request.GET.lists():
+            if self._is_suspicious(key) or any(self._is_suspicious(value) for value in values):
                 return True
         
-        return False
+        # Headers (selective)
+        return any(self._is_suspicious(request.META.get(header)) for header in self.SCANNED_HEADERS)
+    
+    def _is_suspicious(self, value):
+        """Whether a single value matches a suspicious pattern or is over the field size cap."""
+        if not value:
+            return False
+        if len(value) > self.MAX_FIELD_LENGTH:
+            return True
+        return self.SUSPICIOUS_PATTERN.search(value.lower()) is not None
 
 
 class SessionSecurityMiddleware(MiddlewareMixin):
@@ -300,6 +365,17 @@ class SessionSecurityMiddleware(MiddlewareMixin):
         
         return False
     
+    @staticmethod
+    def _activity_is_stale(last_activity, now):
+        """Whether the activity stamp is older than the configured granularity."""
+        granularity = getattr(settings, 'SESSION_ACTIVITY_GRANULARITY', 60)
+        if not granularity or not last_activity:
+            return True
+        try:
+            return (now - datetime.fromisoformat(last_activity)).total_seconds() >= granularity
+        except (TypeError, ValueError):
+            return True
+    
     def _get_client_ip(self, request):
         """Get client IP address."""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -308,8 +384,16 @@ class SessionSecurityMiddleware(MiddlewareMixin):
         return request.META.get('REMOTE_ADDR', '')
     
     def _update_session_activity(self, request):
-        """Update session activity timestamp."""
-        request.session['last_activity'] = timezone.now().isoformat()
+        """
+        Update session activity timestamp.
+        
+        The stamp is rewritten at most once per SESSION_ACTIVITY_GRANULARITY
+        seconds (0 = every request), since each change is a session store
+        write. Each write also extends the session's expiry.
+        """
+        now = timezone.now()
+        if self._activity_is_stale(request.session.get('last_activity'), now):
+            request.session['last_activity'] = now.isoformat()
         
         # Store login metadata if not present
         if 'login_ip' not in request.session:
@@ -324,6 +408,8 @@ class FileUploadSecurityMiddleware(MiddlewareMixin):
     Additional security for file upload requests.
     """
     
+    UPLOAD_LIMIT = 10  # 10 uploads per minute
+    
     def process_request(self, request):
         """Validate file upload requests."""
         
@@ -332,9 +418,12 @@ class FileUploadSecurityMiddleware(MiddlewareMixin):
             return None
         
         # Check upload rate limiting
-        if self._is_upload_rate_limited(request):
+        result = self._check_upload_rate_limit(request)
+        if not result.allowed:
             logger.warning(f"Upload rate limit exceeded for {request.user}")
             response = HttpResponse("Upload rate limit exceeded", status=429)
+            if result.retry_after:
+                response['Retry-After'] = str(result.retry_after)
             return response
         
         # Validate file uploads
@@ -345,19 +434,13 @@ class FileUploadSecurityMiddleware(MiddlewareMixin):
         
         return None
     
-    def _is_upload_rate_limited(self, request):
+    def _check_upload_rate_limit(self, request):
         """Check upload-specific rate limiting."""
         if not request.user.is_authenticated:
-            return True  # Require authentication for uploads
-        
-        cache_key = f"upload_rate_limit_{request.user.id}"
-        upload_count = cache.get(cache_key, 0)
+            # Require authentication for uploads
+            return RateLimit(False, self.UPLOAD_LIMIT)
         
-        if upload_count >= 10:  # 10 uploads per minute
-            return True
-        
-        cache.set(cache_key, upload_count + 1, 60)
-        return False
+        return rate_limiter.hit('file_upload', f"user_{request.user.id}", self.UPLOAD_LIMIT, 60)
     
     def _validate_upload_request(self, request, uploaded_file):
         """Validate individual file upload."""
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_search_documents(apps, schema_editor):
+    """Index the users, jobs and posts that existed before the search index"""
+    from core.search_index import search_index
+
+    search_index.rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_blob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0008_profile_cover_photo'),
+        ('jobs', '0007_alter_application_resume'),
+        ('feed', '0009_alter_postattachment_file'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
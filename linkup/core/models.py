@@ -1,3 +1,53 @@
 from django.db import models
 
-# Create your models here.
+
+class SearchDocument(models.Model):
+    """
+    Precomputed search text for one user, job or post.
+
+    The backend-specific full-text index (tsvector + GIN on PostgreSQL,
+    FTS5 on SQLite) is built over ``title`` and ``body`` by the migration,
+    so a search is one indexed lookup instead of an icontains scan per field.
+    """
+    KIND_USER = 'user'
+    KIND_JOB = 'job'
+    KIND_POST = 'post'
+    KIND_CHOICES = [
+        (KIND_USER, 'User'),
+        (KIND_JOB, 'Job'),
+        (KIND_POST, 'Post'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    # Short, high-weight text used for ranking and prefix suggestions
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document')
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class Blob(models.Model):
+    """
+    One stored copy of an uploaded file, shared by every attachment with
+    the same content.
+
+    ``name`` is the file's path in ContentAddressedStorage and
+    ``ref_count`` the number of file fields pointing at it; the file is
+    removed when the last reference is deleted.
+    """
+    sha256 = models.CharField(max_length=64, db_index=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
@@ -3,11 +3,15 @@ Performance optimization utilities for the professional network platform.
 Implements query optimization, caching strategies, and performance monitoring.
 """
 
+import base64
+import binascii
+import json
 import time
 import logging
+from datetime import datetime
 from functools import wraps
-from django.core.cache import cache
 from django.db import connection
+from django.db.models import Q
 from django.conf import settings
 from django.http import JsonResponse
 from django.utils.decorators import method_decorator
@@ -15,6 +19,10 @@ from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_headers
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
+from .caching import tagged_cache
+from .metrics import http_request_duration, http_requests
+from .query_profiler import query_profiler
+
 logger = logging.getLogger(__name__)
 
 
@@ -98,6 +106,9 @@ class QueryOptimizer:
 class CacheManager:
     """
     Centralized cache management for the application.
+
+    Kept for existing callers; entries now go through core.caching, so they
+    are shared by all workers and invalidated by tag.
     """
     
     # Cache timeout configurations (in seconds)
@@ -111,6 +122,9 @@ class CacheManager:
         'static_content': 3600,   # 1 hour
     }
     
+    user_profiles = tagged_cache.namespace('user_profile', timeout=CACHE_TIMEOUTS['user_profile'])
+    search_results = tagged_cache.namespace('search_results', timeout=CACHE_TIMEOUTS['search_results'], l1=True)
+    
     @classmethod
     def get_cache_key(cls, prefix, *args):
         """Generate consistent cache keys."""
@@ -120,37 +134,27 @@ class CacheManager:
     @classmethod
     def cache_user_profile(cls, user_id, profile_data):
         """Cache user profile data."""
-        cache_key = cls.get_cache_key('user_profile', user_id)
-        cache.set(cache_key, profile_data, cls.CACHE_TIMEOUTS['user_profile'])
+        cls.user_profiles.set(user_id, profile_data, tags=[f'user:{user_id}'])
     
     @classmethod
     def get_cached_user_profile(cls, user_id):
         """Get cached user profile data."""
-        cache_key = cls.get_cache_key('user_profile', user_id)
-        return cache.get(cache_key)
+        return cls.user_profiles.get(user_id)
     
     @classmethod
     def invalidate_user_cache(cls, user_id):
-        """Invalidate all cache entries for a user."""
-        patterns = [
-            cls.get_cache_key('user_profile', user_id),
-            cls.get_cache_key('user_stats', user_id),
-            cls.get_cache_key('feed_posts', user_id),
-        ]
-        for pattern in patterns:
-            cache.delete(pattern)
+        """Invalidate all cache entries tagged with the user."""
+        tagged_cache.invalidate_tags(f'user:{user_id}')
     
     @classmethod
-    def cache_search_results(cls, query, results):
-        """Cache search results."""
-        cache_key = cls.get_cache_key('search_results', query)
-        cache.set(cache_key, results, cls.CACHE_TIMEOUTS['search_results'])
+    def cache_search_results(cls, query, results, tags=()):
+        """Cache search results, tagged with the objects they show."""
+        cls.search_results.set(query, results, tags=tags)
     
     @classmethod
     def get_cached_search_results(cls, query):
         """Get cached search results."""
-        cache_key = cls.get_cache_key('search_results', query)
-        return cache.get(cache_key)
+        return cls.search_results.get(query)
 
 
 def performance_monitor(func):
@@ -161,63 +165,50 @@ def performance_monitor(func):
     def wrapper(*args, **kwargs):
         start_time = time.time()
         
-        # Count initial queries
-        initial_queries = len(connection.queries)
-        
-        try:
-            result = func(*args, **kwargs)
-            
-            # Calculate performance metrics
-            execution_time = time.time() - start_time
-            query_count = len(connection.queries) - initial_queries
-            
-            # Log performance data
-            if execution_time > 1.0 or query_count > 10:  # Slow operation thresholds
-                logger.warning(
-                    f"Slow operation detected - Function: {func.__name__}, "
-                    f"Time: {execution_time:.2f}s, Queries: {query_count}"
+        # Count queries through the profiler; connection.queries is empty without DEBUG
+        with query_profiler.profile(func.__qualname__, record=False) as profile:
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                execution_time = time.time() - start_time
+                logger.error(
+                    f"Error in {func.__name__} after {execution_time:.2f}s: {str(e)}"
                 )
-            else:
-                logger.debug(
-                    f"Performance - Function: {func.__name__}, "
-                    f"Time: {execution_time:.2f}s, Queries: {query_count}"
-                )
-            
-            return result
-            
-        except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(
-                f"Error in {func.__name__} after {execution_time:.2f}s: {str(e)}"
+                raise
+        
+        # Calculate performance metrics
+        execution_time = time.time() - start_time
+        query_count = profile.query_count
+        
+        # Log performance data
+        if execution_time > 1.0 or query_count > 10:  # Slow operation thresholds
+            logger.warning(
+                f"Slow operation detected - Function: {func.__name__}, "
+                f"Time: {execution_time:.2f}s, Queries: {query_count}, "
+                f"Duplicates: {profile.duplicate_count}"
             )
-            raise
+        else:
+            logger.debug(
+                f"Performance - Function: {func.__name__}, "
+                f"Time: {execution_time:.2f}s, Queries: {query_count}"
+            )
+        
+        return result
     
     return wrapper
 
 
-def cache_result(timeout=300, key_prefix=''):
+def cache_result(timeout=300, key_prefix='', tags=None):
     """
     Decorator to cache function results.
+
+    Keys are digests of the function and its arguments, so every worker
+    shares the entry. ``tags`` is called with the same arguments and returns
+    the tags to invalidate the result by.
     """
     def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # Generate cache key from function name and arguments
-            cache_key = f"{key_prefix}:{func.__name__}:{hash(str(args) + str(kwargs))}"
-            
-            # Try to get from cache
-            result = cache.get(cache_key)
-            if result is not None:
-                logger.debug(f"Cache hit for {func.__name__}")
-                return result
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            logger.debug(f"Cache miss for {func.__name__}, result cached")
-            
-            return result
-        return wrapper
+        namespace = tagged_cache.namespace(key_prefix or func.__name__, timeout=timeout)
+        return namespace.cached(tags=tags)(func)
     return decorator
 
 
@@ -275,6 +266,126 @@ class OptimizedPaginator:
         }
 
 
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+class CursorPage:
+    """
+    One keyset page. Knows whether more rows follow without a COUNT.
+    """
+
+    def __init__(self, object_list, next_cursor=None, cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+    def has_next(self):
+        return self.has_more
+
+    def has_previous(self):
+        return self.cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over a ``(created_at, id)`` ordering.
+
+    Pages are addressed by an opaque cursor holding the last row seen, so
+    fetching a deep page is one index range read of ``per_page + 1`` rows,
+    the same cost as the first page. No COUNT is ever issued.
+    """
+
+    def __init__(self, queryset, per_page=25, optimize_func=None,
+                 time_field='created_at', id_field='id'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.optimize_func = optimize_func
+        self.time_field = time_field
+        self.id_field = id_field
+
+    @staticmethod
+    def encode_cursor(created_at, pk):
+        """Encode a ``(created_at, id)`` position as an opaque URL-safe token."""
+        payload = json.dumps([created_at.isoformat(), pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Decode a token from ``encode_cursor``; raises InvalidCursor if tampered with."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, binascii.Error, UnicodeDecodeError) as e:
+            raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+    def keyset_filter(self, created_at, pk):
+        """Rows strictly after ``(created_at, pk)`` in descending order."""
+        return (
+            Q(**{f'{self.time_field}__lt': created_at}) |
+            Q(**{self.time_field: created_at, f'{self.id_field}__lt': pk})
+        )
+
+    def cursor_for(self, obj):
+        """Cursor pointing just past ``obj`` (a model instance or a values() dict)."""
+        if isinstance(obj, dict):
+            return self.encode_cursor(obj[self.time_field], obj[self.id_field])
+        return self.encode_cursor(getattr(obj, self.time_field), getattr(obj, self.id_field))
+
+    def window(self, cursor=None):
+        """
+        Ordered queryset of up to ``per_page + 1`` rows after the cursor.
+
+        The extra row only tells whether another page exists.
+        """
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self.keyset_filter(*self.decode_cursor(cursor)))
+        if self.optimize_func:
+            queryset = self.optimize_func(queryset)
+        return queryset.order_by(f'-{self.time_field}', f'-{self.id_field}')[:self.per_page + 1]
+
+    def get_page(self, cursor=None):
+        """Get the page after ``cursor``; an invalid cursor falls back to the first page."""
+        try:
+            rows = list(self.window(cursor))
+        except InvalidCursor:
+            logger.warning(f"Ignoring invalid pagination cursor: {cursor!r}")
+            cursor = None
+            rows = list(self.window())
+
+        object_list = rows[:self.per_page]
+        next_cursor = self.cursor_for(object_list[-1]) if len(rows) > self.per_page else None
+        return CursorPage(object_list, next_cursor=next_cursor, cursor=cursor or None)
+
+    def get_page_data(self, cursor=None):
+        """Get page data with cursor metadata for API responses."""
+        page = self.get_page(cursor)
+
+        return {
+            'results': list(page.object_list),
+            'pagination': {
+                'per_page': self.per_page,
+                'has_more': page.has_more,
+                'next_cursor': page.next_cursor,
+            }
+        }
+
+
 class DatabaseOptimizer:
     """
     Database optimization utilities and query analysis.
@@ -345,34 +456,39 @@ def optimize_static_files():
 class PerformanceMiddleware:
     """
     Middleware to monitor and optimize performance across requests.
+    
+    Every request is profiled (see core/query_profiler.py): the response
+    carries a ``Server-Timing`` header, the totals feed per-view aggregates,
+    and slow or N+1-looking requests are sampled for the admin. Latency
+    per URL name is exported through core/metrics.py.
     """
     
+    METRIC_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+    
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
-        # Start timing
-        start_time = time.time()
-        initial_queries = len(connection.queries)
+        with query_profiler.profile(request.path, record=False) as profile:
+            response = self.get_response(request)
         
-        # Process request
-        response = self.get_response(request)
+        # Aggregate per view rather than per URL
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match and match.view_name else None
+        profile.label = view_name or request.path
+        query_profiler.record(profile)
         
-        # Calculate metrics
-        execution_time = time.time() - start_time
-        query_count = len(connection.queries) - initial_queries
+        # Unresolved paths and unknown methods share one label to keep metric cardinality bounded
+        method = request.method if request.method in self.METRIC_METHODS else 'other'
+        http_request_duration.observe(profile.elapsed, view=view_name or 'unresolved', method=method)
+        http_requests.inc(view=view_name or 'unresolved', status=f'{response.status_code // 100}xx')
+        
+        response['Server-Timing'] = profile.server_timing()
         
         # Add performance headers (for debugging)
         if settings.DEBUG:
-            response['X-Execution-Time'] = f"{execution_time:.3f}s"
-            response['X-Query-Count'] = str(query_count)
-        
-        # Log slow requests
-        if execution_time > 2.0 or query_count > 20:
-            logger.warning(
-                f"Slow request: {request.path} - "
-                f"Time: {execution_time:.2f}s, Queries: {query_count}"
-            )
+            response['X-Execution-Time'] = f"{profile.elapsed:.3f}s"
+            response['X-Query-Count'] = str(profile.query_count)
         
         return response
 
@@ -406,22 +522,23 @@ def bulk_update_optimized(objects, fields, batch_size=1000):
         model_class.objects.bulk_update(batch, fields)
 
 
-@cache_result(timeout=600, key_prefix='stats')
+@cache_result(timeout=600, key_prefix='stats', tags=lambda user_id: [f'user:{user_id}'])
 def get_dashboard_stats(user_id):
     """
     Get cached dashboard statistics for a user.
     """
     from django.contrib.auth import get_user_model
-    from messaging.models import Message, Notification
+    from messaging.models import UnreadCounter
     
     User = get_user_model()
     
     try:
         user = User.objects.get(id=user_id)
+        badge = UnreadCounter.badge(user.id)
         
         stats = {
-            'unread_messages': Message.objects.filter(recipient=user, is_read=False).count(),
-            'unread_notifications': Notification.objects.filter(recipient=user, is_read=False).count(),
+            'unread_messages': badge['messages'],
+            'unread_notifications': badge['notifications'],
             'total_connections': user.connections.count() if hasattr(user, 'connections') else 0,
             'profile_completeness': calculate_profile_completeness(user),
         }
@@ -0,0 +1,218 @@
+"""
+Always-on query profiling for requests and WebSocket events.
+
+``connection.queries`` is only populated when DEBUG is on, so query counts
+taken from it read 0 in production. Instead every database connection gets
+one execute wrapper (installed from CoreConfig.ready) that reports each
+query to the profiles active in the current context. Outside a profile the
+wrapper is a single context variable lookup.
+
+A profile counts queries, total database time and repeated SQL
+fingerprints, which is how N+1 patterns show up. Finished profiles feed
+per-label aggregates (one label per view or WebSocket event type), and
+slow or duplicate-heavy ones are sampled into a bounded ring buffer that
+staff can inspect from the admin. Both are per process; the per-label
+totals are also exported through core.metrics.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from .metrics import db_duplicate_queries, db_queries, db_query_seconds
+
+logger = logging.getLogger(__name__)
+
+_active_profiles: ContextVar[tuple] = ContextVar('active_query_profiles', default=())
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:\?|%s|NULL)\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql: str) -> str:
+    """SQL with literals and IN lists collapsed, so repeats of one query match."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """Query statistics for one request or WebSocket event."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.query_count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def add(self, sql: str, elapsed: float):
+        self.query_count += 1
+        self.db_time += elapsed
+        self.fingerprints[fingerprint(sql)] += 1
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    @property
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self.started
+
+    @property
+    def duplicate_count(self) -> int:
+        """Queries that repeated an earlier fingerprint within this profile."""
+        return sum(count - 1 for count in self.fingerprints.values() if count > 1)
+
+    def duplicates(self, limit: int = 5) -> List[Dict[str, Any]]:
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in self.fingerprints.most_common(limit) if count > 1
+        ]
+
+    def server_timing(self) -> str:
+        """Value for a ``Server-Timing`` response header."""
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries, '
+            f'{self.duplicate_count} duplicate", total;dur={self.elapsed * 1000:.1f}'
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'label': self.label,
+            'duration_ms': round(self.elapsed * 1000, 2),
+            'query_count': self.query_count,
+            'db_time_ms': round(self.db_time * 1000, 2),
+            'duplicate_count': self.duplicate_count,
+            'duplicates': self.duplicates(),
+        }
+
+
+def instrument(execute, sql, params, many, context):
+    """Execute wrapper feeding every active profile; a no-op when none are active."""
+    profiles = _active_profiles.get()
+    if not profiles:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        for profile in profiles:
+            profile.add(sql, elapsed)
+
+
+def install(connection, **kwargs):
+    """Attach the instrument to a database connection (connection_created receiver)."""
+    if instrument not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument)
+
+
+class QueryProfiler:
+    """Collects finished profiles into per-label aggregates and a slow-sample ring buffer."""
+
+    # Labels can come from client input (WebSocket frame types); cap how many are tracked
+    MAX_LABELS = 500
+    OVERFLOW_LABEL = 'other'
+
+    def __init__(self, sample_size: Optional[int] = None, slow_ms: Optional[float] = None,
+                 slow_queries: Optional[int] = None, duplicate_threshold: Optional[int] = None):
+        self.sample_size = sample_size or getattr(settings, 'QUERY_PROFILER_SAMPLE_SIZE', 100)
+        self.slow_ms = slow_ms or getattr(settings, 'QUERY_PROFILER_SLOW_MS', 500)
+        self.slow_queries = slow_queries or getattr(settings, 'QUERY_PROFILER_SLOW_QUERIES', 20)
+        self.duplicate_threshold = duplicate_threshold or getattr(settings, 'QUERY_PROFILER_DUPLICATE_THRESHOLD', 5)
+        self._samples = deque(maxlen=self.sample_size)
+        self._aggregates: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, label: str, record: bool = True):
+        """
+        Profile the queries run inside the block.
+
+        Works across ``database_sync_to_async`` calls, whose executor copies
+        the caller's context. Nested profiles each see every query.
+        """
+        profile = QueryProfile(label)
+        token = _active_profiles.set(_active_profiles.get() + (profile,))
+        try:
+            yield profile
+        finally:
+            _active_profiles.reset(token)
+            profile.finish()
+            if record:
+                self.record(profile)
+
+    def is_slow(self, profile: QueryProfile) -> bool:
+        return (
+            profile.elapsed * 1000 >= self.slow_ms
+            or profile.query_count >= self.slow_queries
+            or any(count >= self.duplicate_threshold for count in profile.fingerprints.values())
+        )
+
+    def record(self, profile: QueryProfile):
+        slow = self.is_slow(profile)
+        with self._lock:
+            label = profile.label
+            if label not in self._aggregates and len(self._aggregates) >= self.MAX_LABELS:
+                label = self.OVERFLOW_LABEL
+            stats = self._aggregates.setdefault(label, {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0,
+                'max_queries': 0, 'db_ms': 0.0, 'duplicates': 0, 'slow': 0,
+            })
+            duration_ms = profile.elapsed * 1000
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['queries'] += profile.query_count
+            stats['max_queries'] = max(stats['max_queries'], profile.query_count)
+            stats['db_ms'] += profile.db_time * 1000
+            stats['duplicates'] += profile.duplicate_count
+            if slow:
+                stats['slow'] += 1
+                sample = profile.to_dict()
+                sample['recorded_at'] = time.time()
+                self._samples.append(sample)
+        db_queries.inc(profile.query_count, source=label)
+        db_query_seconds.inc(profile.db_time, source=label)
+        if profile.duplicate_count:
+            db_duplicate_queries.inc(profile.duplicate_count, source=label)
+        if slow:
+            logger.warning(
+                f"Slow {profile.label}: {profile.elapsed:.2f}s, {profile.query_count} queries, "
+                f"{profile.duplicate_count} duplicate"
+            )
+
+    def samples(self) -> List[Dict[str, Any]]:
+        """Sampled slow profiles, newest first."""
+        with self._lock:
+            return list(reversed(self._samples))
+
+    def aggregates(self) -> List[Dict[str, Any]]:
+        """Per-label totals and averages, slowest average first."""
+        with self._lock:
+            rows = [dict(stats, label=label) for label, stats in self._aggregates.items()]
+        for row in rows:
+            row['avg_ms'] = round(row['total_ms'] / row['count'], 2)
+            row['avg_queries'] = round(row['queries'] / row['count'], 2)
+            row['avg_db_ms'] = round(row['db_ms'] / row['count'], 2)
+        return sorted(rows, key=lambda row: row['avg_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._aggregates.clear()
+
+
+# Global instance
+query_profiler = QueryProfiler()
@@ -0,0 +1,204 @@
+"""
+Sliding-window rate limiting shared by the HTTP middleware, upload checks
+and the WebSocket consumers.
+
+Each (scope, client) pair has one counter per fixed window in the cache.
+A check estimates the requests made during the last ``window`` seconds from
+the current counter plus the previous one, weighted by how much of the
+previous window still overlaps the sliding one. Unlike a counter whose TTL
+is reset on every hit, the window really slides, and a client is never
+allowed twice the limit across a window boundary.
+
+- On Redis (django_redis) the increment, its expiry, the read of the
+  previous counter and the decision are one Lua script: a single atomic
+  round trip per check.
+- On other backends (locmem in development and tests) the increment is
+  still an atomic ``incr``, followed by one ``get`` for the previous window.
+- Rejected hits are not counted, so a client that backs off recovers.
+- Optional local pre-filter: while a client's last known estimate is well
+  under its limit (below RATE_LIMIT_LOCAL_HEADROOM of it), up to
+  RATE_LIMIT_LOCAL_MAX_PENDING hits are counted in-process and added to the
+  shared counter with the client's next check. Clients near their limit
+  always go to the shared counter, so the pre-filter can only let through
+  hits that were obviously allowed.
+"""
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import rate_limited
+
+# KEYS: current window counter, previous window counter
+# ARGV: increment, counter TTL, weight of the previous window, limit
+SLIDING_WINDOW_SCRIPT = """
+local increment = tonumber(ARGV[1])
+local current = redis.call('INCRBY', KEYS[1], increment)
+if current == increment then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[3]) + current > tonumber(ARGV[4]) then
+    redis.call('DECR', KEYS[1])
+    return {0, current - 1, previous}
+end
+return {1, current, previous}
+"""
+
+
+def _setting(name, default):
+    return getattr(settings, f'RATE_LIMIT_{name}', default)
+
+
+@dataclass
+class RateLimit:
+    """Outcome of one rate limit check."""
+    allowed: bool
+    limit: int
+    count: float = 0.0  # Estimated hits in the sliding window, this one included if allowed
+    retry_after: int = 0  # Seconds until a rejected client may try again
+
+
+class RateLimiter:
+    """Sliding-window counters in the Django cache, one atomic operation per check."""
+
+    KEY_PREFIX = 'rate_limit'
+
+    def __init__(self, cache_backend=None, local_headroom: Optional[float] = None,
+                 local_max_pending: Optional[int] = None, local_max_clients: Optional[int] = None):
+        self.cache = cache_backend or cache
+        self.local_headroom = _setting('LOCAL_HEADROOM', 0.5) if local_headroom is None else local_headroom
+        self.local_max_pending = _setting('LOCAL_MAX_PENDING', 10) if local_max_pending is None else local_max_pending
+        self.local_max_clients = _setting('LOCAL_MAX_CLIENTS', 10000) if local_max_clients is None else local_max_clients
+        # key -> [window id, last shared estimate, hits not yet sent to the shared counter]
+        self._local: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self._script = None
+
+    def _key(self, scope: str, client_id: str) -> str:
+        return f'{self.KEY_PREFIX}_{scope}_{client_id}'
+
+    @staticmethod
+    def _window(window: int):
+        """Current window id and the weight of the previous window in the sliding one."""
+        now = time.time()
+        return int(now // window), 1.0 - (now % window) / window
+
+    def hit(self, scope: str, client_id: str, limit: int, window: int = 60) -> RateLimit:
+        """Count one hit for the client and say whether it is within ``limit`` per ``window`` seconds."""
+        key = self._key(scope, client_id)
+        window_id, weight = self._window(window)
+        increment = self._local_hit(key, window_id, limit)
+        if increment is None:
+            return RateLimit(True, limit)
+        return self._shared_hit(scope, key, window_id, weight, window, limit, increment)
+
+    async def ahit(self, scope: str, client_id: str, limit: int, window: int = 60) -> RateLimit:
+        """hit() for async code: the pre-filter runs inline, the shared counter in a thread."""
+        key = self._key(scope, client_id)
+        window_id, weight = self._window(window)
+        increment = self._local_hit(key, window_id, limit)
+        if increment is None:
+            return RateLimit(True, limit)
+        return await sync_to_async(self._shared_hit, thread_sensitive=False)(
+            scope, key, window_id, weight, window, limit, increment
+        )
+
+    def _local_hit(self, key: str, window_id: int, limit: int) -> Optional[int]:
+        """
+        None if the hit was absorbed by the pre-filter, otherwise the
+        increment to apply to the shared counter (this hit plus pending ones).
+        """
+        if not self.local_max_pending:
+            return 1
+        with self._lock:
+            state = self._local.get(key)
+            if state is None:
+                return 1
+            if (state[0] == window_id and state[2] < self.local_max_pending
+                    and state[1] + state[2] + 1 <= limit * self.local_headroom):
+                state[2] += 1
+                return None
+            pending, state[2] = state[2], 0
+            return pending + 1
+
+    def _remember(self, key: str, window_id: int, estimate: float):
+        if not self.local_max_pending:
+            return
+        with self._lock:
+            if key not in self._local and len(self._local) >= self.local_max_clients:
+                self._local.clear()
+            state = self._local.setdefault(key, [window_id, estimate, 0])
+            state[0], state[1] = window_id, estimate
+
+    def _shared_hit(self, scope: str, key: str, window_id: int, weight: float, window: int,
+                    limit: int, increment: int) -> RateLimit:
+        current_key = f'{key}_{window_id}'
+        previous_key = f'{key}_{window_id - 1}'
+        client = self._redis_client()
+        if client is not None:
+            if self._script is None:
+                self._script = client.register_script(SLIDING_WINDOW_SCRIPT)
+            allowed, current, previous = self._script(
+                keys=[self.cache.make_key(current_key), self.cache.make_key(previous_key)],
+                args=[increment, window * 2, weight, limit],
+                client=client,
+            )
+            allowed = bool(allowed)
+        else:
+            current = self._incr(current_key, increment, window * 2)
+            previous = self.cache.get(previous_key, 0)
+            allowed = previous * weight + current <= limit
+            if not allowed:
+                current = self.cache.decr(current_key)
+
+        estimate = previous * weight + current
+        self._remember(key, window_id, estimate)
+        if allowed:
+            return RateLimit(True, limit, estimate)
+        rate_limited.inc(scope=scope)
+        return RateLimit(False, limit, estimate, self._retry_after(current, previous, weight, window, limit))
+
+    def _redis_client(self):
+        """The raw Redis client behind a django_redis cache, or None for other backends."""
+        client = getattr(self.cache, 'client', None)
+        if client is None or not hasattr(client, 'get_client'):
+            return None
+        return client.get_client(write=True)
+
+    def _incr(self, key: str, increment: int, timeout: int) -> int:
+        try:
+            return self.cache.incr(key, increment)
+        except ValueError:
+            if self.cache.add(key, increment, timeout):
+                return increment
+            return self.cache.incr(key, increment)
+
+    @staticmethod
+    def _retry_after(current: int, previous: int, weight: float, window: int, limit: int) -> int:
+        """Seconds until one more hit fits, assuming the client stops meanwhile."""
+        elapsed = (1.0 - weight) * window
+        if current + 1 > limit or not previous:
+            # Only once this window's hits have mostly slid out
+            return max(1, math.ceil(window - elapsed))
+        # The previous window's weight has to drop to (limit - current - 1) / previous
+        target = max(limit - current - 1, 0) / previous
+        return max(1, math.ceil((weight - target) * window))
+
+    def reset(self, scope: str, client_id: str, window: int = 60):
+        """Forget a client's hits (e.g. after a successful login)."""
+        key = self._key(scope, client_id)
+        window_id, _ = self._window(window)
+        self.cache.delete_many([f'{key}_{window_id}', f'{key}_{window_id - 1}'])
+        with self._lock:
+            self._local.pop(key, None)
+
+
+# Global instance
+rate_limiter = RateLimiter()
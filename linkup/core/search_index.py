@@ -0,0 +1,306 @@
+"""
+Full-text search over precomputed search documents.
+
+Every user, active job and post has one SearchDocument row holding its
+searchable text, kept fresh by the signal handlers in core.signals. They
+only mark objects dirty; each dirty object is reindexed once, after the
+transaction that changed it commits. The
+documents table carries a full-text index built by the core migrations:
+a weighted tsvector with a GIN index on PostgreSQL and an FTS5 table on
+SQLite. A search is one ranked, indexed lookup returning object ids, which
+the caller then hydrates in a single query.
+"""
+
+import logging
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils.html import strip_tags
+
+from .models import SearchDocument
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+
+SQLITE_FTS_TABLE = 'core_searchdocument_fts'
+
+
+def tokenize(query: str) -> List[str]:
+    """Split a query into unique lowercase word tokens that are safe to embed in a full-text query."""
+    terms = []
+    for term in TOKEN_RE.findall((query or '').lower()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _join(*parts) -> str:
+    return ' '.join(str(part) for part in parts if part)
+
+
+# Document builders
+
+def user_document(user) -> Dict[str, str]:
+    """Searchable text for a user: names, profile, experience and education."""
+    try:
+        profile = user.profile
+    except Exception:
+        profile = None
+
+    parts = [user.username, user.first_name, user.last_name]
+    if profile is not None:
+        parts += [profile.headline, profile.bio, profile.location]
+    for exp in user.experiences.all():
+        parts += [exp.title, exp.company, exp.description]
+    for edu in user.educations.all():
+        parts += [edu.school, edu.degree, edu.field_of_study]
+
+    return {
+        'title': _join(user.first_name, user.last_name, user.username)[:255],
+        'body': _join(*parts),
+    }
+
+
+def job_document(job) -> Dict[str, str]:
+    """Searchable text for a job posting."""
+    return {
+        'title': _join(job.title, job.company)[:255],
+        'body': _join(
+            job.description, job.requirements, job.location,
+            job.workplace_type, job.get_workplace_type_display(),
+            job.job_type, job.get_job_type_display(),
+        ),
+    }
+
+
+def post_document(post) -> Dict[str, str]:
+    """Searchable text for a post, with the rich-text markup stripped."""
+    return {'title': '', 'body': strip_tags(post.content or '')}
+
+
+# Backends
+
+class SearchBackend:
+    """
+    Portable fallback for databases without a full-text index.
+
+    Still a single-table scan over the documents instead of icontains
+    across a dozen joined columns.
+    """
+
+    def search(self, kind: str, terms: List[str], limit: int, prefix_title: bool = False) -> List[int]:
+        condition = Q()
+        for term in terms:
+            if prefix_title:
+                condition &= Q(title__icontains=term)
+            else:
+                condition |= Q(title__icontains=term) | Q(body__icontains=term)
+        return list(
+            SearchDocument.objects.filter(condition, kind=kind)
+            .order_by('-object_id')
+            .values_list('object_id', flat=True)[:limit]
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Ranked lookups against the GIN-indexed ``search_vector`` column."""
+
+    def search(self, kind, terms, limit, prefix_title=False):
+        if prefix_title:
+            # Every term must prefix-match a word of the title (weight A)
+            tsquery = ' & '.join(f'{term}:*A' for term in terms)
+        else:
+            tsquery = ' | '.join(f'{term}:*' for term in terms)
+        sql = (
+            "SELECT object_id FROM core_searchdocument, to_tsquery('simple', %s) query "
+            "WHERE kind = %s AND search_vector @@ query "
+            "ORDER BY ts_rank(search_vector, query) DESC, object_id DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, kind, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SqliteSearchBackend(SearchBackend):
+    """Ranked lookups against the FTS5 table kept in step by triggers."""
+
+    def search(self, kind, terms, limit, prefix_title=False):
+        quoted = [f'"{term}"*' for term in terms]
+        if prefix_title:
+            match = f"title : ({' AND '.join(quoted)})"
+        else:
+            match = ' OR '.join(quoted)
+        sql = (
+            f"SELECT d.object_id FROM {SQLITE_FTS_TABLE} "
+            f"JOIN core_searchdocument d ON d.id = {SQLITE_FTS_TABLE}.rowid "
+            f"WHERE {SQLITE_FTS_TABLE} MATCH %s AND d.kind = %s "
+            f"ORDER BY bm25({SQLITE_FTS_TABLE}, 10.0, 1.0), d.object_id DESC LIMIT %s"
+        )
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [match, kind, limit])
+                return [row[0] for row in cursor.fetchall()]
+        except DatabaseError as e:
+            # SQLite builds without FTS5 never got the virtual table
+            logger.warning(f"FTS5 search unavailable, falling back to a table scan: {e}")
+            return super().search(kind, terms, limit, prefix_title)
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+class SearchIndex:
+    """Maintains search documents and answers ranked and prefix queries."""
+
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._backends = {}
+        self._local = threading.local()
+
+    @property
+    def backend(self) -> SearchBackend:
+        vendor = connection.vendor
+        if vendor not in self._backends:
+            self._backends[vendor] = BACKENDS.get(vendor, SearchBackend)()
+        return self._backends[vendor]
+
+    # Writes
+
+    def _write(self, kind: str, object_id: int, document: Optional[Dict[str, str]]):
+        try:
+            with transaction.atomic():
+                if document is None:
+                    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+                else:
+                    SearchDocument.objects.update_or_create(kind=kind, object_id=object_id, defaults=document)
+        except Exception as e:
+            # A stale document is better than a failed save of the source row
+            logger.error(f"Error indexing {kind} {object_id}: {e}")
+
+    def index_user(self, user):
+        self._write(SearchDocument.KIND_USER, user.pk, user_document(user))
+
+    def index_job(self, job):
+        self._write(SearchDocument.KIND_JOB, job.pk, job_document(job) if job.is_active else None)
+
+    def index_post(self, post):
+        self._write(SearchDocument.KIND_POST, post.pk, post_document(post))
+
+    def remove(self, kind: str, object_id: int):
+        self._write(kind, object_id, None)
+
+    def schedule(self, kind: str, object_id: int):
+        """
+        Reindex an object once the current transaction commits (immediately
+        in autocommit). Repeats within one transaction are merged, so saving
+        a user, their profile and experiences writes the document once.
+        """
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = set()
+        self._local.pending.add((kind, object_id))
+        # The first callback to run flushes everything; the rest find nothing left.
+        # Keys left behind by a rolled back transaction are just reindexed later.
+        transaction.on_commit(self.flush_pending)
+
+    def flush_pending(self):
+        pending = getattr(self._local, 'pending', None)
+        if not pending:
+            return
+        self._local.pending = set()
+        for kind, object_id in pending:
+            self.reindex(kind, object_id)
+
+    def reindex(self, kind: str, object_id: int):
+        """Rebuild one document from the current row, or drop it if the row is gone."""
+        from feed.models import Post
+        from jobs.models import Job
+
+        sources = {
+            SearchDocument.KIND_USER: (
+                get_user_model().objects.select_related('profile').prefetch_related('experiences', 'educations'),
+                self.index_user,
+            ),
+            SearchDocument.KIND_JOB: (Job.objects.all(), self.index_job),
+            SearchDocument.KIND_POST: (Post.objects.all(), self.index_post),
+        }
+        queryset, index = sources[kind]
+        obj = queryset.filter(pk=object_id).first()
+        if obj is None:
+            self.remove(kind, object_id)
+        else:
+            index(obj)
+
+    def rebuild(self, kinds: Optional[Iterable[str]] = None, apps=None) -> int:
+        """
+        Rebuild documents from scratch, e.g. after bulk loads that skip signals.
+        A data migration passes its app registry to build from historical models.
+        """
+        apps = apps or global_apps
+        Document = apps.get_model('core', 'SearchDocument')
+        User = apps.get_model(settings.AUTH_USER_MODEL)
+        Job = apps.get_model('jobs', 'Job')
+        Post = apps.get_model('feed', 'Post')
+
+        sources = {
+            SearchDocument.KIND_USER: (
+                User.objects.select_related('profile').prefetch_related('experiences', 'educations'),
+                user_document,
+            ),
+            SearchDocument.KIND_JOB: (Job.objects.filter(is_active=True), job_document),
+            SearchDocument.KIND_POST: (Post.objects.all(), post_document),
+        }
+        total = 0
+        for kind in kinds or sources:
+            queryset, build = sources[kind]
+            with transaction.atomic():
+                Document.objects.filter(kind=kind).delete()
+                batch = []
+                for obj in queryset.iterator(chunk_size=self.BATCH_SIZE):
+                    batch.append(Document(kind=kind, object_id=obj.pk, **build(obj)))
+                    if len(batch) >= self.BATCH_SIZE:
+                        Document.objects.bulk_create(batch)
+                        total += len(batch)
+                        batch = []
+                Document.objects.bulk_create(batch)
+                total += len(batch)
+        return total
+
+    # Reads
+
+    def search(self, kind: str, query: str, limit: int = 50) -> List[int]:
+        """Object ids whose document matches any query term (prefix match), best first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        return self.backend.search(kind, terms, limit)
+
+    def suggest(self, kind: str, query: str, limit: int = 5) -> List[int]:
+        """Object ids whose title prefix-matches every query term, for typeahead."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        return self.backend.search(kind, terms, limit, prefix_title=True)
+
+    @staticmethod
+    def hydrate(queryset, object_ids: List[int]) -> list:
+        """Load the matched objects in one query, keeping the ranked order."""
+        if not object_ids:
+            return []
+        by_id = {obj.pk: obj for obj in queryset.filter(pk__in=object_ids)}
+        return [by_id[object_id] for object_id in object_ids if object_id in by_id]
+
+
+# Global instance
+search_index = SearchIndex()
@@ -0,0 +1,107 @@
+"""
+Signal handlers that keep search documents, tagged cache entries and blob
+reference counts in step with users, jobs, posts and attachments
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import FileField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from feed.models import Post, PostAttachment
+from jobs.models import Application, Job
+from messaging.models import Message
+from users.models import Education, Experience, Profile
+from .caching import tagged_cache
+from .models import SearchDocument
+from .search_index import search_index
+from .storage import ContentAddressedStorage
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, created=False, update_fields=None, **kwargs):
+    """Reindex a user unless only login bookkeeping changed"""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if created:
+        return  # Creating the user creates its profile, whose handler reindexes
+    search_index.schedule(SearchDocument.KIND_USER, instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def remove_user(sender, instance, **kwargs):
+    search_index.schedule(SearchDocument.KIND_USER, instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Experience)
+@receiver(post_save, sender=Education)
+@receiver(post_delete, sender=Experience)
+@receiver(post_delete, sender=Education)
+def reindex_profile_owner(sender, instance, created=False, **kwargs):
+    """Profile, experience and education text is part of the owner's document"""
+    if created and sender is Profile:
+        return  # Created by users.models.create_profile, which save_profile saves again right away
+    search_index.schedule(SearchDocument.KIND_USER, instance.user_id)
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def index_job(sender, instance, **kwargs):
+    search_index.schedule(SearchDocument.KIND_JOB, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search_index.schedule(SearchDocument.KIND_POST, instance.pk)
+
+
+# Cache tags. Invalidation waits for the commit so a concurrent reader can't
+# re-cache the old row under the new tag version.
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    tagged_cache.invalidate_tags_on_commit(f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Experience)
+@receiver(post_save, sender=Education)
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=Experience)
+@receiver(post_delete, sender=Education)
+def invalidate_profile_owner(sender, instance, **kwargs):
+    tagged_cache.invalidate_tags_on_commit(f'user:{instance.user_id}')
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def invalidate_job(sender, instance, **kwargs):
+    tagged_cache.invalidate_tags_on_commit(f'job:{instance.pk}')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    tagged_cache.invalidate_tags_on_commit(f'post:{instance.pk}')
+
+
+# Blob references. Runs for queryset deletes and cascades too, which never
+# call FieldFile.delete().
+
+@receiver(post_delete, sender=PostAttachment)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Application)
+def release_blobs(sender, instance, **kwargs):
+    """Drop the deleted row's references to its shared attachment files"""
+    for field in sender._meta.concrete_fields:
+        if not (isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)):
+            continue
+        name = getattr(instance, field.attname)
+        if name:
+            field.storage.delete(str(name))
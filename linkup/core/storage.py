@@ -0,0 +1,113 @@
+"""
+Content-addressed file storage for user uploads.
+
+Every upload is stored once per SHA-256 digest under ``blobs/``. A file
+field saved through ContentAddressedStorage gets a name of the form
+``blobs/<digest>/<original filename>``, so it still displays the name it
+was uploaded under, while the bytes live in a single shared file tracked
+by a Blob row with a reference count. Saving a duplicate only bumps the
+count; deleting a field's file drops one reference and removes the
+shared file when nothing points at it any more.
+
+Names written before this storage was introduced are served unchanged.
+"""
+
+import logging
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .validators import scan_upload
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = 'blobs'
+BLOB_NAME_RE = re.compile(rf'^{BLOB_PREFIX}/(?P<digest>[0-9a-f]{{64}})/(?P<filename>[^/]+)$')
+MAX_NAME_LENGTH = 255
+
+
+def blob_path(digest: str, extension: str) -> str:
+    """Physical path of the shared file holding content with this digest."""
+    return f"{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that deduplicates uploads by content hash."""
+
+    def _physical_name(self, name):
+        match = BLOB_NAME_RE.match(name.replace('\\', '/'))
+        if not match:
+            return name
+        extension = os.path.splitext(match.group('filename'))[1].lower()
+        return blob_path(match.group('digest'), extension)
+
+    def path(self, name):
+        return super().path(self._physical_name(name))
+
+    def url(self, name):
+        return super().url(self._physical_name(name))
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        # Reuses the digest computed by the upload validator when there is one
+        scan = scan_upload(content)
+        filename = os.path.basename(name)
+        stem, extension = os.path.splitext(filename)
+        physical = blob_path(scan.sha256, extension.lower())
+
+        if not super().exists(physical):
+            stored = super()._save(physical, content)
+            if stored != physical:
+                # Lost a race with an identical upload; keep the first copy
+                super().delete(stored)
+
+        updated = Blob.objects.filter(name=physical).update(ref_count=F('ref_count') + 1)
+        if not updated:
+            blob, created = Blob.objects.get_or_create(
+                name=physical, defaults={'sha256': scan.sha256, 'size': scan.size, 'ref_count': 1}
+            )
+            if not created:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+        prefix = f"{BLOB_PREFIX}/{scan.sha256}/"
+        stem = stem[:max(MAX_NAME_LENGTH - len(prefix) - len(extension), 1)]
+        return f"{prefix}{stem}{extension}"
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        physical = self._physical_name(name)
+        if physical == name:
+            return super().delete(name)
+        self.release(physical)
+
+    def release(self, physical):
+        """Drop one reference to a shared file, removing it after the last one."""
+        from .models import Blob
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=physical).first()
+            if blob is None:
+                logger.warning(f"Released unknown blob {physical}")
+                return
+            if blob.ref_count > 1:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+                return
+            blob.delete()
+
+        def remove_file():
+            # An identical upload may have re-created the blob meanwhile
+            if not Blob.objects.filter(name=physical).exists():
+                super(ContentAddressedStorage, self).delete(physical)
+
+        transaction.on_commit(remove_file)
+
+
+# Storage for attachment file fields
+blob_storage = ContentAddressedStorage()
@@ -0,0 +1,49 @@
+"""
+Test runner keeping in-process background writers away from the test database.
+
+Outside tests the error sink flushes from a background thread and the
+notification outbox is drained by the process_notifications worker. Under
+test the sink runs in 'manual' mode, and whatever a test left queued in the
+global sink is discarded after that test, so no test writes, or sees, another
+test's records; the outbox drains inline on commit, so tests see their
+notifications without a worker.
+"""
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_SETTINGS = {
+    'MESSAGING_ERROR_SINK_MODE': 'manual',
+    'NOTIFICATION_OUTBOX_MODE': 'inline',
+}
+
+
+def discard_queued_errors():
+    from messaging.error_sink import error_sink
+
+    error_sink.discard()
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(**TEST_SETTINGS)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def build_suite(self, *args, **kwargs):
+        suite = super().build_suite(*args, **kwargs)
+        for test in _iter_tests(suite):
+            test.addCleanup(discard_queued_errors)
+        return suite
+
+
+def _iter_tests(suite):
+    for test in suite:
+        if hasattr(test, '__iter__'):
+            yield from _iter_tests(test)
+        else:
+            yield test
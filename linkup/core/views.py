@@ -15,6 +15,7 @@ from feed.models import Post
 from jobs.models import Job
 from users.models import Experience, Education
 from core.performance import CacheManager, performance_monitor
+from core.search_index import search_index
 
 User = get_user_model()
 
@@ -28,13 +29,27 @@ def search(request):
     search_type = request.GET.get('type', 'all')  # all, people, jobs, posts
     page = request.GET.get('page', 1)
     
-    # Check cache first
-    if query:
-        cached_results = CacheManager.get_cached_search_results(f"{query}_{search_type}_{page}")
-        if cached_results:
-            return JsonResponse(cached_results) if request.headers.get('X-Requested-With') == 'XMLHttpRequest' else render(request, 'core/search.html', cached_results)
+    if query and len(query) >= 2:  # Minimum 2 characters for search
+        # When a popular search expires, one request recomputes it while the
+        # others wait for it or are served the previous results
+        tags = set()
+        results = CacheManager.search_results.get_or_compute(
+            (query, search_type, page),
+            lambda: _search_results(query, search_type, tags),
+            tags=lambda results: tags,
+        )
+    else:
+        results = _empty_search_results(query, search_type)
     
-    results = {
+    # Handle AJAX requests
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse(results)
+    
+    return render(request, 'core/search.html', results)
+
+
+def _empty_search_results(query, search_type):
+    return {
         'query': query,
         'search_type': search_type,
         'users': [],
@@ -46,50 +61,59 @@ def search(request):
         'suggestions': [],
         'has_results': False
     }
-    
-    if query and len(query) >= 2:  # Minimum 2 characters for search
-        # Search people with enhanced matching
-        if search_type in ['all', 'people']:
-            users_query = _build_user_search_query(query)
-            users = users_query.select_related('profile').prefetch_related(
-                'experiences', 'educations'
-            ).distinct()[:50]  # Limit for performance
-            
-            results['users'] = _format_user_results(users, query)
-            results['total_users'] = len(results['users'])
-        
-        # Search jobs with comprehensive matching
-        if search_type in ['all', 'jobs']:
-            jobs_query = _build_job_search_query(query)
-            jobs = jobs_query.select_related('posted_by', 'posted_by__profile').distinct()[:50]
-            
-            results['jobs'] = _format_job_results(jobs, query)
-            results['total_jobs'] = len(results['jobs'])
-        
-        # Search posts with content matching
-        if search_type in ['all', 'posts']:
-            posts_query = _build_post_search_query(query)
-            posts = posts_query.select_related('user', 'user__profile').prefetch_related('likes')[:50]
-            
-            results['posts'] = _format_post_results(posts, query)
-            results['total_posts'] = len(results['posts'])
+
+
+def _search_results(query, search_type, tags):
+    """Run a search, adding the tag of every object shown to ``tags``."""
+    results = _empty_search_results(query, search_type)
+    
+    # Search people with enhanced matching
+    if search_type in ['all', 'people']:
+        users = search_index.hydrate(
+            User.objects.select_related('profile').prefetch_related('experiences', 'educations'),
+            search_index.search('user', query, limit=50)
+        )
         
-        # Check if we have any results
-        results['has_results'] = any([results['total_users'], results['total_jobs'], results['total_posts']])
+        results['users'] = _format_user_results(users, query)
+        tags.update(f'user:{user.id}' for user in users)
+        results['total_users'] = len(results['users'])
+    
+    # Search jobs with comprehensive matching
+    if search_type in ['all', 'jobs']:
+        jobs = search_index.hydrate(
+            Job.objects.filter(is_active=True).select_related('posted_by', 'posted_by__profile'),
+            search_index.search('job', query, limit=50)
+        )
         
-        # Generate suggestions if no results
-        if not results['has_results']:
-            results['suggestions'] = _generate_search_suggestions(query)
+        results['jobs'] = _format_job_results(jobs, query)
+        tags.update(f'job:{job.id}' for job in jobs)
+        tags.update(f'user:{job.posted_by_id}' for job in jobs)
+        results['total_jobs'] = len(results['jobs'])
+    
+    # Search posts with content matching
+    if search_type in ['all', 'posts']:
+        posts = search_index.hydrate(
+            Post.objects.select_related('user', 'user__profile'),
+            search_index.search('post', query, limit=50)
+        )
         
-        # Cache results
-        CacheManager.cache_search_results(f"{query}_{search_type}_{page}", results)
+        results['posts'] = _format_post_results(posts, query)
+        tags.update(f'post:{post.id}' for post in posts)
+        tags.update(f'user:{post.user_id}' for post in posts)
+        results['total_posts'] = len(results['posts'])
     
-    # Handle AJAX requests
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return JsonResponse(results)
+    # Check if we have any results
+    results['has_results'] = any([results['total_users'], results['total_jobs'], results['total_posts']])
     
-    return render(request, 'core/search.html', results)
+    # Generate suggestions if no results
+    if not results['has_results']:
+        results['suggestions'] = _generate_search_suggestions(query)
+    
+    return results
+
 
+# The icontains query builders below are the pre-index search path. Views
+# use core.search_index; benchmark_search keeps these to compare against.
 
 def _build_user_search_query(query):
     """Build comprehensive user search query with relevance scoring."""
@@ -187,8 +211,8 @@ def _format_user_results(users, query):
     """Format user search results with highlighting."""
     results = []
     for user in users:
-        # Get user's current position
-        current_experience = user.experiences.filter(is_current=True).first()
+        # Get user's current position from the prefetched experiences
+        current_experience = next((exp for exp in user.experiences.all() if exp.is_current), None)
         
         result = {
             'id': user.id,
@@ -244,7 +268,7 @@ def _format_post_results(posts, query):
             'author': post.user.username,
             'author_name': f"{post.user.first_name} {post.user.last_name}".strip(),
             'created_at': post.created_at,
-            'likes_count': post.likes.count(),
+            'likes_count': post.like_count,
             'highlighted_content': _highlight_text(clean_content, query),
             'author_avatar': post.user.profile.avatar.url if hasattr(post.user, 'profile') and post.user.profile.avatar else None,
             'post_url': f'/post/{post.id}/',
@@ -362,13 +386,10 @@ def search_suggestions(request):
     
     suggestions = []
     
-    # Get user suggestions
-    users = User.objects.filter(
-        Q(username__icontains=query) |
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query) |
-        Q(profile__headline__icontains=query)
-    ).select_related('profile')[:5]
+    # Get user suggestions (prefix match on names)
+    users = search_index.hydrate(
+        User.objects.select_related('profile'), search_index.suggest('user', query, limit=5)
+    )
     
     for user in users:
         suggestions.append({
@@ -378,12 +399,10 @@ def search_suggestions(request):
             'url': f'/users/{user.username}/'
         })
     
-    # Get job suggestions
-    jobs = Job.objects.filter(
-        Q(title__icontains=query) |
-        Q(company__icontains=query),
-        is_active=True
-    )[:5]
+    # Get job suggestions (prefix match on title and company)
+    jobs = search_index.hydrate(
+        Job.objects.filter(is_active=True), search_index.suggest('job', query, limit=5)
+    )
     
     for job in jobs:
         suggestions.append({
@@ -395,7 +414,8 @@ def search_suggestions(request):
     
     # Get company suggestions
     companies = Job.objects.filter(
-        company__icontains=query,
+        id__in=search_index.suggest('job', query, limit=20),
+        company__istartswith=query.split()[0],
         is_active=True
     ).values_list('company', flat=True).distinct()[:3]
     
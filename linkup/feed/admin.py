@@ -4,6 +4,7 @@ from django.utils.text import Truncator
 from django.utils.translation import ngettext
 from django.shortcuts import render
 import bleach
+from .forms import ALLOWED_ATTRIBUTES, ALLOWED_TAGS
 from .models import Post, Comment
 import sys
 import os
@@ -55,15 +56,9 @@ class PostAdmin(admin.ModelAdmin, ExportCSVMixin):
         }),
     )
 
-    # Allowed tags/attributes for sanitization (conservative set)
-    ALLOWED_TAGS = [
-        'p', 'br', 'strong', 'em', 'ul', 'ol', 'li', 'a', 'blockquote', 'code', 'pre', 
-        'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'img'
-    ]
-    ALLOWED_ATTRIBUTES = {
-        'a': ['href', 'title', 'rel', 'target'],
-        'img': ['src', 'alt', 'title', 'width', 'height'],
-    }
+    # Allowed tags/attributes for sanitization (the set new posts are cleaned with)
+    ALLOWED_TAGS = ALLOWED_TAGS
+    ALLOWED_ATTRIBUTES = ALLOWED_ATTRIBUTES
 
     def short_content(self, obj):
         text = strip_tags(obj.content or '')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FeedConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'feed'
+
+    def ready(self):
+        """Register timeline signal handlers"""
+        from . import signals  # noqa: F401
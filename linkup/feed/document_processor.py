@@ -1,8 +1,24 @@
+"""
+PDF page rendering for document attachments.
+
+Uploads never render inline. They queue a DocumentRenderJob for the first
+DOCUMENT_EAGER_PAGES pages, and later pages are queued when a viewer asks
+for them. The render_documents worker (the Procfile's render process)
+claims jobs, renders their pages in a process pool to WebP/JPEG images plus
+thumbnails, and bulk-inserts the DocumentPage rows.
+"""
+
 import os
 import logging
+from datetime import timedelta
 from io import BytesIO
-from django.core.files.base import ContentFile
+from typing import Dict, List, Optional, Tuple
+
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
@@ -13,55 +29,225 @@ except ImportError:
     HAS_FITZ = False
     fitz = None
 
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
-def extract_pdf_pages(attachment):
-    """Extract each page of a PDF as a thumbnail image and create DocumentPage records.
+MAX_ATTEMPTS = 3
 
-    Returns the number of pages extracted, or 0 if processing is skipped.
-    """
-    if not HAS_FITZ:
-        logger.warning("PyMuPDF not installed — skipping PDF page extraction")
-        return 0
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def render_options() -> Dict:
+    """Rendering settings, resolved in the parent so pool workers need no Django setup."""
+    image_format = getattr(settings, 'DOCUMENT_RENDER_FORMAT', 'WEBP').upper()
+    if image_format not in FORMAT_EXTENSIONS:
+        image_format = 'JPEG'
+    return {
+        'format': image_format,
+        'quality': getattr(settings, 'DOCUMENT_RENDER_QUALITY', 80),
+        'page_width': getattr(settings, 'DOCUMENT_PAGE_WIDTH', 1200),
+        'thumbnail_width': getattr(settings, 'DOCUMENT_THUMBNAIL_WIDTH', 320),
+    }
+
+
+def eager_pages() -> int:
+    return getattr(settings, 'DOCUMENT_EAGER_PAGES', 3)
+
+
+def is_pdf(attachment) -> bool:
+    return os.path.splitext(attachment.file.name)[1].lower() == '.pdf'
 
-    ext = os.path.splitext(attachment.file.name)[1].lower()
-    if ext != '.pdf':
-        return 0
 
+# Rendering (runs inside pool workers: no ORM access)
+
+def _encode(image, options) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, options['format'], quality=options['quality'])
+    return buffer.getvalue()
+
+
+def render_page_range(pdf_bytes: bytes, first_page: int, last_page: int,
+                      options: Dict) -> Tuple[int, List[Tuple[int, int, int, bytes, bytes]]]:
+    """
+    Render pages ``first_page``..``last_page`` (1-based, inclusive) of a PDF.
+
+    Returns the document's page count and one
+    ``(page_number, width, height, image_bytes, thumbnail_bytes)`` per page.
+    """
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     try:
-        attachment.file.seek(0)
-        pdf_bytes = attachment.file.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    except Exception as e:
-        logger.error("Failed to open PDF %s: %s", attachment.file.name, e)
-        return 0
+        page_count = len(doc)
+        rendered = []
+        for page_number in range(first_page, min(last_page, page_count) + 1):
+            page = doc.load_page(page_number - 1)
+            zoom = options['page_width'] / max(page.rect.width, 1)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
 
-    from .models import DocumentPage
+            thumbnail = image.copy()
+            thumbnail.thumbnail((options['thumbnail_width'], options['thumbnail_width'] * 4))
 
-    pages_created = 0
-    for page_num in range(len(doc)):
-        try:
-            page = doc.load_page(page_num)
+            rendered.append((page_number, pix.width, pix.height, _encode(image, options), _encode(thumbnail, options)))
+        return page_count, rendered
+    finally:
+        doc.close()
 
-            render_params = {"matrix": fitz.Matrix(2, 2), "dpi": 144}
-            pix = page.get_pixmap(**render_params)
 
-            img_bytes = pix.tobytes("png")
-            filename = f"page_{attachment.id}_{page_num + 1:03d}.png"
+# Queue
 
-            page_record = DocumentPage(
-                attachment=attachment,
-                page_number=page_num + 1,
-                width=pix.width,
-                height=pix.height,
-            )
-            page_record.image.save(filename, ContentFile(img_bytes), save=False)
-            page_record.save()
-            pages_created += 1
+def enqueue_document(attachment, first_page: int = 1, last_page: Optional[int] = None):
+    """
+    Queue pages of a PDF attachment for rendering.
 
-        except Exception as e:
-            logger.error("Failed to extract page %d of %s: %s", page_num + 1, attachment.file.name, e)
+    Defaults to the first DOCUMENT_EAGER_PAGES pages. Ranges that are
+    already rendered or already queued are not queued again. Returns the
+    new job, or None if nothing needed queueing.
+    """
+    from .models import DocumentRenderJob
+
+    if not is_pdf(attachment):
+        return None
+    if not HAS_FITZ or Image is None:
+        logger.warning("PyMuPDF or Pillow not installed — skipping PDF page rendering")
+        return None
+
+    if last_page is None:
+        last_page = first_page + eager_pages() - 1
+    if attachment.page_count:
+        last_page = min(last_page, attachment.page_count)
+    if last_page < first_page:
+        return None
+
+    rendered = attachment.pages.filter(page_number__range=(first_page, last_page)).count()
+    if rendered >= last_page - first_page + 1:
+        return None
+    if attachment.render_jobs.filter(
+        status__in=['queued', 'running'], first_page__lte=first_page, last_page__gte=last_page
+    ).exists():
+        return None
+
+    if attachment.render_status in ('none', 'failed'):
+        attachment.render_status = 'pending'
+        attachment.save(update_fields=['render_status'])
+    return DocumentRenderJob.objects.create(attachment=attachment, first_page=first_page, last_page=last_page)
+
+
+def claim_jobs(limit: int) -> list:
+    """
+    Atomically take up to ``limit`` jobs off the queue.
+
+    Jobs left running by a crashed worker are reclaimed after
+    DOCUMENT_RENDER_TIMEOUT seconds.
+    """
+    from .models import DocumentRenderJob
+
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'DOCUMENT_RENDER_TIMEOUT', 300))
+    with transaction.atomic():
+        queryset = DocumentRenderJob.objects.filter(
+            Q(status='queued') | Q(status='running', started_at__lt=stale)
+        ).order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        job_ids = list(queryset.values_list('id', flat=True)[:limit])
+        DocumentRenderJob.objects.filter(id__in=job_ids).update(
+            status='running', started_at=timezone.now(), attempts=F('attempts') + 1
+        )
+    return list(DocumentRenderJob.objects.filter(id__in=job_ids).select_related('attachment'))
+
+
+def save_rendered_pages(attachment, page_count: int, rendered) -> int:
+    """Store rendered images and insert their DocumentPage rows in one batch."""
+    from .models import DocumentPage, PostAttachment
+
+    extension = FORMAT_EXTENSIONS[render_options()['format']]
+    existing = set(attachment.pages.values_list('page_number', flat=True))
+    pages = []
+    for page_number, width, height, image_bytes, thumbnail_bytes in rendered:
+        if page_number in existing:
             continue
+        page = DocumentPage(attachment=attachment, page_number=page_number, width=width, height=height)
+        name = f"page_{attachment.id}_{page_number:03d}.{extension}"
+        page.image.save(name, ContentFile(image_bytes), save=False)
+        page.thumbnail.save(name, ContentFile(thumbnail_bytes), save=False)
+        pages.append(page)
+
+    DocumentPage.objects.bulk_create(pages, ignore_conflicts=True)
+    PostAttachment.objects.filter(pk=attachment.pk).update(page_count=page_count, render_status='ready')
+    return len(pages)
+
+
+def _job_failed(job, error):
+    from .models import DocumentRenderJob, PostAttachment
+
+    logger.error("Failed to render pages %d-%d of attachment %s: %s",
+                 job.first_page, job.last_page, job.attachment_id, error)
+    status = 'failed' if job.attempts >= MAX_ATTEMPTS else 'queued'
+    DocumentRenderJob.objects.filter(pk=job.pk).update(status=status, error=str(error)[:2000])
+    if status == 'failed':
+        # Keep any pages that did render; otherwise fall back to the download card
+        PostAttachment.objects.filter(pk=job.attachment_id, pages__isnull=True).update(render_status='failed')
+
+
+def process_jobs(jobs, executor=None) -> int:
+    """Render claimed jobs, in ``executor`` if given, and return the number of pages stored."""
+    from .models import DocumentRenderJob
+
+    options = render_options()
+    submitted = []
+    for job in jobs:
+        try:
+            job.attachment.file.open('rb')
+            try:
+                pdf_bytes = job.attachment.file.read()
+            finally:
+                job.attachment.file.close()
+            args = (render_page_range, pdf_bytes, job.first_page, job.last_page, options)
+            submitted.append((job, executor.submit(*args) if executor else None, args))
+        except Exception as e:
+            _job_failed(job, e)
+
+    stored = 0
+    for job, future, args in submitted:
+        try:
+            page_count, rendered = future.result() if future else args[0](*args[1:])
+            stored += save_rendered_pages(job.attachment, page_count, rendered)
+            DocumentRenderJob.objects.filter(pk=job.pk).update(status='done', error='')
+        except Exception as e:
+            _job_failed(job, e)
+    return stored
+
+
+def process_pending(limit: int = 10, executor=None) -> int:
+    """Claim and render up to ``limit`` queued jobs."""
+    jobs = claim_jobs(limit)
+    if not jobs:
+        return 0
+    stored = process_jobs(jobs, executor)
+    logger.info("Rendered %d document pages from %d jobs", stored, len(jobs))
+    return stored
+
+
+def extract_pdf_pages(attachment):
+    """Render every page of a PDF synchronously and create DocumentPage records.
+
+    Kept for scripts and backfills; request handlers use enqueue_document.
+    Returns the number of pages extracted, or 0 if processing is skipped.
+    """
+    if not HAS_FITZ or Image is None:
+        logger.warning("PyMuPDF or Pillow not installed — skipping PDF page extraction")
+        return 0
+    if not is_pdf(attachment):
+        return 0
+
+    try:
+        attachment.file.seek(0)
+        page_count, rendered = render_page_range(attachment.file.read(), 1, 10 ** 6, render_options())
+    except Exception as e:
+        logger.error("Failed to render PDF %s: %s", attachment.file.name, e)
+        return 0
 
-    doc.close()
+    pages_created = save_rendered_pages(attachment, page_count, rendered)
     logger.info("Extracted %d pages from %s", pages_created, attachment.file.name)
     return pages_created
@@ -1,6 +1,23 @@
+import bleach
 from django import forms
 from .models import Post, Comment
 
+# Tags and attributes kept in rich-text post content (conservative set)
+ALLOWED_TAGS = [
+    'p', 'br', 'strong', 'em', 'ul', 'ol', 'li', 'a', 'blockquote', 'code', 'pre',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'img'
+]
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title', 'rel', 'target'],
+    'img': ['src', 'alt', 'title', 'width', 'height'],
+}
+
+
+def sanitize_post_content(content):
+    """Strip post HTML down to the allowed tags and attributes before it is stored."""
+    return bleach.clean(content, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True)
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
@@ -23,6 +40,9 @@ class PostForm(forms.ModelForm):
         self.fields['content'].required = True
         self.fields['image'].required = False
 
+    def clean_content(self):
+        return sanitize_post_content(self.cleaned_data['content'])
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
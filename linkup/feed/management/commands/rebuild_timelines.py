@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from feed.timeline_manager import timeline_manager
+
+
+class Command(BaseCommand):
+    help = 'Push unpushed posts into home feed timelines and cap timeline length'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--trim-only',
+            action='store_true',
+            help='Only cap timelines at FEED_TIMELINE_LENGTH without fanning out posts',
+        )
+
+    def handle(self, *args, **options):
+        if not options['trim_only']:
+            self.stdout.write("Fanning out unpushed posts...")
+            pushed = timeline_manager.rebuild()
+            self.stdout.write(f"Pushed {pushed} posts into follower timelines")
+
+        removed = timeline_manager.trim()
+        self.stdout.write(
+            self.style.SUCCESS(f"Trimmed {removed} entries beyond {timeline_manager.max_length} per timeline")
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from feed.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute the like and comment counts stored on posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--post',
+            type=int,
+            action='append',
+            dest='post_ids',
+            help='Only reconcile this post id (repeatable; default: all posts)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Reconciling post counters...")
+
+        fixed = Post.refresh_counters(options['post_ids'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Fixed {fixed} post counters")
+        )
@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from feed.document_processor import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Worker that renders queued PDF attachment pages in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'DOCUMENT_RENDER_WORKERS', 2),
+            help='Render processes (default: DOCUMENT_RENDER_WORKERS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Jobs claimed per batch (default: 10)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue once and exit instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Rendering documents with {options['workers']} workers")
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            try:
+                while True:
+                    stored = process_pending(options['batch_size'], executor)
+                    if stored:
+                        self.stdout.write(f"Rendered {stored} pages")
+                    elif options['once']:
+                        break
+                    else:
+                        time.sleep(options['sleep'])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping document renderer")
+        self.stdout.write(self.style.SUCCESS("Document queue drained"))
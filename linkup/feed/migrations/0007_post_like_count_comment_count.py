@@ -0,0 +1,39 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    """Count existing likes and comments into the new columns"""
+    Post = apps.get_model('feed', 'Post')
+    Comment = apps.get_model('feed', 'Comment')
+
+    likes = Post.likes.through.objects.filter(post_id=OuterRef('pk')).order_by().values('post_id')
+    comments = Comment.objects.filter(post_id=OuterRef('pk')).order_by().values('post_id')
+    Post.objects.update(
+        like_count=Coalesce(Subquery(likes.annotate(n=Count('id')).values('n')), 0),
+        comment_count=Coalesce(Subquery(comments.annotate(n=Count('id')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0006_post_fanned_out_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_rendered_documents(apps, schema_editor):
+    """Attachments rendered inline before the worker existed are already ready"""
+    PostAttachment = apps.get_model('feed', 'PostAttachment')
+    rendered = PostAttachment.objects.annotate(rendered_pages=Count('pages')).filter(rendered_pages__gt=0)
+    for attachment in rendered.only('id'):
+        PostAttachment.objects.filter(pk=attachment.pk).update(
+            render_status='ready', page_count=attachment.rendered_pages
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0007_post_like_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_page', models.PositiveIntegerField()),
+                ('last_page', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='documentpage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='document_pages/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='postattachment',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='postattachment',
+            name='render_status',
+            field=models.CharField(choices=[('none', 'Not rendered'), ('pending', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='documentpage',
+            constraint=models.UniqueConstraint(fields=('attachment', 'page_number'), name='unique_document_page'),
+        ),
+        migrations.AddField(
+            model_name='documentrenderjob',
+            name='attachment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='render_jobs', to='feed.postattachment'),
+        ),
+        migrations.AddIndex(
+            model_name='documentrenderjob',
+            index=models.Index(fields=['status', 'created_at'], name='feed_docume_status_cc7481_idx'),
+        ),
+        migrations.RunPython(mark_rendered_documents, migrations.RunPython.noop),
+    ]
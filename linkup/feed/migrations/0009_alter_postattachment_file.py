@@ -0,0 +1,20 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:43
+
+import core.storage
+import core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0008_document_render_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='postattachment',
+            name='file',
+            field=models.FileField(max_length=255, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', validators=[core.validators.AttachmentUploadValidator()]),
+        ),
+    ]
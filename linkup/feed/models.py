@@ -1,7 +1,9 @@
 from django.db import models
 from django.conf import settings
 from django.core.validators import FileExtensionValidator
+from django.db.models.functions import Coalesce
 from ckeditor_uploader.fields import RichTextUploadingField
+from core.storage import blob_storage
 from core.validators import AttachmentUploadValidator
 
 class Post(models.Model):
@@ -12,9 +14,25 @@ class Post(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     likes = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='liked_posts', blank=True)
+    
+    # False until the post has been pushed into followers' timelines; posts
+    # from high-fanout authors stay False and are pulled at read time instead
+    fanned_out = models.BooleanField(default=False)
+
+    # Denormalized counters kept in step by the handlers in feed.signals so
+    # rendering a page never counts the like and comment tables
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=models.Q(fanned_out=False),
+                name='feed_post_pull_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s post at {self.created_at}"
@@ -25,6 +43,47 @@ class Post(models.Model):
     def total_comments(self):
         return self.comments.count()
 
+    @classmethod
+    def refresh_counters(cls, post_ids=None):
+        """
+        Recompute like_count and comment_count from the like and comment tables,
+        writing only the posts whose counters drifted. Returns how many were fixed.
+        """
+        likes = cls.likes.through.objects.filter(post_id=models.OuterRef('pk')).order_by().values('post_id')
+        comments = Comment.objects.filter(post_id=models.OuterRef('pk')).order_by().values('post_id')
+        posts = cls.objects.all() if post_ids is None else cls.objects.filter(id__in=post_ids)
+        drifted = posts.annotate(
+            expected_likes=Coalesce(models.Subquery(likes.annotate(n=models.Count('id')).values('n')), 0),
+            expected_comments=Coalesce(models.Subquery(comments.annotate(n=models.Count('id')).values('n')), 0),
+        ).exclude(like_count=models.F('expected_likes'), comment_count=models.F('expected_comments'))
+        return drifted.update(
+            like_count=models.F('expected_likes'),
+            comment_count=models.F('expected_comments'),
+        )
+
+    def is_visible_to(self, viewer):
+        """Whether ``viewer`` may see this post: not if the author is inactive or has blocked them"""
+        from users.models import Block
+
+        if viewer is None or not viewer.is_authenticated:
+            return False
+        if viewer.id == self.user_id:
+            return True
+        return self.user.is_active and not Block.objects.filter(blocker_id=self.user_id, blocked_id=viewer.id).exists()
+
+    @staticmethod
+    def attach_viewer_likes(posts, viewer):
+        """Set ``viewer_has_liked`` on each post with one lookup for the whole page"""
+        posts = list(posts)
+        liked_ids = set()
+        if posts and viewer is not None and viewer.is_authenticated:
+            liked_ids = set(Post.likes.through.objects.filter(
+                user_id=viewer.id, post_id__in=[post.id for post in posts]
+            ).values_list('post_id', flat=True))
+        for post in posts:
+            post.viewer_has_liked = post.id in liked_ids
+        return posts
+
 
 class PostAttachment(models.Model):
     FILE_TYPES = [
@@ -33,12 +92,25 @@ class PostAttachment(models.Model):
         ('audio', 'Audio'),
         ('document', 'Document'),
     ]
+    RENDER_STATUSES = [
+        ('none', 'Not rendered'),
+        ('pending', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='attachments')
-    file = models.FileField(upload_to='posts/', validators=[AttachmentUploadValidator()])
+    file = models.FileField(
+        upload_to='posts/', storage=blob_storage, max_length=255,
+        validators=[AttachmentUploadValidator()]
+    )
     file_type = models.CharField(max_length=10, choices=FILE_TYPES)
     sort_order = models.IntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    # PDF page rendering state, driven by the render_documents worker
+    render_status = models.CharField(max_length=10, choices=RENDER_STATUSES, default='none')
+    page_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['sort_order']
 
@@ -82,6 +154,13 @@ class PostAttachment(models.Model):
             return self.file.url
         return None
 
+    def is_rendering(self):
+        return self.render_status == 'pending'
+
+    def total_pages(self):
+        """Page count of the whole document, even if only some pages are rendered yet"""
+        return self.page_count or len(self.pages.all())
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
@@ -101,11 +180,63 @@ class DocumentPage(models.Model):
     attachment = models.ForeignKey(PostAttachment, on_delete=models.CASCADE, related_name='pages')
     page_number = models.PositiveIntegerField()
     image = models.ImageField(upload_to='document_pages/')
+    thumbnail = models.ImageField(upload_to='document_pages/thumbs/', blank=True)
     width = models.PositiveIntegerField(default=0)
     height = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['page_number']
+        constraints = [
+            models.UniqueConstraint(fields=['attachment', 'page_number'], name='unique_document_page')
+        ]
 
     def __str__(self):
         return f"Page {self.page_number} of {self.attachment.filename()}"
+
+
+class DocumentRenderJob(models.Model):
+    """A range of PDF pages queued for the render_documents worker"""
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    attachment = models.ForeignKey(PostAttachment, on_delete=models.CASCADE, related_name='render_jobs')
+    first_page = models.PositiveIntegerField()
+    last_page = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Render pages {self.first_page}-{self.last_page} of attachment {self.attachment_id}"
+
+
+class TimelineEntry(models.Model):
+    """A post pushed into one user's home timeline (fan-out on write)"""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Denormalized from the post so unfollowing can drop an author's entries
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at']),
+            models.Index(fields=['owner', 'author']),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.owner_id}'s timeline"
@@ -0,0 +1,144 @@
+"""
+Signal handlers that keep home feed timelines in step with posts and the social
+graph, and post like and comment counts in step with the like and comment tables
+"""
+import logging
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from network.models import Connection, Follow
+from .models import Comment, Post
+from .timeline_manager import timeline_manager
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    """Push new posts into followers' timelines once the post is committed"""
+    if not created:
+        return
+
+    def push():
+        try:
+            timeline_manager.fan_out(instance)
+        except Exception as e:
+            # The post stays unpushed and is still served by the pull path
+            logger.error(f"Error fanning out post {instance.id}: {e}")
+
+    transaction.on_commit(push)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """Backfill the follower's timeline with the followed user's posts"""
+    if created:
+        try:
+            timeline_manager.add_author(instance.follower_id, instance.followed_id)
+        except Exception as e:
+            logger.error(f"Error backfilling timeline for follow {instance.id}: {e}")
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Drop the unfollowed user's posts unless the two are still connected"""
+    try:
+        timeline_manager.remove_author(instance.follower_id, instance.followed_id)
+    except Exception as e:
+        logger.error(f"Error trimming timeline after unfollow {instance.id}: {e}")
+
+
+@receiver(pre_save, sender=Connection)
+def remember_connection_status(sender, instance, **kwargs):
+    """Record the previous status so post_save can detect accept/revoke transitions"""
+    if instance.pk:
+        instance._previous_status = Connection.objects.filter(pk=instance.pk).values_list(
+            'status', flat=True
+        ).first()
+    else:
+        instance._previous_status = None
+
+
+@receiver(post_save, sender=Connection)
+def connection_saved(sender, instance, **kwargs):
+    """Link both timelines when a connection is accepted, unlink when it is revoked"""
+    previous = getattr(instance, '_previous_status', None)
+    try:
+        if instance.status == 'accepted' and previous != 'accepted':
+            timeline_manager.add_author(instance.user_id, instance.friend_id)
+            timeline_manager.add_author(instance.friend_id, instance.user_id)
+        elif previous == 'accepted' and instance.status != 'accepted':
+            timeline_manager.remove_author(instance.user_id, instance.friend_id)
+            timeline_manager.remove_author(instance.friend_id, instance.user_id)
+    except Exception as e:
+        logger.error(f"Error updating timelines for connection {instance.id}: {e}")
+
+
+@receiver(post_delete, sender=Connection)
+def connection_deleted(sender, instance, **kwargs):
+    """Unlink both timelines when an accepted connection is removed"""
+    if instance.status != 'accepted':
+        return
+    try:
+        timeline_manager.remove_author(instance.user_id, instance.friend_id)
+        timeline_manager.remove_author(instance.friend_id, instance.user_id)
+    except Exception as e:
+        logger.error(f"Error updating timelines after removing connection {instance.id}: {e}")
+
+
+# Denormalized post counters. Decrements are clamped at zero like
+# UnreadCounter.adjust; reconcile_post_counters repairs any drift left by
+# bulk writes that skip signals.
+
+def _adjust_counter(post_ids, field, delta):
+    Post.objects.filter(pk__in=post_ids).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def _adjust_likes(post_ids, sign):
+    """Add or remove one like per entry in ``post_ids``; a post may repeat"""
+    by_delta = defaultdict(list)
+    for post_id, likes in Counter(post_ids).items():
+        by_delta[sign * likes].append(post_id)
+    for delta, ids in by_delta.items():
+        _adjust_counter(ids, 'like_count', delta)
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def count_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    """Count likes added or removed through post.likes or user.liked_posts"""
+    if action == 'post_add' and pk_set:
+        # pk_set only holds the rows actually inserted
+        _adjust_likes(pk_set if reverse else [instance.pk] * len(pk_set), 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() may name likes that don't exist and clear() names none,
+        # so look up the rows about to go
+        rows = sender.objects.filter(**{'user_id' if reverse else 'post_id': instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{'post_id__in' if reverse else 'user_id__in': pk_set})
+        instance._removed_likes = list(rows.values_list('post_id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        _adjust_likes(instance.__dict__.pop('_removed_likes', []), -1)
+
+
+@receiver(pre_delete, sender=User)
+def uncount_deleted_user_likes(sender, instance, **kwargs):
+    """A deleted user's likes cascade away without m2m_changed"""
+    _adjust_likes(Post.likes.through.objects.filter(user_id=instance.pk).values_list('post_id', flat=True), -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _adjust_counter([instance.post_id], 'comment_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_comment_removed(sender, instance, **kwargs):
+    _adjust_counter([instance.post_id], 'comment_count', -1)
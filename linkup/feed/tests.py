@@ -1,3 +1,377 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from network.models import Connection, Follow
+from . import document_processor
+from .models import Comment, DocumentPage, DocumentRenderJob, Post, PostAttachment, TimelineEntry
+from .timeline_manager import TimelineManager, timeline_manager
+
+User = get_user_model()
+
+
+class TimelineFanOutTests(TestCase):
+    """Home feed timelines are built by fan-out on write."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='pass')
+        self.follower = User.objects.create_user(username='follower', email='follower@example.com', password='pass')
+        self.friend = User.objects.create_user(username='friend', email='friend@example.com', password='pass')
+        self.stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass')
+        Follow.objects.create(follower=self.follower, followed=self.author)
+        Connection.objects.create(user=self.author, friend=self.friend, status='accepted')
+
+    def _post(self, user, content='hello'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(user=user, content=content)
+
+    def _feed_ids(self, user, cursor=None):
+        return [post.id for post in timeline_manager.get_page(user, cursor)]
+
+    def test_post_is_pushed_to_followers_and_connections(self):
+        post = self._post(self.author)
+
+        owners = set(TimelineEntry.objects.filter(post=post).values_list('owner_id', flat=True))
+        self.assertEqual(owners, {self.author.id, self.follower.id, self.friend.id})
+        self.assertTrue(Post.objects.get(pk=post.pk).fanned_out)
+        self.assertEqual(self._feed_ids(self.stranger), [])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        post = self._post(self.author)
+
+        follow = Follow.objects.create(follower=self.stranger, followed=self.author)
+        self.assertEqual(self._feed_ids(self.stranger), [post.id])
+
+        follow.delete()
+        self.assertEqual(self._feed_ids(self.stranger), [])
+
+    def test_unfollow_keeps_posts_from_connections(self):
+        post = self._post(self.author)
+        Follow.objects.create(follower=self.friend, followed=self.author).delete()
+
+        self.assertEqual(self._feed_ids(self.friend), [post.id])
+
+    def test_high_fanout_author_is_pulled_on_read(self):
+        manager = TimelineManager(fanout_limit=2)
+        post = Post.objects.create(user=self.author, content='big audience')
+
+        self.assertEqual(manager.fan_out(post), 0)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual([p.id for p in manager.get_page(self.follower)], [post.id])
+
+    def test_pages_are_ordered_without_count(self):
+        posts = [self._post(self.author, content=f'post {i}') for i in range(12)]
+
+        first = timeline_manager.get_page(self.follower, per_page=10)
+        second = timeline_manager.get_page(self.follower, first.next_cursor, per_page=10)
+
+        self.assertEqual([p.id for p in first], [p.id for p in reversed(posts)][:10])
+        self.assertTrue(first.has_next())
+        self.assertEqual([p.id for p in second], [p.id for p in reversed(posts)][10:])
+        self.assertFalse(second.has_next())
+
+    def test_trim_caps_timeline_length(self):
+        manager = TimelineManager(max_length=5)
+        for i in range(8):
+            manager.fan_out(Post.objects.create(user=self.author, content=f'post {i}'))
+
+        manager.trim()
+
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.follower).count(), 5)
+
+    def test_fan_out_and_backfill_trim_the_timelines_they_grow(self):
+        manager = TimelineManager(max_length=5)
+        start = timezone.now()
+        for i, user in enumerate([self.stranger] * 3 + [self.author] * 8):
+            post = Post.objects.create(user=user, content=f'post {i}')
+            Post.objects.filter(pk=post.pk).update(created_at=start + timedelta(minutes=i))
+            post.refresh_from_db()
+            manager.fan_out(post)
+
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.follower).count(), 5)
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.stranger).count(), 3)
+
+        manager.add_author(self.stranger.id, self.author.id)
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.stranger).count(), 5)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.stranger, author=self.stranger).exists())
+
+    def test_feed_view_query_count_is_independent_of_site_size(self):
+        self.client.force_login(self.follower)
+        self._post(self.author)
+
+        def feed_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('feed:feed'))
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+
+        # The first request also stamps session activity
+        feed_queries()
+        baseline = feed_queries()
+        for i in range(30):
+            self._post(self.stranger, content=f'unrelated {i}')
+
+        self.assertEqual(feed_queries(), baseline)
+
+    def test_cursor_pages_merge_pushed_and_pulled_posts(self):
+        manager = TimelineManager(fanout_limit=2)
+        posts = []
+        for i in range(6):
+            post = Post.objects.create(user=self.author, content=f'post {i}')
+            if i % 2:
+                manager.fan_out(post)  # Over the limit: stays pulled
+            else:
+                timeline_manager.fan_out(post)
+            posts.append(post)
+
+        first = manager.get_page(self.follower, per_page=4)
+        second = manager.get_page(self.follower, first.next_cursor, per_page=4)
+
+        expected = [p.id for p in reversed(posts)]
+        self.assertEqual([p.id for p in first] + [p.id for p in second], expected)
+        self.assertTrue(second.has_previous())
+        self.assertFalse(second.has_next())
+
+
+class PostCounterTests(TestCase):
+    """Like and comment counts are denormalized onto Post."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='pass')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        self.client.force_login(self.reader)
+
+    def _post(self, content='hello'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(user=self.author, content=content)
+
+    def test_like_toggle_keeps_like_count(self):
+        post = self._post()
+
+        liked = self.client.post(reverse('feed:like_post', args=[post.id])).json()
+        self.assertEqual(liked, {'likes_count': 1, 'is_liked': True})
+        self.assertEqual(Post.objects.get(pk=post.pk).like_count, 1)
+
+        unliked = self.client.post(reverse('feed:like_post', args=[post.id])).json()
+        self.assertEqual(unliked, {'likes_count': 0, 'is_liked': False})
+        self.assertEqual(Post.objects.get(pk=post.pk).like_count, 0)
+
+    def test_add_comment_keeps_comment_count(self):
+        post = self._post()
+
+        response = self.client.post(reverse('feed:add_comment', args=[post.id]), {'content': 'Nice'})
+
+        self.assertEqual(response.json()['comments_count'], 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).comment_count, 1)
+
+    def test_refresh_counters_repairs_drift(self):
+        post = self._post()
+        post.likes.add(self.reader)
+        Post.objects.filter(pk=post.pk).update(like_count=7, comment_count=3)
+
+        self.assertEqual(Post.refresh_counters([post.id]), 1)
+
+        post.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count), (1, 0))
+        self.assertEqual(Post.refresh_counters([post.id]), 0)
+
+    def test_counters_follow_writes_outside_the_views(self):
+        post = self._post()
+        commenter = User.objects.create_user(username='commenter', email='c@example.com', password='pass')
+        comment = Comment.objects.create(post=post, user=self.reader, content='First')
+        Comment.objects.create(post=post, user=commenter, content='Second')
+        commenter.liked_posts.add(post)
+        post.likes.add(self.reader)
+
+        post.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count), (2, 2))
+
+        comment.delete()
+        commenter.delete()
+        post.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count), (1, 0))
+
+        post.likes.clear()
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 0)
+
+    def test_decrements_never_go_below_zero(self):
+        post = self._post()
+        Comment.objects.create(post=post, user=self.reader, content='Hi')
+        Post.objects.filter(pk=post.pk).update(comment_count=0)
+
+        Comment.objects.filter(post=post).delete()
+
+        self.assertEqual(Post.objects.get(pk=post.pk).comment_count, 0)
+
+    def test_reconcile_command_fixes_drift(self):
+        post = self._post()
+        Post.objects.filter(pk=post.pk).update(like_count=4)
+        out = StringIO()
+
+        call_command('reconcile_post_counters', stdout=out)
+
+        self.assertEqual(Post.objects.get(pk=post.pk).like_count, 0)
+        self.assertIn('Fixed 1 post counters', out.getvalue())
+
+    def test_feed_page_marks_viewer_likes_in_one_lookup(self):
+        liked, other = self._post('liked'), self._post('other')
+        liked.likes.add(self.reader)
+
+        page = timeline_manager.get_page(self.reader)
+
+        self.assertEqual({p.id: p.viewer_has_liked for p in page}, {liked.id: True, other.id: False})
+
+    def test_feed_query_count_is_independent_of_likes_and_comments(self):
+        post = self._post()
+
+        def feed_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(reverse('feed:feed'))
+            return len(context.captured_queries)
+
+        baseline = feed_queries()
+        for i in range(10):
+            fan = User.objects.create_user(username=f'fan{i}', email=f'fan{i}@example.com', password='pass')
+            post.likes.add(fan)
+            self.client.force_login(fan)
+            self.client.post(reverse('feed:add_comment', args=[post.id]), {'content': f'comment {i}'})
+        self.client.force_login(self.reader)
+
+        self.assertEqual(feed_queries(), baseline)
+
+
+def fake_render(pdf_bytes, first_page, last_page, options):
+    """Stands in for PyMuPDF: a 10 page document with placeholder images"""
+    pages = range(first_page, min(last_page, 10) + 1)
+    return 10, [(n, 1200, 1600, b'page', b'thumb') for n in pages]
+
+
+@mock.patch.object(document_processor, 'HAS_FITZ', True)
+@mock.patch.object(document_processor, 'Image', object())
+@mock.patch.object(document_processor, 'render_page_range', fake_render)
+@override_settings(DOCUMENT_EAGER_PAGES=3)
+class DocumentRenderTests(TestCase):
+    """PDF pages are rendered by a background worker, eagerly for the first few."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', email='author@example.com', password='pass')
+        post = Post.objects.create(user=self.user, content='slides')
+        self.attachment = PostAttachment.objects.create(
+            post=post, file_type='document',
+            file=SimpleUploadedFile('deck.pdf', b'%PDF-1.4 fake', content_type='application/pdf'),
+        )
+        self.client.force_login(self.user)
+
+    def test_enqueue_queues_eager_pages_once(self):
+        job = document_processor.enqueue_document(self.attachment)
+
+        self.assertEqual((job.first_page, job.last_page), (1, 3))
+        self.assertEqual(PostAttachment.objects.get(pk=self.attachment.pk).render_status, 'pending')
+        self.assertIsNone(document_processor.enqueue_document(self.attachment))
+        self.assertEqual(DocumentRenderJob.objects.count(), 1)
+
+    def test_worker_renders_claimed_jobs(self):
+        document_processor.enqueue_document(self.attachment)
+
+        stored = document_processor.process_pending()
+
+        self.attachment.refresh_from_db()
+        self.assertEqual(stored, 3)
+        self.assertEqual((self.attachment.render_status, self.attachment.page_count), ('ready', 10))
+        self.assertEqual(list(self.attachment.pages.values_list('page_number', flat=True)), [1, 2, 3])
+        self.assertEqual(DocumentRenderJob.objects.get().status, 'done')
+        self.assertEqual(document_processor.process_pending(), 0)
+
+    def test_failed_jobs_are_retried_then_given_up(self):
+        document_processor.enqueue_document(self.attachment)
+
+        with mock.patch.object(document_processor, 'render_page_range', side_effect=ValueError('corrupt')):
+            for _ in range(document_processor.MAX_ATTEMPTS):
+                document_processor.process_pending()
+
+        job = DocumentRenderJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('failed', document_processor.MAX_ATTEMPTS))
+        self.assertEqual(PostAttachment.objects.get(pk=self.attachment.pk).render_status, 'failed')
+
+    def test_document_pages_view_returns_pages_and_queues_the_rest(self):
+        document_processor.enqueue_document(self.attachment)
+        document_processor.process_pending()
+        url = reverse('feed:document_pages', args=[self.attachment.id])
+
+        first = self.client.get(url).json()
+        self.assertEqual([p['page_number'] for p in first['pages']], [1, 2, 3])
+        self.assertEqual((first['page_count'], first['pending']), (10, False))
+
+        more = self.client.get(url, {'start': 4}).json()
+        self.assertEqual((more['pages'], more['pending']), ([], True))
+        job = DocumentRenderJob.objects.get(status='queued')
+        self.assertEqual((job.first_page, job.last_page), (4, 6))
+
+        document_processor.process_pending()
+        more = self.client.get(url, {'start': 4}).json()
+        self.assertEqual([p['page_number'] for p in more['pages']], [4, 5, 6])
+        self.assertEqual(DocumentPage.objects.filter(attachment=self.attachment).count(), 6)
+
+    def test_document_pages_view_bounds_the_range(self):
+        url = reverse('feed:document_pages', args=[self.attachment.id])
+
+        # Page count unknown: only the eager pages can be asked for
+        self.assertEqual(self.client.get(url, {'start': 4}).status_code, 400)
+        self.assertFalse(DocumentRenderJob.objects.exists())
+
+        document_processor.enqueue_document(self.attachment)
+        document_processor.process_pending()
+        self.assertEqual(self.client.get(url, {'start': 11}).status_code, 400)
+
+        self.client.get(url, {'start': 9, 'count': 20})
+        job = DocumentRenderJob.objects.get(status='queued')
+        self.assertEqual((job.first_page, job.last_page), (9, 10))
+
+    def test_document_pages_view_does_not_queue_while_a_job_is_in_flight(self):
+        document_processor.enqueue_document(self.attachment)
+        document_processor.process_pending()
+        document_processor.enqueue_document(self.attachment, 4, 6)
+        url = reverse('feed:document_pages', args=[self.attachment.id])
+
+        response = self.client.get(url, {'start': 7}).json()
+
+        self.assertEqual((response['pages'], response['pending']), ([], True))
+        self.assertEqual(DocumentRenderJob.objects.filter(status='queued').count(), 1)
+
+    def test_document_pages_view_hides_posts_from_blocked_viewers(self):
+        from users.models import Block
+
+        viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='pass')
+        Block.objects.create(blocker=self.user, blocked=viewer)
+        self.client.force_login(viewer)
+
+        response = self.client.get(reverse('feed:document_pages', args=[self.attachment.id]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(DocumentRenderJob.objects.exists())
@@ -0,0 +1,208 @@
+"""
+Home feed timelines built by fan-out on write.
+
+A new post is pushed into the timeline of every follower and accepted
+connection of its author (and the author's own). Reading a feed page is then
+a range read over the reader's timeline, merged with any posts from
+high-fanout authors that were left to be pulled at read time, followed by
+one batched hydrate of the page's posts.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q
+
+from core.performance import CursorPage, CursorPaginator, InvalidCursor
+from network.models import Connection, Follow
+from .models import Post, PostAttachment, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+
+class TimelineManager:
+    """Maintains per-user home timelines and serves feed pages from them."""
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, max_length: Optional[int] = None, fanout_limit: Optional[int] = None):
+        self.max_length = max_length or getattr(settings, 'FEED_TIMELINE_LENGTH', 800)
+        self.fanout_limit = fanout_limit or getattr(settings, 'FEED_FANOUT_LIMIT', 5000)
+
+    # Graph helpers
+
+    @staticmethod
+    def audience_ids(author_id: int) -> Set[int]:
+        """Users whose home timeline should contain this author's posts."""
+        audience = {author_id}
+        audience.update(Follow.objects.filter(followed_id=author_id).values_list('follower_id', flat=True))
+        audience.update(
+            Connection.objects.filter(user_id=author_id, status='accepted').values_list('friend_id', flat=True)
+        )
+        audience.update(
+            Connection.objects.filter(friend_id=author_id, status='accepted').values_list('user_id', flat=True)
+        )
+        return audience
+
+    @staticmethod
+    def source_filter(reader_id: int) -> Q:
+        """Post filter matching every author that feeds into the reader's timeline."""
+        following = Follow.objects.filter(follower_id=reader_id).values('followed_id')
+        sent = Connection.objects.filter(user_id=reader_id, status='accepted').values('friend_id')
+        received = Connection.objects.filter(friend_id=reader_id, status='accepted').values('user_id')
+        return (
+            Q(user_id=reader_id) |
+            Q(user_id__in=following) |
+            Q(user_id__in=sent) |
+            Q(user_id__in=received)
+        )
+
+    @staticmethod
+    def is_source(owner_id: int, author_id: int) -> bool:
+        """True if the owner still follows or is connected to the author."""
+        if owner_id == author_id:
+            return True
+        if Follow.objects.filter(follower_id=owner_id, followed_id=author_id).exists():
+            return True
+        return Connection.objects.filter(
+            Q(user_id=owner_id, friend_id=author_id) | Q(user_id=author_id, friend_id=owner_id),
+            status='accepted'
+        ).exists()
+
+    # Writes
+
+    def _push(self, entries: Iterable[TimelineEntry]) -> None:
+        TimelineEntry.objects.bulk_create(list(entries), batch_size=self.BATCH_SIZE, ignore_conflicts=True)
+
+    def fan_out(self, post: Post) -> int:
+        """
+        Push a post into its audience's timelines, then trim any of them that
+        grew past ``max_length``.
+
+        Returns:
+            int: Number of timelines written, or 0 if the author's audience is
+            too large and the post will be pulled at read time instead
+        """
+        audience = self.audience_ids(post.user_id)
+        if len(audience) > self.fanout_limit:
+            logger.info(f"Skipping fan-out for post {post.id}: audience of {len(audience)} exceeds limit")
+            return 0
+
+        self._push(
+            TimelineEntry(owner_id=owner_id, post_id=post.id, author_id=post.user_id, created_at=post.created_at)
+            for owner_id in audience
+        )
+        self.trim(audience)
+        Post.objects.filter(pk=post.pk).update(fanned_out=True)
+        post.fanned_out = True
+        return len(audience)
+
+    def add_author(self, owner_id: int, author_id: int) -> None:
+        """Backfill an owner's timeline with an author's recent posts after a follow/connect."""
+        recent = Post.objects.filter(user_id=author_id, fanned_out=True).order_by('-created_at').values_list(
+            'id', 'created_at'
+        )[:self.max_length]
+        self._push(
+            TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, created_at in recent
+        )
+        self.trim([owner_id])
+
+    def remove_author(self, owner_id: int, author_id: int) -> None:
+        """Drop an author's posts from an owner's timeline once no edge links them."""
+        if self.is_source(owner_id, author_id):
+            return
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+
+    def trim(self, owner_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Cap timelines at ``max_length`` entries.
+
+        Returns:
+            int: Number of entries removed
+        """
+        oversized = TimelineEntry.objects.values('owner_id').annotate(total=Count('id')).filter(
+            total__gt=self.max_length
+        )
+        if owner_ids is None:
+            owners = [row['owner_id'] for row in oversized]
+        else:
+            owner_ids = list(owner_ids)
+            owners = []
+            for start in range(0, len(owner_ids), self.BATCH_SIZE):
+                batch = owner_ids[start:start + self.BATCH_SIZE]
+                owners += [row['owner_id'] for row in oversized.filter(owner_id__in=batch)]
+
+        removed = 0
+        for owner_id in owners:
+            entries = TimelineEntry.objects.filter(owner_id=owner_id)
+            cutoff = entries.order_by('-created_at', '-post_id').values_list('created_at', flat=True)[
+                self.max_length - 1
+            ]
+            removed += entries.filter(created_at__lt=cutoff).delete()[0]
+        return removed
+
+    def rebuild(self) -> int:
+        """Fan out every post that has not been pushed yet, oldest first."""
+        count = 0
+        for post in Post.objects.filter(fanned_out=False).order_by('created_at').iterator():
+            if self.fan_out(post):
+                count += 1
+        return count
+
+    # Reads
+
+    def get_page(self, reader, cursor=None, per_page: int = 10) -> CursorPage:
+        """
+        Build the page of the reader's home feed that follows ``cursor``.
+
+        Costs one keyset range read over the reader's timeline, one over
+        unpushed posts from the reader's sources, and one batched hydrate,
+        however deep the cursor points.
+        """
+        pushed = CursorPaginator(
+            TimelineEntry.objects.filter(owner=reader).values('post_id', 'created_at'),
+            per_page=per_page, id_field='post_id'
+        )
+        pulled = CursorPaginator(
+            Post.objects.filter(fanned_out=False).filter(self.source_filter(reader.id)).values('id', 'created_at'),
+            per_page=per_page
+        )
+        try:
+            rows = list(pushed.window(cursor)) + list(pulled.window(cursor))
+        except InvalidCursor:
+            logger.warning(f"Ignoring invalid feed cursor: {cursor!r}")
+            return self.get_page(reader, None, per_page)
+
+        merged: Dict[int, object] = {row.get('post_id', row.get('id')): row['created_at'] for row in rows}
+        ordered = sorted(merged.items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+        window = ordered[:per_page]
+        next_cursor = None
+        if len(ordered) > per_page:
+            post_id, created_at = window[-1]
+            next_cursor = CursorPaginator.encode_cursor(created_at, post_id)
+        return CursorPage(
+            self.hydrate([post_id for post_id, _ in window], reader), next_cursor=next_cursor, cursor=cursor or None
+        )
+
+    @staticmethod
+    def hydrate(post_ids: List[int], viewer=None) -> List[Post]:
+        """
+        Load posts for display in one batch, preserving the given order.
+
+        Counts come from the denormalized columns and the viewer's like state
+        from one lookup, so no like or comment rows are loaded.
+        """
+        if not post_ids:
+            return []
+        posts = Post.objects.filter(id__in=post_ids).select_related('user', 'user__profile').prefetch_related(
+            Prefetch('attachments', queryset=PostAttachment.objects.prefetch_related('pages'))
+        )
+        by_id = {post.id: post for post in posts}
+        return Post.attach_viewer_likes([by_id[post_id] for post_id in post_ids if post_id in by_id], viewer)
+
+
+# Global instance
+timeline_manager = TimelineManager()
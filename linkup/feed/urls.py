@@ -13,4 +13,5 @@ urlpatterns = [
     path('post/<int:post_id>/delete/', views.delete_post, name='delete_post'),
     path('post/<int:post_id>/edit/', views.get_post_for_edit, name='get_post_for_edit'),
     path('post/<int:post_id>/update/', views.update_post, name='update_post'),
+    path('attachment/<int:attachment_id>/pages/', views.document_pages, name='document_pages'),
 ]
@@ -2,16 +2,17 @@ import os
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.core.paginator import Paginator
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Prefetch
 from .models import DocumentPage
 from .models import Post, Comment, PostAttachment
-from .forms import PostForm, CommentForm
+from .forms import PostForm, CommentForm, sanitize_post_content
 from core.validators import AttachmentUploadValidator
-from .document_processor import extract_pdf_pages
+from .document_processor import eager_pages, enqueue_document
+from .timeline_manager import timeline_manager
 
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
 VIDEO_EXTENSIONS = {'.mp4', '.webm', '.mov', '.avi', '.mkv'}
@@ -47,21 +48,15 @@ def _handle_post_attachments(post, files):
         attachment.save()
         sort_order += 1
         if file_type == 'document':
-            extract_pdf_pages(attachment)
+            # Pages render in the render_documents worker, not in the request
+            enqueue_document(attachment)
 
 
 @login_required
 def feed(request):
     form = PostForm()
     error_message = None
-    posts = Post.objects.select_related('user').prefetch_related(
-        'likes', 'comments',
-        Prefetch('attachments', queryset=PostAttachment.objects.prefetch_related('pages'))
-    ).order_by('-created_at')
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    total_count = posts.count()
+    page_obj = timeline_manager.get_page(request.user, request.GET.get('cursor'), per_page=10)
 
     if request.method == 'POST':
         form = PostForm(request.POST, request.FILES)
@@ -81,7 +76,6 @@ def feed(request):
                     return render(request, 'feed/index.html', {
                         'page_obj': page_obj,
                         'form': form,
-                        'total_posts': total_count,
                         'error_message': error_message
                     })
             return redirect('feed:feed')
@@ -89,20 +83,23 @@ def feed(request):
     return render(request, 'feed/index.html', {
         'page_obj': page_obj,
         'form': form,
-        'total_posts': total_count,
         'error_message': error_message
     })
 
 @login_required
 def like_post(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    if request.user in post.likes.all():
-        post.likes.remove(request.user)
-        is_liked = False
-    else:
-        post.likes.add(request.user)
-        is_liked = True
-    return JsonResponse({'likes_count': post.likes.count(), 'is_liked': is_liked})
+    with transaction.atomic():
+        # Lock the post row so concurrent toggles can't both add or both remove;
+        # like_count follows the change through feed.signals
+        post = get_object_or_404(Post.objects.select_for_update(), id=post_id)
+        if post.likes.filter(pk=request.user.pk).exists():
+            post.likes.remove(request.user)
+            is_liked = False
+        else:
+            post.likes.add(request.user)
+            is_liked = True
+        post.refresh_from_db(fields=['like_count'])
+    return JsonResponse({'likes_count': post.like_count, 'is_liked': is_liked})
 
 @login_required
 def add_comment(request, post_id):
@@ -111,11 +108,13 @@ def add_comment(request, post_id):
         content = request.POST.get('content', '').strip()
         
         if content:
-            comment = Comment.objects.create(
-                post=post,
-                user=request.user,
-                content=content
-            )
+            with transaction.atomic():
+                comment = Comment.objects.create(
+                    post=post,
+                    user=request.user,
+                    content=content
+                )
+                post.refresh_from_db(fields=['comment_count'])
             avatar_url = None
             if comment.user.profile.avatar:
                 avatar_url = comment.user.profile.avatar.url
@@ -129,7 +128,7 @@ def add_comment(request, post_id):
                     'is_owner': comment.user == request.user,
                     'avatar_url': avatar_url
                 },
-                'comments_count': post.total_comments()
+                'comments_count': post.comment_count
             })
         else:
             return JsonResponse({'success': False, 'error': 'Comment cannot be empty'}, status=400)
@@ -161,6 +160,49 @@ def get_comments(request, post_id):
         'comments_count': len(comments_data)
     })
 
+@login_required
+def document_pages(request, attachment_id):
+    """
+    Rendered pages of a PDF attachment from ``start``; queues any that aren't
+    rendered yet, unless a job for the attachment is already in flight
+    """
+    attachment = get_object_or_404(
+        PostAttachment.objects.select_related('post__user'), id=attachment_id, file_type='document'
+    )
+    if not attachment.post.is_visible_to(request.user):
+        return JsonResponse({'success': False, 'error': 'Document not found'}, status=404)
+    try:
+        start = max(int(request.GET.get('start', 1)), 1)
+        count = min(max(int(request.GET.get('count', eager_pages())), 1), 20)
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid page range'}, status=400)
+    # Until the first render reports the page count only the eager pages are known to exist
+    last_known_page = attachment.page_count or eager_pages()
+    if start > last_known_page:
+        return JsonResponse({'success': False, 'error': 'Invalid page range'}, status=400)
+    end = min(start + count - 1, last_known_page)
+
+    pages = list(attachment.pages.filter(page_number__range=(start, end)))
+    pending = False
+    if len(pages) < end - start + 1:
+        pending = attachment.render_jobs.filter(status__in=['queued', 'running']).exists()
+        if not pending:
+            pending = enqueue_document(attachment, start, end) is not None
+
+    return JsonResponse({
+        'success': True,
+        'status': attachment.render_status,
+        'page_count': attachment.page_count,
+        'pending': pending,
+        'pages': [{
+            'page_number': page.page_number,
+            'url': page.image.url,
+            'thumbnail_url': page.thumbnail.url if page.thumbnail else page.image.url,
+            'width': page.width,
+            'height': page.height,
+        } for page in pages],
+    })
+
 @login_required
 def get_post_link(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -171,11 +213,11 @@ def get_post_link(request, post_id):
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects.select_related('user').prefetch_related(
-            'likes', 'comments',
             Prefetch('attachments', queryset=PostAttachment.objects.prefetch_related('pages'))
         ),
         id=post_id
     )
+    Post.attach_viewer_likes([post], request.user)
     comments = post.comments.select_related('user').all()
     
     return render(request, 'feed/post_detail.html', {
@@ -192,13 +234,7 @@ def delete_post(request, post_id):
         if post.user != request.user:
             return JsonResponse({'success': False, 'error': 'You do not have permission to delete this post'}, status=403)
         
-        # Delete attachment files from disk
-        for att in post.attachments.all():
-            if att.file:
-                try:
-                    att.file.delete(save=False)
-                except Exception:
-                    pass
+        # Deleting the attachments releases their blobs (core.signals.release_blobs)
         post.delete()
         
         return JsonResponse({'success': True, 'message': 'Post deleted successfully'})
@@ -249,7 +285,7 @@ def update_post(request, post_id):
             # Wrap plain text in paragraph tags for consistency
             if not content.startswith('<'):
                 content = f'<p>{content}</p>'
-            post.content = content
+            post.content = sanitize_post_content(content)
         
         # Handle image removal
         if request.POST.get('remove_image') == 'true':
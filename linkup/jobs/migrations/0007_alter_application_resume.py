@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:43
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0006_job_active_recent_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='application',
+            name='resume',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='resumes/'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from core.storage import blob_storage
 
 class Job(models.Model):
     WORKPLACE_TYPE_CHOICES = [
@@ -34,6 +35,9 @@ class Job(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_active', '-created_at', '-id'], name='jobs_active_recent_idx'),
+        ]
 
 class Application(models.Model):
     STATUS_CHOICES = [
@@ -46,7 +50,7 @@ class Application(models.Model):
     
     job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='applications')
     applicant = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='job_applications')
-    resume = models.FileField(upload_to='resumes/', blank=True, null=True)
+    resume = models.FileField(upload_to='resumes/', storage=blob_storage, max_length=255, blank=True, null=True)
     cover_letter = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     applied_at = models.DateTimeField(auto_now_add=True)
@@ -4,6 +4,7 @@ from django.contrib import messages
 from django.db import IntegrityError
 from django.db.models import Q
 from django.core.paginator import Paginator
+from core.performance import CursorPaginator
 from .models import Job, Application, SavedJob, JobAlert
 from .forms import JobForm, ApplicationForm, JobSearchForm, JobAlertForm
 
@@ -37,15 +38,13 @@ def job_list(request):
         if job_type:
             jobs = jobs.filter(job_type=job_type)
     
-    # Pagination
-    paginator = Paginator(jobs, 10)  # Show 10 jobs per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination: a deep page costs the same as the first, no COUNT
+    paginator = CursorPaginator(jobs, per_page=10)  # Show 10 jobs per page
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     return render(request, 'jobs/job_list.html', {
         'page_obj': page_obj,
         'search_form': search_form,
-        'total_jobs': jobs.count()
     })
 
 @login_required
@@ -24,6 +24,7 @@ class LinkUpAdminSite(AdminSite):
             path('seed-test-data/', self.admin_view(admin_views.SeedTestDataView.as_view()), name='seed_test_data'),
             path('clear-test-data/', self.admin_view(admin_views.ClearTestDataView.as_view()), name='clear_test_data'),
             path('test-data-stats/', self.admin_view(admin_views.TestDataStatsView.as_view()), name='test_data_stats'),
+            path('query-profile/', self.admin_view(admin_views.QueryProfileView.as_view()), name='query_profile'),
         ]
         return custom_urls + urls
     
@@ -163,3 +163,35 @@ class TestDataStatsView(View):
                 'success': False,
                 'message': f'Error getting stats: {str(e)}'
             })
+
+@method_decorator(staff_member_required, name='dispatch')
+class QueryProfileView(View):
+    template_name = 'admin/query_profile.html'
+
+    def get(self, request):
+        from core.query_profiler import query_profiler
+
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'success': True,
+                'aggregates': query_profiler.aggregates(),
+                'samples': query_profiler.samples(),
+            })
+
+        context = {
+            'title': 'Query Profile',
+            'aggregates': query_profiler.aggregates(),
+            'samples': query_profiler.samples(),
+            'slow_ms': query_profiler.slow_ms,
+            'slow_queries': query_profiler.slow_queries,
+            'duplicate_threshold': query_profiler.duplicate_threshold,
+            'opts': User._meta,
+        }
+        return render(request, self.template_name, context)
+
+    def post(self, request):
+        from core.query_profiler import query_profiler
+
+        query_profiler.reset()
+        messages.success(request, 'Query profile data cleared.')
+        return redirect('admin:query_profile')
@@ -91,6 +91,11 @@ class Command(BaseCommand):
             self.create_applications_bulk(jobs, users)
             self.stdout.write(self.style.SUCCESS('Created job applications'))
 
+        # Bulk inserts skip the signals that keep search documents fresh
+        from core.search_index import search_index
+        search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS('Rebuilt search index'))
+
         end_time = time.time()
         duration = end_time - start_time
         self.stdout.write(self.style.SUCCESS(f'Test data seeding completed successfully in {duration:.2f} seconds!'))
@@ -524,7 +529,7 @@ class Command(BaseCommand):
 
     def create_comments_and_likes(self, posts, users):
         """Create comments and likes on posts"""
-        from feed.models import Comment
+        from feed.models import Comment, Post
         
         for post in posts:
             # Create 0-10 comments per post
@@ -566,6 +571,8 @@ class Command(BaseCommand):
             likers = random.sample(users, min(num_likes, len(users)))
             post.likes.set(likers)
 
+        Post.refresh_counters([post.id for post in posts])
+
     def create_messages(self, users):
         """Create messages between users"""
         from messaging.models import Message
@@ -812,6 +819,10 @@ class Command(BaseCommand):
         # Bulk create
         Connection.objects.bulk_create(connections, batch_size=500)
         Follow.objects.bulk_create(follows, batch_size=500)
+        
+        # bulk_create skips signals, so push the seeded posts into timelines now
+        from feed.timeline_manager import timeline_manager
+        timeline_manager.rebuild()
 
     def create_comments_and_likes_bulk(self, posts, users):
         """Create comments and likes using bulk operations"""
@@ -846,6 +857,9 @@ class Command(BaseCommand):
         for post_id, likers in post_likes.items():
             Post.objects.filter(id=post_id).first().likes.set(likers)
 
+        # Bulk inserts bypass the views that keep the counters in step
+        Post.refresh_counters([post.id for post in posts])
+
     def create_messages_bulk(self, users):
         """Create messages using bulk operations"""
         from messaging.models import Message
@@ -894,6 +908,10 @@ class Command(BaseCommand):
         
         # Bulk create
         Message.objects.bulk_create(messages, batch_size=500)
+        
+        # bulk_create skips post_save, so build the inbox summaries directly
+        from messaging.models import Conversation
+        Conversation.rebuild_all()
 
     def create_applications_bulk(self, jobs, users):
         """Create job applications using bulk operations"""
@@ -529,7 +529,7 @@ class DashboardStatsPropertyTests(HypothesisTestCase):
             user_stats_1 = DashboardStats.get_user_stats()
             
             # Verify data was cached
-            cached_data = cache.get('admin_dashboard_user_stats')
+            cached_data = DashboardStats.cache.get('user_stats')
             self.assertIsNotNone(
                 cached_data,
                 "Data should be cached after first call"
@@ -554,14 +554,14 @@ class DashboardStatsPropertyTests(HypothesisTestCase):
             # Verify cache timeout is set correctly (5 minutes = 300 seconds)
             # We can't directly test the timeout, but we can verify the cache key exists
             self.assertIsNotNone(
-                cache.get('admin_dashboard_user_stats'),
+                DashboardStats.cache.get('user_stats'),
                 "Cache should still exist immediately after second call"
             )
             
             # Test cache clearing functionality
             DashboardStats.clear_cache()
             
-            cached_data_after_clear = cache.get('admin_dashboard_user_stats')
+            cached_data_after_clear = DashboardStats.cache.get('user_stats')
             self.assertIsNone(
                 cached_data_after_clear,
                 "Cache should be cleared after calling clear_cache()"
@@ -569,16 +569,16 @@ class DashboardStatsPropertyTests(HypothesisTestCase):
             
             # Test that all cache keys are cleared
             cache_keys = [
-                'admin_dashboard_user_stats',
-                'admin_dashboard_content_stats',
-                'admin_dashboard_job_stats',
-                'admin_dashboard_network_stats',
-                'admin_dashboard_chart_data',
+                'user_stats',
+                'content_stats',
+                'job_stats',
+                'network_stats',
+                'chart_data',
             ]
             
             # Set some cache values
             for key in cache_keys:
-                cache.set(key, {'test': 'data'}, 300)
+                DashboardStats.cache.set(key, {'test': 'data'})
             
             # Clear cache
             DashboardStats.clear_cache()
@@ -586,7 +586,7 @@ class DashboardStatsPropertyTests(HypothesisTestCase):
             # Verify all keys are cleared
             for key in cache_keys:
                 self.assertIsNone(
-                    cache.get(key),
+                    DashboardStats.cache.get(key),
                     f"Cache key {key} should be cleared"
                 )
             
@@ -14,4 +14,8 @@ class MessagingConfig(AppConfig):
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
-            logger.error(f"Error setting up notification signals: {e}")
\ No newline at end of file
+            logger.error(f"Error setting up notification signals: {e}")
+        
+        from core.metrics import metrics
+        from .offline_queue_manager import offline_queue_manager
+        metrics.register_collector(offline_queue_manager.collect_queue_metrics)
\ No newline at end of file
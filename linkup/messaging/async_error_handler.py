@@ -1,12 +1,14 @@
 """
 Comprehensive async error handler for messaging system
+
+Errors are queued on the buffered error sink (see error_sink.py) rather
+than written inline, so handlers never wait on the database.
 """
 import asyncio
 import logging
 from typing import Optional, Dict, Any, Union
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from .models import MessagingError
+from .error_sink import error_sink
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -14,7 +16,7 @@ User = get_user_model()
 
 class AsyncErrorHandler:
     """
-    Centralized async error handler that safely manages database operations
+    Centralized async error handler; error storage is queued, so it is safe
     in both sync and async contexts
     """
     
@@ -36,34 +38,24 @@ class AsyncErrorHandler:
         context_data: Optional[Dict[str, Any]] = None,
         user: Optional[User] = None,
         severity: str = 'medium'
-    ) -> Optional[MessagingError]:
+    ) -> bool:
         """
-        Safely log error to database, automatically handling async/sync contexts
+        Queue an error for storage. Returns True if it was queued rather than sampled out or dropped.
         """
         try:
-            if AsyncErrorHandler.is_async_context():
-                # We're in async context, use the async method
-                return await MessagingError.log_error_async(
-                    error_type=error_type,
-                    error_message=error_message,
-                    context_data=context_data,
-                    user=user,
-                    severity=severity
-                )
-            else:
-                # We're in sync context, use the regular method
-                return MessagingError.log_error(
-                    error_type=error_type,
-                    error_message=error_message,
-                    context_data=context_data,
-                    user=user,
-                    severity=severity
-                )
+            return error_sink.submit(
+                error_type=error_type,
+                error_message=error_message,
+                context_data=context_data,
+                user=user,
+                severity=severity,
+                with_traceback=True
+            )
         except Exception as db_error:
-            # If database logging fails, at least log to console
+            # If queueing fails, at least log to console
             logger.error(f"Failed to log error to database: {db_error}")
             logger.error(f"Original error: {error_message}")
-            return None
+            return False
     
     @staticmethod
     def log_error_sync(
@@ -72,22 +64,23 @@ class AsyncErrorHandler:
         context_data: Optional[Dict[str, Any]] = None,
         user: Optional[User] = None,
         severity: str = 'medium'
-    ) -> Optional[MessagingError]:
+    ) -> bool:
         """
         Synchronous error logging - safe to call from sync contexts
         """
         try:
-            return MessagingError.log_error(
+            return error_sink.submit(
                 error_type=error_type,
                 error_message=error_message,
                 context_data=context_data,
                 user=user,
-                severity=severity
+                severity=severity,
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log error to database: {db_error}")
             logger.error(f"Original error: {error_message}")
-            return None
+            return False
     
     @staticmethod
     async def handle_websocket_error(
@@ -141,14 +134,15 @@ class AsyncErrorHandler:
         # Log to console immediately
         logger.error(error_message, extra=context_data)
         
-        # Use sync logging to avoid recursive async context issues
+        # Queued, so this never blocks the event loop
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='async_context',
                 error_message=error_message,
                 context_data=context_data,
                 user=user,
-                severity='critical'
+                severity='critical',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log async context error to database: {db_error}")
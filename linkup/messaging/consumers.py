@@ -4,9 +4,10 @@ import time
 from datetime import datetime
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from .models import Message, UserStatus, Notification
+from .models import Message, UserStatus, Notification, UnreadCounter
 # Our comprehensive messaging system fixes
 from .async_handlers import AsyncSafeMessageHandler
 from .serializers import JSONSerializer
@@ -23,6 +24,9 @@ from .message_sync_manager import message_sync_manager
 from .read_receipt_manager import read_receipt_manager
 from .message_retry_manager import MessageRetryManager
 from .message_persistence_manager import message_persistence_manager
+from core.metrics import instrument_channel_layer, websocket_connections
+from core.query_profiler import query_profiler
+from core.rate_limit import rate_limiter
 import logging
 import uuid
 import asyncio
@@ -34,6 +38,19 @@ logger = logging.getLogger(__name__)
 retry_manager = MessageRetryManager()
 
 
+async def is_flooding(user, kind, default_limit):
+    """
+    Count a frame against the user's WebSocket flood limit
+    (RATE_LIMIT_WEBSOCKET_<kind>, per RATE_LIMIT_WEBSOCKET_WINDOW seconds; 0 disables it).
+    """
+    limit = getattr(settings, f'RATE_LIMIT_WEBSOCKET_{kind.upper()}', default_limit)
+    if not limit:
+        return False
+    window = getattr(settings, 'RATE_LIMIT_WEBSOCKET_WINDOW', 10)
+    result = await rate_limiter.ahit(f'ws_{kind}', f'user_{user.id}', limit, window)
+    return not result.allowed
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -98,11 +115,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Add to chat room
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
             
+            # Typing state stays on this connection; nothing is stored
+            self.typing = typing_manager.open(self.channel_layer, self.room_group_name, user, self.other_user)
+            
             # Add to personal user group for status updates
             self.user_group_name = f'user_{user.id}'
             await self.channel_layer.group_add(self.user_group_name, self.channel_name)
             
             await self.accept()
+            instrument_channel_layer(self.channel_layer)
+            websocket_connections.inc(consumer='chat')
+            self.counted_connection = True
             
             # Handle user connection with presence manager (WhatsApp features)
             self.connection_id = await self.handle_user_connected()
@@ -156,6 +179,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
         """Enhanced disconnect handler with comprehensive cleanup and error handling"""
         disconnect_errors = []
 
+        if getattr(self, 'counted_connection', False):
+            websocket_connections.dec(consumer='chat')
+            self.counted_connection = False
+
         try:
             # Stop all typing indicators for this user
             await self.stop_all_typing()
@@ -191,7 +218,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 success = await self.message_handler.set_user_online_status(self.user, False)
                 if not success:
                     try:
-                        await MessagingLogger.log_error(
+                        MessagingLogger.log_error(
                             "Failed to log connection error to database",
                             context_data={'error_type': 'connection_error', 'exception': str(Exception("Failed to set user offline status")), 'traceback': traceback.format_exc()},
                             user=self.user
@@ -240,6 +267,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             MessagingLogger.log_error("Received empty text_data")
             return
 
+        if await is_flooding(self.user, 'frames', 120):
+            await self.send_error_response("Too many requests, slow down", error_type="rate_limited")
+            return
+
         # Validate and parse incoming data
         try:
             data = json.loads(text_data)
@@ -264,99 +295,108 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         message_type = data.get('type', 'message')
 
-        try:
-            if message_type == 'typing':
-                # Handle typing indicator with enhanced debouncing
-                is_typing = data.get('is_typing', False)
-                await self.update_typing_status(is_typing)
-
-            elif message_type == 'read_receipt':
-                # Handle single read receipt with enhanced processing
-                message_id = data.get('message_id')
-                if message_id:
-                    success = await read_receipt_manager.mark_message_as_read(
-                        message_id=message_id,
-                        reader_user_id=self.user.id
-                    )
-                    await self.send(text_data=json.dumps({
-                        'type': 'read_receipt_processed',
-                        'message_id': message_id,
-                        'success': success,
-                        'timestamp': timezone.now().isoformat()
-                    }))
-
-            elif message_type == 'bulk_read_receipt':
-                # Handle bulk read receipts
-                message_ids = data.get('message_ids', [])
-                if message_ids:
-                    result = await read_receipt_manager.mark_multiple_messages_as_read(
-                        message_ids=message_ids,
-                        reader_user_id=self.user.id
+        with query_profiler.profile(f'ws:chat:{message_type}'):
+            try:
+                if message_type == 'typing':
+                    # Broadcast only on transitions, never touches the database
+                    is_typing = bool(data.get('is_typing', False))
+                    await self.update_typing_status(is_typing)
+
+                elif message_type == 'read_receipt':
+                    # Handle single read receipt with enhanced processing
+                    message_id = data.get('message_id')
+                    if message_id:
+                        success = await read_receipt_manager.mark_message_as_read(
+                            message_id=message_id,
+                            reader_user_id=self.user.id
+                        )
+                        await self.send(text_data=json.dumps({
+                            'type': 'read_receipt_processed',
+                            'message_id': message_id,
+                            'success': success,
+                            'timestamp': timezone.now().isoformat()
+                        }))
+
+                elif message_type == 'bulk_read_receipt':
+                    # Handle bulk read receipts
+                    message_ids = data.get('message_ids', [])
+                    if message_ids:
+                        result = await read_receipt_manager.mark_multiple_messages_as_read(
+                            message_ids=message_ids,
+                            reader_user_id=self.user.id
+                        )
+                        await self.send(text_data=json.dumps({
+                            'type': 'bulk_read_receipt_processed',
+                            'result': result
+                        }))
+
+                elif message_type == 'mark_chat_read':
+                    # Handle marking entire chat as read
+                    result = await read_receipt_manager.mark_visible_messages_as_read(
+                        user_id=self.user.id,
+                        chat_partner_id=self.other_user.id,
+                        visible_message_ids=data.get('visible_message_ids')
                     )
                     await self.send(text_data=json.dumps({
-                        'type': 'bulk_read_receipt_processed',
+                        'type': 'chat_marked_read',
                         'result': result
                     }))
 
-            elif message_type == 'mark_chat_read':
-                # Handle marking entire chat as read
-                result = await read_receipt_manager.mark_visible_messages_as_read(
-                    user_id=self.user.id,
-                    chat_partner_id=self.other_user.id,
-                    visible_message_ids=data.get('visible_message_ids')
-                )
-                await self.send(text_data=json.dumps({
-                    'type': 'chat_marked_read',
-                    'result': result
-                }))
+                elif message_type == 'message':
+                    if await is_flooding(self.user, 'messages', 30):
+                        await self.send_error_response(
+                            "You are sending messages too quickly",
+                            client_id=data.get('client_id'),
+                            error_type="rate_limited",
+                            retry_available=True,
+                        )
+                    else:
+                        await self._handle_message(data)
 
-            elif message_type == 'message':
-                await self._handle_message(data)
+                elif message_type == 'ping':
+                    await self._handle_ping(data)
 
-            elif message_type == 'ping':
-                await self._handle_ping(data)
+                elif message_type == 'force_reconnect':
+                    await self.force_reconnect()
+                    await self.send(text_data=json.dumps({
+                        'type': 'reconnect_initiated',
+                        'timestamp': timezone.now().isoformat()
+                    }))
 
-            elif message_type == 'force_reconnect':
-                await self.force_reconnect()
-                await self.send(text_data=json.dumps({
-                    'type': 'reconnect_initiated',
-                    'timestamp': timezone.now().isoformat()
-                }))
+                elif message_type == 'sync_request':
+                    await self.synchronize_missed_messages()
+                    await self.send(text_data=json.dumps({
+                        'type': 'sync_completed',
+                        'timestamp': timezone.now().isoformat()
+                    }))
 
-            elif message_type == 'sync_request':
-                await self.synchronize_missed_messages()
-                await self.send(text_data=json.dumps({
-                    'type': 'sync_completed',
-                    'timestamp': timezone.now().isoformat()
-                }))
+                elif message_type == 'get_connection_status':
+                    await self._handle_get_connection_status(data)
 
-            elif message_type == 'get_connection_status':
-                await self._handle_get_connection_status(data)
+                else:
+                    MessagingLogger.log_error(
+                        f"Unknown message type: {message_type}",
+                        context_data={'message_type': message_type, 'data': data}
+                    )
+                    await self.send_error_response(f"Unknown message type: {message_type}")
 
-            else:
-                MessagingLogger.log_error(
-                    f"Unknown message type: {message_type}",
-                    context_data={'message_type': message_type, 'data': data}
+            except Exception as e:
+                logger.error(f"Error in receive: {e}")
+                # Use the new async error handler
+                await log_async_context_error(
+                    e,
+                    "websocket_receive",
+                    self.user,
+                    context_data={
+                        'message_type': message_type,
+                        'data_keys': list(data.keys()) if isinstance(data, dict) else 'not_dict'
+                    }
+                )
+                await self.send_error_response(
+                    "Internal server error",
+                    error_type="internal_error",
+                    error_details=str(e) if logger.isEnabledFor(logging.DEBUG) else None
                 )
-                await self.send_error_response(f"Unknown message type: {message_type}")
-
-        except Exception as e:
-            logger.error(f"Error in receive: {e}")
-            # Use the new async error handler
-            await log_async_context_error(
-                e,
-                "websocket_receive",
-                self.user,
-                context_data={
-                    'message_type': message_type,
-                    'data_keys': list(data.keys()) if isinstance(data, dict) else 'not_dict'
-                }
-            )
-            await self.send_error_response(
-                "Internal server error",
-                error_type="internal_error",
-                error_details=str(e) if logger.isEnabledFor(logging.DEBUG) else None
-            )
 
     async def _handle_message(self, data):
         """Handle regular message with async-safe operations, enhanced serialization, and retry mechanisms"""
@@ -399,9 +439,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                         await message_persistence_manager.update_message_status_atomic(
                             msg.id, 'read', self.user.id
                         )
-                    else:
-                        # Create notification for the recipient
-                        await self.create_message_notification(msg)
+                    # The recipient's notification is queued by the Message post_save signal
                 else:
                     # Broadcasting failed, initiate retry mechanism
                     logger.warning(f"Message {msg.id} broadcast failed, initiating retry")
@@ -697,27 +735,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'status_icon': 'read' if is_self_chat else msg.get_status_icon()
         }
 
-    @database_sync_to_async
-    def update_typing_status(self, is_typing):
-        """Update typing status using the typing manager"""
+    async def update_typing_status(self, is_typing):
+        """Apply a typing frame to this connection's in-memory indicator"""
         try:
-            return typing_manager.update_typing_status(
-                self.user,
-                self.other_user, 
-                is_typing
-            )
+            return await self.typing.update(is_typing)
         except Exception as e:
             logger.error(f"Failed to update typing status: {e}")
             return False
 
-    @database_sync_to_async
-    def stop_all_typing(self):
-        """Stop all typing indicators for this user"""
+    async def stop_all_typing(self):
+        """Clear this connection's typing indicator"""
         try:
-            return typing_manager.stop_all_typing_for_user(self.user)
+            return await typing_manager.close(getattr(self, 'typing', None))
         except Exception as e:
             logger.error(f"Failed to stop typing for user: {e}")
-            return 0
+            return False
 
     @database_sync_to_async
     def handle_user_connected(self):
@@ -785,19 +817,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'last_seen_display': 'Unknown'
             }
 
-    @database_sync_to_async
-    def create_message_notification(self, message):
-        """Create a notification for a new message"""
-        try:
-            from .notification_service import notify_new_message
-            notify_new_message(
-                sender=message.sender,
-                recipient=message.recipient,
-                message_obj=message
-            )
-        except Exception as e:
-            logger.error(f"Error creating message notification: {e}")
-
     # Connection Recovery Integration Methods
     async def register_connection_recovery(self):
         """Register this connection with the recovery manager"""
@@ -920,6 +939,9 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
         self.user_group_name = f'user_{user.id}'
         await self.channel_layer.group_add(self.user_group_name, self.channel_name)
         await self.accept()
+        instrument_channel_layer(self.channel_layer)
+        websocket_connections.inc(consumer='notifications')
+        self.counted_connection = True
 
         # Mark user as online using async-safe handler
         success = await self.message_handler.set_user_online_status(user, True)
@@ -939,6 +961,10 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=self.json_serializer.to_json_string(serialized_response))
 
     async def disconnect(self, close_code):
+        if getattr(self, 'counted_connection', False):
+            websocket_connections.dec(consumer='notifications')
+            self.counted_connection = False
+
         try:
             # Mark user as offline using async-safe handler
             if hasattr(self, 'user'):
@@ -964,6 +990,10 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
             MessagingLogger.log_error("Received empty text_data in notifications")
             return
 
+        if await is_flooding(self.user, 'frames', 120):
+            await self.send_error_response("Too many requests, slow down")
+            return
+
         try:
             data = json.loads(text_data)
         except json.JSONDecodeError as e:
@@ -987,28 +1017,29 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
 
         message_type = self.connection_validator.safe_get(data, 'type')
 
-        try:
-            if message_type == 'mark_read':
-                await self._handle_mark_read(data)
-            elif message_type == 'mark_all_read':
-                await self._handle_mark_all_read(data)
-            elif message_type == 'get_notifications':
-                await self._handle_get_notifications(data)
-            elif message_type == 'ping':
-                await self._handle_notification_ping(data)
-            else:
+        with query_profiler.profile(f'ws:notifications:{message_type}'):
+            try:
+                if message_type == 'mark_read':
+                    await self._handle_mark_read(data)
+                elif message_type == 'mark_all_read':
+                    await self._handle_mark_all_read(data)
+                elif message_type == 'get_notifications':
+                    await self._handle_get_notifications(data)
+                elif message_type == 'ping':
+                    await self._handle_notification_ping(data)
+                else:
+                    MessagingLogger.log_error(
+                        f"Unknown notification message type: {message_type}",
+                        context_data={'message_type': message_type, 'user_id': self.user.id}
+                    )
+                    await self.send_error_response(f"Unknown message type: {message_type}")
+
+            except Exception as e:
                 MessagingLogger.log_error(
-                    f"Unknown notification message type: {message_type}",
+                    f"Error processing notification request: {e}",
                     context_data={'message_type': message_type, 'user_id': self.user.id}
                 )
-                await self.send_error_response(f"Unknown message type: {message_type}")
-
-        except Exception as e:
-            MessagingLogger.log_error(
-                f"Error processing notification request: {e}",
-                context_data={'message_type': message_type, 'user_id': self.user.id}
-            )
-            await self.send_error_response(f"Error processing request: {str(e)}")
+                await self.send_error_response(f"Error processing request: {str(e)}")
 
     async def _handle_mark_read(self, data):
         """Handle mark notification as read"""
@@ -1166,7 +1197,7 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
     def get_unread_notification_count(self, user):
         """Get total unread notification count with error handling"""
         try:
-            return Notification.objects.filter(recipient=user, is_read=False).count()
+            return UnreadCounter.badge(user.id)['notifications']
         except Exception as e:
             MessagingLogger.log_error(
                 f"Error getting unread notification count: {e}",
@@ -1206,10 +1237,7 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
             if notification_type:
                 query = query.filter(notification_type=notification_type)
 
-            count = 0
-            for notification in query:
-                notification.mark_as_read()
-                count += 1
+            count = Notification.mark_read_bulk(query)
 
             MessagingLogger.log_debug(
                 f"Marked {count} notifications as read",
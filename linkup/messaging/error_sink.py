@@ -0,0 +1,238 @@
+"""
+Buffered, rate-limited sink for MessagingError rows.
+
+MessagingLogger and AsyncErrorHandler used to INSERT one row, with a full
+traceback, for every error they saw, often from inside WebSocket handlers.
+An error storm became a write storm. They now hand records to this sink,
+which never touches the database on the caller's path:
+
+- submit() only appends to a bounded in-memory queue under a lock. It is
+  the same call from sync and async code.
+- Each fingerprint (error type + message with numbers and ids collapsed)
+  is limited per window: the first MESSAGING_ERROR_SINK_BURST occurrences
+  are kept, then one in MESSAGING_ERROR_SINK_SAMPLE_EVERY. A kept row
+  records how many occurrences were skipped since the previous one.
+- When the queue (or the fingerprint table) is full, new records are
+  dropped and counted.
+- MESSAGING_ERROR_SINK_MODE picks the writer. In 'thread' (the default)
+  a background thread writes the queue with bulk_create every
+  MESSAGING_ERROR_SINK_FLUSH_INTERVAL seconds, sooner once a batch is
+  ready, and once more at process exit, whether the error came from sync
+  or async code. In 'manual' (tests) nothing is written until flush() is
+  called.
+
+So write volume is bounded by the number of distinct fingerprints, not by
+the error rate.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.metrics import messaging_error_log
+
+logger = logging.getLogger(__name__)
+
+_VOLATILE = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|0x[0-9a-f]+|\d+',
+    re.IGNORECASE,
+)
+
+
+def _setting(name, default):
+    return getattr(settings, f'MESSAGING_ERROR_SINK_{name}', default)
+
+
+def fingerprint(error_type: str, error_message: str, context_data: Optional[Dict[str, Any]] = None) -> str:
+    """Group errors that differ only in ids, counts or addresses."""
+    exception_type = (context_data or {}).get('exception_type', '')
+    return f"{error_type}:{exception_type}:{_VOLATILE.sub('#', error_message)[:200]}"
+
+
+class _Window:
+    __slots__ = ('started', 'seen', 'skipped')
+
+    def __init__(self, started: float):
+        self.started = started
+        self.seen = 0
+        self.skipped = 0
+
+
+class ErrorSink:
+    """Collects MessagingError records in memory and writes them in batches."""
+
+    def __init__(self):
+        self._queue = deque()
+        self._windows: Dict[str, _Window] = {}
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self._atexit_registered = False
+        self.dropped: Dict[str, int] = {'sampled_out': 0, 'queue_full': 0, 'fingerprints_full': 0, 'write_failed': 0}
+
+    def submit(self, error_type: str, error_message: str, context_data: Optional[Dict[str, Any]] = None,
+               user=None, severity: str = 'medium', with_traceback: bool = False) -> bool:
+        """
+        Queue an error for writing. Never blocks on the database.
+
+        With ``with_traceback``, the exception being handled is formatted
+        only if the record is kept, so sampled-out errors skip that cost.
+
+        Returns:
+            bool: True if the error was queued, False if it was sampled out or dropped
+        """
+        key = fingerprint(error_type, error_message, context_data)
+        now = time.monotonic()
+        with self._lock:
+            window = self._window(key, now)
+            if window is None:
+                outcome = 'fingerprints_full'
+            else:
+                window.seen += 1
+                burst = _setting('BURST', 10)
+                sample_every = max(_setting('SAMPLE_EVERY', 100), 1)
+                if window.seen > burst and (window.seen - burst) % sample_every:
+                    window.skipped += 1
+                    outcome = 'sampled_out'
+                elif len(self._queue) >= _setting('MAX_QUEUE', 1000):
+                    outcome = 'queue_full'
+                else:
+                    outcome = 'queued'
+                    self._queue.append({
+                        'error_type': error_type,
+                        'error_message': error_message,
+                        'context_data': self._trim(context_data, window, with_traceback),
+                        'user_id': getattr(user, 'pk', None),
+                        'severity': severity,
+                    })
+                    window.skipped = 0
+            if outcome != 'queued':
+                self.dropped[outcome] += 1
+            ready = len(self._queue) >= _setting('BATCH_SIZE', 100)
+
+        messaging_error_log.inc(outcome=outcome)
+        if outcome == 'queued' and _setting('MODE', 'thread') == 'thread':
+            self._ensure_thread()
+            if ready:
+                self._event.set()
+        return outcome == 'queued'
+
+    def _window(self, key: str, now: float) -> Optional[_Window]:
+        """The fingerprint's current window, or None when too many fingerprints are tracked."""
+        window = self._windows.get(key)
+        length = _setting('WINDOW', 60)
+        if window is not None and now - window.started < length:
+            return window
+        if window is None and len(self._windows) >= _setting('MAX_FINGERPRINTS', 1000):
+            self._windows = {k: w for k, w in self._windows.items() if now - w.started < length}
+            if len(self._windows) >= _setting('MAX_FINGERPRINTS', 1000):
+                return None
+        fresh = _Window(now)
+        # Carry skips the old window never reported into the first row of the new one
+        if window is not None:
+            fresh.skipped = window.skipped
+        self._windows[key] = fresh
+        return fresh
+
+    @staticmethod
+    def _trim(context_data: Optional[Dict[str, Any]], window: _Window, with_traceback: bool) -> Dict[str, Any]:
+        context = dict(context_data or {})
+        if with_traceback and 'traceback' not in context and sys.exc_info()[0] is not None:
+            context['traceback'] = traceback.format_exc()
+        trace = context.get('traceback')
+        limit = _setting('TRACEBACK_CHARS', 4000)
+        if isinstance(trace, str) and len(trace) > limit:
+            context['traceback'] = '...' + trace[-limit:]
+        if window.skipped:
+            context['suppressed_since_last'] = window.skipped
+        return context
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def flush(self) -> int:
+        """Write everything queued so far. Returns the number of rows written."""
+        from .models import MessagingError
+
+        written = 0
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), _setting('BATCH_SIZE', 100)))]
+            if not batch:
+                return written
+            rows = [
+                MessagingError(
+                    error_type=record['error_type'],
+                    error_message=record['error_message'],
+                    # Callers pass arbitrary objects; make sure the JSON column can hold them
+                    context_data=json.loads(json.dumps(record['context_data'], default=str)),
+                    user_id=record['user_id'],
+                    severity=record['severity'],
+                )
+                for record in batch
+            ]
+            try:
+                MessagingError.objects.bulk_create(rows)
+                written += len(rows)
+            except Exception as e:
+                with self._lock:
+                    self.dropped['write_failed'] += len(rows)
+                messaging_error_log.inc(len(rows), outcome='write_failed')
+                logger.error(f"Failed to write {len(rows)} messaging errors: {e}")
+
+    def discard(self) -> int:
+        """Drop everything queued without writing it (tests). Returns the number of records dropped."""
+        with self._lock:
+            dropped = len(self._queue)
+            self._queue.clear()
+            self._windows.clear()
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'pending': len(self._queue), 'fingerprints': len(self._windows), 'dropped': dict(self.dropped)}
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        register_atexit = False
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's thread did not come along
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='messaging-error-sink', daemon=True)
+                self._thread.start()
+                register_atexit = not self._atexit_registered
+                self._atexit_registered = True
+        if register_atexit:
+            # Once per sink; forked children inherit it and flush their own queue
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._event.wait(_setting('FLUSH_INTERVAL', 2))
+            self._event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing messaging errors: {e}")
+            finally:
+                close_old_connections()
+
+
+# Global instance
+error_sink = ErrorSink()
@@ -1,12 +1,14 @@
 """
 Logging utilities for messaging system with error categorization
+
+Errors are stored through the buffered error sink (see error_sink.py), so
+logging never waits on the database.
 """
 import logging
-import traceback
 import asyncio
 from typing import Optional, Dict, Any
 from django.contrib.auth import get_user_model
-from .models import MessagingError
+from .error_sink import error_sink
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -26,26 +28,16 @@ class MessagingLogger:
     
     @staticmethod
     async def _log_error_safe(error_type, error_message, context_data=None, user=None, severity='medium'):
-        """Safely log error to database, handling both sync and async contexts"""
+        """Queue an error for storage; the sink call is the same in sync and async contexts"""
         try:
-            if MessagingLogger._is_async_context():
-                # Use async-safe method
-                await MessagingError.log_error_async(
-                    error_type=error_type,
-                    error_message=error_message,
-                    context_data=context_data,
-                    user=user,
-                    severity=severity
-                )
-            else:
-                # Use regular sync method
-                MessagingError.log_error(
-                    error_type=error_type,
-                    error_message=error_message,
-                    context_data=context_data,
-                    user=user,
-                    severity=severity
-                )
+            error_sink.submit(
+                error_type=error_type,
+                error_message=error_message,
+                context_data=context_data,
+                user=user,
+                severity=severity,
+                with_traceback=True
+            )
         except Exception as db_error:
             # If database logging fails, at least log to console
             logger.error(f"Failed to log error to database: {db_error}")
@@ -58,20 +50,20 @@ class MessagingLogger:
         context = {
             'error_type': 'async_context',
             'exception_type': type(error).__name__,
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
         logger.error(error_message, extra=context)
         
-        # Store in database for monitoring - use sync version since this is typically called from sync context
+        # Store for monitoring
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='async_context',
                 error_message=error_message,
                 context_data=context,
                 user=user,
-                severity='high'
+                severity='high',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log async context error to database: {db_error}")
@@ -84,7 +76,6 @@ class MessagingLogger:
             'error_type': 'json_serialization',
             'exception_type': type(error).__name__,
             'problematic_data_type': type(data).__name__ if data is not None else 'unknown',
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
@@ -95,12 +86,13 @@ class MessagingLogger:
         logger.error(error_message, extra=context)
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='json_serialization',
                 error_message=error_message,
                 context_data=context,
                 user=user,
-                severity='medium'
+                severity='medium',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log serialization error to database: {db_error}")
@@ -116,19 +108,19 @@ class MessagingLogger:
         context = {
             'error_type': 'connection_handling',
             'connection_data_type': type(connection_data).__name__ if connection_data is not None else 'unknown',
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
         logger.error(error_message, extra=context)
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='connection_handling',
                 error_message=error_message,
                 context_data=context,
                 user=user,
-                severity='medium'
+                severity='medium',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log connection error to database: {db_error}")
@@ -141,18 +133,18 @@ class MessagingLogger:
             'error_type': 'routing_pattern',
             'exception_type': type(error).__name__,
             'pattern': pattern,
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
         logger.error(error_message, extra=context)
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='routing_pattern',
                 error_message=error_message,
                 context_data=context,
-                severity='critical'  # Routing errors are critical
+                severity='critical',  # Routing errors are critical
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log routing error to database: {db_error}")
@@ -165,19 +157,19 @@ class MessagingLogger:
             'error_type': 'websocket_transmission',
             'exception_type': type(error).__name__,
             'message_data_type': type(message_data).__name__ if message_data is not None else 'unknown',
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
         logger.error(error_message, extra=context)
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='websocket_transmission',
                 error_message=error_message,
                 context_data=context,
                 user=user,
-                severity='high'
+                severity='high',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log websocket error to database: {db_error}")
@@ -190,19 +182,19 @@ class MessagingLogger:
             'error_type': 'database_operation',
             'exception_type': type(error).__name__,
             'operation': operation,
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
         logger.error(error_message, extra=context)
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='database_operation',
                 error_message=error_message,
                 context_data=context,
                 user=user,
-                severity='high'
+                severity='high',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log database error to database: {db_error}")
@@ -215,19 +207,19 @@ class MessagingLogger:
             'error_type': 'notification_delivery',
             'exception_type': type(error).__name__,
             'notification_data_type': type(notification_data).__name__ if notification_data is not None else 'unknown',
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
         logger.error(error_message, extra=context)
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='notification_delivery',
                 error_message=error_message,
                 context_data=context,
                 user=user,
-                severity='medium'
+                severity='medium',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log notification error to database: {db_error}")
@@ -240,19 +232,19 @@ class MessagingLogger:
             'error_type': 'message_processing',
             'exception_type': type(error).__name__,
             'message_data_type': type(message_data).__name__ if message_data is not None else 'unknown',
-            'traceback': traceback.format_exc(),
             **(context_data or {})
         }
         
         logger.error(error_message, extra=context)
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='message_processing',
                 error_message=error_message,
                 context_data=context,
                 user=user,
-                severity='medium'
+                severity='medium',
+                with_traceback=True
             )
         except Exception as db_error:
             logger.error(f"Failed to log message processing error to database: {db_error}")
@@ -263,7 +255,7 @@ class MessagingLogger:
         logger.error(message, extra=context_data or {})
         
         try:
-            MessagingError.log_error(
+            error_sink.submit(
                 error_type='message_processing',
                 error_message=message,
                 context_data=context_data or {},
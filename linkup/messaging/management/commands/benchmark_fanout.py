@@ -0,0 +1,285 @@
+"""
+Django management command to benchmark real-time message fan-out through the consumers
+"""
+import asyncio
+import itertools
+import json
+import statistics
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from messaging.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+LAYERS = {
+    'memory': lambda options: {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    'redis': lambda options: {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [options['redis_url']]},
+    },
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Drive simulated chat traffic through ChatConsumer/NotificationsConsumer and report fan-out performance'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=20,
+            help='Number of simulated users (default: 20)',
+        )
+        parser.add_argument(
+            '--conversations',
+            type=int,
+            default=10,
+            help='Number of concurrent conversations between those users (default: 10)',
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=20,
+            help='Messages sent in each conversation (default: 20)',
+        )
+        parser.add_argument(
+            '--typing-frames',
+            type=int,
+            default=3,
+            help='Typing frames sent before each message (default: 3)',
+        )
+        parser.add_argument(
+            '--ping-every',
+            type=int,
+            default=5,
+            help='Send a ping after every N messages, 0 to disable (default: 5)',
+        )
+        parser.add_argument(
+            '--layer',
+            choices=sorted(LAYERS),
+            default='memory',
+            help='Channel layer to benchmark against (default: memory)',
+        )
+        parser.add_argument(
+            '--redis-url',
+            default='redis://127.0.0.1:6379/0',
+            help='Redis URL for --layer redis (default: redis://127.0.0.1:6379/0)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=5.0,
+            help='Seconds to wait for a message to arrive before counting it lost (default: 5)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Output in JSON format',
+        )
+        parser.add_argument(
+            '--output',
+            help='Also write the JSON results to this file',
+        )
+
+    def handle(self, *args, **options):
+        users, conversations = options['users'], options['conversations']
+        if users < 2:
+            raise CommandError('--users must be at least 2')
+        if conversations < 1 or conversations > users * (users - 1) // 2:
+            raise CommandError(f'--conversations must be between 1 and {users * (users - 1) // 2} for {users} users')
+        if options['layer'] == 'redis':
+            try:
+                import channels_redis  # noqa: F401
+            except ImportError:
+                raise CommandError('channels_redis is required for --layer redis')
+
+        self.verbosity = options['verbosity']
+        # Every simulated user sends far faster than the WebSocket flood limits allow
+        with override_settings(
+            CHANNEL_LAYERS={'default': LAYERS[options['layer']](options)},
+            RATE_LIMIT_WEBSOCKET_FRAMES=0,
+            RATE_LIMIT_WEBSOCKET_MESSAGES=0,
+        ):
+            results = self.run_benchmark(options)
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        latency = results['latency_ms']
+        self.stdout.write(
+            f"{results['messages']['received']}/{results['messages']['sent']} messages over "
+            f"{results['config']['conversations']} conversations ({results['config']['layer']} layer)"
+        )
+        self.stdout.write(f"{'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'msg/s':>10} {'q/msg':>10}")
+        self.stdout.write(
+            f"{latency['p50']:>10.2f} {latency['p95']:>10.2f} {latency['p99']:>10.2f} "
+            f"{results['throughput']['messages_per_sec']:>10.1f} {results['db']['queries_per_message']:>10.1f}"
+        )
+        if results['messages']['lost']:
+            self.stdout.write(self.style.WARNING(f"{results['messages']['lost']} messages were not received"))
+
+    def run_benchmark(self, options):
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(username=f'fanout_{run_id}_{i}', email=f'fanout_{run_id}_{i}@bench.local')
+            for i in range(options['users'])
+        ]
+        pairs = list(itertools.islice(itertools.combinations(users, 2), options['conversations']))
+
+        try:
+            return async_to_sync(self.drive)(users, pairs, run_id, options)
+        finally:
+            # Deleting the users cascades to every benchmark message and conversation
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    async def drive(self, users, pairs, run_id, options):
+        application = URLRouter(websocket_urlpatterns)
+
+        def communicator(user, path):
+            socket = WebsocketCommunicator(application, path)
+            socket.scope['user'] = user
+            return socket
+
+        notification_sockets = [communicator(user, '/ws/notifications/') for user in users]
+        chats = [
+            (communicator(a, f'/ws/chat/{b.username}/'), communicator(b, f'/ws/chat/{a.username}/'))
+            for a, b in pairs
+        ]
+        sockets = notification_sockets + [socket for chat in chats for socket in chat]
+        for socket in sockets:
+            connected, _ = await socket.connect()
+            if not connected:
+                raise CommandError('A benchmark WebSocket failed to connect')
+        for socket in sockets:
+            await self.drain(socket)
+        if self.verbosity > 1:
+            self.stdout.write(f"Connected {len(sockets)} sockets")
+
+        # Only the traffic phase is counted. The consumers' ORM work runs on the
+        # thread-sensitive executor, so the capture is entered and read there too.
+        queries = CaptureQueriesContext(connection)
+        await database_sync_to_async(queries.__enter__)()
+        started = time.perf_counter()
+        try:
+            outcomes = await asyncio.gather(*[
+                self.converse(index, a_socket, b_socket, run_id, options)
+                for index, (a_socket, b_socket) in enumerate(chats)
+            ])
+        finally:
+            elapsed = time.perf_counter() - started
+            await database_sync_to_async(queries.__exit__)(None, None, None)
+        query_count = await database_sync_to_async(lambda: len(queries.captured_queries))()
+
+        notification_frames = 0
+        for socket in notification_sockets:
+            notification_frames += await self.drain(socket)
+        for socket in sockets:
+            await socket.disconnect()
+
+        latencies = sorted(latency for outcome in outcomes for latency in outcome['latencies'])
+        frames = {kind: sum(outcome['frames'][kind] for outcome in outcomes) for kind in outcomes[0]['frames']}
+        sent = frames['message']
+        return {
+            'config': {
+                'users': options['users'],
+                'conversations': options['conversations'],
+                'messages_per_conversation': options['messages'],
+                'typing_frames': options['typing_frames'],
+                'ping_every': options['ping_every'],
+                'layer': options['layer'],
+            },
+            'duration_sec': round(elapsed, 3),
+            'messages': {'sent': sent, 'received': len(latencies), 'lost': sent - len(latencies)},
+            'frames_sent': frames,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) or 0, 3),
+                'p95': round(percentile(latencies, 95) or 0, 3),
+                'p99': round(percentile(latencies, 99) or 0, 3),
+                'max': round(latencies[-1], 3) if latencies else 0,
+                'mean': round(statistics.mean(latencies), 3) if latencies else 0,
+            },
+            'throughput': {
+                'messages_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0,
+                'frames_per_sec': round(sum(frames.values()) / elapsed, 1) if elapsed else 0,
+            },
+            'db': {
+                'queries': query_count,
+                'queries_per_message': round(query_count / sent, 2) if sent else 0,
+            },
+            'notifications': {'frames_received': notification_frames},
+        }
+
+    async def converse(self, index, a_socket, b_socket, run_id, options):
+        """Alternate senders in one conversation, timing each message until the other side sees it"""
+        frames = {'message': 0, 'typing': 0, 'ping': 0, 'read_receipt': 0}
+        latencies = []
+        for seq in range(options['messages']):
+            sender, recipient = (a_socket, b_socket) if seq % 2 == 0 else (b_socket, a_socket)
+            client_id = f'fanout_{run_id}_{index}_{seq}'
+
+            for _ in range(options['typing_frames']):
+                await sender.send_json_to({'type': 'typing', 'is_typing': True})
+                frames['typing'] += 1
+
+            started = time.perf_counter()
+            await sender.send_json_to({'type': 'message', 'message': f'benchmark {seq}', 'client_id': client_id})
+            frames['message'] += 1
+            message = await self.wait_for_message(recipient, client_id, options['timeout'])
+            if message is None:
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+            await recipient.send_json_to({'type': 'read_receipt', 'message_id': message['id']})
+            frames['read_receipt'] += 1
+            if options['ping_every'] and (seq + 1) % options['ping_every'] == 0:
+                await sender.send_json_to({'type': 'ping', 'timestamp': time.time()})
+                frames['ping'] += 1
+        return {'latencies': latencies, 'frames': frames}
+
+    @staticmethod
+    async def wait_for_message(socket, client_id, timeout):
+        """Read frames until the chat message with ``client_id`` arrives, or None on timeout"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            try:
+                frame = json.loads(await socket.receive_from(timeout=remaining))
+            except asyncio.TimeoutError:
+                return None
+            if frame.get('type') == 'message' and frame.get('client_id') == client_id:
+                return frame
+
+    @staticmethod
+    async def drain(socket, timeout=0.05):
+        """Discard pending frames, returning how many there were"""
+        count = 0
+        while not await socket.receive_nothing(timeout=timeout):
+            await socket.receive_from()
+            count += 1
+        return count
@@ -0,0 +1,128 @@
+"""
+Django management command to benchmark message send latency against conversation length
+"""
+import json
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from messaging.message_persistence_manager import message_persistence_manager
+from messaging.models import Message
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Measure create_message_atomic latency as a conversation grows from 10 to 100k messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='10,1000,10000,100000',
+            help='Comma-separated conversation lengths to measure (default: 10,1000,10000,100000)',
+        )
+        parser.add_argument(
+            '--sends',
+            type=int,
+            default=50,
+            help='Number of timed sends at each conversation length (default: 50)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Output in JSON format',
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        sends = options['sends']
+        self.verbosity = options['verbosity']
+
+        results = self.run_benchmark(sizes, sends)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'history':>10} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+        for row in results['results']:
+            self.stdout.write(
+                f"{row['history']:>10} {row['p50_ms']:>10.2f} {row['p95_ms']:>10.2f} {row['max_ms']:>10.2f}"
+            )
+
+        first, last = results['results'][0], results['results'][-1]
+        ratio = last['p50_ms'] / first['p50_ms'] if first['p50_ms'] else 0
+        self.stdout.write(
+            self.style.SUCCESS(f"p50 latency at {last['history']} vs {first['history']} messages: {ratio:.2f}x")
+        )
+
+    def run_benchmark(self, sizes, sends):
+        run_id = uuid.uuid4().hex[:8]
+        sender = User.objects.create_user(username=f'bench_sender_{run_id}', email=f'sender_{run_id}@bench.local')
+        recipient = User.objects.create_user(username=f'bench_recipient_{run_id}', email=f'recipient_{run_id}@bench.local')
+
+        try:
+            return self.measure(sender, recipient, run_id, sizes, sends)
+        finally:
+            # Deleting the users cascades to every benchmark message
+            sender.delete()
+            recipient.delete()
+
+    def measure(self, sender, recipient, run_id, sizes, sends):
+        results = []
+        history = 0
+        for size in sizes:
+            history += self.grow_history(sender, recipient, size - history)
+
+            timings = []
+            for i in range(sends):
+                start = time.perf_counter()
+                async_to_sync(message_persistence_manager.create_message_atomic)(
+                    sender=sender,
+                    recipient=recipient,
+                    content=f'benchmark message {i}',
+                    client_id=f'bench_{run_id}_{size}_{i}',
+                )
+                timings.append((time.perf_counter() - start) * 1000)
+            history += sends
+
+            timings.sort()
+            results.append({
+                'history': size,
+                'sends': sends,
+                'p50_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3),
+                'max_ms': round(timings[-1], 3),
+            })
+            if self.verbosity > 1:
+                self.stdout.write(f"Measured {sends} sends at {size} messages of history")
+
+        return {'sends_per_size': sends, 'results': results}
+
+    def grow_history(self, sender, recipient, count, batch_size=5000):
+        """Bulk-insert ``count`` old messages into the conversation."""
+        if count <= 0:
+            return 0
+
+        base_time = timezone.now() - timedelta(days=1)
+        for offset in range(0, count, batch_size):
+            batch = [
+                Message(
+                    sender=sender if i % 2 == 0 else recipient,
+                    recipient=recipient if i % 2 == 0 else sender,
+                    content=f'history message {i}',
+                    created_at=base_time + timedelta(microseconds=i),
+                    status='read',
+                    is_read=True,
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            ]
+            Message.objects.bulk_create(batch, batch_size=batch_size)
+        return count
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from messaging.notification_outbox import process_outbox, prune_processed
+
+
+class Command(BaseCommand):
+    help = 'Worker that turns queued outbox entries into notifications in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 200),
+            help='Outbox entries claimed per batch (default: NOTIFICATION_OUTBOX_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.5,
+            help='Seconds to wait when the outbox is empty (default: 0.5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox once and exit instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Processing notification outbox")
+        handled_since_prune = 0
+        try:
+            while True:
+                handled = process_outbox(options['batch_size'])
+                handled_since_prune += handled
+                if handled:
+                    self.stdout.write(f"Processed {handled} outbox entries")
+                    continue
+                if handled_since_prune:
+                    prune_processed()
+                    handled_since_prune = 0
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping notification worker")
+        self.stdout.write(self.style.SUCCESS("Notification outbox drained"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from messaging.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized conversation summaries used by the inbox'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding conversation summaries...")
+
+        with transaction.atomic():
+            count = Conversation.rebuild_all()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {count} conversation summaries")
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from messaging.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = 'Recompute the unread message and notification counters behind the badges'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Only reconcile this user id (repeatable; default: all users)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Reconciling unread counters...")
+
+        fixed = UnreadCounter.reconcile(options['user_ids'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Fixed {fixed} unread counters")
+        )
@@ -18,10 +18,12 @@ from contextlib import contextmanager, asynccontextmanager
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.db import transaction, IntegrityError, connection
-from django.db.models import Q, F, Max, Min, Count, Exists, OuterRef
+from django.db.models import Q, F, Max, Min, Count, Exists, OuterRef, Subquery
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from channels.layers import get_channel_layer
+from core.metrics import messages as message_metrics
+from core.performance import CursorPaginator, InvalidCursor
 import uuid
 import threading
 from contextlib import contextmanager
@@ -140,54 +142,6 @@ class MessageLockManager:
             with self.lock:
                 if lock_key in self.local_locks:
                     del self.local_locks[lock_key]
-    
-    @asynccontextmanager
-    async def acquire_conversation_lock_async(self, user1_id: int, user2_id: int, operation: str = 'update'):
-        """
-        Async version of conversation lock that properly handles database operations.
-        
-        Args:
-            user1_id: ID of first user
-            user2_id: ID of second user
-            operation: Type of operation
-        """
-        # Ensure consistent ordering for deadlock prevention
-        min_id, max_id = sorted([user1_id, user2_id])
-        lock_key = f"conv_lock_{min_id}_{max_id}_{operation}"
-        
-        # Use asyncio lock for async contexts
-        if not hasattr(self, 'async_locks'):
-            self.async_locks = {}
-        
-        if lock_key not in self.async_locks:
-            self.async_locks[lock_key] = asyncio.Lock()
-        
-        async with self.async_locks[lock_key]:
-            try:
-                # Use async database operations
-                from .models import Message
-                from django.db import transaction
-                from channels.db import database_sync_to_async
-                
-                @database_sync_to_async
-                def acquire_db_locks():
-                    with transaction.atomic():
-                        # Lock all messages in the conversation
-                        messages = Message.objects.filter(
-                            (Q(sender_id=user1_id) & Q(recipient_id=user2_id)) |
-                            (Q(sender_id=user2_id) & Q(recipient_id=user1_id))
-                        ).select_for_update()
-                        
-                        # Force evaluation of queryset to acquire locks
-                        return list(messages)
-                
-                # Acquire database locks asynchronously
-                await acquire_db_locks()
-                yield
-                
-            except Exception as e:
-                logger.error(f"Error in async conversation lock: {e}")
-                yield  # Still yield to prevent hanging
 
 
 class TimestampManager:
@@ -379,7 +333,7 @@ class MessagePersistenceManager:
     async def create_message_atomic(self, sender: User, recipient: User, content: str, 
                                   client_id: str = None, **kwargs) -> Optional['Message']:
         """
-        Create a message with atomic transaction and proper locking.
+        Create a message atomically, deduplicating retries by client_id.
         
         Args:
             sender: User sending the message
@@ -399,57 +353,59 @@ class MessagePersistenceManager:
             if not client_id:
                 client_id = f"server_{uuid.uuid4().hex[:12]}"
             
-            # Use async conversation lock to prevent race conditions
-            async with self.lock_manager.acquire_conversation_lock_async(sender.id, recipient.id, 'create'):
-                # Check for duplicate client_id using async ORM
+            # Create message with precise timestamp
+            created_at = self.timestamp_manager.get_precise_timestamp()
+            
+            # Filter out fields that don't exist in the Message model
+            valid_fields = {
+                'sender', 'recipient', 'content', 'client_id', 'created_at', 'status',
+                'attachment', 'is_read', 'read_at', 'delivered_at', 'sent_at', 'failed_at',
+                'retry_count', 'last_error'
+            }
+            
+            # Filter kwargs to only include valid Message model fields
+            filtered_kwargs = {k: v for k, v in kwargs.items() if k in valid_fields}
+            
+            message_data = {
+                'sender': sender,
+                'recipient': recipient,
+                'content': content,
+                'client_id': client_id,
+                'created_at': created_at,
+                'status': kwargs.get('status', 'pending'),
+                **filtered_kwargs
+            }
+            
+            # Insert-or-return: the unique (sender, client_id) constraint
+            # deduplicates retries, so no conversation-wide lock is needed and
+            # the cost of a send does not depend on the conversation length
+            try:
+                message = await database_sync_to_async(self._insert_message)(message_data)
+            except IntegrityError:
                 existing_message = await Message.objects.filter(
                     sender=sender,
                     client_id=client_id
                 ).afirst()
                 
-                if existing_message:
-                    logger.warning(f"Duplicate message with client_id {client_id}")
-                    return existing_message
-                
-                # Create message with precise timestamp
-                created_at = self.timestamp_manager.get_precise_timestamp()
-                
-                # Filter out fields that don't exist in the Message model
-                valid_fields = {
-                    'sender', 'recipient', 'content', 'client_id', 'created_at', 'status',
-                    'attachment', 'is_read', 'read_at', 'delivered_at', 'sent_at', 'failed_at',
-                    'retry_count', 'last_error'
-                }
-                
-                # Filter kwargs to only include valid Message model fields
-                filtered_kwargs = {k: v for k, v in kwargs.items() if k in valid_fields}
-                
-                message_data = {
-                    'sender': sender,
-                    'recipient': recipient,
-                    'content': content,
-                    'client_id': client_id,
-                    'created_at': created_at,
-                    'status': kwargs.get('status', 'pending'),
-                    **filtered_kwargs
-                }
-                
-                # Use async database operation
-                message = await Message.objects.acreate(**message_data)
-                
-                # Broadcast to multi-tab sync
-                await self.sync_manager.broadcast_message_update(
-                    sender.id,
-                    await self._serialize_message(message)
-                )
-                
-                await self.sync_manager.broadcast_message_update(
-                    recipient.id,
-                    await self._serialize_message(message)
-                )
+                if existing_message is None:
+                    raise
                 
-                logger.info(f"Created message {message.id} from {sender.id} to {recipient.id}")
-                return message
+                logger.warning(f"Duplicate message with client_id {client_id}")
+                return existing_message
+            
+            # Broadcast to multi-tab sync
+            await self.sync_manager.broadcast_message_update(
+                sender.id,
+                await self._serialize_message(message)
+            )
+            
+            await self.sync_manager.broadcast_message_update(
+                recipient.id,
+                await self._serialize_message(message)
+            )
+            
+            logger.info(f"Created message {message.id} from {sender.id} to {recipient.id}")
+            return message
                 
         except IntegrityError as e:
             logger.error(f"Integrity error creating message: {e}")
@@ -458,6 +414,14 @@ class MessagePersistenceManager:
             logger.error(f"Error creating message: {e}")
             return None
     
+    @staticmethod
+    def _insert_message(message_data: Dict[str, Any]) -> 'Message':
+        """Insert a message inside a savepoint so a duplicate can be recovered from."""
+        from .models import Message
+        
+        with transaction.atomic():
+            return Message.objects.create(**message_data)
+    
     async def update_message_status_atomic(self, message_id: int, new_status: str, 
                                          user_id: int = None, **kwargs) -> bool:
         """
@@ -484,6 +448,7 @@ class MessagePersistenceManager:
                 
                 # Update status and timestamp
                 old_status = message.status
+                was_unread = not message.is_read
                 message.status = new_status
                 
                 # Set appropriate timestamp
@@ -508,6 +473,14 @@ class MessagePersistenceManager:
                     return False
                 
                 await message.asave()
+                message_metrics.inc(status=new_status)
+                
+                if was_unread and message.is_read:
+                    from .models import Conversation
+                    from channels.db import database_sync_to_async
+                    await database_sync_to_async(Conversation.decrement_unread)(
+                        message.recipient_id, message.sender_id
+                    )
                 
                 # Broadcast status update
                 message_data = await self._serialize_message(message)
@@ -531,6 +504,41 @@ class MessagePersistenceManager:
             logger.error(f"Error updating message status: {e}")
             return False
     
+    def _advance_receipt_watermarks(self, message_ids: List[int], new_status: str) -> Dict[str, Any]:
+        """
+        Apply read/delivered receipts by moving conversation watermarks.
+        
+        One single-row update per (recipient, sender) pair covers everything
+        up to the newest listed message, with no per-message locking.
+        """
+        from .models import Message, Conversation
+        
+        targets = (
+            Message.objects.filter(id__in=message_ids)
+            .exclude(sender_id=F('recipient_id'))
+            .values('recipient_id', 'sender_id')
+            .annotate(up_to=Max('id'), found=Count('id'))
+            .order_by()
+        )
+        timestamp = self.timestamp_manager.get_precise_timestamp()
+        updated_count = 0
+        for target in targets:
+            if new_status == 'read':
+                updated_count += Conversation.mark_read(
+                    target['recipient_id'], target['sender_id'], target['up_to'], timestamp
+                )
+            elif Conversation.mark_delivered(target['recipient_id'], target['sender_id'], target['up_to']):
+                updated_count += target['found']
+        
+        result = {
+            'updated_count': updated_count,
+            'failed_count': max(len(message_ids) - updated_count, 0),
+            'total_requested': len(message_ids),
+            'success_rate': (updated_count / len(message_ids)) * 100 if message_ids else 0
+        }
+        logger.info(f"Receipt watermark update completed: {result}")
+        return result
+    
     def bulk_update_message_status(self, message_ids: List[int], new_status: str, 
                                        user_id: int = None) -> Dict[str, Any]:
         """
@@ -545,7 +553,10 @@ class MessagePersistenceManager:
             Dictionary with update results
         """
         try:
-            from .models import Message
+            from .models import Message, Conversation
+            
+            if new_status in ('read', 'delivered'):
+                return self._advance_receipt_watermarks(message_ids, new_status)
             
             updated_count = 0
             failed_count = 0
@@ -563,11 +574,13 @@ class MessagePersistenceManager:
                     ).select_for_update()
                     
                     current_time = self.timestamp_manager.get_precise_timestamp()
+                    newly_read = {}  # (recipient_id, sender_id) -> count
                     
                     for message in messages:
                         try:
                             if self._is_valid_status_transition(message.status, new_status):
                                 old_status = message.status
+                                was_unread = not message.is_read
                                 message.status = new_status
                                 
                                 # Set appropriate timestamp
@@ -580,6 +593,9 @@ class MessagePersistenceManager:
                                     message.is_read = True
                                 
                                 message.save()
+                                if was_unread and message.is_read:
+                                    pair = (message.recipient_id, message.sender_id)
+                                    newly_read[pair] = newly_read.get(pair, 0) + 1
                                 updated_count += 1
                                 updated_messages.append({
                                     'id': message.id,
@@ -594,6 +610,10 @@ class MessagePersistenceManager:
                         except Exception as e:
                             logger.error(f"Error updating message {message.id}: {e}")
                             failed_count += 1
+                    
+                    # Keep conversation unread counters in step with the batch
+                    for (reader_id, partner_id), count in newly_read.items():
+                        Conversation.decrement_unread(reader_id, partner_id, count)
             
             # Note: Removed async broadcasting for synchronous operation
             # Broadcasting can be handled separately if needed
@@ -618,10 +638,58 @@ class MessagePersistenceManager:
                 'error': str(e)
             }
     
+    @staticmethod
+    def _history_window(base_query, limit: int, before_id: int = None, cursor: str = None):
+        """
+        Keyset window of up to ``limit + 1`` messages, newest first.
+
+        ``before_id`` is resolved inside the same query, so paging never
+        needs a separate lookup of the anchor message.
+        
+        Returns:
+            Tuple of (paginator, queryset)
+        """
+        from .models import Message
+        
+        paginator = CursorPaginator(base_query, per_page=limit)
+        if before_id and not cursor:
+            anchor = Message.objects.filter(id=before_id).values('created_at')[:1]
+            paginator.queryset = base_query.filter(paginator.keyset_filter(Subquery(anchor), before_id))
+        try:
+            return paginator, paginator.window(cursor)
+        except InvalidCursor:
+            logger.warning(f"Ignoring invalid history cursor: {cursor!r}")
+            return paginator, paginator.window()
+    
+    @staticmethod
+    def _history_page(paginator, rows: list) -> Tuple[list, Optional[str]]:
+        """Split a fetched window into oldest-first messages and the next cursor."""
+        messages = rows[:paginator.per_page]
+        next_cursor = paginator.cursor_for(messages[-1]) if len(rows) > paginator.per_page else None
+        return list(reversed(messages)), next_cursor
+    
+    def history_page(self, base_query, limit: int, before_id: int = None,
+                     cursor: str = None) -> Tuple[list, Optional[str]]:
+        """
+        One keyset page of ``base_query`` (sync version).
+        
+        Args:
+            base_query: Messages of the conversation, already filtered for the viewer
+            limit: Maximum number of messages to return
+            before_id: Get messages before this message ID
+            cursor: Opaque cursor from a previous page's ``next_cursor``
+            
+        Returns:
+            Tuple of (messages oldest first, next cursor or None if no more)
+        """
+        paginator, window = self._history_window(base_query, limit, before_id, cursor)
+        return self._history_page(paginator, list(window))
+    
     def get_conversation_messages(self, user1_id: int, user2_id: int, 
                                     limit: int = 50, before_id: int = None,
                                     include_metadata: bool = True,
-                                    current_user_id: int = None) -> Dict[str, Any]:
+                                    current_user_id: int = None,
+                                    cursor: str = None) -> Dict[str, Any]:
         """
         Get conversation messages with proper locking and caching (sync version).
         
@@ -632,12 +700,13 @@ class MessagePersistenceManager:
             before_id: Get messages before this message ID
             include_metadata: Whether to include conversation metadata
             current_user_id: Current user ID for filtering deleted messages
+            cursor: Opaque cursor from a previous page's ``next_cursor``
             
         Returns:
             Dictionary with messages and metadata
         """
         try:
-            from .models import Message
+            from .models import Message, Conversation
             
             # Build query
             base_query = Message.objects.filter(
@@ -653,29 +722,25 @@ class MessagePersistenceManager:
                     Q(recipient_id=current_user_id) & Q(recipient_deleted=True)
                 )
             
-            # Apply before_id filter if provided
-            if before_id:
-                try:
-                    before_message = Message.objects.get(id=before_id)
-                    base_query = base_query.filter(created_at__lt=before_message.created_at)
-                except Message.DoesNotExist:
-                    pass
-            
-            # Get messages with limit
-            messages = list(base_query.order_by('-created_at')[:limit])
-            
-            # Reverse to show oldest first
-            messages = list(reversed(messages))
+            # Keyset page after the cursor (or before_id), oldest first
+            messages, next_cursor = self.history_page(base_query, limit, before_id, cursor)
             
             # Serialize messages
             serialized_messages = []
             for message in messages:
                 serialized_messages.append(self._serialize_message_sync(message))
             
+            # Read/delivered state comes from the conversation watermarks
+            low, high = Conversation.participant_pair(user1_id, user2_id)
+            conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+            if conversation is not None:
+                conversation.apply_receipts(serialized_messages)
+            
             result = {
                 'messages': serialized_messages,
                 'count': len(serialized_messages),
-                'has_more': len(messages) == limit
+                'has_more': next_cursor is not None,
+                'next_cursor': next_cursor
             }
             
             # Add metadata if requested
@@ -699,7 +764,8 @@ class MessagePersistenceManager:
 
     async def get_conversation_messages_async(self, user1_id: int, user2_id: int, 
                                             limit: int = 50, before_id: int = None,
-                                            include_metadata: bool = True) -> Dict[str, Any]:
+                                            include_metadata: bool = True,
+                                            cursor: str = None) -> Dict[str, Any]:
         """
         Get conversation messages with proper async handling.
         
@@ -709,6 +775,7 @@ class MessagePersistenceManager:
             limit: Maximum number of messages to return
             before_id: Get messages before this message ID
             include_metadata: Whether to include conversation metadata
+            cursor: Opaque cursor from a previous page's ``next_cursor``
             
         Returns:
             Dictionary with messages and metadata
@@ -723,21 +790,12 @@ class MessagePersistenceManager:
                 (Q(sender_id=user2_id) & Q(recipient_id=user1_id))
             ).select_related('sender', 'recipient')
             
-            # Apply before_id filter if provided
-            if before_id:
-                try:
-                    before_message = await Message.objects.aget(id=before_id)
-                    base_query = base_query.filter(created_at__lt=before_message.created_at)
-                except Message.DoesNotExist:
-                    pass
-            
-            # Get messages with limit using async
-            messages = []
-            async for message in base_query.order_by('-created_at')[:limit]:
-                messages.append(message)
-            
-            # Reverse to show oldest first
-            messages = list(reversed(messages))
+            # Keyset page after the cursor (or before_id) using async
+            paginator, window = self._history_window(base_query, limit, before_id, cursor)
+            rows = []
+            async for message in window:
+                rows.append(message)
+            messages, next_cursor = self._history_page(paginator, rows)
             
             # Serialize messages
             serialized_messages = []
@@ -747,7 +805,8 @@ class MessagePersistenceManager:
             result = {
                 'messages': serialized_messages,
                 'count': len(serialized_messages),
-                'has_more': len(messages) == limit
+                'has_more': next_cursor is not None,
+                'next_cursor': next_cursor
             }
             
             # Add metadata if requested
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:26
+
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_conversations(apps, schema_editor):
+    """Build a summary row for every existing conversation"""
+    Message = apps.get_model('messaging', 'Message')
+    Conversation = apps.get_model('messaging', 'Conversation')
+
+    pairs = set()
+    for sender_id, recipient_id in Message.objects.values_list('sender_id', 'recipient_id').distinct():
+        pairs.add((min(sender_id, recipient_id), max(sender_id, recipient_id)))
+
+    for low, high in pairs:
+        messages = Message.objects.filter(
+            Q(sender_id=low, recipient_id=high) | Q(sender_id=high, recipient_id=low)
+        )
+        last = messages.order_by('-created_at', '-id').first()
+        if last.is_deleted:
+            preview = '[This message has been deleted]'
+        elif last.content:
+            preview = last.content[:255]
+        else:
+            preview = os.path.basename(last.attachment.name or '')[:255]
+
+        counts = {'low': 0, 'high': 0}
+        if low != high:
+            counts = messages.filter(is_read=False).aggregate(
+                low=Count('id', filter=Q(recipient_id=low)),
+                high=Count('id', filter=Q(recipient_id=high)),
+            )
+
+        Conversation.objects.create(
+            user_low_id=low,
+            user_high_id=high,
+            last_message_id=last.id,
+            last_message_preview=preview,
+            last_message_at=last.created_at,
+            last_sender_id=last.sender_id,
+            unread_count_low=counts['low'],
+            unread_count_high=counts['high'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_message_deleted_at_message_is_deleted_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_message_preview', models.CharField(blank=True, max_length=255)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count_low', models.PositiveIntegerField(default=0)),
+                ('unread_count_high', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_high', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_low', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', '-last_message_at'], name='messaging_c_user_lo_4e2289_idx'), models.Index(fields=['user_high', '-last_message_at'], name='messaging_c_user_hi_50e7ed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_conversation_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:43
+
+import core.storage
+import core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_conversation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, help_text='Attach a file (max 10MB, images and documents only)', max_length=255, null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.validators.get_upload_path, validators=[core.validators.AttachmentUploadValidator()]),
+        ),
+    ]
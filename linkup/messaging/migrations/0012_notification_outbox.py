@@ -0,0 +1,42 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('messaging', '0011_alter_message_attachment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dedup_key', models.CharField(max_length=255, unique=True)),
+                ('notification_type', models.CharField(choices=[('connection_request', 'Connection Request'), ('connection_accepted', 'Connection Accepted'), ('connection_rejected', 'Connection Rejected'), ('new_message', 'New Message'), ('message_delivered', 'Message Delivered'), ('message_read', 'Message Read'), ('job_application', 'Job Application Received'), ('application_status', 'Application Status Update'), ('new_job_posted', 'New Job Posted'), ('post_liked', 'Post Liked'), ('post_commented', 'Post Commented'), ('post_shared', 'Post Shared'), ('mention', 'Mentioned in Post'), ('new_follower', 'New Follower'), ('follow_accepted', 'Follow Request Accepted'), ('system_announcement', 'System Announcement'), ('security_alert', 'Security Alert')], max_length=50)),
+                ('title', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('normal', 'Normal'), ('high', 'High'), ('urgent', 'Urgent')], default='normal', max_length=10)),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('action_url', models.URLField(blank=True, null=True)),
+                ('group_key', models.CharField(blank=True, max_length=255, null=True)),
+                ('extra_data', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['processed_at', 'created_at'], name='messaging_n_process_332755_idx')],
+            },
+        ),
+    ]
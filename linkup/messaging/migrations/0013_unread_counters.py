@@ -0,0 +1,52 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def backfill_unread_counters(apps, schema_editor):
+    """Seed the counters from the existing unread messages and notifications"""
+    Message = apps.get_model('messaging', 'Message')
+    Notification = apps.get_model('messaging', 'Notification')
+    UnreadCounter = apps.get_model('messaging', 'UnreadCounter')
+
+    counters = []
+    messages = (
+        Message.objects.filter(is_read=False).exclude(sender_id=F('recipient_id'))
+        .values('recipient_id').annotate(n=Count('id')).order_by()
+    )
+    for row in messages:
+        counters.append(UnreadCounter(user_id=row['recipient_id'], kind='messages', count=row['n']))
+    notifications = (
+        Notification.objects.filter(is_read=False)
+        .values('recipient_id', 'notification_type').annotate(n=Count('id')).order_by()
+    )
+    for row in notifications:
+        counters.append(UnreadCounter(user_id=row['recipient_id'], kind=row['notification_type'], count=row['n']))
+    UnreadCounter.objects.bulk_create(counters, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0012_notification_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind'), name='unique_unread_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.10 on 2026-10-16 23:23
+
+from django.db import migrations, models
+from django.db.models import Max, Min, Q
+
+
+def backfill_watermarks(apps, schema_editor):
+    """
+    Seed each side's watermarks from the per-message columns.
+
+    A watermark sits just below the oldest unread (or undelivered) message
+    a participant received, so nothing that is still unread becomes read.
+    """
+    Message = apps.get_model('messaging', 'Message')
+    Conversation = apps.get_model('messaging', 'Conversation')
+
+    marks = {}
+    rows = (
+        Message.objects.values('sender_id', 'recipient_id')
+        .annotate(
+            newest=Max('id'),
+            oldest_unread=Min('id', filter=Q(is_read=False)),
+            oldest_undelivered=Min('id', filter=Q(is_read=False, status__in=['pending', 'sent'])),
+        )
+        .order_by()
+    )
+    for row in rows:
+        read_up_to = row['newest'] if row['oldest_unread'] is None else row['oldest_unread'] - 1
+        delivered_up_to = row['newest'] if row['oldest_undelivered'] is None else row['oldest_undelivered'] - 1
+        marks[(row['recipient_id'], row['sender_id'])] = (read_up_to, max(read_up_to, delivered_up_to))
+
+    changed = []
+    for conversation in Conversation.objects.exclude(user_low_id=models.F('user_high_id')).iterator():
+        low, high = conversation.user_low_id, conversation.user_high_id
+        conversation.last_read_id_low, conversation.last_delivered_id_low = marks.get((low, high), (0, 0))
+        conversation.last_read_id_high, conversation.last_delivered_id_high = marks.get((high, low), (0, 0))
+        changed.append(conversation)
+    Conversation.objects.bulk_update(
+        changed,
+        ['last_read_id_low', 'last_read_id_high', 'last_delivered_id_low', 'last_delivered_id_high'],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0013_unread_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='messaging_m_recipie_f6f3c4_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='messaging_m_recipie_b42201_idx',
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_delivered_id_high',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_delivered_id_low',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_id_high',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_id_low',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+    ]
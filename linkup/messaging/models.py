@@ -4,6 +4,9 @@ from django.utils import timezone
 from datetime import timedelta
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from core.caching import tagged_cache
+from core.metrics import messages as message_metrics
+from core.storage import blob_storage
 from core.validators import AttachmentUploadValidator, get_upload_path
 from channels.db import database_sync_to_async
 
@@ -23,6 +26,8 @@ class Message(models.Model):
     content = models.TextField(blank=True)
     attachment = models.FileField(
         upload_to=get_upload_path, 
+        storage=blob_storage,
+        max_length=255,
         null=True, 
         blank=True,
         validators=[AttachmentUploadValidator()],
@@ -57,11 +62,9 @@ class Message(models.Model):
         indexes = [
             models.Index(fields=['recipient', 'created_at']), 
             models.Index(fields=['sender', 'created_at']),
-            models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['client_id']),
             models.Index(fields=['sender', 'status']),
-            models.Index(fields=['recipient', 'status']),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -95,6 +98,7 @@ class Message(models.Model):
             self.is_read = True
             self.read_at = read_timestamp or timezone.now()
             self.save(update_fields=['status', 'is_read', 'read_at'])
+            Conversation.decrement_unread(self.recipient_id, self.sender_id)
     
     def mark_as_failed(self, error_message=None):
         """Mark message as failed with error details"""
@@ -104,6 +108,7 @@ class Message(models.Model):
         if error_message:
             self.last_error = error_message
         self.save(update_fields=['status', 'failed_at', 'retry_count', 'last_error'])
+        message_metrics.inc(status='failed')
     
     def can_retry(self, max_retries=3):
         """Check if message can be retried"""
@@ -157,6 +162,356 @@ class Message(models.Model):
         }
 
 
+class Conversation(models.Model):
+    """
+    Denormalized summary of a one-to-one conversation.
+
+    One row per participant pair, stored with ``user_low_id <= user_high_id`` so
+    each pair maps to exactly one row. Holds the last message details and a
+    per-side unread counter, which lets the inbox be served from a single
+    indexed query instead of scanning every message a user has exchanged.
+
+    Read and delivered state is kept as per-side watermarks: every message a
+    participant received with an ID at or below their ``last_read_id`` is
+    read (likewise for delivered), so marking a chat read is a single-row
+    UPDATE however many messages were unread. ``Message.is_read``/``status``
+    are still mirrored while MESSAGE_READ_COMPAT_COLUMNS is on.
+    """
+    DELETED_PREVIEW = '[This message has been deleted]'
+    PREVIEW_LENGTH = 255
+
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='conversations_low', on_delete=models.CASCADE)
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='conversations_high', on_delete=models.CASCADE)
+
+    # Last message summary
+    # Plain ID rather than a ForeignKey so deleting messages never has to touch this table
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=255, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_sender = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, related_name='+', on_delete=models.CASCADE)
+
+    # Unread messages addressed to each participant
+    unread_count_low = models.PositiveIntegerField(default=0)
+    unread_count_high = models.PositiveIntegerField(default=0)
+
+    # Highest message ID each participant has read / had delivered (0 = none)
+    last_read_id_low = models.BigIntegerField(default=0)
+    last_read_id_high = models.BigIntegerField(default=0)
+    last_delivered_id_low = models.BigIntegerField(default=0)
+    last_delivered_id_high = models.BigIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_low', '-last_message_at']),
+            models.Index(fields=['user_high', '-last_message_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair')
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.user_low_id} <-> {self.user_high_id}"
+
+    @staticmethod
+    def participant_pair(user1_id, user2_id):
+        """Return the canonical (low, high) ordering for two user IDs"""
+        return (user1_id, user2_id) if user1_id <= user2_id else (user2_id, user1_id)
+
+    @classmethod
+    def unread_field_for(cls, user_id, partner_id):
+        """Name of the unread counter column belonging to ``user_id``"""
+        return 'unread_count_low' if user_id <= partner_id else 'unread_count_high'
+
+    @classmethod
+    def watermark_field_for(cls, kind, user_id, partner_id):
+        """Name of ``user_id``'s ``'read'`` or ``'delivered'`` watermark column"""
+        side = 'low' if user_id <= partner_id else 'high'
+        return f'last_{kind}_id_{side}'
+
+    @classmethod
+    def read_watermark(cls):
+        """
+        Expression for the recipient's read watermark on a Message queryset.
+
+        Evaluates to 0 when the pair has no conversation row yet.
+        """
+        from django.db.models.functions import Coalesce
+
+        pair = cls.objects.filter(
+            models.Q(user_low_id=models.OuterRef('recipient_id'), user_high_id=models.OuterRef('sender_id')) |
+            models.Q(user_low_id=models.OuterRef('sender_id'), user_high_id=models.OuterRef('recipient_id'))
+        )
+        return Coalesce(
+            models.Case(
+                models.When(recipient_id__lte=models.F('sender_id'),
+                            then=models.Subquery(pair.values('last_read_id_low')[:1])),
+                default=models.Subquery(pair.values('last_read_id_high')[:1]),
+            ),
+            models.Value(0),
+            output_field=models.BigIntegerField()
+        )
+
+    @classmethod
+    def unread_messages(cls, queryset):
+        """Messages in ``queryset`` their recipient has not read yet"""
+        return queryset.filter(is_read=False).alias(
+            recipient_read_up_to=cls.read_watermark()
+        ).filter(id__gt=models.F('recipient_read_up_to'))
+
+    @classmethod
+    def build_preview(cls, message):
+        """Short inbox preview text for a message"""
+        if message.is_deleted:
+            return cls.DELETED_PREVIEW
+        if message.content:
+            return message.content[:cls.PREVIEW_LENGTH]
+        if message.attachment:
+            import os
+            return os.path.basename(message.attachment.name)[:cls.PREVIEW_LENGTH]
+        return ''
+
+    def other_user(self, user):
+        """Return the participant that is not ``user``"""
+        return self.user_high if self.user_low_id == user.id else self.user_low
+
+    def unread_count_for(self, user):
+        """Unread message count for one side of the conversation"""
+        if self.user_low_id == self.user_high_id:
+            return 0
+        return self.unread_count_low if self.user_low_id == user.id else self.unread_count_high
+
+    def receipt_state(self, message_id, recipient_id, status, is_read=False):
+        """
+        ``(status, is_read)`` for a message in this conversation, taking the
+        recipient's watermarks over the message's own columns.
+        """
+        if self.user_low_id == self.user_high_id:
+            return status, is_read
+        is_low = recipient_id == self.user_low_id
+        read_up_to = self.last_read_id_low if is_low else self.last_read_id_high
+        delivered_up_to = self.last_delivered_id_low if is_low else self.last_delivered_id_high
+        if message_id <= read_up_to:
+            return 'read', True
+        if message_id <= delivered_up_to and status in ('pending', 'sent'):
+            return 'delivered', is_read
+        return status, is_read
+
+    def apply_receipts(self, messages):
+        """Overlay watermark-derived ``status``/``is_read`` onto serialized messages"""
+        for message in messages:
+            message['status'], message['is_read'] = self.receipt_state(
+                message['id'], message['recipient_id'], message['status'], message['is_read']
+            )
+        return messages
+
+    @classmethod
+    def for_user(cls, user):
+        """Conversations involving ``user``, most recent first"""
+        return cls.objects.filter(
+            models.Q(user_low=user) | models.Q(user_high=user),
+            last_message_at__isnull=False
+        ).order_by('-last_message_at', '-id')
+
+    @classmethod
+    def record_message(cls, message):
+        """
+        Fold a newly created message into its conversation summary.
+
+        Costs a single UPDATE regardless of conversation length; the row is
+        only inserted for the first message between two users.
+        """
+        from django.db import IntegrityError, transaction
+
+        low, high = cls.participant_pair(message.sender_id, message.recipient_id)
+        unread_field = None
+        if message.sender_id != message.recipient_id and not message.is_read:
+            unread_field = cls.unread_field_for(message.recipient_id, message.sender_id)
+
+        updates = {
+            'last_message_id': message.id,
+            'last_message_preview': cls.build_preview(message),
+            'last_message_at': message.created_at,
+            'last_sender_id': message.sender_id,
+            'updated_at': timezone.now(),
+        }
+        if unread_field:
+            updates[unread_field] = models.F(unread_field) + 1
+            UnreadCounter.adjust(message.recipient_id, UnreadCounter.MESSAGES, 1)
+
+        pair = cls.objects.filter(user_low_id=low, user_high_id=high)
+        if pair.update(**updates):
+            return
+
+        values = dict(updates, user_low_id=low, user_high_id=high)
+        if unread_field:
+            values[unread_field] = 1
+        try:
+            with transaction.atomic():
+                cls.objects.create(**values)
+        except IntegrityError:
+            # Another writer created the row first; apply the increment to it
+            pair.update(**updates)
+
+    @classmethod
+    def decrement_unread(cls, reader_id, partner_id, count=1):
+        """Lower ``reader_id``'s unread counter after messages were read"""
+        if count <= 0 or reader_id == partner_id:
+            return 0
+        from django.db.models.functions import Greatest
+
+        low, high = cls.participant_pair(reader_id, partner_id)
+        field = cls.unread_field_for(reader_id, partner_id)
+        UnreadCounter.adjust(reader_id, UnreadCounter.MESSAGES, -count)
+        return cls.objects.filter(user_low_id=low, user_high_id=high).update(
+            **{field: Greatest(models.F(field) - count, 0)}
+        )
+
+    @classmethod
+    def mark_read(cls, reader_id, partner_id, up_to=None, read_timestamp=None):
+        """
+        Advance ``reader_id``'s read watermark for messages from ``partner_id``.
+
+        Reads everything up to ``up_to`` (default: the whole conversation) with
+        a single-row UPDATE; the delivered watermark moves along with it.
+        Returns the number of messages that became read.
+        """
+        from django.db import transaction
+        from django.db.models.functions import Greatest
+
+        if reader_id == partner_id:
+            return 0
+        low, high = cls.participant_pair(reader_id, partner_id)
+        read_field = cls.watermark_field_for('read', reader_id, partner_id)
+        delivered_field = cls.watermark_field_for('delivered', reader_id, partner_id)
+        unread_field = cls.unread_field_for(reader_id, partner_id)
+
+        with transaction.atomic():
+            pair = cls.objects.select_for_update().filter(user_low_id=low, user_high_id=high)
+            row = pair.values('last_message_id', read_field, unread_field).first()
+            if row is None or row['last_message_id'] is None:
+                return 0
+            previous_up_to, previous_unread = row[read_field], row[unread_field]
+            up_to = row['last_message_id'] if up_to is None else min(up_to, row['last_message_id'])
+            if up_to <= previous_up_to:
+                return 0
+
+            if up_to == row['last_message_id']:
+                remaining = 0
+            else:
+                # Partial read: count what is left above the new watermark
+                remaining = Message.objects.filter(
+                    sender_id=partner_id, recipient_id=reader_id, id__gt=up_to, is_read=False
+                ).count()
+            pair.update(**{
+                read_field: up_to,
+                delivered_field: Greatest(models.F(delivered_field), up_to),
+                unread_field: remaining,
+            })
+            newly_read = max(previous_unread - remaining, 0)
+            UnreadCounter.adjust(reader_id, UnreadCounter.MESSAGES, remaining - previous_unread)
+
+            if getattr(settings, 'MESSAGE_READ_COMPAT_COLUMNS', True):
+                Message.objects.filter(
+                    sender_id=partner_id, recipient_id=reader_id,
+                    id__gt=previous_up_to, id__lte=up_to, is_read=False
+                ).update(is_read=True, status='read', read_at=read_timestamp or timezone.now())
+        if newly_read:
+            message_metrics.inc(newly_read, status='read')
+        return newly_read
+
+    @classmethod
+    def mark_delivered(cls, recipient_id, partner_id, up_to):
+        """
+        Advance ``recipient_id``'s delivered watermark to ``up_to``.
+
+        A single-row UPDATE; returns True when the watermark moved.
+        """
+        from django.db.models.functions import Greatest
+
+        if recipient_id == partner_id:
+            return False
+        low, high = cls.participant_pair(recipient_id, partner_id)
+        field = cls.watermark_field_for('delivered', recipient_id, partner_id)
+        moved = cls.objects.filter(
+            user_low_id=low, user_high_id=high, **{f'{field}__lt': up_to}
+        ).update(**{field: Greatest(models.F(field), up_to)})
+
+        if moved and getattr(settings, 'MESSAGE_READ_COMPAT_COLUMNS', True):
+            Message.objects.filter(
+                sender_id=partner_id, recipient_id=recipient_id,
+                id__lte=up_to, status__in=['pending', 'sent']
+            ).update(status='delivered', delivered_at=timezone.now())
+        return bool(moved)
+
+    @classmethod
+    def refresh_for_pair(cls, user1_id, user2_id):
+        """
+        Recompute a conversation summary from its messages.
+
+        Used by the delete/clear paths, which can change the last message or
+        unread totals in ways that cannot be applied as simple increments.
+        Removes the summary row when no messages remain.
+        """
+        low, high = cls.participant_pair(user1_id, user2_id)
+        messages = Message.objects.filter(
+            models.Q(sender_id=low, recipient_id=high) | models.Q(sender_id=high, recipient_id=low)
+        )
+        pair = cls.objects.filter(user_low_id=low, user_high_id=high)
+        previous_low, previous_high = pair.values_list('unread_count_low', 'unread_count_high').first() or (0, 0)
+        last = messages.order_by('-created_at', '-id').first()
+        if last is None:
+            pair.delete()
+            unread_low = unread_high = 0
+        elif low == high:
+            unread_low = unread_high = 0
+        else:
+            counts = cls.unread_messages(messages).aggregate(
+                low=models.Count('id', filter=models.Q(recipient_id=low)),
+                high=models.Count('id', filter=models.Q(recipient_id=high)),
+            )
+            unread_low, unread_high = counts['low'], counts['high']
+
+        # Carry the recomputed per-partner counts into the users' totals
+        if low != high:
+            UnreadCounter.adjust(low, UnreadCounter.MESSAGES, unread_low - previous_low)
+            UnreadCounter.adjust(high, UnreadCounter.MESSAGES, unread_high - previous_high)
+        if last is None:
+            return None
+
+        conversation, _ = cls.objects.update_or_create(
+            user_low_id=low,
+            user_high_id=high,
+            defaults={
+                'last_message_id': last.id,
+                'last_message_preview': cls.build_preview(last),
+                'last_message_at': last.created_at,
+                'last_sender_id': last.sender_id,
+                'unread_count_low': unread_low,
+                'unread_count_high': unread_high,
+            }
+        )
+        return conversation
+
+    @classmethod
+    def rebuild_all(cls):
+        """Rebuild every conversation summary from the message table"""
+        pairs = set()
+        for sender_id, recipient_id in Message.objects.values_list('sender_id', 'recipient_id').distinct():
+            pairs.add(cls.participant_pair(sender_id, recipient_id))
+
+        stale_ids = [
+            pk for pk, low, high in cls.objects.values_list('pk', 'user_low_id', 'user_high_id')
+            if (low, high) not in pairs
+        ]
+        cls.objects.filter(pk__in=stale_ids).delete()
+        for low, high in pairs:
+            cls.refresh_for_pair(low, high)
+        return len(pairs)
+
+
 class UserStatus(models.Model):
     """Track user online/offline status with enhanced connection tracking"""
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='status')
@@ -177,6 +532,11 @@ class UserStatus(models.Model):
             models.Index(fields=['active_connections']),
         ]
     
+    # is_online/last_seen for page views, tagged status:<user_id>. Saves
+    # invalidate through messaging/signals.py, and PresenceManager's bulk
+    # updates invalidate explicitly.
+    status_cache = tagged_cache.namespace('user_status', timeout=60, l1=True)
+    
     def __str__(self):
         status = "Online" if self.is_online else "Offline"
         connections = f" ({self.active_connections} connections)" if self.active_connections > 0 else ""
@@ -229,7 +589,25 @@ class UserStatus(models.Model):
         return f"Last seen {timesince(self.last_seen)} ago"
     
     @classmethod
-    def cleanup_stale_connections(cls, timeout_seconds=30):
+    def snapshots(cls, user_ids):
+        """
+        Cached ``{'is_online', 'last_seen'}`` for each user, loading misses in one query.
+        
+        Users without a status row read as offline and never seen.
+        """
+        def load(missing):
+            loaded = {user_id: {'is_online': False, 'last_seen': None} for user_id in missing}
+            rows = cls.objects.filter(user_id__in=missing).values_list('user_id', 'is_online', 'last_seen')
+            for user_id, is_online, last_seen in rows:
+                loaded[user_id] = {'is_online': is_online, 'last_seen': last_seen}
+            return loaded
+        
+        return cls.status_cache.get_or_compute_many(
+            set(user_ids), load, tags_for=lambda user_id: [f'status:{user_id}']
+        )
+    
+    @classmethod
+    def cleanup_stale_connections(cls, timeout_seconds=30, exclude_user_ids=None):
         """Clean up stale connections and update online status"""
         from datetime import timedelta
         cutoff_time = timezone.now() - timedelta(seconds=timeout_seconds)
@@ -239,6 +617,8 @@ class UserStatus(models.Model):
             is_online=True,
             last_ping__lt=cutoff_time
         )
+        if exclude_user_ids:
+            stale_statuses = stale_statuses.exclude(user_id__in=exclude_user_ids)
         
         count = 0
         for status in stale_statuses:
@@ -252,7 +632,12 @@ class UserStatus(models.Model):
 
 
 class TypingStatus(models.Model):
-    """Track typing indicators for real-time chat"""
+    """
+    Legacy table for typing indicators.
+
+    Typing state now lives on the WebSocket connection (see
+    messaging/typing_manager.py) and this table is no longer written.
+    """
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='typing_statuses')
     chat_partner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='partner_typing_statuses')
     is_typing = models.BooleanField(default=False)
@@ -551,6 +936,23 @@ class Notification(models.Model):
             self.is_read = True
             self.read_at = timezone.now()
             self.save(update_fields=['is_read', 'read_at'])
+            UnreadCounter.adjust(self.recipient_id, self.notification_type, -1)
+
+    @classmethod
+    def mark_read_bulk(cls, queryset):
+        """
+        Mark every unread notification in ``queryset`` as read with one
+        UPDATE, lowering the recipients' counters per type. Returns the
+        number of notifications marked.
+        """
+        unread = queryset.filter(is_read=False)
+        deltas = {
+            (row['recipient_id'], row['notification_type']): -row['n']
+            for row in unread.order_by().values('recipient_id', 'notification_type').annotate(n=models.Count('id'))
+        }
+        updated = unread.update(is_read=True, read_at=timezone.now())
+        UnreadCounter.adjust_many(deltas)
+        return updated
     
     def mark_as_delivered(self):
         """Mark notification as delivered with timestamp"""
@@ -585,6 +987,8 @@ class Notification(models.Model):
             
             if existing_group:
                 # Update existing group
+                if existing_group.is_read:
+                    UnreadCounter.adjust(recipient.id, notification_type, 1)
                 existing_group.group_count += 1
                 existing_group.message = message  # Update with latest message
                 existing_group.created_at = timezone.now()  # Update timestamp
@@ -694,17 +1098,12 @@ class NotificationPreference(models.Model):
     
     @classmethod
     def get_user_preference(cls, user, notification_type):
-        """Get user preference for a specific notification type"""
-        try:
-            return cls.objects.get(user=user, notification_type=notification_type)
-        except cls.DoesNotExist:
-            # Return default preference
-            return cls(
-                user=user,
-                notification_type=notification_type,
-                delivery_method='realtime',
-                is_enabled=True
-            )
+        """Get user preference for a specific notification type (default if unset), via the preference cache"""
+        from .notification_preferences import preference_resolver
+
+        preference = preference_resolver.get(user.id, notification_type)
+        preference.user = user
+        return preference
     
     def is_in_quiet_hours(self):
         """Check if current time is within user's quiet hours"""
@@ -722,6 +1121,171 @@ class NotificationPreference(models.Model):
             return current_time >= self.quiet_hours_start or current_time <= self.quiet_hours_end
 
 
+class UnreadCounter(models.Model):
+    """
+    Unread totals per user, so badge reads and pushes never count rows.
+
+    One row per user and ``kind``: MESSAGES for unread chat messages (the
+    per-partner split lives on Conversation) or a notification type for
+    unread notifications of that type. Every path that creates, reads or
+    deletes messages and notifications adjusts the counters with a single
+    F() update; the reconcile_unread_counters command repairs any drift.
+    """
+    MESSAGES = 'messages'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='unread_counters')
+    kind = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='unique_unread_counter')
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.kind}: {self.count}"
+
+    @classmethod
+    def adjust(cls, user_id, kind, delta):
+        """Atomically add ``delta`` to a counter, never going below zero"""
+        if not delta:
+            return
+        from django.db import IntegrityError, transaction
+        from django.db.models.functions import Greatest
+
+        counter = cls.objects.filter(user_id=user_id, kind=kind)
+        if counter.update(count=Greatest(models.F('count') + delta, 0)) or delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, kind=kind, count=delta)
+        except IntegrityError:
+            # Another writer created the row first; apply the increment to it
+            counter.update(count=models.F('count') + delta)
+
+    @classmethod
+    def adjust_many(cls, deltas):
+        """Apply ``{(user_id, kind): delta}`` adjustments with one INSERT and one UPDATE"""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        from django.db.models.functions import Greatest
+
+        missing = [cls(user_id=user_id, kind=kind, count=0) for (user_id, kind), delta in deltas.items() if delta > 0]
+        if missing:
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+
+        match = models.Q()
+        whens = []
+        for (user_id, kind), delta in deltas.items():
+            match |= models.Q(user_id=user_id, kind=kind)
+            whens.append(models.When(user_id=user_id, kind=kind, then=models.Value(delta)))
+        cls.objects.filter(match).update(
+            count=Greatest(models.F('count') + models.Case(*whens, default=models.Value(0)), 0)
+        )
+
+    @classmethod
+    def expected_counts(cls, user_ids=None):
+        """Counter values recomputed from the message and notification tables"""
+        messages = Conversation.unread_messages(Message.objects.exclude(sender_id=models.F('recipient_id')))
+        notifications = Notification.objects.filter(is_read=False)
+        if user_ids is not None:
+            messages = messages.filter(recipient_id__in=user_ids)
+            notifications = notifications.filter(recipient_id__in=user_ids)
+
+        expected = {}
+        for row in messages.values('recipient_id').annotate(n=models.Count('id')).order_by():
+            expected[(row['recipient_id'], cls.MESSAGES)] = row['n']
+        rows = notifications.values('recipient_id', 'notification_type').annotate(n=models.Count('id')).order_by()
+        for row in rows:
+            expected[(row['recipient_id'], row['notification_type'])] = row['n']
+        return expected
+
+    @classmethod
+    def reconcile(cls, user_ids=None):
+        """Repair counters that drifted from the underlying rows. Returns the number fixed."""
+        from django.db import transaction
+
+        expected = cls.expected_counts(user_ids)
+        counters = cls.objects.all() if user_ids is None else cls.objects.filter(user_id__in=user_ids)
+        with transaction.atomic():
+            stale, changed = [], []
+            for counter in counters.select_for_update():
+                count = expected.pop((counter.user_id, counter.kind), 0)
+                if counter.count == count:
+                    continue
+                if count:
+                    counter.count = count
+                    changed.append(counter)
+                else:
+                    stale.append(counter.id)
+            cls.objects.filter(id__in=stale).delete()
+            cls.objects.bulk_update(changed, ['count'])
+            cls.objects.bulk_create([
+                cls(user_id=user_id, kind=kind, count=count)
+                for (user_id, kind), count in expected.items()
+            ])
+            fixed = len(stale) + len(changed) + len(expected)
+        return fixed
+
+    @classmethod
+    def badges(cls, user_ids):
+        """Badge totals for several users from one indexed query"""
+        badges = {
+            user_id: {'messages': 0, 'notifications': 0, 'notifications_by_type': {}, 'total': 0}
+            for user_id in user_ids
+        }
+        for user_id, kind, count in cls.objects.filter(user_id__in=badges).values_list('user_id', 'kind', 'count'):
+            badge = badges[user_id]
+            if kind == cls.MESSAGES:
+                badge['messages'] = count
+            else:
+                badge['notifications'] += count
+                badge['notifications_by_type'][kind] = count
+            badge['total'] += count
+        return badges
+
+    @classmethod
+    def badge(cls, user_id):
+        """Unread messages, notifications (total and per type) and their sum for one user"""
+        return cls.badges([user_id])[user_id]
+
+
+class NotificationOutbox(models.Model):
+    """
+    A notification waiting to be created by the outbox worker.
+
+    The notify_* helpers insert one row per source event, deduplicated by
+    ``dedup_key``, instead of creating and pushing the notification on the
+    request path. See messaging/notification_outbox.py.
+    """
+    dedup_key = models.CharField(max_length=255, unique=True)
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    notification_type = models.CharField(max_length=50, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    priority = models.CharField(max_length=10, choices=Notification.PRIORITY_LEVELS, default='normal')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    action_url = models.URLField(null=True, blank=True)
+    group_key = models.CharField(max_length=255, null=True, blank=True)
+    extra_data = models.JSONField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['processed_at', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.notification_type} for user {self.recipient_id} ({self.dedup_key})"
+
+
 class MessagingError(models.Model):
     """Model for structured error logging in messaging system"""
     
@@ -781,7 +1345,7 @@ class MessagingError(models.Model):
     
     @classmethod
     def log_error(cls, error_type, error_message, context_data=None, user=None, severity='medium'):
-        """Convenience method to log an error"""
+        """Write an error row immediately; messaging code queues through error_sink instead"""
         return cls.objects.create(
             error_type=error_type,
             error_message=error_message,
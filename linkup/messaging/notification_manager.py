@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 from django.contrib.auth import get_user_model
 from django.db.models import Q, Count, Max
 from django.utils import timezone
-from .models import Notification, NotificationPreference
+from .models import Notification, NotificationPreference, UnreadCounter
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -167,12 +167,7 @@ class NotificationGroupingManager:
     def get_notification_summary(self, user: User) -> Dict:
         """Get a summary of user's notifications"""
         total_count = Notification.objects.filter(recipient=user).count()
-        unread_count = Notification.objects.filter(recipient=user, is_read=False).count()
-        
-        # Count by type
-        type_counts = Notification.objects.filter(recipient=user, is_read=False).values(
-            'notification_type'
-        ).annotate(count=Count('id'))
+        badge = UnreadCounter.badge(user.id)
         
         # Recent activity (last 7 days)
         week_ago = timezone.now() - timedelta(days=7)
@@ -183,9 +178,9 @@ class NotificationGroupingManager:
         
         return {
             'total_notifications': total_count,
-            'unread_notifications': unread_count,
+            'unread_notifications': badge['notifications'],
             'recent_notifications': recent_count,
-            'notifications_by_type': {item['notification_type']: item['count'] for item in type_counts},
+            'notifications_by_type': {kind: count for kind, count in badge['notifications_by_type'].items() if count},
             'last_notification': Notification.objects.filter(recipient=user).first()
         }
     
@@ -200,12 +195,7 @@ class NotificationGroupingManager:
         if notification_type:
             query = query.filter(notification_type=notification_type)
         
-        count = 0
-        for notification in query:
-            notification.mark_as_read()
-            count += 1
-        
-        return count
+        return Notification.mark_read_bulk(query)
     
     def get_grouped_notifications(self, user: User, limit: int = 20) -> List[Dict]:
         """Get notifications with proper grouping display"""
@@ -341,45 +331,51 @@ class NotificationBatchProcessor:
     
     def send_digest_notifications(self, frequency: str = 'daily') -> int:
         """Send digest notifications to users who prefer them"""
-        # Get users who prefer digest notifications
-        digest_preferences = NotificationPreference.objects.filter(
+        # Determine time range based on frequency
+        if frequency == 'daily':
+            since = timezone.now() - timedelta(days=1)
+        elif frequency == 'weekly':
+            since = timezone.now() - timedelta(days=7)
+        else:
+            return 0
+
+        # Users who prefer digests, per notification type
+        digest_preferences = set(NotificationPreference.objects.filter(
             delivery_method='email',
             is_enabled=True
-        )
-        
-        sent_count = 0
-        
-        for pref in digest_preferences:
-            user = pref.user
-            
-            # Determine time range based on frequency
-            if frequency == 'daily':
-                since = timezone.now() - timedelta(days=1)
-            elif frequency == 'weekly':
-                since = timezone.now() - timedelta(days=7)
-            else:
-                continue
-            
-            # Get unread notifications for this user
-            unread_notifications = Notification.objects.filter(
-                recipient=user,
-                is_read=False,
-                created_at__gte=since,
-                notification_type=pref.notification_type
+        ).values_list('user_id', 'notification_type'))
+        if not digest_preferences:
+            return 0
+
+        # Unread counts for every (user, type) pair in one query
+        unread_counts = Notification.objects.filter(
+            recipient_id__in={user_id for user_id, _ in digest_preferences},
+            notification_type__in={notification_type for _, notification_type in digest_preferences},
+            is_read=False,
+            created_at__gte=since
+        ).values('recipient_id', 'notification_type').annotate(count=Count('id')).order_by()
+
+        digests = [
+            Notification(
+                recipient_id=row['recipient_id'],
+                notification_type='system_announcement',
+                title=f'{frequency.title()} Digest',
+                message=f"You have {row['count']} unread notifications",
+                priority='low'
             )
-            
-            if unread_notifications.exists():
-                # Create digest notification
-                count = unread_notifications.count()
-                digest_notification = Notification.objects.create(
-                    recipient=user,
-                    notification_type='system_announcement',
-                    title=f'{frequency.title()} Digest',
-                    message=f'You have {count} unread notifications',
-                    priority='low'
-                )
-                
-                sent_count += 1
-                logger.info(f"Sent {frequency} digest to user {user.username}")
-        
+            for row in unread_counts
+            if (row['recipient_id'], row['notification_type']) in digest_preferences
+        ]
+        Notification.objects.bulk_create(digests, batch_size=self.batch_size)
+
+        # bulk_create skips the post_save signal that counts new notifications
+        unread_deltas = {}
+        for digest in digests:
+            unread_deltas[(digest.recipient_id, 'system_announcement')] = (
+                unread_deltas.get((digest.recipient_id, 'system_announcement'), 0) + 1
+            )
+        UnreadCounter.adjust_many(unread_deltas)
+
+        sent_count = len(digests)
+        logger.info(f"Sent {sent_count} {frequency} digests")
         return sent_count
\ No newline at end of file
@@ -0,0 +1,391 @@
+"""
+Notification outbox: creating notifications off the request path.
+
+The notify_* helpers call enqueue_notification, which is a single INSERT
+deduplicated by the source event, so sending a message, liking a post or
+following someone never waits on notification work. process_outbox drains
+the outbox in batches: preferences come from the preference cache, events for
+the same notification group are coalesced, notifications are written with
+bulk inserts and updates, and each recipient gets one real-time push per
+batch carrying their newest notification and unread counts, read from
+the UnreadCounter table.
+
+Draining happens in the process_notifications worker
+(NOTIFICATION_OUTBOX_MODE = 'worker', the default), on a background thread
+('thread', for deployments on a server database that handles concurrent
+writers), or in the caller once the enqueueing transaction commits
+('inline', for tests only: every request would drain the whole outbox).
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification, NotificationOutbox, UnreadCounter
+from .notification_preferences import preference_resolver
+
+logger = logging.getLogger(__name__)
+
+REALTIME_METHODS = ('realtime', 'push')
+
+
+def _setting(name, default):
+    return getattr(settings, f'NOTIFICATION_OUTBOX_{name}', default)
+
+
+def dedup_key_for(notification_type: str, recipient_id: int, sender_id: Optional[int] = None,
+                  content_type_id: Optional[int] = None, object_id: Optional[int] = None) -> str:
+    """Identify the source event, so the same event never notifies twice."""
+    return f"{notification_type}:{recipient_id}:{sender_id or ''}:{content_type_id or ''}:{object_id or ''}"
+
+
+def _content_ids(content_object):
+    if content_object is None:
+        return None, None
+    return ContentType.objects.get_for_model(content_object).id, content_object.pk
+
+
+def _wake_worker():
+    mode = _setting('MODE', 'worker')
+    if mode == 'thread':
+        transaction.on_commit(drainer.wake)
+    elif mode == 'inline':
+        transaction.on_commit(drain)
+
+
+def enqueue_notification(recipient, notification_type: str, title: str, message: str,
+                         sender=None, content_object: Optional[Any] = None, priority: str = 'normal',
+                         action_url: Optional[str] = None, group_key: Optional[str] = None,
+                         extra_data: Optional[Dict] = None, dedup_key: Optional[str] = None):
+    """
+    Queue a notification for the outbox worker.
+
+    One INSERT; an event that is already queued (same ``dedup_key``) is
+    ignored by the database.
+    """
+    content_type_id, object_id = _content_ids(content_object)
+    entry = NotificationOutbox(
+        dedup_key=(dedup_key or dedup_key_for(
+            notification_type, recipient.id, sender.id if sender else None, content_type_id, object_id
+        ))[:255],
+        recipient_id=recipient.id,
+        sender_id=sender.id if sender else None,
+        notification_type=notification_type,
+        title=title,
+        message=message,
+        priority=priority,
+        content_type_id=content_type_id,
+        object_id=object_id,
+        action_url=action_url,
+        group_key=group_key,
+        extra_data=extra_data,
+    )
+    NotificationOutbox.objects.bulk_create([entry], ignore_conflicts=True)
+    _wake_worker()
+
+
+def enqueue_notifications(recipient_ids, notification_type: str, title: str, message: str,
+                          sender=None, content_object: Optional[Any] = None, priority: str = 'normal',
+                          action_url: Optional[str] = None, extra_data: Optional[Dict] = None) -> int:
+    """
+    Queue the same notification for many recipients (announcements, fan-out to followers).
+
+    Recipients who disabled the type or are in quiet hours are dropped up
+    front using the preference cache, then the rest are queued with one
+    bulk INSERT. Returns the number of recipients queued.
+    """
+    sender_id = sender.id if sender else None
+    recipient_ids = [
+        recipient_id
+        for recipient_id in preference_resolver.enabled_recipients(recipient_ids, notification_type, priority)
+        if recipient_id != sender_id
+    ]
+    if not recipient_ids:
+        return 0
+
+    content_type_id, object_id = _content_ids(content_object)
+    entries = [
+        NotificationOutbox(
+            dedup_key=dedup_key_for(notification_type, recipient_id, sender_id, content_type_id, object_id)[:255],
+            recipient_id=recipient_id,
+            sender_id=sender_id,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            priority=priority,
+            content_type_id=content_type_id,
+            object_id=object_id,
+            action_url=action_url,
+            extra_data=extra_data,
+        )
+        for recipient_id in recipient_ids
+    ]
+    NotificationOutbox.objects.bulk_create(
+        entries, batch_size=_setting('BATCH_SIZE', 200), ignore_conflicts=True
+    )
+    _wake_worker()
+    return len(entries)
+
+
+# Worker
+
+def claim_batch(limit: int) -> List[NotificationOutbox]:
+    """
+    Atomically take up to ``limit`` unprocessed entries.
+
+    Batches left claimed by a crashed worker are reclaimed after
+    NOTIFICATION_OUTBOX_CLAIM_TIMEOUT seconds.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=_setting('CLAIM_TIMEOUT', 60))
+    with transaction.atomic():
+        queryset = NotificationOutbox.objects.filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale), processed_at__isnull=True
+        ).order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        entry_ids = list(queryset.values_list('id', flat=True)[:limit])
+        NotificationOutbox.objects.filter(id__in=entry_ids).update(claimed_at=now)
+    return list(
+        NotificationOutbox.objects.filter(id__in=entry_ids)
+        .select_related('recipient', 'sender')
+        .order_by('created_at')
+    )
+
+
+def _load_preferences(entries) -> Dict:
+    """Explicit preferences for every (recipient, type) in the batch, from the preference cache."""
+    return preference_resolver.explicit((entry.recipient_id, entry.notification_type) for entry in entries)
+
+
+def _deliverable(entries, preferences, validator) -> List[NotificationOutbox]:
+    kept = []
+    for entry in entries:
+        pref = preferences.get((entry.recipient_id, entry.notification_type))
+        if pref is not None and not pref.is_enabled:
+            continue
+        if pref is not None and pref.is_in_quiet_hours() and entry.priority not in ('high', 'urgent'):
+            continue
+        if not validator(entry.recipient, entry.notification_type, entry.title, entry.message):
+            continue
+        kept.append(entry)
+    return kept
+
+
+def _new_notification(entry, now, **extra) -> Notification:
+    return Notification(
+        recipient_id=entry.recipient_id,
+        sender_id=entry.sender_id,
+        notification_type=entry.notification_type,
+        title=entry.title,
+        message=entry.message,
+        priority=entry.priority,
+        content_type_id=entry.content_type_id,
+        object_id=entry.object_id,
+        action_url=entry.action_url,
+        is_delivered=True,
+        delivered_at=now,
+        **extra
+    )
+
+
+def _write_notifications(entries, now) -> List[Notification]:
+    """Create or update notifications for a batch with bulk statements."""
+    # Coalesce grouped events per (recipient, group), keeping arrival order
+    groups = OrderedDict()
+    singles = []
+    for entry in entries:
+        if entry.group_key:
+            groups.setdefault((entry.recipient_id, entry.group_key), []).append(entry)
+        else:
+            singles.append(entry)
+
+    existing = {}
+    if groups:
+        open_groups = Notification.objects.filter(
+            is_grouped=True,
+            recipient_id__in={recipient_id for recipient_id, _ in groups},
+            group_key__in={group_key for _, group_key in groups},
+        ).order_by('created_at')
+        for notification in open_groups:
+            # Newest wins, as in Notification.create_notification
+            existing[(notification.recipient_id, notification.group_key)] = notification
+
+    created, updated = [], []
+    unread_deltas = {}
+    for key, group_entries in groups.items():
+        latest = group_entries[-1]
+        notification = existing.get(key)
+        if notification is None:
+            created.append(_new_notification(
+                latest, now, group_key=latest.group_key, is_grouped=True, group_count=len(group_entries)
+            ))
+        else:
+            if notification.is_read:
+                counter = (notification.recipient_id, notification.notification_type)
+                unread_deltas[counter] = unread_deltas.get(counter, 0) + 1
+            notification.group_count += len(group_entries)
+            notification.message = latest.message
+            notification.created_at = now
+            notification.is_read = False
+            notification.read_at = None
+            updated.append(notification)
+    created.extend(_new_notification(entry, now) for entry in singles)
+
+    for notification in created:
+        counter = (notification.recipient_id, notification.notification_type)
+        unread_deltas[counter] = unread_deltas.get(counter, 0) + 1
+
+    Notification.objects.bulk_create(created)
+    if updated:
+        Notification.objects.bulk_update(updated, ['group_count', 'message', 'created_at', 'is_read', 'read_at'])
+    UnreadCounter.adjust_many(unread_deltas)
+    return created + updated
+
+
+def _push(notifications, entries, preferences, serializer):
+    """One real-time push per recipient: their newest notification plus unread count."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not notifications:
+        return
+
+    realtime = set()
+    for entry in entries:
+        pref = preferences.get((entry.recipient_id, entry.notification_type))
+        if pref is None or pref.delivery_method in REALTIME_METHODS:
+            realtime.add((entry.recipient_id, entry.notification_type))
+
+    newest = {}
+    batched = {}
+    for notification in notifications:
+        if (notification.recipient_id, notification.notification_type) not in realtime:
+            continue
+        batched[notification.recipient_id] = batched.get(notification.recipient_id, 0) + 1
+        current = newest.get(notification.recipient_id)
+        if current is None or notification.created_at >= current.created_at:
+            newest[notification.recipient_id] = notification
+    if not newest:
+        return
+
+    badges = UnreadCounter.badges(list(newest))
+    senders = {n.sender_id for n in newest.values() if n.sender_id}
+    sender_map = {}
+    if senders:
+        from django.contrib.auth import get_user_model
+        sender_map = get_user_model().objects.select_related('profile').in_bulk(senders)
+
+    events = []
+    for recipient_id, notification in newest.items():
+        notification.sender = sender_map.get(notification.sender_id)
+        data = serializer.serialize_notification(notification)
+        badge = badges[recipient_id]
+        data['unread_count'] = badge['notifications']
+        data['unread_messages'] = badge['messages']
+        data['total_unread'] = badge['total']
+        data['batched_count'] = batched[recipient_id]
+        events.append((f'user_{recipient_id}', {
+            'type': 'notification_message',
+            'message': {'type': 'notification', 'notification': data},
+        }))
+
+    async def send_all():
+        for group, event in events:
+            try:
+                await channel_layer.group_send(group, event)
+            except Exception as e:
+                logger.error(f"Error pushing notification to {group}: {e}")
+
+    async_to_sync(send_all)()
+
+
+def process_batch(entries) -> int:
+    """Turn claimed outbox entries into notifications and push them. Returns notifications written."""
+    from .notification_service import NotificationService
+
+    if not entries:
+        return 0
+    service = NotificationService()
+    now = timezone.now()
+    preferences = _load_preferences(entries)
+    deliverable = _deliverable(entries, preferences, service._validate_notification_data)
+
+    with transaction.atomic():
+        notifications = _write_notifications(deliverable, now)
+        NotificationOutbox.objects.filter(id__in=[entry.id for entry in entries]).update(processed_at=now)
+
+    try:
+        _push(notifications, deliverable, preferences, service.json_serializer)
+    except Exception as e:
+        # Notifications are stored; clients still see them on their next fetch
+        logger.error(f"Error pushing notification batch: {e}")
+    return len(notifications)
+
+
+def prune_processed() -> int:
+    """Delete processed entries older than NOTIFICATION_OUTBOX_RETENTION."""
+    cutoff = timezone.now() - timedelta(seconds=_setting('RETENTION', 86400))
+    deleted, _ = NotificationOutbox.objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
+
+
+def process_outbox(limit: Optional[int] = None) -> int:
+    """Claim and process one batch. Returns the number of outbox entries handled."""
+    entries = claim_batch(limit or _setting('BATCH_SIZE', 200))
+    if entries:
+        written = process_batch(entries)
+        logger.debug(f"Processed {len(entries)} outbox entries into {written} notifications")
+    return len(entries)
+
+
+def drain() -> int:
+    """Process batches until the outbox is empty."""
+    total = 0
+    while True:
+        handled = process_outbox()
+        if not handled:
+            break
+        total += handled
+    if total:
+        prune_processed()
+    return total
+
+
+class OutboxDrainer:
+    """Background thread that drains the outbox whenever it is woken."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+            try:
+                drain()
+            except Exception as e:
+                logger.error(f"Error draining notification outbox: {e}")
+            finally:
+                close_old_connections()
+
+
+# Global instance
+drainer = OutboxDrainer()
@@ -0,0 +1,135 @@
+"""
+Cached notification preference lookups.
+
+A user's explicit preferences are loaded with one query and kept in the
+Django cache under a per-user key, so deciding whether to notify someone
+never queries NotificationPreference on the hot path. Users without any
+explicit rows are cached too (as an empty mapping) and resolve to the
+defaults: real-time delivery, enabled, no quiet hours. Saving or deleting
+a preference invalidates that user's entry (see messaging/signals.py).
+
+The bulk methods resolve thousands of recipients with one cache
+``get_many`` plus at most one query for the misses, so fan-out events can
+filter their audience in a single round trip.
+"""
+
+import logging
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import NotificationPreference
+
+logger = logging.getLogger(__name__)
+
+# Cached row: (delivery_method, is_enabled, quiet_hours_start, quiet_hours_end)
+CachedRow = Tuple[str, bool, object, object]
+
+
+class NotificationPreferenceResolver:
+    """Resolves users' notification preferences through a per-user cache entry."""
+
+    KEY_PREFIX = 'notification_prefs'
+
+    def __init__(self, cache_backend=None, timeout: Optional[int] = None):
+        self.cache = cache_backend or cache
+        self.timeout = timeout or getattr(settings, 'NOTIFICATION_PREFERENCE_CACHE_TIMEOUT', 3600)
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    def _load(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, CachedRow]]:
+        """Cached rows for every user, querying the misses in one go."""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+        keys = {self._key(user_id): user_id for user_id in user_ids}
+        found = self.cache.get_many(list(keys))
+        rows = {keys[key]: value for key, value in found.items()}
+
+        missing = user_ids - set(rows)
+        if missing:
+            loaded = {user_id: {} for user_id in missing}
+            preferences = NotificationPreference.objects.filter(user_id__in=missing).values_list(
+                'user_id', 'notification_type', 'delivery_method', 'is_enabled',
+                'quiet_hours_start', 'quiet_hours_end'
+            )
+            for user_id, notification_type, *row in preferences:
+                loaded[user_id][notification_type] = tuple(row)
+            self.cache.set_many({self._key(user_id): value for user_id, value in loaded.items()}, self.timeout)
+            rows.update(loaded)
+        return rows
+
+    @staticmethod
+    def _build(user_id: int, notification_type: str, row: Optional[CachedRow]) -> NotificationPreference:
+        if row is None:
+            return NotificationPreference(
+                user_id=user_id,
+                notification_type=notification_type,
+                delivery_method='realtime',
+                is_enabled=True
+            )
+        delivery_method, is_enabled, quiet_hours_start, quiet_hours_end = row
+        return NotificationPreference(
+            user_id=user_id,
+            notification_type=notification_type,
+            delivery_method=delivery_method,
+            is_enabled=is_enabled,
+            quiet_hours_start=quiet_hours_start,
+            quiet_hours_end=quiet_hours_end
+        )
+
+    # Lookups
+
+    def get(self, user_id: int, notification_type: str) -> NotificationPreference:
+        """A user's preference for one type, or the default when they have none."""
+        rows = self._load([user_id])[user_id]
+        return self._build(user_id, notification_type, rows.get(notification_type))
+
+    def explicit(self, pairs: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], NotificationPreference]:
+        """Explicit preferences for (user_id, notification_type) pairs; defaults are left out."""
+        pairs = set(pairs)
+        rows = self._load(user_id for user_id, _ in pairs)
+        preferences = {}
+        for user_id, notification_type in pairs:
+            row = rows[user_id].get(notification_type)
+            if row is not None:
+                preferences[(user_id, notification_type)] = self._build(user_id, notification_type, row)
+        return preferences
+
+    def enabled_recipients(self, user_ids: Iterable[int], notification_type: str,
+                           priority: str = 'normal') -> List[int]:
+        """
+        The users who should receive a ``notification_type`` notification now.
+
+        Drops users who disabled the type, and users in quiet hours unless
+        the priority is high or urgent. Keeps the order of ``user_ids``.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        rows = self._load(user_ids)
+        enabled = []
+        for user_id in user_ids:
+            row = rows[user_id].get(notification_type)
+            if row is not None:
+                preference = self._build(user_id, notification_type, row)
+                if not preference.is_enabled:
+                    continue
+                if preference.is_in_quiet_hours() and priority not in ('high', 'urgent'):
+                    continue
+            enabled.append(user_id)
+        return enabled
+
+    def invalidate(self, user_id: int):
+        """Forget a user's cached preferences after they change."""
+        self.cache.delete(self._key(user_id))
+
+    def invalidate_on_commit(self, user_id: int):
+        """Invalidate once the current transaction commits, so readers can't re-cache old rows."""
+        transaction.on_commit(partial(self.invalidate, user_id))
+
+
+# Global instance
+preference_resolver = NotificationPreferenceResolver()
@@ -10,7 +10,9 @@ from django.urls import reverse
 from django.utils import timezone
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from .models import Notification, NotificationPreference
+from core.performance import CursorPaginator
+from .models import Notification, NotificationPreference, UnreadCounter
+from .notification_outbox import enqueue_notification, enqueue_notifications
 from .serializers import JSONSerializer
 from .logging_utils import MessagingLogger
 from .retry_handler import MessageRetryHandler, RetryConfig
@@ -274,7 +276,7 @@ class NotificationService:
     def get_unread_count(self, user: User) -> int:
         """Get total unread notification count for user with error handling"""
         try:
-            return Notification.objects.filter(recipient=user, is_read=False).count()
+            return UnreadCounter.badge(user.id)['notifications']
         except Exception as e:
             MessagingLogger.log_error(
                 f"Error getting unread count: {e}",
@@ -436,17 +438,7 @@ class NotificationService:
             if notification_type:
                 query = query.filter(notification_type=notification_type)
             
-            count = 0
-            for notification in query:
-                try:
-                    notification.mark_as_read()
-                    count += 1
-                except Exception as e:
-                    MessagingLogger.log_error(
-                        f"Error marking individual notification {notification.id} as read: {e}",
-                        context_data={'notification_id': notification.id, 'user_id': user.id}
-                    )
-                    continue
+            count = Notification.mark_read_bulk(query)
             
             # Send real-time update for badge count with error handling
             self._send_badge_update_with_fallback(user)
@@ -573,13 +565,62 @@ class NotificationService:
             )
             return []
 
+    def get_notifications_page(self, user: User, limit: int = 20, cursor: Optional[str] = None,
+                               notification_type: Optional[str] = None,
+                               unread_only: bool = False) -> Dict[str, Any]:
+        """
+        Get the page of notifications after ``cursor`` using keyset pagination.
+
+        Returns:
+            Dict with serialized ``notifications``, ``has_more`` and ``next_cursor``
+        """
+        try:
+            query = Notification.objects.filter(recipient=user)
+            
+            if notification_type:
+                query = query.filter(notification_type=notification_type)
+            
+            if unread_only:
+                query = query.filter(is_read=False)
+            
+            page = CursorPaginator(query.select_related('sender'), per_page=limit).get_page(cursor)
+            
+            result = []
+            for notification in page:
+                try:
+                    result.append(self.json_serializer.serialize_notification(notification))
+                except Exception as e:
+                    MessagingLogger.log_error(
+                        f"Error serializing notification {notification.id}: {e}",
+                        context_data={'notification_id': notification.id, 'user_id': user.id}
+                    )
+                    continue
+            
+            return {
+                'notifications': result,
+                'has_more': page.has_more,
+                'next_cursor': page.next_cursor,
+            }
+            
+        except Exception as e:
+            MessagingLogger.log_error(
+                f"Error getting notifications page: {e}",
+                context_data={
+                    'user_id': user.id,
+                    'limit': limit,
+                    'notification_type': notification_type,
+                    'unread_only': unread_only
+                }
+            )
+            return {'notifications': [], 'has_more': False, 'next_cursor': None}
 
-# Convenience functions for specific notification types
+
+# Convenience functions for specific notification types. These queue the
+# notification in the outbox; see notification_outbox.process_outbox.
 
 def notify_connection_request(sender: User, recipient: User, connection_obj):
     """Send notification for new connection request"""
-    service = NotificationService()
-    return service.create_and_send_notification(
+    return enqueue_notification(
         recipient=recipient,
         notification_type='connection_request',
         title='New Connection Request',
@@ -593,8 +634,7 @@ def notify_connection_request(sender: User, recipient: User, connection_obj):
 
 def notify_connection_accepted(sender: User, recipient: User, connection_obj):
     """Send notification when connection is accepted"""
-    service = NotificationService()
-    return service.create_and_send_notification(
+    return enqueue_notification(
         recipient=recipient,
         notification_type='connection_accepted',
         title='Connection Accepted',
@@ -607,8 +647,7 @@ def notify_connection_accepted(sender: User, recipient: User, connection_obj):
 
 def notify_new_message(sender: User, recipient: User, message_obj):
     """Send notification for new message"""
-    service = NotificationService()
-    return service.create_and_send_notification(
+    return enqueue_notification(
         recipient=recipient,
         notification_type='new_message',
         title='New Message',
@@ -622,8 +661,7 @@ def notify_new_message(sender: User, recipient: User, message_obj):
 
 def notify_job_application(applicant: User, job_poster: User, application_obj):
     """Send notification for new job application"""
-    service = NotificationService()
-    return service.create_and_send_notification(
+    return enqueue_notification(
         recipient=job_poster,
         notification_type='job_application',
         title='New Job Application',
@@ -640,8 +678,7 @@ def notify_post_liked(liker: User, post_owner: User, post_obj):
     if liker == post_owner:  # Don't notify self-likes
         return None
     
-    service = NotificationService()
-    return service.create_and_send_notification(
+    return enqueue_notification(
         recipient=post_owner,
         notification_type='post_liked',
         title='Post Liked',
@@ -655,8 +692,7 @@ def notify_post_liked(liker: User, post_owner: User, post_obj):
 
 def notify_new_follower(follower: User, followed: User, follow_obj):
     """Send notification for new follower"""
-    service = NotificationService()
-    return service.create_and_send_notification(
+    return enqueue_notification(
         recipient=followed,
         notification_type='new_follower',
         title='New Follower',
@@ -670,8 +706,7 @@ def notify_new_follower(follower: User, followed: User, follow_obj):
 
 def notify_mention(mentioner: User, mentioned: User, post_obj):
     """Send notification when user is mentioned in a post"""
-    service = NotificationService()
-    return service.create_and_send_notification(
+    return enqueue_notification(
         recipient=mentioned,
         notification_type='mention',
         title='You were mentioned',
@@ -680,4 +715,30 @@ def notify_mention(mentioner: User, mentioned: User, post_obj):
         content_object=post_obj,
         priority='high',  # Mentions are high priority
         action_url=reverse('feed:post_detail', args=[post_obj.id]) if hasattr(post_obj, 'id') else None
-    )
\ No newline at end of file
+    )
+
+
+def notify_job_posted(poster: User, job_obj, follower_ids: List[int]) -> int:
+    """Tell the poster's followers about a new job, skipping anyone who opted out"""
+    return enqueue_notifications(
+        recipient_ids=follower_ids,
+        notification_type='new_job_posted',
+        title='New Job Posted',
+        message=f'{poster.get_full_name() or poster.username} posted {job_obj.title} at {job_obj.company}',
+        sender=poster,
+        content_object=job_obj,
+        action_url=reverse('jobs:job_detail', args=[job_obj.id])
+    )
+
+
+def notify_system_announcement(recipient_ids: List[int], title: str, message: str,
+                               priority: str = 'normal', action_url: Optional[str] = None) -> int:
+    """Send an announcement to many users, skipping anyone who opted out"""
+    return enqueue_notifications(
+        recipient_ids=recipient_ids,
+        notification_type='system_announcement',
+        title=title,
+        message=message,
+        priority=priority,
+        action_url=action_url
+    )
@@ -622,6 +622,19 @@ class OfflineQueueManager:
                 'error': str(e),
                 'timestamp': timezone.now().isoformat()
             }
+    
+    def collect_queue_metrics(self):
+        """Set the queue depth gauges; registered as a metrics collector, so it runs on each scrape."""
+        from core.metrics import message_queue_depth
+        from .models import QueuedMessage
+        
+        depths = dict(
+            QueuedMessage.objects.filter(is_processed=False)
+            .values_list('queue_type')
+            .annotate(depth=models.Count('id'))
+        )
+        for queue_type, _ in QueuedMessage.QUEUE_TYPES:
+            message_queue_depth.set(depths.get(queue_type, 0), queue_type=queue_type)
 
 
 # Global instance
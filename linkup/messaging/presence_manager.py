@@ -1,6 +1,10 @@
 """
 User Presence Manager for real-time online/offline status tracking.
 Handles connection tracking, heartbeat monitoring, and status broadcasting.
+
+Live state is kept in the cache-backed presence store; UserStatus rows are
+written only when a user comes online or goes offline, and last_seen is
+flushed to them in periodic batches.
 """
 
 import logging
@@ -10,7 +14,9 @@ from django.utils import timezone
 from django.db import transaction
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from core.caching import tagged_cache
 from .models import UserStatus
+from .presence_store import presence_store
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
@@ -19,8 +25,11 @@ logger = logging.getLogger(__name__)
 class PresenceManager:
     """Manages user presence with connection tracking and heartbeat monitoring."""
     
-    def __init__(self):
+    FLUSH_BATCH_SIZE = 500
+    
+    def __init__(self, store=None):
         self.channel_layer = get_channel_layer()
+        self.store = store or presence_store
     
     def user_connected(self, user, connection_info: Optional[Dict] = None) -> str:
         """
@@ -36,32 +45,18 @@ class PresenceManager:
         try:
             connection_id = f"conn_{user.id}_{uuid.uuid4().hex[:8]}"
             
-            with transaction.atomic():
-                status, created = UserStatus.objects.get_or_create(
-                    user=user,
-                    defaults={
-                        'is_online': True,
-                        'active_connections': 1,
-                        'connection_id': connection_id,
-                        'device_info': connection_info or {}
-                    }
-                )
-                
-                if not created:
-                    # Update existing status
-                    was_offline = not status.is_online
-                    status.increment_connections(connection_id)
-                    
-                    # Broadcast status change if user was offline
-                    if was_offline:
-                        self._broadcast_presence_update(user, True)
-                        logger.info(f"User {user.username} came online")
-                else:
-                    # New user status created
-                    self._broadcast_presence_update(user, True)
-                    logger.info(f"User {user.username} connected for first time")
-                
-                return connection_id
+            count = self.store.connect(
+                user.id,
+                meta={'connection_id': connection_id, 'device_info': connection_info or {}}
+            )
+            
+            # Only the first connection changes the persisted status
+            if count == 1:
+                self._persist_online(user, connection_id, connection_info)
+                self._broadcast_presence_update(user, True)
+                logger.info(f"User {user.username} came online")
+            
+            return connection_id
                 
         except Exception as e:
             logger.error(f"Failed to handle user connection for {user.username}: {e}")
@@ -76,20 +71,13 @@ class PresenceManager:
             connection_id: Connection ID that was disconnected
         """
         try:
-            with transaction.atomic():
-                try:
-                    status = UserStatus.objects.get(user=user)
-                    was_online = status.is_online
-                    
-                    status.decrement_connections()
-                    
-                    # Broadcast status change if user went offline
-                    if was_online and not status.is_online:
-                        self._broadcast_presence_update(user, False)
-                        logger.info(f"User {user.username} went offline")
-                        
-                except UserStatus.DoesNotExist:
-                    logger.warning(f"UserStatus not found for disconnecting user {user.username}")
+            remaining = self.store.disconnect(user.id)
+            
+            # Broadcast status change if user went offline
+            if remaining == 0:
+                self._persist_offline([user.id])
+                self._broadcast_presence_update(user, False)
+                logger.info(f"User {user.username} went offline")
                     
         except Exception as e:
             logger.error(f"Failed to handle user disconnection for {user.username}: {e}")
@@ -106,29 +94,80 @@ class PresenceManager:
             bool: True if heartbeat was updated successfully
         """
         try:
-            status, created = UserStatus.objects.get_or_create(
-                user=user,
-                defaults={
-                    'is_online': True,
-                    'active_connections': 1,
-                    'connection_id': connection_id
-                }
-            )
-            
-            status.update_ping()
+            # Heartbeats only touch the cache; the database sees them in batches
+            came_back_online = self.store.heartbeat(user.id)
             
-            # Ensure user is marked online if sending heartbeat
-            if not status.is_online:
-                status.is_online = True
-                status.save(update_fields=['is_online'])
+            if came_back_online:
+                self._persist_online(user, connection_id)
                 self._broadcast_presence_update(user, True)
             
+            if self.store.should_flush():
+                self.flush_last_seen()
+            
             return True
             
         except Exception as e:
             logger.error(f"Failed to update heartbeat for {user.username}: {e}")
             return False
     
+    def _persist_online(self, user, connection_id: Optional[str] = None,
+                        connection_info: Optional[Dict] = None):
+        """Record an offline -> online transition in UserStatus."""
+        defaults = {
+            'is_online': True,
+            'active_connections': 1,
+            'connection_id': connection_id,
+            'last_ping': timezone.now(),
+        }
+        if connection_info is not None:
+            defaults['device_info'] = connection_info
+        UserStatus.objects.update_or_create(user=user, defaults=defaults)
+    
+    def _persist_offline(self, user_ids: List[int]):
+        """Record online -> offline transitions in UserStatus."""
+        snapshots = self.store.get_presence_many(user_ids)
+        now = timezone.now()
+        for user_id in user_ids:
+            last_seen = snapshots[user_id]['last_seen'] or now
+            UserStatus.objects.filter(user_id=user_id).update(
+                is_online=False,
+                active_connections=0,
+                connection_id=None,
+                last_ping=last_seen,
+                last_seen=last_seen
+            )
+        # .update() sends no post_save, so drop the cached statuses here
+        tagged_cache.invalidate_tags_on_commit(*[f'status:{user_id}' for user_id in user_ids])
+    
+    def flush_last_seen(self) -> int:
+        """
+        Write cached heartbeat times for online users to UserStatus in batches.
+        
+        Returns:
+            int: Number of status rows updated
+        """
+        try:
+            online = self.store.online_users()
+            user_ids = list(online)
+            updated = 0
+            
+            for start in range(0, len(user_ids), self.FLUSH_BATCH_SIZE):
+                batch = user_ids[start:start + self.FLUSH_BATCH_SIZE]
+                statuses = list(UserStatus.objects.filter(user_id__in=batch))
+                for status in statuses:
+                    seen = self.store.to_datetime(online[status.user_id])
+                    status.last_ping = seen
+                    status.last_seen = seen
+                UserStatus.objects.bulk_update(statuses, ['last_ping', 'last_seen'])
+                updated += len(statuses)
+            
+            logger.debug(f"Flushed last_seen for {updated} online users")
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Failed to flush last_seen: {e}")
+            return 0
+    
     def _broadcast_presence_update(self, user, is_online: bool):
         """Broadcast presence update to relevant users."""
         if not self.channel_layer:
@@ -173,32 +212,45 @@ class PresenceManager:
             dict: Presence information
         """
         try:
-            status = UserStatus.objects.get(user=user)
+            snapshot = self.store.get_presence(user.id)
             
-            return {
-                'user_id': user.id,
-                'username': user.username,
-                'is_online': status.is_online,
-                'last_seen': status.last_seen.isoformat() if status.last_seen else None,
-                'last_seen_display': status.get_last_seen_display(),
-                'active_connections': status.active_connections,
-                'last_ping': status.last_ping.isoformat() if status.last_ping else None,
-                'connection_stale': status.is_connection_stale(),
-                'device_info': status.device_info
-            }
+            if snapshot['is_online']:
+                return {
+                    'user_id': user.id,
+                    'username': user.username,
+                    'is_online': True,
+                    'last_seen': snapshot['last_ping'].isoformat() if snapshot['last_ping'] else None,
+                    'last_seen_display': 'Online',
+                    'active_connections': snapshot['active_connections'],
+                    'last_ping': snapshot['last_ping'].isoformat() if snapshot['last_ping'] else None,
+                    'connection_stale': False,
+                    'device_info': snapshot['meta'].get('device_info', {})
+                }
+            
+            # Offline: fall back to the persisted status when the cache has
+            # no record of the user (e.g. after a cache restart)
+            last_seen = snapshot['last_seen']
+            if last_seen is None:
+                last_seen = UserStatus.snapshots([user.id])[user.id]['last_seen']
+            
+            if last_seen is None:
+                last_seen_display = 'Never'
+            else:
+                from django.utils.timesince import timesince
+                last_seen_display = f"Last seen {timesince(last_seen)} ago"
             
-        except UserStatus.DoesNotExist:
             return {
                 'user_id': user.id,
                 'username': user.username,
                 'is_online': False,
-                'last_seen': None,
-                'last_seen_display': 'Never',
+                'last_seen': last_seen.isoformat() if last_seen else None,
+                'last_seen_display': last_seen_display,
                 'active_connections': 0,
                 'last_ping': None,
                 'connection_stale': True,
                 'device_info': {}
             }
+            
         except Exception as e:
             logger.error(f"Failed to get presence for {user.username}: {e}")
             return {
@@ -225,18 +277,26 @@ class PresenceManager:
             list: List of online user information
         """
         try:
-            online_statuses = UserStatus.objects.filter(
-                is_online=True
-            ).select_related('user').order_by('-last_ping')[:limit]
+            from django.contrib.auth import get_user_model
+            
+            online = self.store.online_users()
+            user_ids = sorted(online, key=online.get, reverse=True)[:limit]
+            snapshots = self.store.get_presence_many(user_ids)
+            usernames = dict(
+                get_user_model().objects.filter(id__in=user_ids).values_list('id', 'username')
+            )
             
             online_users = []
-            for status in online_statuses:
+            for user_id in user_ids:
+                if user_id not in usernames:
+                    continue
+                snapshot = snapshots[user_id]
                 online_users.append({
-                    'user_id': status.user.id,
-                    'username': status.user.username,
-                    'active_connections': status.active_connections,
-                    'last_ping': status.last_ping.isoformat() if status.last_ping else None,
-                    'device_info': status.device_info
+                    'user_id': user_id,
+                    'username': usernames[user_id],
+                    'active_connections': snapshot['active_connections'],
+                    'last_ping': snapshot['last_ping'].isoformat() if snapshot['last_ping'] else None,
+                    'device_info': snapshot['meta'].get('device_info', {})
                 })
             
             return online_users
@@ -256,7 +316,21 @@ class PresenceManager:
             int: Number of stale connections cleaned up
         """
         try:
-            count = UserStatus.cleanup_stale_connections(timeout_seconds)
+            stale_ids = self.store.stale_user_ids(timeout_seconds)
+            if stale_ids:
+                self.store.mark_offline(stale_ids)
+                self._persist_offline(stale_ids)
+                
+                from django.contrib.auth import get_user_model
+                for user in get_user_model().objects.filter(id__in=stale_ids):
+                    self._broadcast_presence_update(user, False)
+            
+            # Rows marked online that the cache no longer tracks (for example
+            # after a worker crash) are cleaned up from their persisted ping
+            count = len(stale_ids) + UserStatus.cleanup_stale_connections(
+                timeout_seconds,
+                exclude_user_ids=list(self.store.online_users())
+            )
             
             if count > 0:
                 logger.info(f"Cleaned up {count} stale connections")
@@ -278,6 +352,8 @@ class PresenceManager:
             bool: True if user was forced offline successfully
         """
         try:
+            self.store.mark_offline([user.id])
+            
             with transaction.atomic():
                 status = UserStatus.objects.get(user=user)
                 
@@ -310,28 +386,19 @@ class PresenceManager:
             dict: Presence summary statistics
         """
         try:
-            from django.db.models import Count, Avg
-            
-            # Get basic counts
-            total_users = UserStatus.objects.count()
-            online_users = UserStatus.objects.filter(is_online=True).count()
+            # Live counts come from the presence store
+            online = self.store.online_users()
+            snapshots = self.store.get_presence_many(online)
+            online_users = len(online)
+            total_users = max(UserStatus.objects.count(), online_users)
             
             # Get connection statistics
-            total_connections = UserStatus.objects.aggregate(
-                total=models.Sum('active_connections')
-            )['total'] or 0
-            
-            avg_connections = UserStatus.objects.filter(
-                is_online=True
-            ).aggregate(
-                avg=Avg('active_connections')
-            )['avg'] or 0
+            total_connections = sum(s['active_connections'] for s in snapshots.values())
+            avg_connections = total_connections / online_users if online_users else 0
             
             # Get recent activity
-            recent_cutoff = timezone.now() - timedelta(minutes=5)
-            recent_activity = UserStatus.objects.filter(
-                last_ping__gte=recent_cutoff
-            ).count()
+            recent_cutoff = (timezone.now() - timedelta(minutes=5)).timestamp()
+            recent_activity = sum(1 for ping in online.values() if ping >= recent_cutoff)
             
             return {
                 'total_users': total_users,
@@ -369,47 +436,43 @@ class PresenceManager:
             list: Conversations with presence data
         """
         try:
-            from django.db.models import Q
-            from .models import Message
-            
-            # Get unique users the current user has conversed with
-            conversations = []
-            seen_users = set()
+            from .models import Conversation
             
-            messages = Message.objects.filter(
-                Q(sender=user) | Q(recipient=user)
-            ).select_related('sender', 'recipient').order_by('-created_at')
+            summaries = list(
+                Conversation.for_user(user).select_related('user_low', 'user_high', 'last_sender')
+            )
+            partners = [summary.other_user(user) for summary in summaries]
+            statuses = {
+                status.user_id: status
+                for status in UserStatus.objects.filter(user_id__in=[p.id for p in partners])
+            }
             
-            for msg in messages:
-                other_user = msg.recipient if msg.sender == user else msg.sender
-                if other_user.id not in seen_users:
-                    seen_users.add(other_user.id)
-                    
-                    # Get presence information
-                    presence = self.get_user_presence(other_user)
-                    
-                    # Get unread count
-                    unread_count = Message.objects.filter(
-                        sender=other_user,
-                        recipient=user,
-                        is_read=False
-                    ).count()
-                    
-                    conversations.append({
-                        'user': {
-                            'id': other_user.id,
-                            'username': other_user.username,
-                            'full_name': other_user.get_full_name() if hasattr(other_user, 'get_full_name') else other_user.username
-                        },
-                        'presence': presence,
-                        'last_message': {
-                            'id': msg.id,
-                            'content': msg.content[:100] + '...' if len(msg.content) > 100 else msg.content,
-                            'created_at': msg.created_at.isoformat(),
-                            'sender': msg.sender.username
-                        },
-                        'unread_count': unread_count
-                    })
+            conversations = []
+            for summary, other_user in zip(summaries, partners):
+                status = statuses.get(other_user.id)
+                preview = summary.last_message_preview
+                
+                conversations.append({
+                    'user': {
+                        'id': other_user.id,
+                        'username': other_user.username,
+                        'full_name': other_user.get_full_name() if hasattr(other_user, 'get_full_name') else other_user.username
+                    },
+                    'presence': {
+                        'user_id': other_user.id,
+                        'username': other_user.username,
+                        'is_online': status.is_online if status else False,
+                        'last_seen': status.last_seen.isoformat() if status and status.last_seen else None,
+                        'last_seen_display': status.get_last_seen_display() if status else 'Never',
+                    },
+                    'last_message': {
+                        'id': summary.last_message_id,
+                        'content': preview[:100] + '...' if len(preview) > 100 else preview,
+                        'created_at': summary.last_message_at.isoformat(),
+                        'sender': summary.last_sender.username if summary.last_sender else None
+                    },
+                    'unread_count': summary.unread_count_for(user)
+                })
             
             return conversations
             
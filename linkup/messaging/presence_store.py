@@ -0,0 +1,300 @@
+"""
+Cache-backed presence store for real-time online/offline tracking.
+
+Connection counts, heartbeat timestamps and last-seen times live in the
+Django cache (Redis in production, locmem in development and tests) so that
+a heartbeat never touches the database. Per-user keys expire on their own
+when a socket dies without disconnecting.
+
+The index of online users only changes when a user comes online or goes
+offline, and each change costs O(1) rather than O(online users):
+
+- On Redis (django_redis) it is one set, updated with SADD/SREM.
+- On other backends it is split into INDEX_SHARDS shards by user id. A
+  change rewrites only its shard, under that shard's lock. A change whose
+  shard is locked is kept in-process and applied by the next index update,
+  so the index is never written without the lock.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceStore:
+    """Keeps per-user presence state in the cache using atomic counters."""
+
+    KEY_PREFIX = 'presence'
+    LAST_SEEN_TTL = 60 * 60 * 24 * 7  # Remember last seen for a week
+    INDEX_SHARDS = 64
+    INDEX_LOCK_TTL = 5
+    INDEX_LOCK_ATTEMPTS = 3
+
+    def __init__(self, cache_backend=None, connection_ttl: Optional[int] = None,
+                 flush_interval: Optional[int] = None):
+        self.cache = cache_backend or cache
+        self.connection_ttl = connection_ttl or getattr(settings, 'PRESENCE_CONNECTION_TTL', 90)
+        self.flush_interval = flush_interval or getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 60)
+        # shard -> {user id: True to add, False to remove}, waiting for the shard's lock
+        self._pending: Dict[int, Dict[int, bool]] = {}
+        self._pending_lock = threading.Lock()
+
+    # Key helpers
+
+    def _key(self, kind: str, user_id: Optional[int] = None) -> str:
+        if user_id is None:
+            return f"{self.KEY_PREFIX}:{kind}"
+        return f"{self.KEY_PREFIX}:{kind}:{user_id}"
+
+    @staticmethod
+    def to_datetime(timestamp: Optional[float]) -> Optional[datetime]:
+        """Convert a stored epoch timestamp to an aware datetime."""
+        if timestamp is None:
+            return None
+        return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+    # Connection lifecycle
+
+    def connect(self, user_id: int, meta: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Register a new connection for a user.
+
+        Returns:
+            int: Number of open connections after this one was added
+        """
+        key = self._key('connections', user_id)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # Key missing or expired; add() is atomic so only one writer wins
+            if self.cache.add(key, 1, self.connection_ttl):
+                count = 1
+            else:
+                count = self.cache.incr(key)
+        self.cache.touch(key, self.connection_ttl)
+
+        now = time.time()
+        values = {self._key('ping', user_id): now}
+        if meta is not None:
+            values[self._key('meta', user_id)] = meta
+        self.cache.set_many(values, self.connection_ttl)
+
+        if count == 1:
+            self._update_index(add=[user_id])
+        return count
+
+    def disconnect(self, user_id: int) -> int:
+        """
+        Remove a connection for a user.
+
+        Returns:
+            int: Number of connections still open
+        """
+        key = self._key('connections', user_id)
+        try:
+            remaining = self.cache.decr(key)
+        except ValueError:
+            remaining = 0
+
+        if remaining <= 0:
+            self.mark_offline([user_id])
+            return 0
+        return remaining
+
+    def heartbeat(self, user_id: int) -> bool:
+        """
+        Record a heartbeat and extend the connection TTL.
+
+        Returns:
+            bool: True if the user had expired and is now back online
+        """
+        self.cache.set(self._key('ping', user_id), time.time(), self.connection_ttl)
+
+        if self.cache.touch(self._key('connections', user_id), self.connection_ttl):
+            return False
+
+        # The connection count expired while the socket stayed open
+        if self.cache.add(self._key('connections', user_id), 1, self.connection_ttl):
+            self._update_index(add=[user_id])
+            return True
+        return False
+
+    def mark_offline(self, user_ids: Iterable[int]) -> None:
+        """Drop live state for users and remember when they were last seen."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+        pings = self.cache.get_many([self._key('ping', uid) for uid in user_ids])
+        now = time.time()
+        self.cache.set_many(
+            {
+                self._key('last_seen', uid): pings.get(self._key('ping', uid), now)
+                for uid in user_ids
+            },
+            self.LAST_SEEN_TTL
+        )
+
+        stale_keys = []
+        for uid in user_ids:
+            stale_keys.extend([
+                self._key('connections', uid),
+                self._key('ping', uid),
+                self._key('meta', uid),
+            ])
+        self.cache.delete_many(stale_keys)
+        self._update_index(remove=user_ids)
+
+    # Reads
+
+    def get_presence(self, user_id: int) -> Dict[str, Any]:
+        """Return the cached presence snapshot for one user."""
+        return self.get_presence_many([user_id])[user_id]
+
+    def get_presence_many(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Return cached presence snapshots for several users in one round trip."""
+        user_ids = list(user_ids)
+        kinds = ('connections', 'ping', 'last_seen', 'meta')
+        values = self.cache.get_many([
+            self._key(kind, uid) for uid in user_ids for kind in kinds
+        ])
+
+        snapshots = {}
+        for uid in user_ids:
+            connections = values.get(self._key('connections', uid)) or 0
+            snapshots[uid] = {
+                'is_online': connections > 0,
+                'active_connections': max(connections, 0),
+                'last_ping': self.to_datetime(values.get(self._key('ping', uid))),
+                'last_seen': self.to_datetime(values.get(self._key('last_seen', uid))),
+                'meta': values.get(self._key('meta', uid)) or {},
+            }
+        return snapshots
+
+    def online_users(self) -> Dict[int, float]:
+        """Map of online user IDs to their last heartbeat timestamp."""
+        user_ids = self.online_user_ids()
+        if not user_ids:
+            return {}
+
+        pings = self.cache.get_many([self._key('ping', uid) for uid in user_ids])
+        return {
+            uid: pings[self._key('ping', uid)]
+            for uid in user_ids
+            if self._key('ping', uid) in pings
+        }
+
+    def stale_user_ids(self, timeout_seconds: int) -> List[int]:
+        """Users in the online index whose heartbeat is missing or too old."""
+        user_ids = self.online_user_ids()
+        if not user_ids:
+            return []
+
+        cutoff = time.time() - timeout_seconds
+        pings = self.cache.get_many([self._key('ping', uid) for uid in user_ids])
+        return [
+            uid for uid in user_ids
+            if pings.get(self._key('ping', uid), 0) < cutoff
+        ]
+
+    def should_flush(self) -> bool:
+        """True for at most one caller per flush interval across all workers."""
+        return self.cache.add(self._key('flush'), 1, self.flush_interval)
+
+    # Online index
+
+    def online_user_ids(self) -> Set[int]:
+        """IDs in the online-user index."""
+        client = self._redis_client()
+        if client is not None:
+            return {int(uid) for uid in client.smembers(self.cache.make_key(self._key('online')))}
+
+        if self._pending:
+            self._update_index()  # Retry changes deferred by a busy shard lock
+        shards = self.cache.get_many([self._shard_key(shard) for shard in range(self.INDEX_SHARDS)])
+        user_ids = set()
+        for members in shards.values():
+            user_ids.update(members)
+        return user_ids
+
+    def _update_index(self, add: Iterable[int] = (), remove: Iterable[int] = ()) -> None:
+        """Add users to and remove them from the online-user index."""
+        add, remove = list(add), list(remove)
+        client = self._redis_client()
+        if client is not None:
+            key = self.cache.make_key(self._key('online'))
+            if add:
+                client.sadd(key, *add)
+            if remove:
+                client.srem(key, *remove)
+            return
+
+        with self._pending_lock:
+            for uid, online in [(uid, True) for uid in add] + [(uid, False) for uid in remove]:
+                self._pending.setdefault(self._shard(uid), {})[uid] = online
+            changes, self._pending = self._pending, {}
+
+        for shard, shard_changes in changes.items():
+            if not self._update_shard(shard, shard_changes):
+                logger.warning(f"Presence index shard {shard} is locked; deferring {len(shard_changes)} changes")
+                with self._pending_lock:
+                    # Changes queued meanwhile are newer and win
+                    self._pending[shard] = {**shard_changes, **self._pending.get(shard, {})}
+
+    def _update_shard(self, shard: int, changes: Dict[int, bool]) -> bool:
+        """Apply changes to one index shard under its lock; False if the lock wasn't acquired."""
+        lock_key = self._key(f'online:lock:{shard}')
+        token = uuid.uuid4().hex
+        for attempt in range(self.INDEX_LOCK_ATTEMPTS):
+            if self.cache.add(lock_key, token, self.INDEX_LOCK_TTL):
+                break
+            time.sleep(0.001 * 2 ** attempt)
+        else:
+            return False
+        deadline = time.monotonic() + self.INDEX_LOCK_TTL
+
+        members = self.cache.get(self._shard_key(shard)) or set()
+        for uid, online in changes.items():
+            if online:
+                members.add(uid)
+            else:
+                members.discard(uid)
+
+        # Only write while the lock is still ours, and never release someone else's
+        if not self._holds_lock(lock_key, token, deadline):
+            return False
+        self.cache.set(self._shard_key(shard), members, None)
+        if self._holds_lock(lock_key, token, deadline):
+            self.cache.delete(lock_key)
+        return True
+
+    def _holds_lock(self, lock_key: str, token: str, deadline: float) -> bool:
+        return time.monotonic() < deadline and self.cache.get(lock_key) == token
+
+    def _shard(self, user_id: int) -> int:
+        return user_id % self.INDEX_SHARDS
+
+    def _shard_key(self, shard: int) -> str:
+        return self._key(f'online:{shard}')
+
+    def _redis_client(self):
+        """The raw Redis client behind a django_redis cache, or None for other backends."""
+        client = getattr(self.cache, 'client', None)
+        if client is None or not hasattr(client, 'get_client'):
+            return None
+        return client.get_client(write=True)
+
+    def clear(self) -> None:
+        """Forget all tracked presence (used by tests and admin resets)."""
+        self.mark_offline(self.online_user_ids())
+
+# Global instance
+presence_store = PresenceStore()
@@ -12,8 +12,10 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Set, Tuple
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from django.db import transaction, models
+from django.core.cache import cache
+from django.db import models
 from django.db.models import Q, F
+from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
 import asyncio
 import json
@@ -24,26 +26,30 @@ logger = logging.getLogger(__name__)
 
 class ReadReceiptManager:
     """
-    Manages read receipts for messages with deduplication and bulk processing.
+    Manages read receipts for messages as per-chat watermarks.
     
-    Features:
-    - Automatic read receipt generation on message view
-    - Bulk read receipt processing for multiple messages
-    - Read receipt deduplication to prevent duplicates
-    - Real-time status updates to message senders
-    - Batch processing for performance optimization
+    Reading is expressed as "``reader`` has read everything ``sender`` sent
+    them up to message id X": one UPDATE marks the whole range read and one
+    ``read_watermark`` event per (chat room, reader) tells both participants,
+    however many messages were in the range.
+    
+    Deduplication keeps the highest watermark already processed for each
+    (reader, sender) pair in the Django cache, so it is shared by every
+    worker and bounded to one short-lived key per active chat.
     """
     
-    def __init__(self):
+    KEY_PREFIX = 'read_receipts'
+    
+    def __init__(self, cache_backend=None):
         self.channel_layer = get_channel_layer()
         self.batch_size = 20  # Messages to process per batch
-        self.deduplication_cache = {}  # In-memory cache for recent receipts
+        self.deduplication_cache = cache_backend or cache  # Shared watermark cache
         self.cache_ttl_minutes = 5  # Cache TTL for deduplication
     
     async def mark_message_as_read(self, message_id: int, reader_user_id: int,
                                  read_timestamp: datetime = None) -> bool:
         """
-        Mark a single message as read and send read receipt.
+        Mark a message, and everything before it in the same chat, as read.
         
         Args:
             message_id: ID of the message being read
@@ -54,60 +60,13 @@ class ReadReceiptManager:
             bool: True if successful, False otherwise
         """
         try:
-            from .models import Message
-            from channels.db import database_sync_to_async
-            
-            if read_timestamp is None:
-                read_timestamp = timezone.now()
-            
-            # Check deduplication cache
-            cache_key = f"{message_id}_{reader_user_id}"
-            if self._is_recently_processed(cache_key):
-                logger.debug(f"Read receipt for message {message_id} already processed recently")
-                return True
-            
-            @database_sync_to_async
-            def mark_read():
-                try:
-                    with transaction.atomic():
-                        # Get the message and verify recipient
-                        message = Message.objects.select_for_update().get(
-                            id=message_id,
-                            recipient_id=reader_user_id
-                        )
-                        
-                        # Skip if already read
-                        if message.is_read:
-                            return message, False
-                        
-                        # Use message status manager for integrated read receipt handling
-                        from .message_status_manager import message_status_manager
-                        success = message_status_manager.update_message_to_read_with_receipt(
-                            message, read_timestamp
-                        )
-                        
-                        return message, success
-                
-                except Message.DoesNotExist:
-                    logger.warning(f"Message {message_id} not found or not for user {reader_user_id}")
-                    return None, False
-                except Exception as e:
-                    logger.error(f"Error marking message {message_id} as read: {e}")
-                    return None, False
-            
-            message, was_updated = await mark_read()
-            
-            if message and was_updated:
-                # Add to deduplication cache
-                self._add_to_cache(cache_key)
-                
-                # Send read receipt to sender
-                await self._send_read_receipt_to_sender(message, read_timestamp)
-                
-                logger.info(f"Marked message {message_id} as read by user {reader_user_id}")
-                return True
+            targets = await database_sync_to_async(self._read_targets)(reader_user_id, id=message_id)
+            if not targets:
+                logger.warning(f"Message {message_id} not found or not for user {reader_user_id}")
+                return False
             
-            return message is not None
+            await self._apply_watermarks(reader_user_id, targets, read_timestamp or timezone.now())
+            return True
         
         except Exception as e:
             logger.error(f"Error in mark_message_as_read: {e}")
@@ -119,6 +78,9 @@ class ReadReceiptManager:
         """
         Mark multiple messages as read in bulk (e.g., when user views chat).
         
+        The messages are reduced to one watermark per sender, the highest
+        of their ids, so a 200-message backlog is one UPDATE and one event.
+        
         Args:
             message_ids: List of message IDs to mark as read
             reader_user_id: ID of the user who read the messages
@@ -128,9 +90,6 @@ class ReadReceiptManager:
             Dict with processing results
         """
         try:
-            from .models import Message
-            from django.db import sync_to_async
-            
             if read_timestamp is None:
                 read_timestamp = timezone.now()
             
@@ -139,72 +98,20 @@ class ReadReceiptManager:
                     'processed_count': 0,
                     'failed_count': 0,
                     'already_read_count': 0,
-                    'message_ids': []
+                    'read_up_to': {}
                 }
             
-            # Filter out recently processed messages
-            filtered_ids = []
-            for msg_id in message_ids:
-                cache_key = f"{msg_id}_{reader_user_id}"
-                if not self._is_recently_processed(cache_key):
-                    filtered_ids.append(msg_id)
-            
-            if not filtered_ids:
-                return {
-                    'processed_count': 0,
-                    'failed_count': 0,
-                    'already_read_count': len(message_ids),
-                    'message_ids': []
-                }
-            
-            @sync_to_async
-            def bulk_mark_read():
-                try:
-                    with transaction.atomic():
-                        # Get unread messages for this user
-                        messages = Message.objects.select_for_update().filter(
-                            id__in=filtered_ids,
-                            recipient_id=reader_user_id,
-                            is_read=False
-                        )
-                        
-                        updated_messages = []
-                        from .message_status_manager import message_status_manager
-                        
-                        for message in messages:
-                            # Use message status manager for integrated handling
-                            success = message_status_manager.update_message_to_read_with_receipt(
-                                message, read_timestamp
-                            )
-                            if success:
-                                updated_messages.append(message)
-                        
-                        return updated_messages
-                
-                except Exception as e:
-                    logger.error(f"Error in bulk mark read: {e}")
-                    return []
-            
-            updated_messages = await bulk_mark_read()
-            
-            # Process results
-            processed_count = len(updated_messages)
-            already_read_count = len(message_ids) - len(filtered_ids)
-            failed_count = len(filtered_ids) - processed_count
-            
-            # Add to deduplication cache
-            for message in updated_messages:
-                cache_key = f"{message.id}_{reader_user_id}"
-                self._add_to_cache(cache_key)
-            
-            # Send read receipts to senders
-            await self._send_bulk_read_receipts(updated_messages, read_timestamp)
+            targets = await database_sync_to_async(self._read_targets)(
+                reader_user_id, id__in=message_ids
+            )
+            processed_count = await self._apply_watermarks(reader_user_id, targets, read_timestamp)
+            found_count = sum(target['found'] for target in targets)
             
             result = {
                 'processed_count': processed_count,
-                'failed_count': failed_count,
-                'already_read_count': already_read_count,
-                'message_ids': [msg.id for msg in updated_messages],
+                'failed_count': len(set(message_ids)) - found_count,
+                'already_read_count': max(found_count - processed_count, 0),
+                'read_up_to': {target['sender_id']: target['up_to'] for target in targets},
                 'timestamp': read_timestamp.isoformat()
             }
             
@@ -234,41 +141,22 @@ class ReadReceiptManager:
             Dict with processing results
         """
         try:
-            from .models import Message
-            from django.db import sync_to_async
+            filters = {'sender_id': chat_partner_id}
+            if visible_message_ids:
+                filters['id__in'] = visible_message_ids
+            else:
+                filters['is_read'] = False
             
-            @sync_to_async
-            def get_unread_messages():
-                query = Message.objects.filter(
-                    recipient_id=user_id,
-                    sender_id=chat_partner_id,
-                    is_read=False
-                )
-                
-                # If specific visible messages provided, filter to those
-                if visible_message_ids:
-                    query = query.filter(id__in=visible_message_ids)
-                
-                return list(query.values_list('id', flat=True))
-            
-            unread_message_ids = await get_unread_messages()
-            
-            if not unread_message_ids:
-                return {
-                    'processed_count': 0,
-                    'failed_count': 0,
-                    'already_read_count': 0,
-                    'message_ids': []
-                }
-            
-            # Use bulk processing
-            result = await self.mark_multiple_messages_as_read(
-                message_ids=unread_message_ids,
-                reader_user_id=user_id
-            )
+            targets = await database_sync_to_async(self._read_targets)(user_id, **filters)
+            processed_count = await self._apply_watermarks(user_id, targets, timezone.now())
             
             logger.info(f"Marked visible messages as read for user {user_id} in chat with {chat_partner_id}")
-            return result
+            return {
+                'processed_count': processed_count,
+                'failed_count': 0,
+                'already_read_count': max(sum(t['found'] for t in targets) - processed_count, 0),
+                'read_up_to': {target['sender_id']: target['up_to'] for target in targets}
+            }
         
         except Exception as e:
             logger.error(f"Error marking visible messages as read: {e}")
@@ -278,161 +166,96 @@ class ReadReceiptManager:
                 'failed_count': 0
             }
     
-    async def _send_read_receipt_to_sender(self, message, read_timestamp: datetime) -> bool:
-        """Send read receipt notification to message sender."""
-        try:
-            if not self.channel_layer:
-                return False
-            
-            # Create read receipt payload
-            receipt_payload = {
-                'type': 'read_receipt_update',
-                'message': {
-                    'type': 'read_receipt',
-                    'message_id': message.id,
-                    'client_id': message.client_id,
-                    'read_by': message.recipient.username,
-                    'read_by_id': message.recipient.id,
-                    'read_at': read_timestamp.isoformat(),
-                    'status': 'read',
-                    'status_icon': message.get_status_icon()
-                }
-            }
-            
-            # Send to sender's user group
-            sender_group = f'user_{message.sender.id}'
-            await self.channel_layer.group_send(sender_group, receipt_payload)
-            
-            # Also send to the chat room for real-time updates
-            a, b = sorted([message.sender.id, message.recipient.id])
-            chat_room = f'chat_{a}_{b}'
-            await self.channel_layer.group_send(chat_room, receipt_payload)
-            
-            return True
+    # Watermarks
+    
+    @staticmethod
+    def _read_targets(reader_user_id: int, **filters) -> List[Dict]:
+        """One row per sender among the matching messages: the watermark to read up to."""
+        from .models import Message
         
-        except Exception as e:
-            logger.error(f"Error sending read receipt to sender: {e}")
-            return False
+        return list(
+            Message.objects.filter(recipient_id=reader_user_id, **filters)
+            .exclude(sender_id=reader_user_id)
+            .values('sender_id', 'recipient__username')
+            .annotate(up_to=models.Max('id'), found=models.Count('id'))
+            .order_by()
+        )
     
-    async def _send_bulk_read_receipts(self, messages: List, read_timestamp: datetime) -> int:
-        """Send read receipts for multiple messages, grouped by sender."""
-        try:
-            if not self.channel_layer or not messages:
-                return 0
-            
-            # Group messages by sender
-            messages_by_sender = {}
-            for message in messages:
-                sender_id = message.sender.id
-                if sender_id not in messages_by_sender:
-                    messages_by_sender[sender_id] = []
-                messages_by_sender[sender_id].append(message)
-            
-            sent_count = 0
-            
-            # Send bulk receipts to each sender
-            for sender_id, sender_messages in messages_by_sender.items():
-                try:
-                    # Create bulk receipt payload
-                    receipt_payload = {
-                        'type': 'bulk_read_receipts',
-                        'message': {
-                            'type': 'bulk_read_receipts',
-                            'read_by': sender_messages[0].recipient.username,
-                            'read_by_id': sender_messages[0].recipient.id,
-                            'read_at': read_timestamp.isoformat(),
-                            'message_count': len(sender_messages),
-                            'messages': [
-                                {
-                                    'message_id': msg.id,
-                                    'client_id': msg.client_id,
-                                    'status': 'read',
-                                    'status_icon': msg.get_status_icon()
-                                }
-                                for msg in sender_messages
-                            ]
-                        }
-                    }
-                    
-                    # Send to sender's user group
-                    sender_group = f'user_{sender_id}'
-                    await self.channel_layer.group_send(sender_group, receipt_payload)
-                    
-                    # Send to chat rooms
-                    for message in sender_messages:
-                        a, b = sorted([message.sender.id, message.recipient.id])
-                        chat_room = f'chat_{a}_{b}'
-                        await self.channel_layer.group_send(chat_room, {
-                            'type': 'read_receipt_update',
-                            'message': {
-                                'type': 'read_receipt',
-                                'message_id': message.id,
-                                'client_id': message.client_id,
-                                'read_by': message.recipient.username,
-                                'read_by_id': message.recipient.id,
-                                'read_at': read_timestamp.isoformat(),
-                                'status': 'read',
-                                'status_icon': message.get_status_icon()
-                            }
-                        })
-                    
-                    sent_count += len(sender_messages)
-                
-                except Exception as e:
-                    logger.error(f"Error sending bulk receipts to sender {sender_id}: {e}")
-            
-            return sent_count
+    @staticmethod
+    def _mark_read_up_to(reader_user_id: int, sender_id: int, up_to: int,
+                         read_timestamp: datetime) -> int:
+        """Advance the conversation's read watermark for ``reader_user_id`` to ``up_to``."""
+        from .models import Conversation
         
-        except Exception as e:
-            logger.error(f"Error sending bulk read receipts: {e}")
-            return 0
+        return Conversation.mark_read(reader_user_id, sender_id, up_to, read_timestamp)
+    
+    async def _apply_watermarks(self, reader_user_id: int, targets: List[Dict],
+                                read_timestamp: datetime) -> int:
+        """Advance each (reader, sender) watermark and announce it once per chat room."""
+        processed_count = 0
+        for target in targets:
+            sender_id, up_to = target['sender_id'], target['up_to']
+            if up_to <= self._processed_watermark(reader_user_id, sender_id):
+                logger.debug(f"Read watermark {up_to} for {reader_user_id}/{sender_id} already processed")
+                continue
+            
+            count = await database_sync_to_async(self._mark_read_up_to)(
+                reader_user_id, sender_id, up_to, read_timestamp
+            )
+            self._remember_watermark(reader_user_id, sender_id, up_to)
+            if count:
+                processed_count += count
+                await self._send_read_watermark(
+                    reader_user_id, target['recipient__username'], sender_id, up_to, count, read_timestamp
+                )
+        return processed_count
+    
+    def _watermark_key(self, reader_user_id: int, sender_id: int) -> str:
+        return f"{self.KEY_PREFIX}:watermark:{reader_user_id}:{sender_id}"
     
-    def _is_recently_processed(self, cache_key: str) -> bool:
-        """Check if a read receipt was recently processed (deduplication)."""
+    def _processed_watermark(self, reader_user_id: int, sender_id: int) -> int:
+        """Highest message id recently processed for this reader and sender (0 if none)."""
         try:
-            if cache_key in self.deduplication_cache:
-                cached_time = self.deduplication_cache[cache_key]
-                if timezone.now() - cached_time < timedelta(minutes=self.cache_ttl_minutes):
-                    return True
-                else:
-                    # Remove expired entry
-                    del self.deduplication_cache[cache_key]
-            
-            return False
-        
+            return self.deduplication_cache.get(self._watermark_key(reader_user_id, sender_id)) or 0
         except Exception as e:
             logger.error(f"Error checking deduplication cache: {e}")
-            return False
+            return 0
     
-    def _add_to_cache(self, cache_key: str) -> None:
-        """Add entry to deduplication cache."""
+    def _remember_watermark(self, reader_user_id: int, sender_id: int, up_to: int) -> None:
         try:
-            self.deduplication_cache[cache_key] = timezone.now()
-            
-            # Clean up old entries periodically
-            if len(self.deduplication_cache) > 1000:
-                self._cleanup_cache()
-        
+            if up_to > self._processed_watermark(reader_user_id, sender_id):
+                self.deduplication_cache.set(
+                    self._watermark_key(reader_user_id, sender_id), up_to, self.cache_ttl_minutes * 60
+                )
         except Exception as e:
             logger.error(f"Error adding to deduplication cache: {e}")
     
-    def _cleanup_cache(self) -> None:
-        """Clean up expired entries from deduplication cache."""
+    async def _send_read_watermark(self, reader_user_id: int, reader_username: str, sender_id: int,
+                                   up_to: int, count: int, read_timestamp: datetime) -> bool:
+        """Send one read watermark event to the chat room shared by reader and sender."""
         try:
-            cutoff_time = timezone.now() - timedelta(minutes=self.cache_ttl_minutes)
-            expired_keys = [
-                key for key, timestamp in self.deduplication_cache.items()
-                if timestamp < cutoff_time
-            ]
-            
-            for key in expired_keys:
-                del self.deduplication_cache[key]
+            if not self.channel_layer:
+                return False
             
-            if expired_keys:
-                logger.debug(f"Cleaned up {len(expired_keys)} expired cache entries")
+            a, b = sorted([sender_id, reader_user_id])
+            await self.channel_layer.group_send(f'chat_{a}_{b}', {
+                'type': 'read_receipt_update',
+                'message': {
+                    'type': 'read_watermark',
+                    'read_up_to': up_to,
+                    'sender_id': sender_id,
+                    'read_by': reader_username,
+                    'read_by_id': reader_user_id,
+                    'read_at': read_timestamp.isoformat(),
+                    'message_count': count,
+                    'status': 'read'
+                }
+            })
+            return True
         
         except Exception as e:
-            logger.error(f"Error cleaning up cache: {e}")
+            logger.error(f"Error sending read watermark to chat with {sender_id}: {e}")
+            return False
     
     async def get_read_receipt_statistics(self, user_id: int = None) -> Dict:
         """
@@ -446,9 +269,8 @@ class ReadReceiptManager:
         """
         try:
             from .models import Message
-            from django.db import sync_to_async
             
-            @sync_to_async
+            @database_sync_to_async
             def get_stats():
                 base_query = Message.objects.all()
                 if user_id:
@@ -464,7 +286,6 @@ class ReadReceiptManager:
                         is_read=True,
                         read_at__isnull=False
                     ).count(),
-                    'cache_size': len(self.deduplication_cache),
                     'timestamp': timezone.now().isoformat()
                 }
                 
@@ -489,60 +310,46 @@ class ReadReceiptManager:
         """
         Process any delayed read receipts (cleanup/recovery operation).
         
+        Messages marked read without a read timestamp get one, and each
+        affected chat gets a single watermark event.
+        
         Returns:
             Dict with processing results
         """
         try:
             from .models import Message
-            from django.db import sync_to_async
             
-            @sync_to_async
-            def get_delayed_receipts():
-                # Find messages that should have read receipts but don't
-                # (messages marked as read but without read_at timestamp)
-                return list(
-                    Message.objects.filter(
-                        is_read=True,
-                        read_at__isnull=True
-                    ).select_related('sender', 'recipient')[:self.batch_size]
+            read_timestamp = timezone.now()
+            
+            @database_sync_to_async
+            def stamp_delayed_receipts():
+                delayed = Message.objects.filter(is_read=True, read_at__isnull=True)
+                targets = list(
+                    delayed.values('sender_id', 'recipient_id', 'recipient__username')
+                    .annotate(up_to=models.Max('id'), found=models.Count('id'))
+                    .order_by()
                 )
+                delayed.update(read_at=read_timestamp)
+                return targets
             
-            delayed_messages = await get_delayed_receipts()
+            targets = await stamp_delayed_receipts()
             
-            if not delayed_messages:
+            if not targets:
                 return {
                     'processed_count': 0,
                     'message': 'No delayed read receipts found'
                 }
             
-            processed_count = 0
-            
-            for message in delayed_messages:
-                try:
-                    # Set read timestamp to now
-                    read_timestamp = timezone.now()
-                    
-                    # Update message
-                    from django.db import sync_to_async
-                    
-                    @sync_to_async
-                    def update_message():
-                        message.read_at = read_timestamp
-                        message.save(update_fields=['read_at'])
-                    
-                    await update_message()
-                    
-                    # Send read receipt
-                    await self._send_read_receipt_to_sender(message, read_timestamp)
-                    
-                    processed_count += 1
-                
-                except Exception as e:
-                    logger.error(f"Error processing delayed receipt for message {message.id}: {e}")
+            for target in targets:
+                await self._send_read_watermark(
+                    target['recipient_id'], target['recipient__username'], target['sender_id'],
+                    target['up_to'], target['found'], read_timestamp
+                )
             
+            processed_count = sum(target['found'] for target in targets)
             result = {
                 'processed_count': processed_count,
-                'total_found': len(delayed_messages),
+                'total_found': processed_count,
                 'timestamp': timezone.now().isoformat()
             }
             
@@ -5,12 +5,15 @@ import logging
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Message
+from core.caching import tagged_cache
+from .models import Message, Conversation, Notification, NotificationPreference, UnreadCounter, UserStatus
+from .notification_preferences import preference_resolver
 from .notification_service import (
     notify_new_message, 
     notify_connection_request, 
     notify_connection_accepted,
     notify_job_application,
+    notify_job_posted,
     notify_post_liked,
     notify_new_follower,
     notify_mention
@@ -20,6 +23,16 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+@receiver(post_save, sender=Message)
+def update_conversation_summary(sender, instance, created, **kwargs):
+    """Keep the denormalized Conversation row in step with new messages"""
+    if created:
+        try:
+            Conversation.record_message(instance)
+        except Exception as e:
+            logger.error(f"Error updating conversation for message {instance.id}: {e}")
+
+
 @receiver(post_save, sender=Message)
 def create_message_notification(sender, instance, created, **kwargs):
     """Create notification when a new message is sent (skip for self-chat)"""
@@ -30,11 +43,45 @@ def create_message_notification(sender, instance, created, **kwargs):
                 recipient=instance.recipient,
                 message_obj=instance
             )
-            logger.info(f"Message notification created for message {instance.id}")
+            logger.info(f"Message notification queued for message {instance.id}")
         except Exception as e:
             logger.error(f"Error creating message notification: {e}")
 
 
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance, created, **kwargs):
+    """New unread notifications go on the recipient's badge (bulk inserts adjust their own)"""
+    if created and not instance.is_read:
+        try:
+            UnreadCounter.adjust(instance.recipient_id, instance.notification_type, 1)
+        except Exception as e:
+            logger.error(f"Error updating unread counter for notification {instance.id}: {e}")
+
+
+@receiver(post_delete, sender=Notification)
+def release_unread_notification(sender, instance, **kwargs):
+    """Deleting an unread notification takes it off the recipient's badge"""
+    if not instance.is_read:
+        try:
+            UnreadCounter.adjust(instance.recipient_id, instance.notification_type, -1)
+        except Exception as e:
+            logger.error(f"Error updating unread counter for notification {instance.id}: {e}")
+
+
+@receiver(post_save, sender=NotificationPreference)
+@receiver(post_delete, sender=NotificationPreference)
+def invalidate_notification_preferences(sender, instance, **kwargs):
+    """Drop the user's cached preferences once the change is committed"""
+    preference_resolver.invalidate_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=UserStatus)
+@receiver(post_delete, sender=UserStatus)
+def invalidate_user_status(sender, instance, **kwargs):
+    """Drop the user's cached status once the change is committed"""
+    tagged_cache.invalidate_tags_on_commit(f'status:{instance.user_id}')
+
+
 # Connection-related signals
 def setup_connection_signals():
     """Setup signals for connection-related notifications"""
@@ -52,7 +99,7 @@ def setup_connection_signals():
                         recipient=instance.friend,
                         connection_obj=instance
                     )
-                    logger.info(f"Connection request notification created for connection {instance.id}")
+                    logger.info(f"Connection request notification queued for connection {instance.id}")
                 
                 elif not created and instance.status == 'accepted':
                     # Connection accepted (status changed from pending to accepted)
@@ -61,7 +108,7 @@ def setup_connection_signals():
                         recipient=instance.user,  # The person who sent the request
                         connection_obj=instance
                     )
-                    logger.info(f"Connection accepted notification created for connection {instance.id}")
+                    logger.info(f"Connection accepted notification queued for connection {instance.id}")
                     
             except Exception as e:
                 logger.error(f"Error creating connection notification: {e}")
@@ -74,7 +121,7 @@ def setup_connection_signals():
 def setup_job_signals():
     """Setup signals for job-related notifications"""
     try:
-        from jobs.models import Application
+        from jobs.models import Application, Job
         
         @receiver(post_save, sender=Application)
         def create_job_application_notification(sender, instance, created, **kwargs):
@@ -86,9 +133,28 @@ def setup_job_signals():
                         job_poster=instance.job.posted_by,
                         application_obj=instance
                     )
-                    logger.info(f"Job application notification created for application {instance.id}")
+                    logger.info(f"Job application notification queued for application {instance.id}")
                 except Exception as e:
                     logger.error(f"Error creating job application notification: {e}")
+
+        @receiver(post_save, sender=Job)
+        def create_job_posted_notifications(sender, instance, created, **kwargs):
+            """Notify the poster's followers about a new job"""
+            if created:
+                try:
+                    from network.models import Follow
+
+                    follower_ids = Follow.objects.filter(
+                        followed_id=instance.posted_by_id
+                    ).values_list('follower_id', flat=True)
+                    queued = notify_job_posted(
+                        poster=instance.posted_by,
+                        job_obj=instance,
+                        follower_ids=list(follower_ids)
+                    )
+                    logger.info(f"Job posted notifications queued for {queued} followers of job {instance.id}")
+                except Exception as e:
+                    logger.error(f"Error creating job posted notifications: {e}")
                     
     except ImportError:
         logger.warning("Jobs app not available, skipping job signals")
@@ -113,7 +179,7 @@ def setup_post_signals():
                             post_owner=post.user,
                             post_obj=post
                         )
-                        logger.info(f"Post like notification created for post {post.id}")
+                        logger.info(f"Post like notification queued for post {post.id}")
                 except Exception as e:
                     logger.error(f"Error creating post like notification: {e}")
         
@@ -141,7 +207,7 @@ def setup_follow_signals():
                         followed=instance.followed,
                         follow_obj=instance
                     )
-                    logger.info(f"Follow notification created for follow {instance.id}")
+                    logger.info(f"Follow notification queued for follow {instance.id}")
                 except Exception as e:
                     logger.error(f"Error creating follow notification: {e}")
                     
@@ -170,7 +236,7 @@ def detect_and_notify_mentions(post_content, post_obj, author):
                     mentioned=mentioned_user,
                     post_obj=post_obj
                 )
-                logger.info(f"Mention notification created for user {mentioned_user.username}")
+                logger.info(f"Mention notification queued for user {mentioned_user.username}")
         except User.DoesNotExist:
             logger.warning(f"Mentioned user @{username} not found")
         except Exception as e:
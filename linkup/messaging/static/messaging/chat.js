@@ -29,6 +29,7 @@
     let isLoadingOlder = false;
     let hasMoreMessages = true;
     let oldestMessageId = null;
+    let olderCursor = null; // Keyset cursor for the next page of older messages
     let messageQueue = []; // Queue for offline messages
     let isOnline = navigator.onLine;
     let retryQueue = []; // Queue for failed messages
@@ -306,6 +307,9 @@
             case 'bulk_read_receipts':
                 handleBulkReadReceipts(data);
                 break;
+            case 'read_watermark':
+                handleReadWatermark(data);
+                break;
             case 'user_status':
                 handleUserStatus(data);
                 break;
@@ -560,6 +564,20 @@
         }
     }
 
+    // The other participant has read everything we sent up to read_up_to
+    let readWatermark = 0;
+    function handleReadWatermark(data) {
+        if (data.read_by === currentUser || !(data.read_up_to > readWatermark)) return;
+        const previous = readWatermark;
+        readWatermark = data.read_up_to;
+        document.querySelectorAll('[data-message-id]').forEach(el => {
+            const id = parseInt(el.getAttribute('data-message-id'), 10);
+            if (id > previous && id <= readWatermark) {
+                updateMessageStatus(id, 'read');
+            }
+        });
+    }
+
     // Enhanced error handling with user-friendly messages and retry options
     function handleMessageDeleted(data) {
         var messageId = data.message_id;
@@ -948,7 +966,8 @@
         const scrollTop = chatWindow.scrollTop;
         
         // Enhanced fetch with better error handling
-        fetch(`${window.CHAT_CONFIG.loadOlderUrl}?before_id=${oldestMessageId}&page_size=${MESSAGE_BATCH_SIZE}`, {
+        const pageParam = olderCursor ? `cursor=${encodeURIComponent(olderCursor)}` : `before_id=${oldestMessageId}`;
+        fetch(`${window.CHAT_CONFIG.loadOlderUrl}?${pageParam}&page_size=${MESSAGE_BATCH_SIZE}`, {
             credentials: 'same-origin',
             headers: {
                 'Accept': 'application/json',
@@ -1001,6 +1020,7 @@
                 }, 100);
                 
                 hasMoreMessages = data.has_more;
+                olderCursor = data.next_cursor || null;
                 
                 // Update performance metrics
                 console.log(`Loaded ${data.messages.length} older messages`);
@@ -1537,9 +1557,8 @@
                 });
                 
                 // Set up pagination info
-                if (data.pagination) {
-                    hasMoreMessages = data.pagination.has_previous;
-                }
+                hasMoreMessages = Boolean(data.has_more);
+                olderCursor = data.next_cursor || null;
                 
                 // Scroll to bottom after all messages loaded
                 setTimeout(() => {
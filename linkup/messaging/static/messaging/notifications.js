@@ -21,7 +21,7 @@ class NotificationSystem {
         this.markAllReadBtn = document.getElementById('mark-all-read');
 
         // Pagination
-        this.currentOffset = 0;
+        this.nextCursor = null;
         this.pageSize = 20;
         this.hasMore = true;
 
@@ -35,8 +35,12 @@ class NotificationSystem {
         this.connectWebSocket();
         this.loadInitialNotifications();
 
-        // Periodic fallback polling
-        setInterval(() => this.pollFallback(), 30000);
+        // Pushes carry the badge counts; only poll while the socket is down
+        setInterval(() => {
+            if (!this.ws || this.ws.readyState !== WebSocket.OPEN) {
+                this.pollFallback();
+            }
+        }, 30000);
     }
 
     setupEventListeners() {
@@ -153,8 +157,8 @@ class NotificationSystem {
         // Add to notifications array
         this.notifications.unshift(notification);
         
-        // Update badge count
-        this.updateBadgeCount(notification.unread_count);
+        // Update badge count (messages plus notifications, as in the poll)
+        this.updateBadgeCount(notification.total_unread ?? notification.unread_count);
         
         // Add to UI
         this.addNotificationToUI(notification);
@@ -367,13 +371,14 @@ class NotificationSystem {
     }
     
     loadInitialNotifications() {
-        fetch(`/messages/notifications/?limit=${this.pageSize}&offset=0`, {
+        fetch(`/messages/notifications/?limit=${this.pageSize}`, {
             credentials: 'same-origin'
         }).then(response => response.json()).then(data => {
             this.notifications = data.notifications || [];
             this.updateBadgeCount(data.total_unread || 0);
             this.renderNotifications();
-            this.hasMore = data.has_more || false;
+            this.nextCursor = data.next_cursor || null;
+            this.hasMore = Boolean(data.has_more && this.nextCursor);
             this.updateLoadMoreButton();
         }).catch(error => {
             console.error('Error loading initial notifications:', error);
@@ -382,17 +387,16 @@ class NotificationSystem {
     }
     
     loadMoreNotifications() {
-        if (!this.hasMore) return;
-        
-        this.currentOffset += this.pageSize;
+        if (!this.hasMore || !this.nextCursor) return;
         
-        fetch(`/messages/notifications/?limit=${this.pageSize}&offset=${this.currentOffset}`, {
+        fetch(`/messages/notifications/?limit=${this.pageSize}&cursor=${encodeURIComponent(this.nextCursor)}`, {
             credentials: 'same-origin'
         }).then(response => response.json()).then(data => {
             const newNotifications = data.notifications || [];
             this.notifications.push(...newNotifications);
             this.renderAdditionalNotifications(newNotifications);
-            this.hasMore = data.has_more || false;
+            this.nextCursor = data.next_cursor || null;
+            this.hasMore = Boolean(data.has_more && this.nextCursor);
             this.updateLoadMoreButton();
         }).catch(error => {
             console.error('Error loading more notifications:', error);
@@ -564,7 +568,8 @@ class NotificationSystem {
     handleNotificationsList(data) {
         this.notifications = data.notifications || [];
         this.renderNotifications();
-        this.hasMore = data.has_more || false;
+        this.nextCursor = data.next_cursor || null;
+        this.hasMore = Boolean(data.has_more && this.nextCursor);
         this.updateLoadMoreButton();
     }
     
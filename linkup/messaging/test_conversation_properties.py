@@ -0,0 +1,153 @@
+"""
+Property-Based Tests for Denormalized Conversation Summaries
+
+Tests that the Conversation table stays consistent with the message history
+and that the inbox is served from it with a constant number of queries.
+"""
+
+from hypothesis import given, strategies as st, settings
+from hypothesis.extra.django import TestCase as HypothesisTestCase
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import json
+
+from core.caching import tagged_cache
+from .models import Message, Conversation
+
+User = get_user_model()
+
+
+class ConversationSummaryTests(TestCase):
+    """Unit tests for keeping Conversation rows in step with messages."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@test.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@test.com', password='pass')
+
+    def _conversation(self):
+        low, high = Conversation.participant_pair(self.alice.id, self.bob.id)
+        return Conversation.objects.get(user_low_id=low, user_high_id=high)
+
+    def test_new_message_updates_summary(self):
+        """Creating a message records it as the last message and bumps unread"""
+        message = Message.objects.create(sender=self.alice, recipient=self.bob, content='Hello Bob')
+
+        conversation = self._conversation()
+        self.assertEqual(conversation.last_message_id, message.id)
+        self.assertEqual(conversation.last_message_preview, 'Hello Bob')
+        self.assertEqual(conversation.last_sender_id, self.alice.id)
+        self.assertEqual(conversation.unread_count_for(self.bob), 1)
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+
+    def test_mark_as_read_decrements_unread(self):
+        """Reading a message lowers the reader's unread counter"""
+        first = Message.objects.create(sender=self.alice, recipient=self.bob, content='one')
+        Message.objects.create(sender=self.alice, recipient=self.bob, content='two')
+
+        first.mark_as_read()
+
+        self.assertEqual(self._conversation().unread_count_for(self.bob), 1)
+
+    def test_self_chat_has_no_unread(self):
+        """Messages to oneself never count as unread"""
+        Message.objects.create(sender=self.alice, recipient=self.alice, content='note to self')
+
+        conversation = Conversation.objects.get(user_low=self.alice, user_high=self.alice)
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+
+    def test_delete_for_everyone_refreshes_preview(self):
+        """Deleting the last message for everyone replaces the preview"""
+        message = Message.objects.create(sender=self.alice, recipient=self.bob, content='oops')
+        client = Client()
+        client.force_login(self.alice)
+
+        response = client.post(
+            reverse('messaging:delete_message', args=[message.id]),
+            data=json.dumps({'mode': 'everyone'}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._conversation().last_message_preview, Conversation.DELETED_PREVIEW)
+
+    def test_refresh_removes_empty_conversation(self):
+        """Refreshing a pair with no messages drops its summary row"""
+        Message.objects.create(sender=self.alice, recipient=self.bob, content='hi')
+        Message.objects.filter(sender=self.alice).delete()
+
+        Conversation.refresh_for_pair(self.alice.id, self.bob.id)
+
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_inbox_query_count_is_constant(self):
+        """The inbox costs the same number of queries regardless of history size"""
+        client = Client()
+        client.force_login(self.alice)
+
+        def inbox_queries():
+            # Measure with cold user-status caches, so each request looks statuses up
+            cache.clear()
+            tagged_cache.clear_l1()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(reverse('messaging:inbox'))
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+
+        Message.objects.create(sender=self.bob, recipient=self.alice, content='first')
+        # The first request also stamps session activity
+        inbox_queries()
+        baseline = inbox_queries()
+
+        for i in range(30):
+            partner = User.objects.create_user(username=f'partner{i}', email=f'partner{i}@test.com')
+            Message.objects.create(sender=partner, recipient=self.alice, content=f'hi {i}')
+            Message.objects.create(sender=self.alice, recipient=partner, content=f'reply {i}')
+
+        self.assertEqual(inbox_queries(), baseline)
+
+
+class ConversationConsistencyPropertyTests(HypothesisTestCase):
+    """Property-based tests comparing incremental updates to a full rebuild."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@test.com')
+            for i in range(3)
+        ]
+
+    @given(
+        exchanges=st.lists(
+            st.tuples(st.integers(0, 2), st.integers(0, 2), st.booleans()),
+            min_size=1,
+            max_size=20
+        )
+    )
+    @settings(max_examples=20, deadline=None)
+    def test_incremental_summary_matches_rebuild(self, exchanges):
+        """
+        **Property: Conversation Consistency**
+
+        Summaries maintained on write must equal summaries rebuilt from scratch.
+        """
+        for sender_index, recipient_index, read in exchanges:
+            message = Message.objects.create(
+                sender=self.users[sender_index],
+                recipient=self.users[recipient_index],
+                content='message'
+            )
+            if read:
+                message.mark_as_read()
+
+        fields = (
+            'user_low_id', 'user_high_id', 'last_message_id', 'last_sender_id',
+            'unread_count_low', 'unread_count_high'
+        )
+        incremental = sorted(Conversation.objects.values_list(*fields))
+        Conversation.rebuild_all()
+        rebuilt = sorted(Conversation.objects.values_list(*fields))
+
+        self.assertEqual(incremental, rebuilt)
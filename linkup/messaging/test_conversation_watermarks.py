@@ -0,0 +1,101 @@
+"""
+Tests for per-conversation read/delivered watermarks.
+
+Marking a chat read or delivered updates one Conversation row; message
+status is derived from the watermarks, and the legacy Message columns are
+only written while MESSAGE_READ_COMPAT_COLUMNS is on.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .message_persistence_manager import message_persistence_manager
+from .models import Conversation, Message, UnreadCounter
+
+User = get_user_model()
+
+
+class ConversationWatermarkTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='wm_alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='wm_bob', email='bob@example.com', password='pw')
+
+    def _backlog(self, count):
+        return [
+            Message.objects.create(sender=self.bob, recipient=self.alice, content=f'message {i}').id
+            for i in range(count)
+        ]
+
+    def _conversation(self):
+        low, high = Conversation.participant_pair(self.alice.id, self.bob.id)
+        return Conversation.objects.get(user_low_id=low, user_high_id=high)
+
+    @override_settings(MESSAGE_READ_COMPAT_COLUMNS=False)
+    def test_mark_read_is_a_single_row_update(self):
+        message_ids = self._backlog(300)
+
+        with CaptureQueriesContext(connection) as context:
+            marked = Conversation.mark_read(self.alice.id, self.bob.id)
+
+        self.assertEqual(marked, 300)
+        updates = [q['sql'] for q in context.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len([sql for sql in updates if 'messaging_conversation' in sql]), 1)
+        self.assertFalse([sql for sql in updates if 'messaging_message' in sql])
+
+        conversation = self._conversation()
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['messages'], 0)
+        self.assertFalse(Conversation.unread_messages(Message.objects.filter(recipient=self.alice)).exists())
+        self.assertEqual(conversation.receipt_state(message_ids[-1], self.alice.id, 'pending'), ('read', True))
+
+    def test_partial_read_keeps_newer_messages_unread(self):
+        first, second, third = self._backlog(3)
+
+        self.assertEqual(Conversation.mark_read(self.alice.id, self.bob.id, up_to=second), 2)
+        self.assertEqual(Conversation.mark_read(self.alice.id, self.bob.id, up_to=first), 0)
+
+        self.assertEqual(self._conversation().unread_count_for(self.alice), 1)
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['messages'], 1)
+        # Compatibility columns are mirrored by default
+        unread = set(Message.objects.filter(recipient=self.alice, is_read=False).values_list('id', flat=True))
+        self.assertEqual(unread, {third})
+
+    @override_settings(MESSAGE_READ_COMPAT_COLUMNS=False)
+    def test_history_derives_status_from_watermarks(self):
+        first, second = self._backlog(2)
+        reply = Message.objects.create(sender=self.alice, recipient=self.bob, content='reply').id
+        Conversation.mark_read(self.alice.id, self.bob.id, up_to=first)
+        Conversation.mark_delivered(self.alice.id, self.bob.id, second)
+        Conversation.mark_delivered(self.bob.id, self.alice.id, reply)
+
+        history = message_persistence_manager.get_conversation_messages(self.alice.id, self.bob.id, limit=10)
+        states = {m['id']: (m['status'], m['is_read']) for m in history['messages']}
+
+        self.assertEqual(states[first], ('read', True))
+        self.assertEqual(states[second], ('delivered', False))
+        self.assertEqual(states[reply], ('delivered', False))
+
+    def test_mark_delivered_only_moves_forward(self):
+        first, second = self._backlog(2)
+
+        self.assertTrue(Conversation.mark_delivered(self.alice.id, self.bob.id, second))
+        self.assertFalse(Conversation.mark_delivered(self.alice.id, self.bob.id, first))
+
+        field = Conversation.watermark_field_for('delivered', self.alice.id, self.bob.id)
+        self.assertEqual(getattr(self._conversation(), field), second)
+        self.assertEqual(Message.objects.filter(recipient=self.alice, status='delivered').count(), 2)
+
+    def test_mark_messages_read_view(self):
+        self._backlog(4)
+        Message.objects.create(sender=self.alice, recipient=self.bob, content='reply')
+        self.client.force_login(self.alice)
+
+        response = self.client.post(reverse('messaging:mark_messages_read', args=[self.bob.username]))
+
+        self.assertEqual(response.json()['marked_read'], 4)
+        conversation = self._conversation()
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+        self.assertEqual(conversation.unread_count_for(self.bob), 1)
@@ -0,0 +1,121 @@
+"""
+Tests for the buffered MessagingError sink.
+
+Logging an error only queues it in memory: repeats of one fingerprint are
+rate limited and sampled, a full queue drops with a counter, and rows are
+written in bulk when the sink flushes.
+"""
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import error_sink as error_sink_module, logging_utils
+from .error_sink import ErrorSink, error_sink, fingerprint
+from .logging_utils import MessagingLogger
+from .models import MessagingError
+
+User = get_user_model()
+
+
+@override_settings(
+    MESSAGING_ERROR_SINK_MODE='manual',
+    MESSAGING_ERROR_SINK_BURST=3,
+    MESSAGING_ERROR_SINK_SAMPLE_EVERY=10,
+    MESSAGING_ERROR_SINK_BATCH_SIZE=50,
+)
+class ErrorSinkTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sink_user', email='sink@example.com')
+
+    def test_fingerprint_ignores_ids(self):
+        self.assertEqual(
+            fingerprint('message_processing', 'Message 17 failed for user 4'),
+            fingerprint('message_processing', 'Message 902 failed for user 11'),
+        )
+        self.assertNotEqual(
+            fingerprint('message_processing', 'Message 17 failed'),
+            fingerprint('json_serialization', 'Message 17 failed'),
+        )
+
+    def test_error_storm_is_sampled_and_written_in_bulk(self):
+        sink = ErrorSink()
+
+        with CaptureQueriesContext(connection) as submitting:
+            queued = sum(
+                sink.submit('message_processing', f'Message {i} failed', {'message_id': i}, user=self.user)
+                for i in range(1003)
+            )
+        with CaptureQueriesContext(connection) as flushing:
+            written = sink.flush()
+
+        self.assertEqual(len(submitting.captured_queries), 0)
+        # Three burst rows, then one in ten of the remaining thousand
+        self.assertEqual(queued, 103)
+        self.assertEqual(written, 103)
+        self.assertEqual(len([q for q in flushing.captured_queries if q['sql'].startswith('INSERT')]), 3)
+        self.assertEqual(sink.stats()['dropped']['sampled_out'], 900)
+        sampled = MessagingError.objects.filter(context_data__message_id=12).get()
+        self.assertEqual(sampled.context_data['suppressed_since_last'], 9)
+        self.assertEqual(sampled.user, self.user)
+
+    @override_settings(MESSAGING_ERROR_SINK_MAX_QUEUE=5, MESSAGING_ERROR_SINK_BURST=100)
+    def test_full_queue_drops_and_counts(self):
+        sink = ErrorSink()
+
+        results = [sink.submit('connection_handling', f'Error {i}') for i in range(8)]
+
+        self.assertEqual(results, [True] * 5 + [False] * 3)
+        self.assertEqual(sink.stats()['dropped']['queue_full'], 3)
+        self.assertEqual(sink.flush(), 5)
+
+    def test_logger_queues_from_async_handlers_without_queries(self):
+        sink = ErrorSink()
+        patcher = mock.patch.object(logging_utils, 'error_sink', sink)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        async def handler():
+            try:
+                raise ValueError('bad frame')
+            except ValueError as e:
+                MessagingLogger.log_serialization_error(e, data={'type': 'unknown'}, user=self.user)
+
+        with CaptureQueriesContext(connection) as context:
+            async_to_sync(handler)()
+
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(sink.flush(), 1)
+        error = MessagingError.objects.get()
+        self.assertEqual(error.error_type, 'json_serialization')
+        self.assertIn('ValueError: bad frame', error.context_data['traceback'])
+
+    @override_settings(MESSAGING_ERROR_SINK_MODE='thread')
+    def test_async_submits_start_the_flusher_and_register_one_exit_flush(self):
+        sink = ErrorSink()
+
+        async def handler(i):
+            sink.submit('connection_handling', f'Socket {i} dropped')
+            sink._thread.join()  # _run is patched out, so the flusher exits at once
+
+        with mock.patch.object(ErrorSink, '_run'), mock.patch.object(error_sink_module.atexit, 'register') as register:
+            for i in range(3):
+                async_to_sync(handler)(i)
+
+        register.assert_called_once_with(sink.flush)
+        self.assertEqual(sink.pending(), 3)
+
+    def test_discard_drops_the_queue_without_writing(self):
+        sink = ErrorSink()
+        sink.submit('connection_handling', 'Socket dropped')
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(sink.discard(), 1)
+
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(sink.flush(), 0)
+        self.assertEqual(error_sink.pending(), 0)
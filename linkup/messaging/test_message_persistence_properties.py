@@ -19,7 +19,8 @@ from datetime import datetime, timedelta
 from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db import transaction, IntegrityError
+from django.db import transaction, IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from hypothesis import given, strategies as st, settings, assume, example
 from hypothesis.extra.django import TestCase as HypothesisTestCase
 from unittest.mock import patch, MagicMock, AsyncMock
@@ -556,5 +557,63 @@ class MessageLockManagerPropertiesTest(TransactionTestCase):
             self.assertEqual(message.content, f"Bulk updated {i}")
 
 
+class MessageSendCostTest(TestCase):
+    """Send cost must not depend on how long the conversation already is"""
+    
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username='cost_user1',
+            email='cost1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='cost_user2',
+            email='cost2@example.com',
+            password='testpass123'
+        )
+        self.persistence_manager = MessagePersistenceManager()
+    
+    def _send(self, client_id, content='cost test'):
+        from asgiref.sync import async_to_sync
+        
+        with CaptureQueriesContext(connection) as context:
+            message = async_to_sync(self.persistence_manager.create_message_atomic)(
+                sender=self.user1,
+                recipient=self.user2,
+                content=content,
+                client_id=client_id
+            )
+        return message, [query['sql'] for query in context.captured_queries]
+    
+    def test_duplicate_client_id_returns_existing_message(self):
+        """Retrying with the same client_id returns the stored message"""
+        first, _ = self._send('retry-1', content='original')
+        second, _ = self._send('retry-1', content='retried')
+        
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(second.content, 'original')
+        self.assertEqual(Message.objects.filter(sender=self.user1, client_id='retry-1').count(), 1)
+    
+    def test_query_count_independent_of_history(self):
+        """A send issues the same queries with 1 or 500 prior messages"""
+        self._send('warmup')
+        _, short_history_queries = self._send('short')
+        
+        Message.objects.bulk_create([
+            Message(sender=self.user2, recipient=self.user1, content=f'history {i}', is_read=True)
+            for i in range(500)
+        ])
+        _, long_history_queries = self._send('long')
+        
+        self.assertEqual(len(short_history_queries), len(long_history_queries))
+        
+        # The conversation history itself is never read while sending
+        history_reads = [
+            sql for sql in long_history_queries
+            if sql.startswith('SELECT') and 'FROM "messaging_message"' in sql
+        ]
+        self.assertEqual(history_reads, [])
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
\ No newline at end of file
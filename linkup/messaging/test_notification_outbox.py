@@ -0,0 +1,111 @@
+"""
+Tests for the notification outbox.
+
+Sending a message only queues its notification; the worker turns queued
+entries into notifications in batches and pushes once per recipient.
+"""
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from network.models import Follow
+from . import notification_outbox
+from .models import Message, Notification, NotificationOutbox, NotificationPreference
+from .notification_service import notify_new_message
+from .testing import FakeChannelLayer
+
+User = get_user_model()
+
+
+@override_settings(NOTIFICATION_OUTBOX_MODE='worker')
+class NotificationOutboxTest(TestCase):
+    """Notifications are queued on the send path and written in batches."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='outbox_alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='outbox_bob', email='bob@example.com')
+        self.layer = FakeChannelLayer()
+        patcher = mock.patch.object(notification_outbox, 'get_channel_layer', return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _followers(self, count, start=0):
+        users = [
+            User.objects.create_user(username=f'outbox_fan{i}', email=f'fan{i}@example.com')
+            for i in range(start, start + count)
+        ]
+        for user in users:
+            Follow.objects.create(follower=user, followed=self.alice)
+        return users
+
+    def test_message_send_only_queues_one_notification(self):
+        """The post_save signal queues; nothing is written until the worker runs"""
+        message = Message.objects.create(sender=self.bob, recipient=self.alice, content='hi')
+        notify_new_message(sender=self.bob, recipient=self.alice, message_obj=message)
+
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+        self.assertFalse(Notification.objects.filter(notification_type='new_message').exists())
+
+        notification_outbox.drain()
+
+        notification = Notification.objects.get(notification_type='new_message')
+        self.assertEqual((notification.recipient, notification.object_id), (self.alice, message.id))
+        self.assertTrue(notification.is_delivered)
+
+    def test_grouped_events_are_coalesced(self):
+        """Followers in one batch become one grouped notification, later batches extend it"""
+        self._followers(3)
+        notification_outbox.drain()
+
+        group = Notification.objects.get(notification_type='new_follower')
+        self.assertEqual(group.group_count, 3)
+
+        group.mark_as_read()
+        self._followers(2, start=3)
+        notification_outbox.drain()
+
+        group.refresh_from_db()
+        self.assertEqual((group.group_count, group.is_read), (5, False))
+        self.assertEqual(Notification.objects.filter(notification_type='new_follower').count(), 1)
+
+    def test_one_push_per_recipient_per_batch(self):
+        """Each recipient gets a single push with their unread count"""
+        self._followers(2)
+        message = Message.objects.create(sender=self.bob, recipient=self.alice, content='hi')
+
+        notification_outbox.drain()
+
+        self.assertEqual([group for group, _ in self.layer.sent], [f'user_{self.alice.id}'])
+        payload = self.layer.sent[0][1]['message']['notification']
+        self.assertEqual((payload['unread_count'], payload['batched_count']), (2, 2))
+        self.assertEqual(payload['notification_type'], 'new_message')
+        self.assertIn(message.content, payload['message'])
+
+    def test_disabled_preference_is_skipped(self):
+        NotificationPreference.objects.create(user=self.alice, notification_type='new_message', is_enabled=False)
+        Message.objects.create(sender=self.bob, recipient=self.alice, content='hi')
+
+        notification_outbox.drain()
+
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(NotificationOutbox.objects.filter(processed_at__isnull=True).exists())
+
+    def test_batch_queries_do_not_grow_with_batch_size(self):
+        def batch_queries(count, start):
+            self._followers(count, start)
+            for user in User.objects.filter(username__startswith='outbox_fan')[:count]:
+                Message.objects.create(sender=user, recipient=self.alice, content='hello')
+            cache.clear()  # Compare cold preference caches
+            with CaptureQueriesContext(connection) as context:
+                notification_outbox.drain()
+            # Read everything so the next batch reopens groups and moves the counters again
+            Notification.mark_read_bulk(Notification.objects.all())
+            return len(context.captured_queries)
+
+        self.assertEqual(batch_queries(10, 0), batch_queries(3, 10))
@@ -0,0 +1,106 @@
+"""
+Tests for the cached notification preference resolver.
+
+A user's preferences are loaded once and cached until they change; bulk
+lookups resolve a whole audience with one cache round trip and at most
+one query.
+"""
+
+from datetime import time, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from network.models import Follow
+from .models import NotificationOutbox, NotificationPreference
+from .notification_manager import NotificationBatchProcessor
+from .notification_preferences import preference_resolver
+from .notification_service import notify_system_announcement
+
+User = get_user_model()
+
+
+@override_settings(NOTIFICATION_OUTBOX_MODE='worker')
+class NotificationPreferenceResolverTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(username=f'prefs_user{i}', email=f'prefs{i}@example.com')
+            for i in range(5)
+        ]
+
+    def _quiet_now(self, user, notification_type):
+        now = timezone.now()
+        NotificationPreference.objects.create(
+            user=user, notification_type=notification_type,
+            quiet_hours_start=(now - timedelta(minutes=5)).time(),
+            quiet_hours_end=(now + timedelta(minutes=5)).time(),
+        )
+
+    def test_lookups_are_cached_until_preferences_change(self):
+        user = self.users[0]
+        with self.assertNumQueries(1):
+            self.assertTrue(NotificationPreference.get_user_preference(user, 'post_liked').is_enabled)
+            self.assertEqual(NotificationPreference.get_user_preference(user, 'mention').delivery_method, 'realtime')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationPreference.objects.create(user=user, notification_type='post_liked', is_enabled=False)
+            # Invalidation waits for the commit, so no reader re-caches the old rows
+            self.assertTrue(NotificationPreference.get_user_preference(user, 'post_liked').is_enabled)
+        self.assertFalse(NotificationPreference.get_user_preference(user, 'post_liked').is_enabled)
+
+    def test_enabled_recipients_in_one_query(self):
+        disabled, quiet = self.users[1], self.users[2]
+        NotificationPreference.objects.create(user=disabled, notification_type='system_announcement', is_enabled=False)
+        self._quiet_now(quiet, 'system_announcement')
+        user_ids = [user.id for user in self.users]
+
+        with self.assertNumQueries(1):
+            enabled = preference_resolver.enabled_recipients(user_ids, 'system_announcement')
+        self.assertEqual(enabled, [u.id for u in self.users if u not in (disabled, quiet)])
+
+        with self.assertNumQueries(0):
+            urgent = preference_resolver.enabled_recipients(user_ids, 'system_announcement', priority='urgent')
+        self.assertEqual(urgent, [u.id for u in self.users if u != disabled])
+
+    def test_announcement_fan_out_queues_in_bulk(self):
+        NotificationPreference.objects.create(user=self.users[0], notification_type='system_announcement', is_enabled=False)
+
+        queued = notify_system_announcement([user.id for user in self.users], 'Maintenance', 'Back soon')
+
+        self.assertEqual(queued, 4)
+        self.assertEqual(
+            set(NotificationOutbox.objects.values_list('recipient_id', flat=True)),
+            {user.id for user in self.users[1:]}
+        )
+
+    def test_job_post_notifies_followers(self):
+        poster, *followers = self.users
+        for follower in followers:
+            Follow.objects.create(follower=follower, followed=poster)
+        NotificationOutbox.objects.all().delete()
+        NotificationPreference.objects.create(user=followers[0], notification_type='new_job_posted', is_enabled=False)
+
+        Job.objects.create(
+            title='Engineer', company='Acme', location='Remote', description='Build things', posted_by=poster
+        )
+
+        self.assertEqual(
+            set(NotificationOutbox.objects.filter(notification_type='new_job_posted').values_list('recipient_id', flat=True)),
+            {follower.id for follower in followers[1:]}
+        )
+
+    def test_digest_queries_do_not_grow_with_users(self):
+        from .models import Notification
+
+        for user in self.users:
+            NotificationPreference.objects.create(user=user, notification_type='post_liked', delivery_method='email')
+            Notification.objects.create(recipient=user, notification_type='post_liked', title='Liked', message='Liked')
+
+        with self.assertNumQueries(5):
+            sent = NotificationBatchProcessor().send_digest_notifications('daily')
+        self.assertEqual(sent, len(self.users))
@@ -0,0 +1,153 @@
+"""
+Tests for the cache-backed presence store.
+
+Heartbeats must not write to the database; UserStatus is only touched when
+a user comes online, goes offline, or during the periodic last_seen flush.
+"""
+
+import time
+import uuid
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .models import UserStatus
+from .presence_manager import PresenceManager
+from .presence_store import PresenceStore
+
+User = get_user_model()
+
+
+class PresenceStoreTest(TestCase):
+    """Presence state lives in the cache and reaches the DB only on transitions."""
+
+    def setUp(self):
+        # A private locmem cache stands in for Redis and isolates each test
+        self.cache = LocMemCache(f'presence-{uuid.uuid4().hex}', {})
+        self.store = PresenceStore(cache_backend=self.cache, connection_ttl=60, flush_interval=60)
+        self.manager = PresenceManager(store=self.store)
+        self.alice = User.objects.create_user(username='presence_alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='presence_bob', email='bob@example.com')
+
+    def test_connection_counts_track_open_sockets(self):
+        """Online state follows the number of open connections"""
+        self.manager.user_connected(self.alice)
+        self.manager.user_connected(self.alice)
+
+        presence = self.manager.get_user_presence(self.alice)
+        self.assertTrue(presence['is_online'])
+        self.assertEqual(presence['active_connections'], 2)
+        self.assertTrue(UserStatus.objects.get(user=self.alice).is_online)
+
+        self.manager.user_disconnected(self.alice)
+        self.assertTrue(self.manager.get_user_presence(self.alice)['is_online'])
+
+        self.manager.user_disconnected(self.alice)
+        presence = self.manager.get_user_presence(self.alice)
+        self.assertFalse(presence['is_online'])
+        self.assertIsNotNone(presence['last_seen'])
+        self.assertFalse(UserStatus.objects.get(user=self.alice).is_online)
+
+    def test_heartbeat_does_not_touch_database(self):
+        """Heartbeats between flushes only update the cache"""
+        self.manager.user_connected(self.alice)
+        self.store.should_flush()  # Start the flush interval
+
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(10):
+                self.assertTrue(self.manager.update_heartbeat(self.alice))
+
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_heartbeat_revives_expired_connection(self):
+        """A heartbeat after the connection key expired brings the user back online"""
+        self.manager.user_connected(self.alice)
+        self.cache.delete(self.store._key('connections', self.alice.id))
+
+        self.manager.update_heartbeat(self.alice)
+
+        self.assertTrue(self.manager.get_user_presence(self.alice)['is_online'])
+
+    def test_flush_last_seen_is_batched(self):
+        """Flushing writes every online user's last ping in a fixed number of queries"""
+        users = [
+            User.objects.create_user(username=f'flush_{i}', email=f'flush_{i}@example.com')
+            for i in range(20)
+        ]
+        for user in users:
+            self.manager.user_connected(user)
+
+        with CaptureQueriesContext(connection) as context:
+            updated = self.manager.flush_last_seen()
+
+        self.assertEqual(updated, len(users))
+        self.assertLessEqual(len(context.captured_queries), 3)
+
+    def test_get_online_users_reads_from_store(self):
+        """Online users come back most recent heartbeat first"""
+        self.manager.user_connected(self.alice)
+        time.sleep(0.01)
+        self.manager.user_connected(self.bob)
+
+        usernames = [entry['username'] for entry in self.manager.get_online_users()]
+
+        self.assertEqual(usernames, ['presence_bob', 'presence_alice'])
+
+    def test_cleanup_marks_silent_users_offline(self):
+        """Users whose heartbeat stopped are marked offline in cache and DB"""
+        self.manager.user_connected(self.alice)
+        self.manager.user_connected(self.bob)
+        self.cache.set(self.store._key('ping', self.alice.id), time.time() - 120, 60)
+
+        cleaned = self.manager.cleanup_stale_connections(timeout_seconds=30)
+
+        self.assertEqual(cleaned, 1)
+        self.assertFalse(self.manager.get_user_presence(self.alice)['is_online'])
+        self.assertTrue(self.manager.get_user_presence(self.bob)['is_online'])
+        self.assertFalse(UserStatus.objects.get(user=self.alice).is_online)
+        self.assertTrue(UserStatus.objects.get(user=self.bob).is_online)
+
+    def test_index_updates_touch_one_shard(self):
+        """Coming online rewrites only the user's own index shard"""
+        self.manager.user_connected(self.alice)
+        self.manager.user_connected(self.bob)
+
+        self.assertEqual(self.store.online_user_ids(), {self.alice.id, self.bob.id})
+        alice_shard = self.cache.get(self.store._shard_key(self.store._shard(self.alice.id)))
+        self.assertIn(self.alice.id, alice_shard)
+        self.assertNotIn(self.bob.id, alice_shard)
+
+    def test_index_is_not_written_without_the_lock(self):
+        """A change to a locked shard is deferred, then applied once the lock is free"""
+        lock_key = self.store._key(f'online:lock:{self.store._shard(self.alice.id)}')
+        self.cache.add(lock_key, 'other-worker', 60)
+
+        with self.assertLogs('messaging.presence_store', 'WARNING'):
+            self.store.connect(self.alice.id)
+
+        self.assertIsNone(self.cache.get(self.store._shard_key(self.store._shard(self.alice.id))))
+        self.assertEqual(self.cache.get(lock_key), 'other-worker')
+
+        self.cache.delete(lock_key)
+        self.assertIn(self.alice.id, self.store.online_user_ids())
+
+    def test_expired_lock_is_not_released_over_its_new_holder(self):
+        """A worker whose shard lock expired and was taken over neither writes nor unlocks"""
+        shard = self.store._shard(self.alice.id)
+        lock_key = self.store._key(f'online:lock:{shard}')
+        original_get = self.cache.get
+
+        def get_after_takeover(key, *args, **kwargs):
+            if key == self.store._shard_key(shard):
+                self.cache.set(lock_key, 'new-holder', 60)
+            return original_get(key, *args, **kwargs)
+
+        with mock.patch.object(self.cache, 'get', side_effect=get_after_takeover):
+            self.assertFalse(self.store._update_shard(shard, {self.alice.id: True}))
+
+        self.assertEqual(self.cache.get(lock_key), 'new-holder')
+        self.assertIsNone(self.cache.get(self.store._shard_key(shard)))
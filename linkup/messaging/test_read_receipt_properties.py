@@ -17,6 +17,7 @@ from unittest.mock import Mock, AsyncMock, patch
 from hypothesis import given, strategies as st, settings, assume
 from django.test import TransactionTestCase
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.utils import timezone
 
 from messaging.read_receipt_manager import ReadReceiptManager
@@ -31,6 +32,7 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
     
     def setUp(self):
         """Set up test environment."""
+        cache.clear()  # Processed read watermarks live in the shared cache
         self.user1 = User.objects.create_user(
             username='receipt_user1',
             email='receipt1@example.com',
@@ -87,7 +89,7 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
                 read_time = timezone.now() + timedelta(seconds=delay)
                 
                 # Mock the WebSocket broadcasting to capture calls
-                with patch.object(self.receipt_manager, '_send_read_receipt_to_sender') as mock_send:
+                with patch.object(self.receipt_manager, '_send_read_watermark') as mock_send:
                     mock_send.return_value = True
                     
                     success = await self.receipt_manager.mark_message_as_read(
@@ -176,8 +178,8 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
             batch_results = []
             
             for batch in batch_info:
-                with patch.object(self.receipt_manager, '_send_bulk_read_receipts') as mock_bulk_send:
-                    mock_bulk_send.return_value = len(batch['messages'])
+                with patch.object(self.receipt_manager, '_send_read_watermark') as mock_watermark:
+                    mock_watermark.return_value = True
                     
                     result = await self.receipt_manager.mark_multiple_messages_as_read(
                         message_ids=batch['message_ids'],
@@ -187,7 +189,7 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
                     batch_results.append({
                         'batch_size': batch['size'],
                         'result': result,
-                        'bulk_send_called': mock_bulk_send.called
+                        'watermarks_sent': mock_watermark.call_count
                     })
             
             return batch_results
@@ -203,7 +205,7 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
             assert 'processed_count' in result, f"Batch {i+1} should have processed count"
             assert result['processed_count'] == expected_size, f"Batch {i+1} should process all messages"
             assert result.get('failed_count', 0) == 0, f"Batch {i+1} should have no failures"
-            assert batch_result['bulk_send_called'], f"Bulk send should be called for batch {i+1}"
+            assert batch_result['watermarks_sent'] == 1, f"Batch {i+1} should send one read watermark"
         
         # Verify all messages are marked as read
         for message in all_messages:
@@ -246,7 +248,7 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
         async def run_duplicate_attempts():
             results = []
             
-            with patch.object(self.receipt_manager, '_send_read_receipt_to_sender') as mock_send:
+            with patch.object(self.receipt_manager, '_send_read_watermark') as mock_send:
                 mock_send.return_value = True
                 
                 # First attempt should succeed
@@ -295,12 +297,11 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
         assert results[0]['success'], "First attempt should succeed"
         assert results[0]['send_called'], "First attempt should send receipt"
         
-        # Subsequent attempts should be handled gracefully (may succeed but not send duplicate receipts)
+        # Subsequent attempts find the watermark already processed and send nothing
         for i in range(1, len(results)):
             result = results[i]
-            # The attempt may succeed (message already read) but shouldn't send duplicate receipts
-            # This is acceptable behavior - the important thing is no duplicate processing
-            assert isinstance(result['success'], bool), f"Attempt {i+1} should return boolean"
+            assert result['success'], f"Attempt {i+1} should succeed"
+            assert not result['send_called'], f"Attempt {i+1} should not send a duplicate receipt"
         
         # Verify message state is correct
         message.refresh_from_db()
@@ -356,19 +357,20 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
             chat_results = []
             
             for chat in chat_data:
-                with patch.object(self.receipt_manager, '_send_bulk_read_receipts') as mock_bulk:
-                    mock_bulk.return_value = len(chat['messages'])
+                with patch.object(self.receipt_manager, '_send_read_watermark') as mock_watermark:
+                    mock_watermark.return_value = True
                     
                     result = await self.receipt_manager.mark_visible_messages_as_read(
                         user_id=self.user2.id,
-                        chat_partner_id=chat['sender'].id
+                        chat_partner_id=chat['sender'].id,
+                        visible_message_ids=[msg.id for msg in chat['messages']]
                     )
                     
                     chat_results.append({
                         'sender_id': chat['sender'].id,
                         'expected_count': chat['message_count'],
                         'result': result,
-                        'bulk_send_called': mock_bulk.called
+                        'watermarks_sent': mock_watermark.call_count
                     })
             
             return chat_results
@@ -386,7 +388,7 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
             assert result.get('failed_count', 0) == 0, f"Chat {i+1} should have no failures"
             
             if expected_count > 0:
-                assert chat_result['bulk_send_called'], f"Bulk send should be called for chat {i+1}"
+                assert chat_result['watermarks_sent'] == 1, f"Chat {i+1} should send one read watermark"
         
         # Verify all messages are marked as read
         for chat in chat_data:
@@ -463,7 +465,7 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
                 recipient = msg_data['recipient']
                 sender = msg_data['sender']
                 
-                with patch.object(self.receipt_manager, '_send_read_receipt_to_sender') as mock_send:
+                with patch.object(self.receipt_manager, '_send_read_watermark') as mock_send:
                     mock_send.return_value = True
                     
                     # Mark message as read
@@ -504,73 +506,56 @@ class ReadReceiptPropertiesTest(TransactionTestCase):
         Message.objects.filter(id__in=[msg_data['message'].id for msg_data in created_messages]).delete()
     
     @given(
-        cache_operations=st.lists(
+        watermark_operations=st.lists(
             st.tuples(
-                st.text(min_size=1, max_size=20),  # cache key
-                st.integers(min_value=0, max_value=300)  # delay seconds
+                st.sampled_from(['user1', 'user3']),  # sender
+                st.integers(min_value=1, max_value=10000)  # read up to message id
             ),
             min_size=1,
             max_size=20
         )
     )
     @settings(max_examples=15, deadline=4000)
-    def test_deduplication_cache_management_property(self, cache_operations):
+    def test_deduplication_cache_management_property(self, watermark_operations):
         """
         Property 10.6: Deduplication Cache Management
-        For any sequence of cache operations, the deduplication cache should 
-        properly manage entries with TTL and prevent memory leaks.
+        For any sequence of processed read watermarks, the shared cache keeps
+        one entry per (reader, sender) pair holding the highest watermark,
+        visible to every manager and gone once the entry expires.
         
         **Validates: Requirements 8.5**
         """
         # Arrange - Clear cache
-        self.receipt_manager.deduplication_cache.clear()
-        initial_cache_size = len(self.receipt_manager.deduplication_cache)
-        
-        # Act - Perform cache operations
-        for cache_key, delay in cache_operations:
-            # Add entry to cache
-            self.receipt_manager._add_to_cache(f"test_{cache_key}")
-            
-            # Check if recently processed
-            is_recent = self.receipt_manager._is_recently_processed(f"test_{cache_key}")
-            assert is_recent, f"Entry {cache_key} should be recently processed"
-        
-        # Verify cache size
-        current_cache_size = len(self.receipt_manager.deduplication_cache)
-        expected_unique_keys = len(set(f"test_{key}" for key, _ in cache_operations))
-        
-        assert current_cache_size >= initial_cache_size, "Cache size should increase"
-        assert current_cache_size <= initial_cache_size + expected_unique_keys, "Cache should not have duplicates"
-        
-        # Test cache cleanup
-        if current_cache_size > 0:
-            # Force cleanup by setting old timestamps
-            old_time = timezone.now() - timedelta(minutes=10)
-            for key in list(self.receipt_manager.deduplication_cache.keys()):
-                self.receipt_manager.deduplication_cache[key] = old_time
+        cache.clear()
+        reader_id = self.user2.id
+        
+        # Act - Remember watermarks in any order
+        expected = {}
+        for sender_name, up_to in watermark_operations:
+            sender_id = getattr(self, sender_name).id
+            self.receipt_manager._remember_watermark(reader_id, sender_id, up_to)
+            expected[sender_id] = max(expected.get(sender_id, 0), up_to)
             
-            # Trigger cleanup
-            self.receipt_manager._cleanup_cache()
-            
-            # Verify cleanup worked
-            final_cache_size = len(self.receipt_manager.deduplication_cache)
-            assert final_cache_size == 0, "Cache should be cleaned up"
-        
-        # Test cache TTL behavior
-        test_key = "ttl_test_key"
-        self.receipt_manager._add_to_cache(test_key)
-        
-        # Should be recent immediately
-        assert self.receipt_manager._is_recently_processed(test_key), "Should be recent immediately"
-        
-        # Simulate expired entry
-        if test_key in self.receipt_manager.deduplication_cache:
-            self.receipt_manager.deduplication_cache[test_key] = timezone.now() - timedelta(minutes=10)
-        
-        # Should not be recent after expiry
-        is_recent_after_expiry = self.receipt_manager._is_recently_processed(test_key)
-        assert not is_recent_after_expiry, "Should not be recent after expiry"
-
+            assert self.receipt_manager._processed_watermark(reader_id, sender_id) >= up_to, \
+                f"Watermark {up_to} should count as processed"
+        
+        # Assert - Highest watermark per pair, shared with other managers
+        other_manager = ReadReceiptManager()
+        for sender_id, up_to in expected.items():
+            assert self.receipt_manager._processed_watermark(reader_id, sender_id) == up_to, \
+                "Cache should keep the highest watermark"
+            assert other_manager._processed_watermark(reader_id, sender_id) == up_to, \
+                "Watermarks should be shared through the cache"
+        
+        # Pairs never read have no watermark
+        assert self.receipt_manager._processed_watermark(self.user1.id, self.user3.id) == 0, \
+            "Unknown pair should have no watermark"
+        
+        # Simulate expired entries
+        for sender_id in expected:
+            cache.delete(self.receipt_manager._watermark_key(reader_id, sender_id))
+            assert self.receipt_manager._processed_watermark(reader_id, sender_id) == 0, \
+                "Expired watermark should no longer be processed"
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v', '-s'])
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Tests for read receipts as per-chat watermarks.
+
+Reading a backlog is one UPDATE and one event per (chat room, reader),
+and the deduplication watermark is shared through the cache.
+"""
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .models import Conversation, Message, UnreadCounter
+from .read_receipt_manager import ReadReceiptManager
+from .testing import FakeChannelLayer
+
+User = get_user_model()
+
+
+class ReadWatermarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='watermark_alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='watermark_bob', email='bob@example.com')
+        self.layer = FakeChannelLayer()
+        self.manager = self._manager()
+
+    def _manager(self):
+        manager = ReadReceiptManager()
+        manager.channel_layer = self.layer
+        return manager
+
+    def _backlog(self, count):
+        return [
+            Message.objects.create(sender=self.bob, recipient=self.alice, content=f'message {i}').id
+            for i in range(count)
+        ]
+
+    def test_backlog_is_one_update_and_one_event(self):
+        message_ids = self._backlog(200)
+
+        with CaptureQueriesContext(connection) as context:
+            result = async_to_sync(self.manager.mark_multiple_messages_as_read)(message_ids, self.alice.id)
+
+        self.assertEqual(result['processed_count'], 200)
+        message_updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE "messaging_message"')]
+        self.assertEqual(len(message_updates), 1)
+        self.assertFalse(Message.objects.filter(recipient=self.alice, is_read=False).exists())
+
+        low, high = sorted([self.alice.id, self.bob.id])
+        self.assertEqual(len(self.layer.sent), 1)
+        group, event = self.layer.sent[0]
+        self.assertEqual(group, f'chat_{low}_{high}')
+        self.assertEqual(event['message']['type'], 'read_watermark')
+        self.assertEqual((event['message']['read_up_to'], event['message']['message_count']), (max(message_ids), 200))
+
+        conversation = Conversation.objects.get(user_low_id=low, user_high_id=high)
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['messages'], 0)
+
+    def test_single_receipt_reads_everything_before_it(self):
+        first, second, third = self._backlog(3)
+
+        self.assertTrue(async_to_sync(self.manager.mark_message_as_read)(second, self.alice.id))
+
+        unread = set(Message.objects.filter(recipient=self.alice, is_read=False).values_list('id', flat=True))
+        self.assertEqual(unread, {third})
+        self.assertEqual(self.layer.sent[0][1]['message']['read_up_to'], second)
+
+    def test_repeated_watermark_is_deduplicated_across_managers(self):
+        message_ids = self._backlog(5)
+        async_to_sync(self.manager.mark_multiple_messages_as_read)(message_ids, self.alice.id)
+
+        # Another worker sees the same watermark through the shared cache
+        other = self._manager()
+        with CaptureQueriesContext(connection) as context:
+            result = async_to_sync(other.mark_multiple_messages_as_read)(message_ids[:3], self.alice.id)
+
+        self.assertEqual((result['processed_count'], result['already_read_count']), (0, 3))
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(len(self.layer.sent), 1)
+
+    def test_mark_chat_read(self):
+        self._backlog(4)
+        Message.objects.create(sender=self.alice, recipient=self.bob, content='reply')
+
+        result = async_to_sync(self.manager.mark_visible_messages_as_read)(self.alice.id, self.bob.id)
+
+        self.assertEqual(result['processed_count'], 4)
+        self.assertTrue(Message.objects.filter(recipient=self.bob, is_read=False).exists())
+        self.assertEqual(len(self.layer.sent), 1)
@@ -0,0 +1,97 @@
+"""
+Tests for in-memory typing indicators.
+
+Typing frames are handled on the connection: they never query the
+database, and the chat room only hears about start/stop transitions.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .consumers import ChatConsumer
+from .models import TypingStatus
+from .testing import FakeChannelLayer
+from .typing_manager import TypingIndicator, TypingManager, typing_manager
+
+User = get_user_model()
+
+
+class TypingIndicatorTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='typing_alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='typing_bob', email='bob@example.com')
+        self.layer = FakeChannelLayer()
+
+    def _indicator(self, **kwargs):
+        return TypingIndicator(self.layer, 'chat_room', self.alice, self.bob, **kwargs)
+
+    def test_typing_frames_make_no_queries(self):
+        """Load test: a burst of typing frames through the consumer costs zero queries"""
+        consumer = ChatConsumer()
+        consumer.user = self.alice
+        consumer.other_user = self.bob
+        consumer.typing = typing_manager.open(self.layer, 'chat_room', self.alice, self.bob)
+        frame = json.dumps({'type': 'typing', 'is_typing': True})
+
+        async def burst():
+            for _ in range(1000):
+                await consumer.receive(text_data=frame)
+            await consumer.stop_all_typing()
+
+        with CaptureQueriesContext(connection) as context:
+            async_to_sync(burst)()
+
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(self.layer.states(), [True, False])
+        self.assertFalse(TypingStatus.objects.exists())
+
+    def test_indicator_expires_without_frames(self):
+        async def scenario():
+            indicator = self._indicator(timeout=0.05)
+            await indicator.update(True)
+            await asyncio.sleep(0.03)
+            await indicator.update(True)  # Refreshes the deadline, no broadcast
+            await asyncio.sleep(0.1)
+            return indicator.is_typing
+
+        self.assertFalse(async_to_sync(scenario)())
+        self.assertEqual(self.layer.states(), [True, False])
+
+    def test_stop_delay_absorbs_flapping(self):
+        async def scenario():
+            indicator = self._indicator(timeout=1, stop_delay=0.05)
+            await indicator.update(True)
+            await indicator.update(False)
+            await indicator.update(True)
+            await asyncio.sleep(0.08)
+            flapped = list(self.layer.states())
+            await indicator.update(False)
+            await asyncio.sleep(0.08)
+            return flapped
+
+        self.assertEqual(async_to_sync(scenario)(), [True])
+        self.assertEqual(self.layer.states(), [True, False])
+
+    def test_manager_tracks_open_indicators(self):
+        manager = TypingManager()
+
+        async def scenario():
+            indicator = manager.open(self.layer, 'chat_room', self.alice, self.bob)
+            await indicator.update(True)
+            typing = manager.get_typing_users_for_chat(self.bob, self.alice)
+            summary = manager.get_typing_summary_for_user(self.bob)
+            await manager.close(indicator)
+            return typing, summary, manager.get_typing_users_for_chat(self.bob, self.alice)
+
+        typing, summary, after_close = async_to_sync(scenario)()
+
+        self.assertEqual(typing, ['typing_alice'])
+        self.assertEqual(summary['total_incoming'], 1)
+        self.assertEqual(after_close, [])
+        self.assertEqual(self.layer.states(), [True, False])
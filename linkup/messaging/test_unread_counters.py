@@ -0,0 +1,94 @@
+"""
+Tests for the unread counters behind the badges.
+
+Badge reads come from UnreadCounter; every write path that creates, reads
+or deletes messages and notifications keeps the counters in step.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Message, Notification, UnreadCounter
+
+User = get_user_model()
+
+
+class UnreadCounterTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='counter_alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='counter_bob', email='bob@example.com', password='pw')
+
+    def _notify(self, notification_type='post_liked', **kwargs):
+        return Notification.objects.create(
+            recipient=self.alice, sender=self.bob, notification_type=notification_type,
+            title='Title', message='Body', **kwargs
+        )
+
+    def test_messages_are_counted_on_send_and_read(self):
+        first = Message.objects.create(sender=self.bob, recipient=self.alice, content='one')
+        Message.objects.create(sender=self.bob, recipient=self.alice, content='two')
+        Message.objects.create(sender=self.alice, recipient=self.alice, content='note to self')
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['messages'], 2)
+
+        first.mark_as_read()
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['messages'], 1)
+
+    def test_notifications_by_type(self):
+        self._notify()
+        self._notify()
+        self._notify('new_follower')
+
+        badge = UnreadCounter.badge(self.alice.id)
+        self.assertEqual(badge['notifications'], 3)
+        self.assertEqual(badge['notifications_by_type'], {'post_liked': 2, 'new_follower': 1})
+
+    def test_bulk_read_and_delete(self):
+        read_one = self._notify()
+        self._notify()
+        unread = self._notify('new_follower')
+
+        read_one.mark_as_read()
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['notifications'], 2)
+
+        Notification.mark_read_bulk(Notification.objects.filter(notification_type='post_liked'))
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['notifications'], 1)
+
+        unread.delete()
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['total'], 0)
+
+    def test_reconcile_repairs_drift(self):
+        Message.objects.create(sender=self.bob, recipient=self.alice, content='hi')
+        self._notify()
+        UnreadCounter.objects.filter(user=self.alice, kind=UnreadCounter.MESSAGES).update(count=7)
+        UnreadCounter.objects.create(user=self.bob, kind='post_liked', count=4)
+
+        call_command('reconcile_unread_counters', verbosity=0, stdout=open('/dev/null', 'w'))
+
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['messages'], 1)
+        self.assertEqual(UnreadCounter.badge(self.alice.id)['notifications'], 1)
+        self.assertFalse(UnreadCounter.objects.filter(user=self.bob).exists())
+        self.assertEqual(UnreadCounter.reconcile(), 0)
+
+    def test_badge_is_one_query(self):
+        for _ in range(3):
+            Message.objects.create(sender=self.bob, recipient=self.alice, content='hi')
+            self._notify()
+
+        with CaptureQueriesContext(connection) as context:
+            badge = UnreadCounter.badge(self.alice.id)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual((badge['messages'], badge['notifications'], badge['total']), (3, 3, 6))
+
+    def test_unread_endpoint_uses_counters(self):
+        Message.objects.create(sender=self.bob, recipient=self.alice, content='hi')
+        self._notify()
+        self.client.force_login(self.alice)
+
+        data = self.client.get(reverse('messaging:unread_notifications')).json()
+
+        self.assertEqual((data['messages']['count'], data['notifications']['count']), (1, 1))
+        self.assertEqual(data['total_unread'], 2)
@@ -0,0 +1,17 @@
+"""
+Test helpers shared by the messaging test modules.
+"""
+
+
+class FakeChannelLayer:
+    """Records group_send calls instead of delivering them."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, event):
+        self.sent.append((group, event))
+
+    def states(self):
+        """is_typing of every typing event sent, in order."""
+        return [event['is_typing'] for _, event in self.sent]
@@ -28,6 +28,33 @@ class MessagingViewTests(TestCase):
         m.refresh_from_db()
         self.assertTrue(m.is_read)
 
+    def test_history_pages_follow_the_cursor(self):
+        sent = [Message.objects.create(sender=self.u2, recipient=self.u1, content=f'm{i}').id for i in range(12)]
+        c = Client()
+        c.login(username='alice', password='pass')
+
+        first = c.get(reverse('messaging:fetch_history', args=[self.u2.username]), {'page_size': 10}).json()
+        older = c.get(
+            reverse('messaging:load_older_messages', args=[self.u2.username]),
+            {'page_size': 10, 'cursor': first['next_cursor']},
+        ).json()
+
+        self.assertEqual([m['id'] for m in first['messages']], sent[2:])
+        self.assertEqual([m['id'] for m in older['messages']], sent[:2])
+        self.assertIsNone(older['next_cursor'])
+
+    def test_history_page_before_id(self):
+        from django.db.models import Q
+        from .message_persistence_manager import message_persistence_manager
+
+        sent = [Message.objects.create(sender=self.u1, recipient=self.u2, content=f'm{i}').id for i in range(4)]
+        conversation = Message.objects.filter(Q(sender=self.u1) | Q(recipient=self.u1))
+
+        messages, next_cursor = message_persistence_manager.history_page(conversation, 2, before_id=sent[3])
+
+        self.assertEqual([m.id for m in messages], sent[1:3])
+        self.assertIsNotNone(next_cursor)
+
     def test_send_message_fallback(self):
         c = Client()
         c.login(username='alice', password='pass')
@@ -1,285 +1,191 @@
 """
-Typing Status Manager for real-time typing indicators.
-Handles typing status tracking, debouncing, and cleanup.
+In-memory typing indicators for real-time chat.
+
+Typing state is ephemeral, so it lives on the WebSocket connection rather
+than in the database. Each ChatConsumer owns a TypingIndicator that:
+
+- broadcasts to the chat room only when the state flips, so a stream of
+  keystroke-driven ``typing`` frames costs one group_send in total;
+- clears itself when no ``typing`` frame arrives within the timeout, which
+  covers clients that go quiet without sending a stop;
+- holds an explicit stop for a short delay, so stop/start flapping between
+  words never reaches the other participant.
+
+A typing frame never queries the database. The TypingStatus table is no
+longer written.
 """
 
+import asyncio
 import logging
-from typing import Optional, Dict, Any
-from django.utils import timezone
-from django.db import transaction
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import TypingStatus
-from datetime import timedelta
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
-class TypingManager:
-    """Manages typing indicators with debouncing and cleanup."""
-    
-    def __init__(self):
-        self.channel_layer = get_channel_layer()
-    
-    def update_typing_status(self, user, chat_partner, is_typing: bool) -> bool:
+class TypingIndicator:
+    """Typing state for one connection: one user typing in one chat room."""
+
+    def __init__(self, channel_layer, room_group_name: str, user, chat_partner,
+                 timeout: Optional[float] = None, stop_delay: Optional[float] = None):
+        self.channel_layer = channel_layer
+        self.room_group_name = room_group_name
+        self.user = user
+        self.chat_partner = chat_partner
+        self.timeout = timeout if timeout is not None else getattr(settings, 'TYPING_INDICATOR_TIMEOUT', 5)
+        self.stop_delay = stop_delay if stop_delay is not None else getattr(settings, 'TYPING_INDICATOR_STOP_DELAY', 1)
+        self.is_typing = False
+        self.started_at: Optional[float] = None
+        self.last_frame_at: Optional[float] = None
+        self._deadline = 0.0
+        self._timer: Optional[asyncio.Task] = None
+
+    async def update(self, is_typing: bool) -> bool:
         """
-        Update typing status for a user in a specific chat.
-        
-        Args:
-            user: User who is typing
-            chat_partner: User they are chatting with
-            is_typing: Whether user is currently typing
-            
+        Apply a typing frame from the client.
+
         Returns:
-            bool: True if status was updated successfully
+            bool: True if the frame changed the state and was broadcast
         """
+        now = time.monotonic()
+        if is_typing:
+            self.last_frame_at = now
+            self._schedule(now + self.timeout)
+            if self.is_typing:
+                return False
+            self.is_typing = True
+            self.started_at = now
+            await self._broadcast(True)
+            return True
+
+        # Explicit stop: wait out the delay in case typing resumes
+        if self.is_typing:
+            self._schedule(min(self._deadline, now + self.stop_delay))
+        return False
+
+    async def stop(self) -> bool:
+        """Clear the indicator immediately, e.g. when the connection closes."""
+        self._cancel_timer()
+        return await self._clear()
+
+    def _schedule(self, deadline: float):
+        """Move the expiry deadline; one timer task per typing burst, not per frame."""
+        if deadline < self._deadline:
+            # The running timer sleeps until the old deadline; restart it
+            self._cancel_timer()
+        self._deadline = deadline
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._expire())
+
+    def _cancel_timer(self):
+        if self._timer is not None and not self._timer.done() and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+    async def _expire(self):
         try:
-            with transaction.atomic():
-                typing_status, created = TypingStatus.objects.get_or_create(
-                    user=user,
-                    chat_partner=chat_partner,
-                    defaults={'is_typing': is_typing}
-                )
-                
-                # Only update if status actually changed
-                if typing_status.is_typing != is_typing:
-                    typing_status.is_typing = is_typing
-                    typing_status.last_updated = timezone.now()
-                    typing_status.save(update_fields=['is_typing', 'last_updated'])
-                    
-                    # Broadcast typing status update
-                    self._broadcast_typing_status(user, chat_partner, is_typing)
-                    
-                    logger.debug(f"Updated typing status: {user.username} -> {chat_partner.username}: {is_typing}")
-                    return True
-                else:
-                    # Status unchanged, just update timestamp for debouncing
-                    typing_status.last_updated = timezone.now()
-                    typing_status.save(update_fields=['last_updated'])
-                    return True
-                    
-        except Exception as e:
-            logger.error(f"Failed to update typing status: {e}")
+            while True:
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+            self._timer = None
+            await self._clear()
+        except asyncio.CancelledError:
+            pass
+
+    async def _clear(self) -> bool:
+        if not self.is_typing:
             return False
-    
-    def _broadcast_typing_status(self, user, chat_partner, is_typing: bool):
-        """Broadcast typing status update via WebSocket."""
+        self.is_typing = False
+        self.started_at = None
+        await self._broadcast(False)
+        return True
+
+    async def _broadcast(self, is_typing: bool):
         if not self.channel_layer:
             logger.warning("Channel layer not available for typing status broadcasting")
             return
-        
         try:
-            # Create room name (same logic as ChatConsumer)
-            a, b = sorted([user.id, chat_partner.id])
-            room_group_name = f'chat_{a}_{b}'
-            
-            # Create typing status payload
-            typing_payload = {
-                'type': 'typing_indicator',
-                'username': user.username,
-                'is_typing': is_typing,
-                'timestamp': timezone.now().isoformat()
-            }
-            
-            # Broadcast to chat room
-            async_to_sync(self.channel_layer.group_send)(
-                room_group_name,
+            await self.channel_layer.group_send(
+                self.room_group_name,
                 {
                     'type': 'typing_indicator',
-                    'username': user.username,
+                    'username': self.user.username,
                     'is_typing': is_typing
                 }
             )
-            
-            logger.debug(f"Broadcasted typing status: {user.username} -> {is_typing}")
-            
+            logger.debug(f"Broadcasted typing status: {self.user.username} -> {is_typing}")
         except Exception as e:
             logger.error(f"Failed to broadcast typing status: {e}")
-    
-    def get_typing_users_for_chat(self, user, chat_partner) -> list:
-        """
-        Get list of users currently typing in a chat.
-        
-        Args:
-            user: Current user
-            chat_partner: Their chat partner
-            
-        Returns:
-            list: List of usernames currently typing
-        """
-        try:
-            # Clean up stale statuses first
-            self.cleanup_stale_typing_statuses()
-            
-            # Get active typing statuses for this chat
-            typing_statuses = TypingStatus.objects.filter(
-                chat_partner=user,  # People typing TO the current user
-                is_typing=True
-            ).select_related('user')
-            
-            typing_users = [status.user.username for status in typing_statuses]
-            
-            return typing_users
-            
-        except Exception as e:
-            logger.error(f"Failed to get typing users: {e}")
-            return []
-    
-    def cleanup_stale_typing_statuses(self, timeout_seconds: int = 5) -> int:
+
+
+class TypingManager:
+    """Creates the per-connection indicators and keeps a process-local view of them."""
+
+    def __init__(self):
+        self._indicators: Dict[int, TypingIndicator] = {}
+
+    def open(self, channel_layer, room_group_name: str, user, chat_partner) -> TypingIndicator:
+        """Create and register the typing indicator for a new connection."""
+        indicator = TypingIndicator(channel_layer, room_group_name, user, chat_partner)
+        self._indicators[id(indicator)] = indicator
+        return indicator
+
+    async def close(self, indicator: Optional[TypingIndicator]) -> bool:
         """
-        Clean up stale typing indicators.
-        
-        Args:
-            timeout_seconds: Timeout for considering status stale
-            
+        Stop and forget a connection's indicator.
+
         Returns:
-            int: Number of stale statuses cleaned up
+            bool: True if a "stopped typing" update was broadcast
         """
-        try:
-            cutoff_time = timezone.now() - timedelta(seconds=timeout_seconds)
-            
-            # Find stale typing statuses
-            stale_statuses = TypingStatus.objects.filter(
-                is_typing=True,
-                last_updated__lt=cutoff_time
-            ).select_related('user', 'chat_partner')
-            
-            # Broadcast stop typing for each stale status
-            for status in stale_statuses:
-                self._broadcast_typing_status(
-                    status.user, 
-                    status.chat_partner, 
-                    False
-                )
-            
-            # Update stale statuses to not typing
-            count = stale_statuses.update(is_typing=False)
-            
-            if count > 0:
-                logger.info(f"Cleaned up {count} stale typing statuses")
-            
-            return count
-            
-        except Exception as e:
-            logger.error(f"Failed to cleanup stale typing statuses: {e}")
-            return 0
-    
-    def stop_all_typing_for_user(self, user) -> int:
+        if indicator is None:
+            return False
+        self._indicators.pop(id(indicator), None)
+        return await indicator.stop()
+
+    def _active(self) -> List[TypingIndicator]:
+        return [indicator for indicator in self._indicators.values() if indicator.is_typing]
+
+    def get_typing_users_for_chat(self, user, chat_partner) -> list:
         """
-        Stop all typing indicators for a user (e.g., when they disconnect).
-        
-        Args:
-            user: User to stop typing for
-            
-        Returns:
-            int: Number of typing statuses stopped
+        Usernames currently typing to ``user`` in their chat with ``chat_partner``.
+
+        Only covers connections handled by this process.
         """
-        try:
-            # Get all active typing statuses for this user
-            active_statuses = TypingStatus.objects.filter(
-                user=user,
-                is_typing=True
-            ).select_related('chat_partner')
-            
-            # Broadcast stop typing for each
-            for status in active_statuses:
-                self._broadcast_typing_status(
-                    status.user,
-                    status.chat_partner,
-                    False
-                )
-            
-            # Update all to not typing
-            count = active_statuses.update(is_typing=False)
-            
-            if count > 0:
-                logger.info(f"Stopped {count} typing indicators for user {user.username}")
-            
-            return count
-            
-        except Exception as e:
-            logger.error(f"Failed to stop typing for user {user.username}: {e}")
-            return 0
-    
+        return [
+            indicator.user.username for indicator in self._active()
+            if indicator.user.id == chat_partner.id and indicator.chat_partner.id == user.id
+        ]
+
     def get_typing_summary_for_user(self, user) -> Dict[str, Any]:
         """
-        Get comprehensive typing status summary for a user.
-        
-        Args:
-            user: User to get summary for
-            
+        Typing activity to and from a user on this process's connections.
+
         Returns:
             dict: Summary with typing counts and active chats
         """
-        try:
-            # Clean up stale statuses first
-            self.cleanup_stale_typing_statuses()
-            
-            # Get users typing TO this user
-            incoming_typing = TypingStatus.objects.filter(
-                chat_partner=user,
-                is_typing=True
-            ).select_related('user')
-            
-            # Get users this user is typing TO
-            outgoing_typing = TypingStatus.objects.filter(
-                user=user,
-                is_typing=True
-            ).select_related('chat_partner')
-            
-            summary = {
-                'incoming_typing': [
-                    {
-                        'username': status.user.username,
-                        'started_at': status.started_at.isoformat(),
-                        'last_updated': status.last_updated.isoformat()
-                    }
-                    for status in incoming_typing
-                ],
-                'outgoing_typing': [
-                    {
-                        'username': status.chat_partner.username,
-                        'started_at': status.started_at.isoformat(),
-                        'last_updated': status.last_updated.isoformat()
-                    }
-                    for status in outgoing_typing
-                ],
-                'total_incoming': incoming_typing.count(),
-                'total_outgoing': outgoing_typing.count()
-            }
-            
-            return summary
-            
-        except Exception as e:
-            logger.error(f"Failed to get typing summary for user {user.username}: {e}")
+        now = time.monotonic()
+
+        def entry(indicator, other):
             return {
-                'incoming_typing': [],
-                'outgoing_typing': [],
-                'total_incoming': 0,
-                'total_outgoing': 0,
-                'error': str(e)
+                'username': other.username,
+                'typing_for_seconds': round(now - indicator.started_at, 3),
+                'last_frame_seconds_ago': round(now - indicator.last_frame_at, 3),
             }
-    
-    def debounce_typing_stop(self, user, chat_partner, delay_seconds: int = 1):
-        """
-        Schedule automatic typing stop after delay (debouncing).
-        This would typically be implemented with Celery or similar task queue.
-        For now, we rely on frontend timeout and cleanup.
-        
-        Args:
-            user: User who is typing
-            chat_partner: User they are chatting with
-            delay_seconds: Delay before auto-stop
-        """
-        # This is a placeholder for future implementation with task queue
-        # For now, we rely on:
-        # 1. Frontend sending stop typing after timeout
-        # 2. Periodic cleanup of stale statuses
-        # 3. WebSocket disconnect handling
-        
-        logger.debug(f"Typing debounce scheduled for {user.username} -> {chat_partner.username}")
-        pass
+
+        active = self._active()
+        incoming = [entry(i, i.user) for i in active if i.chat_partner.id == user.id and i.user.id != user.id]
+        outgoing = [entry(i, i.chat_partner) for i in active if i.user.id == user.id]
+        return {
+            'incoming_typing': incoming,
+            'outgoing_typing': outgoing,
+            'total_incoming': len(incoming),
+            'total_outgoing': len(outgoing)
+        }
 
 
 # Global instance
-typing_manager = TypingManager()
\ No newline at end of file
+typing_manager = TypingManager()
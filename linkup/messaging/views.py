@@ -11,13 +11,11 @@ from django.db import transaction, IntegrityError
 from django.db.models import Q, F, Case, When
 from django.utils import timezone
 from django.conf import settings
-from .models import Message, UserStatus, Notification, QueuedMessage
+from .models import Message, UserStatus, Notification, QueuedMessage, Conversation, UnreadCounter
 from .notification_service import NotificationService
+from .notification_preferences import preference_resolver
 from .message_persistence_manager import message_persistence_manager
-from core.performance import (
-    performance_monitor, QueryOptimizer, OptimizedPaginator, 
-    CacheManager, cache_result
-)
+from core.performance import performance_monitor, QueryOptimizer, OptimizedPaginator
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -32,15 +30,15 @@ def unread_notifications(request):
     try:
         from django.urls import reverse
 
-        # Get unread messages count with optimized query
-        unread_messages_query = Message.objects.filter(recipient=request.user, is_read=False)
+        # Badge counts come from the counter table, not from counting rows
+        badge = UnreadCounter.badge(request.user.id)
+        total_unread_messages = badge['messages']
+        total_unread_notifications = badge['notifications']
+
+        unread_messages_query = Conversation.unread_messages(Message.objects.filter(recipient=request.user))
         unread_messages_query = QueryOptimizer.optimize_message_queries(unread_messages_query)
-        total_unread_messages = unread_messages_query.count()
-        
-        # Get unread notifications count
         notification_service = NotificationService()
-        total_unread_notifications = notification_service.get_unread_count(request.user)
-        
+
         # Get message previews with optimization
         message_previews = unread_messages_query.order_by('-created_at')[:5]
         
@@ -60,7 +58,7 @@ def unread_notifications(request):
                 'count': total_unread_notifications,
                 'items': notification_previews
             },
-            'total_unread': total_unread_messages + total_unread_notifications
+            'total_unread': badge['total']
         }
         
         # Process message previews
@@ -105,15 +103,9 @@ def chat_view(request, username):
         
         if not is_self:
             try:
-                status = UserStatus.objects.get(user=target)
-                is_online = status.is_online
-                last_seen = status.last_seen
-            except UserStatus.DoesNotExist:
-                logger.info(f"UserStatus not found for user {target.id}, creating default")
-                try:
-                    UserStatus.objects.create(user=target, is_online=False)
-                except IntegrityError:
-                    pass
+                status = UserStatus.snapshots([target.id])[target.id]
+                is_online = status['is_online']
+                last_seen = status['last_seen']
             except Exception as e:
                 logger.error(f"Error fetching user status for {target.id}: {e}")
         else:
@@ -147,6 +139,7 @@ def fetch_history(request, username):
         page = int(request.GET.get('page', 1))
         page_size = int(request.GET.get('page_size', 50))  # Default 50 messages for initial load
         before_id = request.GET.get('before_id')  # For loading older messages
+        cursor = request.GET.get('cursor')  # Opaque keyset cursor from next_cursor
         include_metadata = request.GET.get('include_metadata', 'true').lower() == 'true'
         
         # Validate page size with enhanced limits
@@ -163,11 +156,13 @@ def fetch_history(request, username):
                 limit=page_size,
                 before_id=int(before_id) if before_id else None,
                 include_metadata=include_metadata,
-                current_user_id=request.user.id
+                current_user_id=request.user.id,
+                cursor=cursor
             )
             
             messages = conversation_data.get('messages', [])
             has_more = conversation_data.get('has_more', False)
+            next_cursor = conversation_data.get('next_cursor')
             metadata = conversation_data.get('metadata', {})
             
         except Exception as e:
@@ -189,29 +184,12 @@ def fetch_history(request, username):
                 Q(recipient=request.user) & Q(recipient_deleted=True)
             )
             
-            # If before_id is provided, get messages older than that message
-            if before_id:
-                try:
-                    before_message = Message.objects.get(id=before_id)
-                    base_query = base_query.filter(created_at__lt=before_message.created_at)
-                except Message.DoesNotExist:
-                    pass  # Ignore invalid before_id
-            
-            # Order by created_at descending for pagination, then reverse for display
-            msgs_query = base_query.order_by('-created_at')
-            
-            # Use optimized paginator
-            paginator = OptimizedPaginator(
-                msgs_query, 
-                per_page=page_size,
-                optimize_func=QueryOptimizer.optimize_message_queries
-            )
-            
+            # Keyset page after the cursor (or before_id), newest first, then reverse for display
             try:
-                page_obj = paginator.get_page(page)
-                msgs = list(page_obj.object_list)
-                msgs.reverse()  # Reverse to show oldest first
-                has_more = page_obj.has_next()
+                msgs, next_cursor = message_persistence_manager.history_page(
+                    base_query, page_size, int(before_id) if before_id else None, cursor
+                )
+                has_more = next_cursor is not None
             except Exception as e:
                 logger.error(f"Error paginating messages: {e}")
                 return JsonResponse({
@@ -227,6 +205,7 @@ def fetch_history(request, username):
                         'id': m.id,
                         'sender': m.sender.username,
                         'recipient': m.recipient.username,
+                        'recipient_id': m.recipient_id,
                         'content': '[This message has been deleted]' if deleted_everyone else m.content,
                         'attachment_url': None if deleted_everyone else (m.attachment.url if m.attachment else None),
                         'attachment_name': None if deleted_everyone else (os.path.basename(m.attachment.name) if m.attachment else None),
@@ -247,35 +226,41 @@ def fetch_history(request, username):
                     logger.error(f"Error processing message {m.id} in fetch_history: {e}")
                     continue
             
+            low, high = Conversation.participant_pair(request.user.id, target.id)
+            conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+            if conversation is not None:
+                conversation.apply_receipts(messages)
+            
             metadata = {}
 
-        # Mark messages as read using persistence manager for atomic operations
+        # Opening the chat reads everything up to the newest message shown,
+        # which is a single watermark update on the conversation row
         try:
-            unread_message_ids = [
+            unread_message_ids = {
                 msg['id'] for msg in messages 
                 if (msg.get('recipient') or msg.get('recipient_username')) == request.user.username and not msg['is_read']
-            ]
+            }
             
             if unread_message_ids:
-                message_persistence_manager.bulk_update_message_status(
-                    unread_message_ids, 'read', request.user.id
-                )
+                Conversation.mark_read(request.user.id, target.id, max(unread_message_ids))
                 
                 # Update the messages in response to reflect read status
+                read_at = timezone.now().isoformat()
                 for msg in messages:
                     if msg['id'] in unread_message_ids:
                         msg['is_read'] = True
-                        msg['read_at'] = timezone.now().isoformat()
+                        msg['read_at'] = read_at
                         msg['status'] = 'read'
                         
         except Exception as e:
-            logger.error(f"Error marking messages as read with persistence manager: {e}")
+            logger.error(f"Error marking messages as read: {e}")
             # Continue even if read marking fails
 
         # Enhanced response with metadata and performance info
         response_data = {
             'messages': messages,
             'has_more': has_more,
+            'next_cursor': next_cursor,
             'count': len(messages),
             'requested_count': page_size,
             'performance': {
@@ -450,84 +435,45 @@ def send_message_fallback(request, username):
 def messages_inbox(request):
     """Display all conversations for the current user with error handling"""
     try:
-        from django.db.models import Q, Max
-        
-        # Get unique users the current user has conversed with
-        conversations = []
-        seen_users = set()
+        # One indexed query over the denormalized conversation summaries,
+        # independent of how many messages the user has exchanged
+        conversations_query = Conversation.for_user(request.user).select_related(
+            'user_low', 'user_low__profile', 'user_high', 'user_high__profile'
+        )
+        paginator = OptimizedPaginator(conversations_query, per_page=20)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        page_conversations = list(page_obj.object_list)
         
+        # Presence for every partner on the page from the status cache,
+        # with at most one query for the misses
+        partner_ids = [conv.other_user(request.user).id for conv in page_conversations]
         try:
-            # Optimized query to get conversations
-            messages_query = Message.objects.filter(
-                Q(sender=request.user) | Q(recipient=request.user)
-            )
-            messages_query = QueryOptimizer.optimize_message_queries(messages_query)
-            messages = messages_query.order_by('-created_at')
+            statuses = UserStatus.snapshots(partner_ids)
         except Exception as e:
-            logger.error(f"Error fetching messages for inbox: {e}")
-            messages = []
+            logger.error(f"Error fetching user statuses in inbox: {e}")
+            statuses = {}
         
-        for msg in messages:
-            try:
-                other_user = msg.recipient if msg.sender == request.user else msg.sender
-                if other_user.id not in seen_users:
-                    seen_users.add(other_user.id)
-                    
-                    # Get unread count with optimized query
-                    try:
-                        unread_count = Message.objects.filter(
-                            sender=other_user, 
-                            recipient=request.user, 
-                            is_read=False
-                        ).count()
-                    except Exception as e:
-                        logger.error(f"Error counting unread messages: {e}")
-                        unread_count = 0
-                    
-                    # Get user status with caching
-                    cache_key = CacheManager.get_cache_key('user_status', other_user.id)
-                    cached_status = CacheManager.get_cached_user_profile(other_user.id)
-                    
-                    is_online = False
-                    last_seen = None
-                    
-                    if not cached_status:
-                        try:
-                            status = UserStatus.objects.get(user=other_user)
-                            is_online = status.is_online
-                            last_seen = status.last_seen
-                            
-                            # Cache the status
-                            status_data = {'is_online': is_online, 'last_seen': last_seen}
-                            CacheManager.cache_user_profile(other_user.id, status_data)
-                        except UserStatus.DoesNotExist:
-                            pass
-                        except Exception as e:
-                            logger.error(f"Error fetching user status in inbox: {e}")
-                    else:
-                        is_online = cached_status.get('is_online', False)
-                        last_seen = cached_status.get('last_seen')
-                    
-                    conversations.append({
-                        'user': other_user,
-                        'last_message': msg,
-                        'unread_count': unread_count,
-                        'is_online': is_online,
-                        'last_seen': last_seen
-                    })
-            except Exception as e:
-                logger.error(f"Error processing conversation in inbox: {e}")
-                continue
-        
-        # Implement optimized pagination
-        paginator = OptimizedPaginator(conversations, per_page=20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        conversations = []
+        for conv in page_conversations:
+            other_user = conv.other_user(request.user)
+            status = statuses.get(other_user.id)
+            conversations.append({
+                'user': other_user,
+                'last_message': {
+                    'id': conv.last_message_id,
+                    'content': conv.last_message_preview,
+                    'created_at': conv.last_message_at,
+                    'sender_id': conv.last_sender_id,
+                },
+                'unread_count': conv.unread_count_for(request.user),
+                'is_online': status['is_online'] if status else False,
+                'last_seen': status['last_seen'] if status else None,
+            })
         
         return render(request, 'messaging/inbox.html', {
             'page_obj': page_obj,
-            'conversations': page_obj.object_list,
-            'total_conversations': len(conversations)
+            'conversations': conversations,
+            'total_conversations': page_obj.paginator.count
         })
     
     except Exception as e:
@@ -555,6 +501,7 @@ def load_older_messages(request, username):
         
         # Get parameters with enhanced validation
         before_id = request.GET.get('before_id')
+        cursor = request.GET.get('cursor')  # Opaque keyset cursor from next_cursor
         page_size = int(request.GET.get('page_size', 20))  # Default 20 messages per batch
         
         # Validate and limit page size for performance
@@ -563,17 +510,18 @@ def load_older_messages(request, username):
         elif page_size < 5:
             page_size = 5   # Minimum 5 messages per request
         
-        if not before_id:
-            return JsonResponse({'error': 'before_id parameter is required'}, status=400)
+        if not before_id and not cursor:
+            return JsonResponse({'error': 'before_id or cursor parameter is required'}, status=400)
         
         # Validate before_id - must be a positive integer (real message ID)
-        try:
-            before_id = int(before_id)
-            if before_id <= 0:
-                raise ValueError("before_id must be positive")
-        except (ValueError, TypeError):
-            logger.warning(f"Invalid before_id format: {before_id}")
-            return JsonResponse({'error': 'Invalid before_id format - must be a positive integer'}, status=400)
+        if before_id:
+            try:
+                before_id = int(before_id)
+                if before_id <= 0:
+                    raise ValueError("before_id must be positive")
+            except (ValueError, TypeError):
+                logger.warning(f"Invalid before_id format: {before_id}")
+                return JsonResponse({'error': 'Invalid before_id format - must be a positive integer'}, status=400)
         
         # Use persistence manager for optimized message loading
         try:
@@ -582,39 +530,34 @@ def load_older_messages(request, username):
                 user2_id=target.id,
                 limit=page_size,
                 before_id=before_id,
-                include_metadata=False  # Don't need metadata for older messages
+                include_metadata=False,  # Don't need metadata for older messages
+                cursor=cursor
             )
             
             messages = conversation_data.get('messages', [])
             has_more = conversation_data.get('has_more', False)
+            next_cursor = conversation_data.get('next_cursor')
             
         except Exception as e:
             logger.error(f"Error loading older messages with persistence manager: {e}")
             # Fallback to original implementation
             from django.db.models import Q
             
-            try:
-                before_message = Message.objects.get(id=before_id)
-            except Message.DoesNotExist:
-                return JsonResponse({'error': 'Invalid before_id'}, status=400)
-            
             # Enhanced query with optimization
             try:
                 base_query = Message.objects.filter(
                     (Q(sender=request.user) & Q(recipient=target)) |
-                    (Q(sender=target) & Q(recipient=request.user)),
-                    created_at__lt=before_message.created_at
+                    (Q(sender=target) & Q(recipient=request.user))
                 )
                 
                 # Apply query optimization
                 base_query = QueryOptimizer.optimize_message_queries(base_query)
                 
-                # Fetch messages with proper ordering
-                msgs = base_query.order_by('-created_at')[:page_size]
-                
-                # Convert to list and reverse to show oldest first
-                msgs = list(msgs)
-                msgs.reverse()
+                # Keyset page before the anchor; the extra row answers has_more
+                msgs, next_cursor = message_persistence_manager.history_page(
+                    base_query, page_size, before_id, cursor
+                )
+                has_more = next_cursor is not None
                 
                 # Convert to message format
                 messages = []
@@ -640,18 +583,6 @@ def load_older_messages(request, username):
                         logger.error(f"Error processing message {m.id} in load_older_messages: {e}")
                         continue
                 
-                # Enhanced check for more messages with performance optimization
-                has_more = False
-                if messages:
-                    oldest_loaded_time = msgs[0].created_at
-                    
-                    # Use exists() for better performance
-                    has_more = Message.objects.filter(
-                        (Q(sender=request.user) & Q(recipient=target)) |
-                        (Q(sender=target) & Q(recipient=request.user)),
-                        created_at__lt=oldest_loaded_time
-                    ).exists()
-                
             except Exception as e:
                 logger.error(f"Error fetching older messages: {e}")
                 return JsonResponse({
@@ -662,6 +593,7 @@ def load_older_messages(request, username):
         response_data = {
             'messages': messages,
             'has_more': has_more,
+            'next_cursor': next_cursor,
             'loaded_count': len(messages),
             'requested_count': page_size,
             'performance': {
@@ -744,25 +676,13 @@ def user_status(request, username):
     try:
         target = get_object_or_404(User, username=username)
         
-        try:
-            status = UserStatus.objects.get(user=target)
-            return JsonResponse({
-                'username': target.username,
-                'is_online': status.is_online,
-                'last_seen': status.last_seen.isoformat() if status.last_seen else None
-            })
-        except UserStatus.DoesNotExist:
-            # Create default status
-            try:
-                UserStatus.objects.create(user=target, is_online=False)
-            except IntegrityError:
-                pass  # Status was created by another request
-            
-            return JsonResponse({
-                'username': target.username,
-                'is_online': False,
-                'last_seen': None
-            })
+        # Users without a status row read as offline
+        status = UserStatus.snapshots([target.id])[target.id]
+        return JsonResponse({
+            'username': target.username,
+            'is_online': status['is_online'],
+            'last_seen': status['last_seen'].isoformat() if status['last_seen'] else None
+        })
     
     except User.DoesNotExist:
         return JsonResponse({'error': 'User not found'}, status=404)
@@ -992,6 +912,7 @@ def delete_message(request, message_id):
                     message.attachment.delete(save=False)
                 message.deleted_at = now
                 message.save()
+                Conversation.refresh_for_pair(message.sender_id, message.recipient_id)
 
                 try:
                     from channels.layers import get_channel_layer
@@ -1065,6 +986,14 @@ def delete_messages_bulk(request):
 
                 deleted_ids.append(message.id)
 
+            if mode == 'everyone':
+                pairs = {
+                    Conversation.participant_pair(message.sender_id, message.recipient_id)
+                    for message in messages if message.id in deleted_ids
+                }
+                for user_low_id, user_high_id in pairs:
+                    Conversation.refresh_for_pair(user_low_id, user_high_id)
+
         if deleted_ids and mode == 'everyone':
             try:
                 from channels.layers import get_channel_layer
@@ -1135,23 +1064,12 @@ def mark_messages_read(request, username):
     """Mark all messages from a specific user as read"""
     try:
         target = get_object_or_404(User, username=username)
+        count = Conversation.mark_read(request.user.id, target.id)
         
-        with transaction.atomic():
-            unread_messages = Message.objects.filter(
-                sender=target,
-                recipient=request.user,
-                is_read=False
-            ).select_for_update()
-            
-            count = 0
-            for msg in unread_messages:
-                msg.mark_as_read()
-                count += 1
-            
-            return JsonResponse({
-                'success': True,
-                'marked_read': count
-            })
+        return JsonResponse({
+            'success': True,
+            'marked_read': count
+        })
     
     except User.DoesNotExist:
         return JsonResponse({'error': 'User not found'}, status=404)
@@ -1176,7 +1094,22 @@ def notifications_list(request):
         total_unread = notification_service.get_unread_count(request.user)
         
         # If AJAX request (has limit param), return JSON with serialized dicts
-        if 'limit' in request.GET or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        is_json = 'limit' in request.GET or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        if is_json and 'offset' not in request.GET:
+            page = notification_service.get_notifications_page(
+                user=request.user, limit=limit, cursor=request.GET.get('cursor'),
+                notification_type=notification_type, unread_only=unread_only,
+            )
+            return JsonResponse({
+                'notifications': page['notifications'],
+                'total_unread': total_unread,
+                'limit': limit,
+                'has_more': page['has_more'],
+                'next_cursor': page['next_cursor'],
+            })
+        
+        # Legacy offset pagination for older clients
+        if is_json:
             notifications = notification_service.get_notifications(
                 user=request.user, limit=limit, offset=offset,
                 notification_type=notification_type, unread_only=unread_only,
@@ -1265,19 +1198,22 @@ def notification_preferences(request):
         all_types = [choice[0] for choice in Notification.NOTIFICATION_TYPES]
         existing_types = set(pref.notification_type for pref in preferences)
         
-        for notification_type in all_types:
-            if notification_type not in existing_types:
-                NotificationPreference.objects.get_or_create(
-                    user=request.user,
-                    notification_type=notification_type,
-                    defaults={
-                        'delivery_method': 'realtime',
-                        'is_enabled': True
-                    }
-                )
-        
-        # Refresh preferences
-        preferences = NotificationPreference.objects.filter(user=request.user)
+        missing = [
+            NotificationPreference(
+                user=request.user,
+                notification_type=notification_type,
+                delivery_method='realtime',
+                is_enabled=True
+            )
+            for notification_type in all_types
+            if notification_type not in existing_types
+        ]
+        if missing:
+            NotificationPreference.objects.bulk_create(missing, ignore_conflicts=True)
+            # bulk_create skips the signal that invalidates the preference cache
+            preference_resolver.invalidate_on_commit(request.user.id)
+            # Refresh preferences
+            preferences = NotificationPreference.objects.filter(user=request.user)
         
         data = []
         for pref in preferences:
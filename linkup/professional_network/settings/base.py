@@ -66,6 +66,9 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'professional_network.urls'
 
+# Keeps background writers off the test database (see core/test_runner.py)
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -132,6 +135,89 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
 
+# Query profiling for requests and WebSocket events (see core/query_profiler.py)
+QUERY_PROFILER_SLOW_MS = 500  # Requests slower than this are sampled
+QUERY_PROFILER_SLOW_QUERIES = 20  # ...as are requests running at least this many queries
+QUERY_PROFILER_DUPLICATE_THRESHOLD = 5  # ...or repeating one SQL fingerprint this often (N+1)
+QUERY_PROFILER_SAMPLE_SIZE = 100  # Slow samples kept per process
+
+# Prometheus metrics at /metrics (see core/metrics.py)
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or None  # Shared by all workers; None = single process
+METRICS_FLUSH_INTERVAL = 5  # Seconds between each worker's snapshot writes
+METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN', '')  # Bearer token required to scrape; unset = staff only
+
+# Tag-invalidated application cache (see core/caching.py)
+TAGGED_CACHE_KEY_PREFIX = 'tc'
+TAGGED_CACHE_TAG_TIMEOUT = 86400  # Seconds a tag version lives; must outlast the entries using it
+TAGGED_CACHE_L1_SIZE = 1000  # Entries in each process's L1 (namespaces created with l1=True)
+TAGGED_CACHE_L1_TTL = 5  # Seconds an L1 copy is served without checking tags
+TAGGED_CACHE_STALE_TTL = 60  # Seconds an expired entry may still be served while one caller recomputes it
+TAGGED_CACHE_LOCK_TIMEOUT = 10  # Seconds a recompute lock is held at most
+TAGGED_CACHE_LOCK_WAIT = 2  # Seconds a caller waits for another's recompute on a miss before computing itself
+TAGGED_CACHE_LOCK_POLL_INTERVAL = 0.05  # Seconds between checks while waiting
+TAGGED_CACHE_EARLY_REFRESH_BETA = 1.0  # >1 refreshes earlier, 0 disables early refresh
+
+# Sliding-window rate limiting (see core/rate_limit.py)
+RATE_LIMIT_LOCAL_HEADROOM = 0.5  # Hits are counted in-process only while a client is under this share of its limit
+RATE_LIMIT_LOCAL_MAX_PENDING = 10  # In-process hits batched into one shared increment, 0 disables the pre-filter
+RATE_LIMIT_LOCAL_MAX_CLIENTS = 10000  # Clients tracked in-process before the table is reset
+RATE_LIMIT_WEBSOCKET_WINDOW = 10  # Seconds
+RATE_LIMIT_WEBSOCKET_FRAMES = 120  # Frames per window on any WebSocket, 0 disables
+RATE_LIMIT_WEBSOCKET_MESSAGES = 30  # Chat messages per window, 0 disables
+
+# Sessions: SessionSecurityMiddleware rewrites last_activity (a session write that
+# also extends the session's expiry) at most this often, in seconds; 0 = every request
+SESSION_ACTIVITY_GRANULARITY = 60
+
+# Presence tracking (cache-backed, see messaging/presence_store.py)
+PRESENCE_CONNECTION_TTL = 90  # Seconds a connection survives without a heartbeat
+PRESENCE_FLUSH_INTERVAL = 60  # Seconds between batched last_seen writes
+
+# Typing indicators (in-memory per connection, see messaging/typing_manager.py)
+TYPING_INDICATOR_TIMEOUT = 5  # Seconds without a typing frame before the indicator clears
+TYPING_INDICATOR_STOP_DELAY = 1  # Seconds an explicit stop waits in case typing resumes
+
+# Read/delivered receipts are per-conversation watermarks (see messaging/models.py
+# Conversation); while this is on, Message.is_read/read_at/status are mirrored too
+MESSAGE_READ_COMPAT_COLUMNS = True
+
+# Home feed timelines (see feed/timeline_manager.py)
+FEED_TIMELINE_LENGTH = 800  # Entries kept per user timeline
+FEED_FANOUT_LIMIT = 5000  # Audiences larger than this are pulled at read time
+
+# PDF attachment rendering (see feed/document_processor.py)
+DOCUMENT_RENDER_FORMAT = 'WEBP'  # WEBP or JPEG
+DOCUMENT_RENDER_QUALITY = 80
+DOCUMENT_PAGE_WIDTH = 1200  # Pixels, full-size page images
+DOCUMENT_THUMBNAIL_WIDTH = 320  # Pixels, page thumbnails
+DOCUMENT_EAGER_PAGES = 3  # Pages queued at upload; the rest render on demand
+DOCUMENT_RENDER_WORKERS = 2  # Processes in the worker's render pool
+DOCUMENT_RENDER_TIMEOUT = 300  # Seconds before a running job is reclaimed
+
+# Buffered MessagingError writes (see messaging/error_sink.py)
+MESSAGING_ERROR_SINK_MODE = 'thread'  # 'thread' flushes in the background; 'manual' waits for flush() (tests)
+MESSAGING_ERROR_SINK_FLUSH_INTERVAL = 2  # Seconds between background flushes
+MESSAGING_ERROR_SINK_BATCH_SIZE = 100  # Rows per bulk_create; a full batch flushes early
+MESSAGING_ERROR_SINK_MAX_QUEUE = 1000  # Queued errors beyond this are dropped and counted
+MESSAGING_ERROR_SINK_WINDOW = 60  # Seconds per rate-limit window for each error fingerprint
+MESSAGING_ERROR_SINK_BURST = 10  # Errors kept per fingerprint per window before sampling starts
+MESSAGING_ERROR_SINK_SAMPLE_EVERY = 100  # After the burst, keep one error in this many
+MESSAGING_ERROR_SINK_MAX_FINGERPRINTS = 1000  # Distinct fingerprints tracked at once
+MESSAGING_ERROR_SINK_TRACEBACK_CHARS = 4000  # Stored tracebacks keep their last this-many characters
+
+# Notification outbox (see messaging/notification_outbox.py)
+# 'worker' leaves draining to the process_notifications command (run it next
+# to the web process), 'thread' drains on a background thread (only with a
+# server database: on SQLite it contends with request writes), 'inline'
+# drains the whole outbox on commit in the caller (tests only)
+NOTIFICATION_OUTBOX_MODE = 'worker'
+NOTIFICATION_OUTBOX_BATCH_SIZE = 200  # Outbox rows processed per batch
+NOTIFICATION_OUTBOX_CLAIM_TIMEOUT = 60  # Seconds before a claimed batch is reclaimed
+NOTIFICATION_OUTBOX_RETENTION = 86400  # Seconds processed rows are kept for deduplication
+
+# Per-user notification preference cache (see messaging/notification_preferences.py)
+NOTIFICATION_PREFERENCE_CACHE_TIMEOUT = 3600  # Seconds; saves invalidate immediately
+
 # Create logs directory if it doesn't exist
 os.makedirs(BASE_DIR / 'logs', exist_ok=True)
 
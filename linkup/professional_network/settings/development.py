@@ -63,7 +63,7 @@ SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False  # Expiry slides with the throttled activity stamp (SESSION_ACTIVITY_GRANULARITY)
 
 # Security Headers (relaxed for development)
 SECURE_BROWSER_XSS_FILTER = True
@@ -54,9 +54,39 @@ CACHES = {
             'SOCKET_TIMEOUT': 5,
         },
         'TIMEOUT': 300,  # 5 minutes default
-    }
+    },
+    # Sessions get their own alias so they can live on a separate Redis instance
+    'sessions': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': config('SESSION_REDIS_URL', default=REDIS_URL),
+        'KEY_PREFIX': 'session',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'CONNECTION_POOL_KWARGS': {'max_connections': 50},
+            'SOCKET_CONNECT_TIMEOUT': 5,
+            'SOCKET_TIMEOUT': 5,
+        },
+    },
 }
 
+# Session storage: 'cached_db' reads from Redis and writes through to the database,
+# 'cache' keeps sessions in Redis only (no database writes; sessions are lost if Redis is flushed)
+SESSION_STORE = config('SESSION_STORE', default='cached_db')
+SESSION_ENGINE = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+}[SESSION_STORE]
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Notifications are drained by the Procfile's notifications process
+NOTIFICATION_OUTBOX_MODE = config('NOTIFICATION_OUTBOX_MODE', default='worker')
+
+# Background writers - PostgreSQL handles them alongside request threads
+MESSAGING_ERROR_SINK_MODE = config('MESSAGING_ERROR_SINK_MODE', default='thread')
+
+# Prometheus scrapes must present this token; without one /metrics is staff-only
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
+
 # Security Settings for Production
 SECURE_SSL_REDIRECT = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -75,7 +105,7 @@ SESSION_COOKIE_SAMESITE = 'Lax'
 CSRF_COOKIE_SAMESITE = 'Lax'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False  # Expiry slides with the throttled activity stamp (SESSION_ACTIVITY_GRANULARITY)
 
 # CSRF Settings
 CSRF_COOKIE_AGE = 31449600  # 1 year
@@ -36,6 +36,7 @@ urlpatterns = [
     path('health/db/', health_views.health_check_db, name='health_check_db'),
     path('health/redis/', health_views.health_check_redis, name='health_check_redis'),
     path('readiness/', health_views.readiness_check, name='readiness_check'),
+    path('metrics', health_views.metrics, name='metrics'),
 ]
 
 # Development-only URLs